@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from itertools import islice
+from time import monotonic
+from typing import Callable
+
+from chik_rs.sized_bytes import bytes32
+from chik_rs.sized_ints import uint32, uint64, uint128
+
+from chik.types.blockchain_format.coin import Coin
+from chik.wallet.coin_selection import select_coins
+from chik.wallet.util.tx_config import DEFAULT_COIN_SELECTION_CONFIG
+from chik.wallet.util.wallet_types import WalletType
+from chik.wallet.wallet_coin_record import WalletCoinRecord
+from chik.wallet.wallet_coin_store import UnspentCoins
+
+# to run this benchmark:
+# python -m benchmarks.coin_selection
+
+COIN_COUNTS = [1000, 10000, 100000]
+NUM_SELECTIONS = 50
+# Wallet.max_send_quantity
+MAX_SEND_QUANTITY = 200
+
+DISTRIBUTIONS: dict[str, Callable[[], int]] = {
+    "uniform": lambda: random.randrange(1, 10**12),
+    "exponential": lambda: int(random.expovariate(1 / 10**9)) + 1,
+    # mostly tiny coins, e.g. from faucets or dust attacks, and a few large ones
+    "dust-heavy": lambda: random.randrange(1, 1000) if random.random() < 0.95 else random.randrange(10**9, 10**12),
+}
+
+log = logging.getLogger(__name__)
+
+
+def make_record(amount: int) -> WalletCoinRecord:
+    coin = Coin(bytes32.random(), bytes32.random(), uint64(amount))
+    return WalletCoinRecord(coin, uint32(1), uint32(0), False, False, WalletType.STANDARD_WALLET, 1)
+
+
+async def run_selections(records: list[WalletCoinRecord], targets: list[int]) -> float:
+    """
+    Returns the average time of a coin selection, including picking the candidates
+    """
+    unspent = UnspentCoins()
+    for record in records:
+        unspent.add(record.name(), record)
+
+    start = monotonic()
+    for target in targets:
+        spendable = list(islice(unspent.largest_first(), MAX_SEND_QUANTITY))
+        spendable_amount = sum(record.coin.amount for record in spendable)
+        await select_coins(
+            uint128(spendable_amount),
+            DEFAULT_COIN_SELECTION_CONFIG,
+            spendable,
+            {},
+            log,
+            uint128(min(target, spendable_amount)),
+        )
+    return (monotonic() - start) / len(targets)
+
+
+def main() -> None:
+    random.seed(123456789)
+    for name, amount in DISTRIBUTIONS.items():
+        for count in COIN_COUNTS:
+            records = [make_record(amount()) for _ in range(count)]
+            # amounts which are, and aren't, exactly the sum of some coins
+            targets = [random.randrange(1, 10**10) for _ in range(NUM_SELECTIONS)]
+            targets += [sum(record.coin.amount for record in random.sample(records, 3)) for _ in range(NUM_SELECTIONS)]
+            average = asyncio.run(run_selections(records, targets))
+            print(f"{name:>12s} {count:7d} coins: {average * 1000:8.2f} ms per selection")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,12 +14,16 @@ from benchmarks.utils import setup_db
 from chik._tests.util.benchmarks import rand_hash, rewards
 from chik.full_node.coin_store import CoinStore
 from chik.types.blockchain_format.coin import Coin
+from chik.util.db_wrapper import bucketed_parameters
 
 # to run this benchmark:
 # python -m benchmarks.coin_store
 
 NUM_ITERS = 200
 
+# the number of coins looked up per query in the lookup benchmark
+LOOKUP_BATCH_SIZES = [1, 10, 100, 1000, 5000]
+
 # we need seeded random, to have reproducible benchmark runs
 random.seed(123456789)
 
@@ -306,6 +310,56 @@ async def run_new_block_benchmark(version: int) -> None:
     print(f"database size: {db_size / 1000000:.3f} MB")
 
 
+async def run_lookup_benchmark(version: int) -> None:
+    """
+    Compares looking up coins by name with a query string built for the exact
+    number of coins, to one with the parameters padded to a fixed bucket size
+    (see bucketed_parameters()), with and without a statement cache.
+    """
+
+    async def lookup(coin_store: CoinStore, names: list[bytes32], bucketed: bool) -> int:
+        if bucketed:
+            placeholders, params = bucketed_parameters(names)
+        else:
+            placeholders, params = ",".join(["?"] * len(names)), list(names)
+        async with coin_store.db_wrapper.reader_no_transaction() as conn:
+            async with conn.execute(
+                f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                f"coin_parent, amount, timestamp FROM coin_record WHERE coin_name in ({placeholders})",
+                params,
+            ) as cursor:
+                return len(list(await cursor.fetchall()))
+
+    for statement_cache_size in [0, 128]:
+        async with setup_db("coin-store-benchmark.db", version, statement_cache_size=statement_cache_size) as db:
+            coin_store = await CoinStore.create(db)
+            all_coins: list[bytes32] = []
+            for height in range(1, 51):
+                additions, hashes = make_coins(2000)
+                farmer_coin, pool_coin = rewards(uint32(height))
+                await coin_store.new_block(
+                    uint32(height), uint64(1631794488 + height * 19), [pool_coin, farmer_coin], additions, []
+                )
+                all_coins += hashes
+
+            for batch_size in LOOKUP_BATCH_SIZES:
+                for bucketed in [False, True]:
+                    total_time = 0.0
+                    found_coins = 0
+                    for i in range(NUM_ITERS):
+                        # vary the number of coins, like real queries do
+                        names = random.sample(all_coins, random.randint(batch_size // 2 + 1, batch_size))
+                        start = monotonic()
+                        found_coins += await lookup(coin_store, names, bucketed)
+                        total_time += monotonic() - start
+                    print(
+                        f"{total_time:0.4f}s, LOOKUP up to {batch_size} coins, "
+                        f"{'bucketed' if bucketed else 'exact'} parameters, "
+                        f"statement cache: {statement_cache_size}, found {found_coins} coins in total"
+                    )
+
+
 if __name__ == "__main__":
     print("version 2")
     asyncio.run(run_new_block_benchmark(2))
+    asyncio.run(run_lookup_benchmark(2))
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import itertools
+import random
+import sqlite3
+from collections.abc import Iterator
+from time import monotonic
+from typing import Optional, Protocol
+
+from chik_rs.sized_bytes import bytes32
+from chik_rs.sized_ints import uint32, uint64
+
+from chik.full_node.mempool_index import MempoolIndex
+
+# to run this benchmark:
+# python -m benchmarks.mempool_index
+
+# the number of items in the mempool, in the steady state
+MEMPOOL_SIZES = [1000, 10000, 50000]
+NUM_BLOCKS = 200
+# the number of items included in (and added after) each block
+ITEMS_PER_BLOCK = 200
+
+
+class Index(Protocol):
+    def add(
+        self,
+        name: bytes32,
+        cost: int,
+        fee: int,
+        assert_before_height: Optional[int],
+        coin_ids: list[bytes32],
+    ) -> None: ...
+
+    def remove(self, names: list[bytes32]) -> None: ...
+
+    def by_fee_rate(self) -> Iterator[bytes32]: ...
+
+    def min_fee_rate(self, cost: int, max_cost: int) -> Optional[float]: ...
+
+    def by_coin_ids(self, coin_ids: list[bytes32]) -> list[bytes32]: ...
+
+    def expired(self, height: int) -> list[bytes32]: ...
+
+
+class SQLiteIndex:
+    """
+    The in-memory SQLite database the mempool used to keep its index in, with
+    the same queries.
+    """
+
+    def __init__(self) -> None:
+        self.db = sqlite3.connect(":memory:")
+        self.db.execute(
+            "CREATE TABLE tx(name BLOB, cost INT NOT NULL, fee INT NOT NULL, assert_height INT, "
+            "assert_before_height INT, assert_before_seconds INT, fee_per_cost REAL, "
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT)"
+        )
+        self.db.execute("CREATE INDEX name_idx ON tx(name)")
+        self.db.execute("CREATE INDEX feerate ON tx(fee_per_cost)")
+        self.db.execute(
+            "CREATE INDEX assert_before ON tx(assert_before_height, assert_before_seconds) "
+            "WHERE assert_before_height IS NOT NULL OR assert_before_seconds IS NOT NULL"
+        )
+        self.db.execute("CREATE TABLE spends(coin_id BLOB NOT NULL, tx BLOB NOT NULL, UNIQUE(coin_id, tx))")
+        self.db.execute("CREATE INDEX spend_by_coin ON spends(coin_id)")
+        self.db.execute("CREATE INDEX spend_by_bundle ON spends(tx)")
+
+    def add(
+        self,
+        name: bytes32,
+        cost: int,
+        fee: int,
+        assert_before_height: Optional[int],
+        coin_ids: list[bytes32],
+    ) -> None:
+        with self.db as conn:
+            conn.execute(
+                "INSERT INTO tx(name,cost,fee,assert_height,assert_before_height,assert_before_seconds,fee_per_cost) "
+                "VALUES(?, ?, ?, ?, ?, ?, ?)",
+                (name, cost, fee, None, assert_before_height, None, fee / cost),
+            )
+            conn.executemany("INSERT OR IGNORE INTO spends VALUES(?, ?)", [(coin_id, name) for coin_id in coin_ids])
+
+    def remove(self, names: list[bytes32]) -> None:
+        args = ",".join(["?"] * len(names))
+        with self.db as conn:
+            conn.execute(f"SELECT SUM(cost), SUM(fee) FROM tx WHERE name in ({args})", names).fetchone()
+            conn.execute(f"DELETE FROM tx WHERE name in ({args})", names)
+            conn.execute(f"DELETE FROM spends WHERE tx in ({args})", names)
+
+    def by_fee_rate(self) -> Iterator[bytes32]:
+        for row in self.db.execute("SELECT name, fee FROM tx ORDER BY fee_per_cost DESC, seq ASC"):
+            yield bytes32(row[0])
+
+    def min_fee_rate(self, cost: int, max_cost: int) -> Optional[float]:
+        current_cost = self.db.execute("SELECT SUM(cost) FROM tx").fetchone()[0]
+        for item_cost, fee_per_cost in self.db.execute(
+            "SELECT cost,fee_per_cost FROM tx ORDER BY fee_per_cost ASC, seq DESC"
+        ):
+            current_cost -= item_cost
+            if current_cost + cost <= max_cost:
+                return float(fee_per_cost)
+        return None
+
+    def by_coin_ids(self, coin_ids: list[bytes32]) -> list[bytes32]:
+        args = ",".join(["?"] * len(coin_ids))
+        cursor = self.db.execute(
+            f"SELECT * FROM tx WHERE name IN (SELECT tx FROM spends WHERE coin_id IN ({args}))", coin_ids
+        )
+        return [bytes32(row[0]) for row in cursor]
+
+    def expired(self, height: int) -> list[bytes32]:
+        cursor = self.db.execute(
+            "SELECT name FROM tx WHERE assert_before_seconds <= ? OR assert_before_height <= ?", (2**63 - 1, height)
+        )
+        return [bytes32(row[0]) for row in cursor]
+
+
+class PythonIndex:
+    def __init__(self) -> None:
+        self.index = MempoolIndex()
+
+    def add(
+        self,
+        name: bytes32,
+        cost: int,
+        fee: int,
+        assert_before_height: Optional[int],
+        coin_ids: list[bytes32],
+    ) -> None:
+        abh = None if assert_before_height is None else uint32(assert_before_height)
+        self.index.add(name, cost, fee, None, abh, None, coin_ids)
+
+    def remove(self, names: list[bytes32]) -> None:
+        for name in names:
+            self.index.remove(name)
+
+    def by_fee_rate(self) -> Iterator[bytes32]:
+        for entry in self.index.by_fee_rate():
+            yield entry.name
+
+    def min_fee_rate(self, cost: int, max_cost: int) -> Optional[float]:
+        current_cost = sum(e.cost for e in self.index.all_entries())
+        for entry in self.index.by_fee_rate_ascending():
+            current_cost -= entry.cost
+            if current_cost + cost <= max_cost:
+                return entry.fee_per_cost
+        return None
+
+    def by_coin_ids(self, coin_ids: list[bytes32]) -> list[bytes32]:
+        return [e.name for e in self.index.get_by_coin_ids(coin_ids)]
+
+    def expired(self, height: int) -> list[bytes32]:
+        return self.index.expired(height, uint64.MAXIMUM)
+
+
+def rand_hash() -> bytes32:
+    return bytes32(random.randbytes(32))
+
+
+def run_workload(index: Index, mempool_size: int) -> float:
+    """
+    Fills the mempool and then, for every block, looks up and removes the
+    items included in it, expires items, adds new ones and goes through the
+    items by fee rate to create the next block. Returns the time it took.
+    """
+    # both indexes get the same items
+    random.seed(123456789)
+    items: dict[bytes32, list[bytes32]] = {}
+
+    def new_item(height: int) -> tuple[bytes32, int, int, Optional[int], list[bytes32]]:
+        name = rand_hash()
+        cost = random.randint(5_000_000, 50_000_000)
+        fee = random.randint(0, 1_000_000_000)
+        assert_before_height = height + random.randint(10, 100) if random.random() < 0.1 else None
+        coin_ids = [rand_hash() for _ in range(random.randint(1, 4))]
+        items[name] = coin_ids
+        return name, cost, fee, assert_before_height, coin_ids
+
+    start = monotonic()
+    for _ in range(mempool_size):
+        index.add(*new_item(0))
+
+    for height in range(1, NUM_BLOCKS + 1):
+        included = random.sample(list(items), min(ITEMS_PER_BLOCK, len(items)))
+        spent_coins = [coin_id for name in included for coin_id in items[name]]
+        to_remove = index.by_coin_ids(spent_coins)
+        index.remove(to_remove)
+        for name in to_remove:
+            del items[name]
+
+        expired = index.expired(height)
+        index.remove(expired)
+        for name in expired:
+            del items[name]
+
+        while len(items) < mempool_size:
+            index.add(*new_item(height))
+
+        index.min_fee_rate(10_000_000, 550_000_000_000 * 10)
+        for _ in itertools.islice(index.by_fee_rate(), 1000):
+            pass
+
+    return monotonic() - start
+
+
+def main() -> None:
+    for mempool_size in MEMPOOL_SIZES:
+        indexes: list[tuple[str, Index]] = [("sqlite", SQLiteIndex()), ("python", PythonIndex())]
+        for name, index in indexes:
+            duration = run_workload(index, mempool_size)
+            print(f"{duration:0.4f}s, {name:6s} index, mempool size: {mempool_size} blocks: {NUM_BLOCKS}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from time import monotonic
+
+from chik_rs import G1Element, PlotSize
+from chik_rs.sized_bytes import bytes32
+from chik_rs.sized_ints import uint32, uint64
+
+from chik.plotting.filter_table import PlotFilterTable
+from chik.plotting.util import PlotInfo
+from chik.simulator.block_tools import test_constants
+from chik.types.blockchain_format.proof_of_space import calculate_prefix_bits, passes_plot_filter
+
+# to run this benchmark:
+# python -m benchmarks.plot_filter
+
+PLOT_COUNTS = [1000, 10000, 100000, 300000]
+# the number of signage points to apply the filter for
+NUM_SIGNAGE_POINTS = 20
+PEAK_HEIGHT = uint32(0)
+
+
+@dataclass
+class FakeDiskProver:
+    plot_id: bytes32
+
+    def get_id(self) -> bytes32:
+        return self.plot_id
+
+    def get_size(self) -> int:
+        return 32
+
+
+def filter_one_by_one(plots: dict[Path, PlotInfo], challenge_hash: bytes32, sp_hash: bytes32) -> int:
+    """
+    The way the harvester used to apply the plot filter
+    """
+    passed = 0
+    for plot_info in plots.values():
+        prefix_bits = calculate_prefix_bits(test_constants, PEAK_HEIGHT, PlotSize.make_v1(plot_info.prover.get_size()))
+        if passes_plot_filter(prefix_bits, plot_info.prover.get_id(), challenge_hash, sp_hash):
+            passed += 1
+    return passed
+
+
+def main() -> None:
+    random.seed(123456789)
+    for count in PLOT_COUNTS:
+        plots = {
+            Path(f"plot-{i}.plot"): PlotInfo(
+                prover=FakeDiskProver(bytes32.random()),
+                pool_public_key=None,
+                pool_contract_puzzle_hash=None,
+                plot_public_key=G1Element(),
+                file_size=uint64(0),
+                time_modified=0,
+            )
+            for i in range(count)
+        }
+        challenges = [(bytes32.random(), bytes32.random()) for _ in range(NUM_SIGNAGE_POINTS)]
+
+        start = monotonic()
+        expected = [filter_one_by_one(plots, challenge_hash, sp_hash) for challenge_hash, sp_hash in challenges]
+        one_by_one = (monotonic() - start) / NUM_SIGNAGE_POINTS
+
+        start = monotonic()
+        table = PlotFilterTable.create(plots)
+        build = monotonic() - start
+
+        def prefix_bits(size: int) -> int:
+            return calculate_prefix_bits(test_constants, PEAK_HEIGHT, PlotSize.make_v1(size))
+
+        start = monotonic()
+        passed = [len(table.passing(prefix_bits, challenge_hash, sp_hash)) for challenge_hash, sp_hash in challenges]
+        batched = (monotonic() - start) / NUM_SIGNAGE_POINTS
+        assert passed == expected
+
+        print(
+            f"{count:7d} plots: one by one: {one_by_one * 1000:8.2f} ms, "
+            f"table: {batched * 1000:8.2f} ms per signage point (table built in {build * 1000:0.2f} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -28,7 +28,9 @@ class EnumType(click.Choice, Generic[_T_Enum]):
 
 
 @contextlib.asynccontextmanager
-async def setup_db(name: Union[str, os.PathLike[str]], db_version: int) -> AsyncIterator[DBWrapper2]:
+async def setup_db(
+    name: Union[str, os.PathLike[str]], db_version: int, *, statement_cache_size: int = 0
+) -> AsyncIterator[DBWrapper2]:
     db_filename = Path(name)
     try:
         os.unlink(db_filename)
@@ -48,6 +50,7 @@ async def setup_db(name: Union[str, os.PathLike[str]], db_version: int) -> Async
         reader_count=1,
         journal_mode="wal",
         synchronous="full",
+        statement_cache_size=statement_cache_size,
     ) as db_wrapper:
         yield db_wrapper
 
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Sequence
+from time import monotonic
+from typing import Callable
+
+import zstd
+from chik_rs import FullBlock
+from chik_rs.sized_ints import uint32
+
+from chik._tests.util.blockchain import persistent_blocks
+from chik.full_node.block_store import compress
+from chik.server.compression import compress_payload, concatenate_frames, decompress_payload
+from chik.simulator.block_tools import create_block_tools_async, test_constants
+from chik.simulator.keyring import TempKeyring
+from chik.util.keyring_wrapper import KeyringWrapper
+
+# to run this benchmark:
+# python -m benchmarks.wire_compression
+
+# the number of blocks in a respond_blocks message (MAX_BLOCK_COUNT_PER_REQUESTS)
+BATCH_SIZE = 32
+
+
+def respond_blocks_prefix(batch: Sequence[FullBlock]) -> bytes:
+    return (
+        uint32(batch[0].height).stream_to_bytes()
+        + uint32(batch[-1].height).stream_to_bytes()
+        + uint32(len(batch)).stream_to_bytes()
+    )
+
+
+def measure(name: str, batches: list[tuple[bytes, list[bytes]]], encode: Callable[[bytes, list[bytes]], bytes]) -> None:
+    """
+    batches are (respond_blocks prefix, blocks stored compressed) pairs. encode
+    turns a batch into the data sent on the wire.
+    """
+    wire_bytes = 0
+    start = monotonic()
+    for prefix, stored in batches:
+        wire_bytes += len(encode(prefix, stored))
+    duration = monotonic() - start
+    print(f"{name:30s} {wire_bytes / 1000000:10.2f} MB {duration:8.4f}s")
+
+
+async def run_benchmark() -> None:
+    with TempKeyring() as keychain:
+        bt = await create_block_tools_async(constants=test_constants, keychain=keychain)
+        blocks = persistent_blocks(1000, "test_blocks_1000_rc5.db", bt, seed=b"100")
+        KeyringWrapper.cleanup_shared_instance()
+
+    # the blocks the way they're stored in the BlockStore
+    batches = [
+        (respond_blocks_prefix(blocks[i : i + BATCH_SIZE]), [compress(b) for b in blocks[i : i + BATCH_SIZE]])
+        for i in range(0, len(blocks), BATCH_SIZE)
+    ]
+
+    def uncompressed(prefix: bytes, stored: list[bytes]) -> bytes:
+        # what the full node does without compression
+        return prefix + b"".join(zstd.decompress(b) for b in stored)
+
+    def recompressed(prefix: bytes, stored: list[bytes]) -> bytes:
+        return compress_payload(uncompressed(prefix, stored))
+
+    def passed_through(prefix: bytes, stored: list[bytes]) -> bytes:
+        return concatenate_frames(prefix, stored)
+
+    print(f"{len(blocks)} blocks, {len(batches)} respond_blocks messages")
+    print(f"{'sender':30s} {'on the wire':>13s} {'CPU':>9s}")
+    measure("uncompressed", batches, uncompressed)
+    measure("compressed per message", batches, recompressed)
+    measure("stored blocks passed through", batches, passed_through)
+
+    payloads = [passed_through(prefix, stored) for prefix, stored in batches]
+    start = monotonic()
+    for payload in payloads:
+        decompress_payload(payload)
+    print(f"{'receiver decompression':30s} {'':13s} {monotonic() - start:8.4f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark())
@@ -21,6 +21,7 @@ from chik.consensus.block_body_validation import ForkInfo
 from chik.consensus.blockchain import AddBlockResult, Blockchain
 from chik.consensus.default_constants import DEFAULT_CONSTANTS
 from chik.consensus.full_block_to_block_record import header_block_to_sub_block_record
+from chik.full_node.block_archive import BlockArchive
 from chik.full_node.block_height_map import BlockHeightMap
 from chik.full_node.block_store import BlockStore
 from chik.full_node.coin_store import CoinStore
@@ -600,3 +601,47 @@ async def test_get_prev_hash(tmp_dir: Path, bt: BlockTools, db_version: int, use
 
         with pytest.raises(KeyError, match="missing block in chain"):
             await store.get_prev_hash(bytes32.from_bytes(b"yolo" * 8))
+
+
+@pytest.mark.limit_consensus_modes(reason="save time")
+@pytest.mark.anyio
+async def test_block_archive(bt: BlockTools, tmp_dir: Path, default_400_blocks: list[FullBlock]) -> None:
+    blocks = default_400_blocks[:100]
+
+    async with DBConnection(2) as db_wrapper:
+        archive = BlockArchive.open(tmp_dir / "archive", segment_blocks=20)
+        coin_store = await CoinStore.create(db_wrapper)
+        block_store = await BlockStore.create(db_wrapper, use_cache=False, archive=archive)
+        height_map = await BlockHeightMap.create(tmp_dir, db_wrapper)
+        bc = await Blockchain.create(coin_store, block_store, height_map, bt.constants, 2)
+        try:
+            for block in blocks:
+                await _validate_and_add_block(bc, block)
+
+            # only complete segments are archived
+            assert await block_store.archive_blocks(69) == 60
+            assert archive.archived_height() == 60
+            assert await block_store.archive_blocks(69) == 0
+
+            async with db_wrapper.reader_no_transaction() as conn:
+                async with conn.execute("SELECT height FROM full_blocks WHERE block IS NULL") as cursor:
+                    assert sorted(row[0] for row in await cursor.fetchall()) == list(range(60))
+
+            # blocks are read from both tiers
+            for block in blocks:
+                assert await block_store.get_full_block(block.header_hash) == block
+                assert await block_store.get_full_block_bytes(block.header_hash) == bytes(block)
+            assert await block_store.get_block_bytes_in_range(0, 99) == [bytes(b) for b in blocks]
+            assert await block_store.get_blocks_by_hash([b.header_hash for b in blocks]) == blocks
+            assert set(await block_store.get_full_blocks_at([uint32(10), uint32(70)])) == {blocks[10], blocks[70]}
+
+            # the archive is picked up again when re-opened
+            archive.close()
+            archive = BlockArchive.open(tmp_dir / "archive", segment_blocks=20)
+            assert archive.archived_height() == 60
+            assert archive.get(10, blocks[10].header_hash) is not None
+            assert archive.get(10, blocks[11].header_hash) is None
+            assert archive.get(60, blocks[60].header_hash) is None
+        finally:
+            bc.shut_down()
+            archive.close()
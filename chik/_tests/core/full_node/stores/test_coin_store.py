@@ -987,3 +987,105 @@ async def test_rollback_to_block_spent_index_update() -> None:
             assert await get_spent_index(conn, reward_coin.name()) == 0
             # The potential ff singleton child should be marked with -1
             assert await get_spent_index(conn, same_as_parent_child.name()) == -1
+
+
+@pytest.mark.anyio
+async def test_write_behind() -> None:
+    """
+    In write-behind mode, the coin set changes of new blocks are buffered in
+    memory, but still visible through the coin record lookups. They reach the
+    DB once flushed.
+    """
+    async with DBConnection(2) as db_wrapper:
+        coin_store = await CoinStore.create(db_wrapper)
+        parent = Coin(bytes32([0] * 32), bytes32([1] * 32), uint64(1337))
+        await coin_store.new_block(uint32(0), uint64(1), [], [(parent.name(), parent, False)], [])
+
+        coin_store.set_write_behind(True)
+        child = Coin(parent.name(), bytes32([2] * 32), uint64(42))
+        same_as_parent = Coin(parent.name(), parent.puzzle_hash, parent.amount)
+        rewards = [Coin(bytes32([3] * 32), bytes32([3] * 32), uint64(i + 1)) for i in range(2)]
+        await coin_store.new_block(
+            uint32(1),
+            uint64(2),
+            rewards,
+            [(child.name(), child, False), (same_as_parent.name(), same_as_parent, True)],
+            [parent.name()],
+        )
+        assert coin_store.pending_count() == 5
+        # nothing was written to the DB yet
+        async with db_wrapper.reader_no_transaction() as conn:
+            assert await get_spent_index(conn, parent.name()) == 0
+            cursor = await conn.execute("SELECT COUNT(*) FROM coin_record")
+            row = await cursor.fetchone()
+            assert row is not None
+            assert row[0] == 1
+
+        # but the buffered changes are visible
+        record = await coin_store.get_coin_record(parent.name())
+        assert record is not None
+        assert record.spent_block_index == 1
+        record = await coin_store.get_coin_record(child.name())
+        assert record is not None
+        assert record.confirmed_block_index == 1
+        assert not record.spent
+        records = await coin_store.get_coin_records([parent.name(), child.name(), rewards[0].name()])
+        assert {r.name: r.spent_block_index for r in records} == {
+            parent.name(): 1,
+            child.name(): 0,
+            rewards[0].name(): 0,
+        }
+        assert {r.name for r in await coin_store.get_coins_added_at_height(uint32(1))} == {
+            child.name(),
+            same_as_parent.name(),
+            rewards[0].name(),
+            rewards[1].name(),
+        }
+        assert [r.name for r in await coin_store.get_coins_removed_at_height(uint32(1))] == [parent.name()]
+
+        # spending a buffered coin
+        rewards_2 = [Coin(bytes32([4] * 32), bytes32([4] * 32), uint64(i + 1)) for i in range(2)]
+        await coin_store.new_block(uint32(2), uint64(3), rewards_2, [], [child.name()])
+        record = await coin_store.get_coin_record(child.name())
+        assert record is not None
+        assert record.spent_block_index == 2
+
+        # undo the last block
+        coin_store.rollback_pending(1)
+        record = await coin_store.get_coin_record(child.name())
+        assert record is not None
+        assert not record.spent
+        assert coin_store.pending_count() == 5
+
+        await coin_store.flush_pending()
+        assert coin_store.pending_count() == 0
+        coin_store.set_write_behind(False)
+        async with db_wrapper.reader_no_transaction() as conn:
+            assert await get_spent_index(conn, parent.name()) == 1
+            assert await get_spent_index(conn, child.name()) == 0
+            assert await get_spent_index(conn, same_as_parent.name()) == -1
+            assert await get_spent_index(conn, rewards[0].name()) == 0
+
+
+@pytest.mark.anyio
+async def test_write_behind_rollback_to_block() -> None:
+    """
+    rollback_to_block() flushes buffered changes first, so they are rolled
+    back and reported like the ones already in the DB.
+    """
+    async with DBConnection(2) as db_wrapper:
+        coin_store = await CoinStore.create(db_wrapper)
+        parent = Coin(bytes32([0] * 32), bytes32([1] * 32), uint64(1337))
+        await coin_store.new_block(uint32(0), uint64(1), [], [(parent.name(), parent, False)], [])
+
+        coin_store.set_write_behind(True)
+        rewards = [Coin(bytes32([3] * 32), bytes32([3] * 32), uint64(i + 1)) for i in range(2)]
+        await coin_store.new_block(uint32(1), uint64(2), rewards, [], [parent.name()])
+
+        changes = await coin_store.rollback_to_block(0)
+        assert coin_store.pending_count() == 0
+        assert set(changes.keys()) == {parent.name(), rewards[0].name(), rewards[1].name()}
+        record = await coin_store.get_coin_record(parent.name())
+        assert record is not None
+        assert not record.spent
+        assert await coin_store.get_coin_record(rewards[0].name()) is None
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Optional, cast
+
+import pytest
+from chik_rs import FullBlock
+from chik_rs.sized_ints import uint16
+
+from chik.full_node.block_fetcher import BlockFetcher
+from chik.protocols.full_node_protocol import RequestBlocks, RespondBlocks
+from chik.protocols.outbound_message import Message
+from chik.server.ws_connection import WSChikConnection
+from chik.types.peer_info import PeerInfo
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class FakePeer:
+    blocks: list[FullBlock]
+    delay: float = 0.0
+    # when set, the peer never responds (simulating a timeout)
+    unresponsive: bool = False
+    closed: bool = False
+    peer_info: PeerInfo = field(default_factory=lambda: PeerInfo("127.0.0.1", uint16(8444)))
+    requests: list[tuple[int, int]] = field(default_factory=list)
+
+    async def call_api(self, request_method: Any, message: RequestBlocks, timeout: int) -> Optional[RespondBlocks]:
+        self.requests.append((message.start_height, message.end_height))
+        if self.unresponsive:
+            return None
+        await asyncio.sleep(self.delay)
+        return RespondBlocks(
+            message.start_height,
+            message.end_height,
+            self.blocks[message.start_height : message.end_height + 1],
+        )
+
+    def send_delay(self, message: Message) -> float:
+        return 0.0
+
+    async def close(self, ban_time: int = 0) -> None:
+        self.closed = True
+
+
+async def run_fetcher(peers: list[FakePeer], end_height: int, **kwargs: Any) -> tuple[bool, list[list[FullBlock]]]:
+    queue: asyncio.Queue[Optional[tuple[WSChikConnection, list[FullBlock]]]] = asyncio.Queue()
+    fetcher = BlockFetcher(
+        log=log,
+        get_peers=lambda: cast(list[WSChikConnection], peers),
+        peers_changed=asyncio.Event(),
+        start_height=0,
+        end_height=end_height,
+        batch_size=32,
+        **kwargs,
+    )
+    ret = await fetcher.run(queue)
+    batches = []
+    while not queue.empty():
+        item = queue.get_nowait()
+        assert item is not None
+        batches.append(item[1])
+    return ret, batches
+
+
+@pytest.mark.anyio
+async def test_fetch_in_order(default_400_blocks: list[FullBlock]) -> None:
+    # the first peer is much slower than the others, so responses arrive out
+    # of order. They must still come out in height order
+    peers = [FakePeer(default_400_blocks, delay=0.3)] + [FakePeer(default_400_blocks, delay=0.01) for _ in range(3)]
+    ret, batches = await run_fetcher(peers, len(default_400_blocks) - 1, window=4)
+    assert ret
+    fetched = [b for batch in batches for b in batch]
+    assert [b.height for b in fetched] == list(range(len(default_400_blocks)))
+    # all peers were used
+    assert all(len(p.requests) > 0 for p in peers)
+
+
+@pytest.mark.anyio
+async def test_fetch_reissue_failed(default_400_blocks: list[FullBlock]) -> None:
+    bad_peer = FakePeer(default_400_blocks, unresponsive=True)
+    good_peer = FakePeer(default_400_blocks)
+    ret, batches = await run_fetcher([bad_peer, good_peer], 99)
+    assert ret
+    assert [b.height for batch in batches for b in batch] == list(range(100))
+    assert bad_peer.closed
+    assert not good_peer.closed
+
+
+@pytest.mark.anyio
+async def test_fetch_straggler(default_400_blocks: list[FullBlock]) -> None:
+    slow_peer = FakePeer(default_400_blocks, delay=30)
+    fast_peer = FakePeer(default_400_blocks)
+    ret, batches = await run_fetcher([slow_peer, fast_peer], 99, straggler_timeout=0.2)
+    assert ret
+    assert [b.height for batch in batches for b in batch] == list(range(100))
+    # the slow peer was not closed, its request was just superseded
+    assert not slow_peer.closed
+
+
+@pytest.mark.anyio
+async def test_fetch_no_peers(default_400_blocks: list[FullBlock]) -> None:
+    peers = [FakePeer(default_400_blocks, unresponsive=True) for _ in range(2)]
+    ret, batches = await run_fetcher(peers, 99)
+    assert not ret
+    assert batches == []
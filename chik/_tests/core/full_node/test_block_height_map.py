@@ -11,7 +11,7 @@ from chik_rs.sized_bytes import bytes32
 from chik_rs.sized_ints import uint8, uint32
 
 from chik._tests.util.db_connection import DBConnection
-from chik.full_node.block_height_map import BlockHeightMap, SesCache
+from chik.full_node.block_height_map import BlockHeightMap, HeightToHashReader, SesCache
 from chik.util.db_wrapper import DBWrapper2
 from chik.util.files import write_file_async
 
@@ -514,6 +514,70 @@ class TestBlockHeightMap:
                 for idx in range(2000):
                     assert new_heights[idx * 32 : idx * 32 + 32] == gen_block_hash(idx)
 
+    @pytest.mark.anyio
+    async def test_cache_file_rollback(self, tmp_dir: Path, db_version: int) -> None:
+        # rolling back leaves the cache file as is, it's only shrunk when it's
+        # flushed or closed
+        async with DBConnection(db_version) as db_wrapper:
+            await setup_db(db_wrapper)
+            await setup_chain(db_wrapper, 2000, ses_every=20)
+            bh = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            assert os.path.getsize(tmp_dir / "height-to-hash") == 2001 * 32
+
+            bh.rollback(1499)
+            assert os.path.getsize(tmp_dir / "height-to-hash") == 2001 * 32
+            assert bh.contains_height(uint32(1499))
+            assert not bh.contains_height(uint32(1500))
+
+            # appending reuses the room left by the rollback
+            bh.update_height(uint32(1500), gen_block_hash(1500), None)
+            assert bh.get_hash(uint32(1500)) == gen_block_hash(1500)
+            assert os.path.getsize(tmp_dir / "height-to-hash") == 2001 * 32
+
+            # closing drops the records past the peak
+            bh.close()
+            assert os.path.getsize(tmp_dir / "height-to-hash") == 1501 * 32
+
+    @pytest.mark.anyio
+    async def test_reader(self, tmp_dir: Path, db_version: int) -> None:
+        async with DBConnection(db_version) as db_wrapper:
+            await setup_db(db_wrapper)
+            await setup_chain(db_wrapper, 2000, ses_every=20)
+            bh = await BlockHeightMap.create(tmp_dir, db_wrapper)
+
+            with HeightToHashReader(tmp_dir / "height-to-hash") as reader:
+                assert len(reader) == 2001
+                for height in range(2001):
+                    assert reader.get_hash(height) == gen_block_hash(height)
+                with pytest.raises(AssertionError):
+                    reader.get_hash(2001)
+
+            # records appended after the last flush are not covered by the
+            # header, so other processes don't see them yet
+            bh.update_height(uint32(2001), gen_block_hash(2001), None)
+            with HeightToHashReader(tmp_dir / "height-to-hash") as reader:
+                assert len(reader) == 2001
+            bh.close()
+
+    @pytest.mark.anyio
+    async def test_cache_file_torn_tail(self, tmp_dir: Path, db_version: int) -> None:
+        # if the tail of the file doesn't match the checksum in the header, the
+        # records are reloaded from the DB
+        async with DBConnection(db_version) as db_wrapper:
+            await setup_db(db_wrapper)
+            await setup_chain(db_wrapper, 2000, ses_every=20)
+            bh = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            bh.close()
+
+            with open(tmp_dir / "height-to-hash", "r+b") as f:
+                f.seek(1990 * 32)
+                f.write(bytes(32))
+
+            bh = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            for height in range(2001):
+                assert bh.get_hash(uint32(height)) == gen_block_hash(height)
+            bh.close()
+
 
 @pytest.mark.anyio
 async def test_unsupported_version(tmp_dir: Path) -> None:
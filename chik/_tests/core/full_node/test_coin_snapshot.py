@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import io
+import random
+import sqlite3
+from contextlib import closing
+from typing import Optional
+
+import pytest
+from chik_rs import Coin
+from chik_rs.sized_bytes import bytes32
+from chik_rs.sized_ints import uint64
+
+from chik.full_node.coin_snapshot import CHUNK_ROWS, CoinSnapshotError, export_coin_snapshot, import_coin_snapshot
+from chik.full_node.coin_store import COIN_RECORD_TABLE
+
+
+def make_db(rng: random.Random, num_coins: int, peak_height: int) -> sqlite3.Connection:
+    """
+    Returns a database with a chain of peak_height + 1 blocks and num_coins
+    coins. Some coins have the same puzzle hash and amount as their parent
+    """
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.execute(COIN_RECORD_TABLE)
+    conn.execute(
+        "CREATE TABLE full_blocks(header_hash blob PRIMARY KEY, height bigint, in_main_chain tinyint, block blob)"
+    )
+    conn.execute("CREATE TABLE current_peak(key int PRIMARY KEY, hash blob)")
+    for height in range(peak_height + 1):
+        conn.execute("INSERT INTO full_blocks VALUES(?, ?, 1, NULL)", (bytes32([height % 256] * 32), height))
+    conn.execute("INSERT INTO current_peak VALUES(0, ?)", (bytes32([peak_height % 256] * 32),))
+    parent: Optional[tuple[Coin, int]] = None
+    for _ in range(num_coins):
+        same_as_parent = parent is not None and rng.random() < 0.5
+        if parent is not None and same_as_parent:
+            coin = Coin(parent[0].name(), parent[0].puzzle_hash, parent[0].amount)
+            confirmed = parent[1]
+            coinbase = 0
+        else:
+            coin = Coin(bytes32.random(rng), bytes32.random(rng), uint64(rng.randint(0, 2**64 - 1)))
+            confirmed = rng.randint(0, peak_height)
+            coinbase = rng.randint(0, 1)
+        spent = rng.choice([0, rng.randint(confirmed, peak_height)])
+        if spent == 0 and same_as_parent:
+            spent = -1
+        # the next coin may be a child of this one, if it's spent
+        parent = (coin, spent) if spent > 0 else None
+        conn.execute(
+            "INSERT INTO coin_record VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                coin.name(),
+                confirmed,
+                spent,
+                coinbase,
+                coin.puzzle_hash,
+                coin.parent_coin_info,
+                coin.amount.stream_to_bytes(),
+                1000 + confirmed,
+            ),
+        )
+    return conn
+
+
+def unspent_at(conn: sqlite3.Connection, height: int) -> list[tuple[bytes, ...]]:
+    """
+    Returns the coins unspent at height, the way they're expected to be
+    imported, i.e. with spent_index -1 if the coin has the same puzzle hash and
+    amount as its parent and 0 otherwise
+    """
+    with closing(
+        conn.execute(
+            "SELECT c.coin_name, c.confirmed_index, "
+            "CASE WHEN p.puzzle_hash = c.puzzle_hash AND p.amount = c.amount THEN -1 ELSE 0 END, "
+            "c.coinbase, c.puzzle_hash, c.coin_parent, c.amount, c.timestamp "
+            "FROM coin_record c LEFT JOIN coin_record p ON p.coin_name = c.coin_parent "
+            "WHERE c.confirmed_index <= ? AND (c.spent_index <= 0 OR c.spent_index > ?) ORDER BY c.coin_name",
+            (height, height),
+        )
+    ) as cursor:
+        return list(cursor.fetchall())
+
+
+def imported_coins(conn: sqlite3.Connection) -> list[tuple[bytes, ...]]:
+    with closing(
+        conn.execute(
+            "SELECT coin_name, confirmed_index, spent_index, coinbase, puzzle_hash, coin_parent, amount, timestamp "
+            "FROM coin_record ORDER BY coin_name"
+        )
+    ) as cursor:
+        return list(cursor.fetchall())
+
+
+@pytest.mark.parametrize("num_coins", [0, 10, CHUNK_ROWS + 10])
+def test_export_import(seeded_random: random.Random, num_coins: int) -> None:
+    with closing(make_db(seeded_random, num_coins, 50)) as src:
+        buf = io.BytesIO()
+        header = export_coin_snapshot(src, buf)
+        assert header.height == 50
+        expected = unspent_at(src, 50)
+        assert header.coin_count == len(expected)
+
+    with closing(make_db(seeded_random, 0, 50)) as dst:
+        dst.execute("DROP TABLE coin_record")
+        buf.seek(0)
+        import_coin_snapshot(dst, buf)
+        assert imported_coins(dst) == expected
+        # all unspent coins were imported
+        with closing(dst.execute("SELECT COUNT(*) FROM coin_record")) as cursor:
+            row = cursor.fetchone()
+            assert row is not None
+            assert row[0] == len(expected)
+        with closing(dst.execute("SELECT name FROM sqlite_master WHERE type='index'")) as cursor:
+            indexes = {r[0] for r in cursor.fetchall()}
+        assert "coin_puzzle_hash" in indexes
+        assert "coin_record_ph_ff_unspent_idx" in indexes
+
+
+def test_export_at_height(seeded_random: random.Random) -> None:
+    with closing(make_db(seeded_random, 100, 50)) as src:
+        # a coin with the same puzzle hash and amount as its parent, spent
+        # after the snapshot height
+        parent = Coin(bytes32.random(seeded_random), bytes32.random(seeded_random), uint64(1))
+        child = Coin(parent.name(), parent.puzzle_hash, parent.amount)
+        for coin, confirmed, spent in [(parent, 5, 10), (child, 10, 30)]:
+            src.execute(
+                "INSERT INTO coin_record VALUES(?, ?, ?, 0, ?, ?, ?, 0)",
+                (
+                    coin.name(),
+                    confirmed,
+                    spent,
+                    coin.puzzle_hash,
+                    coin.parent_coin_info,
+                    coin.amount.stream_to_bytes(),
+                ),
+            )
+        buf = io.BytesIO()
+        header = export_coin_snapshot(src, buf, height=20)
+        assert header.height == 20
+        expected = unspent_at(src, 20)
+
+    # the child was unspent at the snapshot height and keeps its flag
+    assert [row[2] for row in expected if row[0] == child.name()] == [-1]
+
+    with closing(make_db(seeded_random, 0, 20)) as dst:
+        buf.seek(0)
+        import_coin_snapshot(dst, buf)
+        assert imported_coins(dst) == expected
+
+    # the snapshot can only be imported into a database whose peak is the
+    # snapshot block
+    for peak_height in [10, 50]:
+        with closing(make_db(seeded_random, 0, peak_height)) as dst:
+            buf.seek(0)
+            with pytest.raises(CoinSnapshotError, match="peak of the database"):
+                import_coin_snapshot(dst, buf)
+    with closing(sqlite3.connect(":memory:", isolation_level=None)) as dst:
+        buf.seek(0)
+        with pytest.raises(CoinSnapshotError, match="peak of the database"):
+            import_coin_snapshot(dst, buf)
+
+
+def test_import_tampered(seeded_random: random.Random) -> None:
+    with closing(make_db(seeded_random, 100, 50)) as src:
+        buf = io.BytesIO()
+        export_coin_snapshot(src, buf)
+
+    # flip a byte of the commitment in the footer
+    data = bytearray(buf.getvalue())
+    data[-1] ^= 1
+    with closing(make_db(seeded_random, 0, 50)) as dst:
+        dst.execute("DROP TABLE coin_record")
+        with pytest.raises(CoinSnapshotError, match="commitment mismatch"):
+            import_coin_snapshot(dst, io.BytesIO(data))
+        # nothing was committed
+        with closing(dst.execute("SELECT name FROM sqlite_master WHERE name='coin_record'")) as cursor:
+            assert cursor.fetchone() is None
+
+
+def test_import_not_empty(seeded_random: random.Random) -> None:
+    with closing(make_db(seeded_random, 10, 50)) as src:
+        buf = io.BytesIO()
+        export_coin_snapshot(src, buf)
+        buf.seek(0)
+        with pytest.raises(CoinSnapshotError, match="not empty"):
+            import_coin_snapshot(src, buf)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import pytest
+from chik_rs import Coin
+from chik_rs.sized_bytes import bytes32
+from chik_rs.sized_ints import uint32, uint64
+
+from chik._tests.util.db_connection import DBConnection
+from chik.full_node.block_store import BlockStore
+from chik.full_node.coin_store import CoinStore
+from chik.full_node.deferred_indexes import (
+    DEFERRABLE_INDEXES,
+    drop_deferrable_indexes,
+    has_deferred_indexes,
+    rebuild_deferred_indexes,
+)
+from chik.full_node.hint_store import HintStore
+from chik.util.db_wrapper import DBWrapper2
+
+
+async def get_indexes(db_wrapper: DBWrapper2) -> set[str]:
+    async with db_wrapper.reader_no_transaction() as conn:
+        # the deferred_indexes table has an index of its own
+        async with conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name != 'deferred_indexes'"
+        ) as cursor:
+            return {row[0] for row in await cursor.fetchall()}
+
+
+@pytest.mark.anyio
+async def test_drop_and_rebuild() -> None:
+    async with DBConnection(2) as db_wrapper:
+        block_store = await BlockStore.create(db_wrapper)
+        hint_store = await HintStore.create(db_wrapper)
+        coin_store = await CoinStore.create(db_wrapper)
+        before = await get_indexes(db_wrapper)
+        assert set(DEFERRABLE_INDEXES) <= before
+        assert not await has_deferred_indexes(db_wrapper)
+
+        dropped = await drop_deferrable_indexes(db_wrapper)
+        assert set(dropped) == set(DEFERRABLE_INDEXES)
+        assert await get_indexes(db_wrapper) == before - set(DEFERRABLE_INDEXES)
+        assert await has_deferred_indexes(db_wrapper)
+
+        # the stores can still be queried while the indexes are missing
+        await coin_store.refresh_indexes()
+        await hint_store.refresh_indexes()
+        assert await coin_store.get_unspent_lineage_info_for_puzzle_hash(bytes32.zeros) is None
+        assert await coin_store.get_coin_records_by_puzzle_hash(True, bytes32.zeros) == []
+        assert await coin_store.get_coin_records_by_puzzle_hashes(True, [bytes32.zeros]) == []
+        assert await coin_store.get_coin_records_by_parent_ids(True, [bytes32.zeros]) == []
+        assert await coin_store.get_coin_states_by_puzzle_hashes(True, {bytes32.zeros}) == set()
+        assert await coin_store.rollback_to_block(0) == {}
+        assert await hint_store.get_coin_ids_multi({bytes32.zeros}) == []
+        await block_store.rollback(0)
+
+        assert await rebuild_deferred_indexes(db_wrapper) == len(DEFERRABLE_INDEXES)
+        assert await get_indexes(db_wrapper) == before
+        assert not await has_deferred_indexes(db_wrapper)
+        assert await rebuild_deferred_indexes(db_wrapper) == 0
+
+
+@pytest.mark.anyio
+async def test_rebuild_after_restart() -> None:
+    async with DBConnection(2) as db_wrapper:
+        await BlockStore.create(db_wrapper)
+        await HintStore.create(db_wrapper)
+        coin_store = await CoinStore.create(db_wrapper)
+        coin = Coin(bytes32.zeros, bytes32.zeros, uint64(1))
+        await coin_store.new_block(uint32(0), uint64(1), [], [(coin.name(), coin, False)], [])
+        before = await get_indexes(db_wrapper)
+        await drop_deferrable_indexes(db_wrapper)
+
+        # creating the stores again re-creates most indexes, but not the
+        # partial index that's only created for new coin stores
+        await BlockStore.create(db_wrapper)
+        await HintStore.create(db_wrapper)
+        await CoinStore.create(db_wrapper)
+        assert await get_indexes(db_wrapper) == before - {"coin_record_ph_ff_unspent_idx"}
+
+        assert await rebuild_deferred_indexes(db_wrapper) == len(DEFERRABLE_INDEXES)
+        assert await get_indexes(db_wrapper) == before
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from chik_rs.sized_bytes import bytes32
+from chik_rs.sized_ints import uint32, uint64
+
+from chik.full_node.mempool_index import MempoolIndex
+
+
+def name(i: int) -> bytes32:
+    return bytes32(i.to_bytes(32, "big"))
+
+
+def coin(i: int) -> bytes32:
+    return bytes32(b"c" + i.to_bytes(31, "big"))
+
+
+def test_fee_rate_order() -> None:
+    index = MempoolIndex()
+    index.add(name(1), 10, 10, None, None, None, [coin(1)])
+    index.add(name(2), 10, 20, None, None, None, [coin(2)])
+    # same fee rate as item 1, but added later
+    index.add(name(3), 20, 20, None, None, None, [coin(3)])
+    index.add(name(4), 10, 0, None, None, None, [coin(4)])
+
+    assert [e.name for e in index.by_fee_rate()] == [name(2), name(1), name(3), name(4)]
+    assert [e.name for e in index.by_fee_rate_ascending()] == [name(4), name(3), name(1), name(2)]
+    assert [e.name for e in index.all_entries()] == [name(1), name(2), name(3), name(4)]
+
+    index.remove(name(1))
+    assert [e.name for e in index.by_fee_rate()] == [name(2), name(3), name(4)]
+    assert len(index) == 3
+    assert name(1) not in index
+    assert index.get(name(1)) is None
+
+
+def test_coin_ids() -> None:
+    index = MempoolIndex()
+    index.add(name(1), 10, 10, None, None, None, [coin(1), coin(2)])
+    index.add(name(2), 10, 10, None, None, None, [coin(2), coin(3)])
+
+    assert [e.name for e in index.get_by_coin_id(coin(2))] == [name(1), name(2)]
+    assert [e.name for e in index.get_by_coin_ids([coin(1), coin(2), coin(3)])] == [name(1), name(2)]
+    assert index.get_by_coin_id(coin(4)) == []
+
+    index.update_coin_id(coin(4), coin(1), name(1))
+    assert index.get_by_coin_id(coin(1)) == []
+    assert [e.name for e in index.get_by_coin_id(coin(4))] == [name(1)]
+    # an item that isn't indexed by the current coin ID is left alone
+    index.update_coin_id(coin(5), coin(1), name(2))
+    assert index.get_by_coin_id(coin(5)) == []
+
+    index.remove(name(1))
+    assert index.get_by_coin_id(coin(4)) == []
+    assert [e.name for e in index.get_by_coin_id(coin(2))] == [name(2)]
+
+
+def test_expiry() -> None:
+    index = MempoolIndex()
+    index.add(name(1), 10, 10, None, uint32(100), None, [coin(1)])
+    index.add(name(2), 10, 20, None, None, uint64(1000), [coin(2)])
+    index.add(name(3), 10, 30, uint32(5), uint32(200), uint64(2000), [coin(3)])
+    index.add(name(4), 10, 40, None, None, None, [coin(4)])
+
+    assert index.expired(99, 999) == []
+    assert index.expired(100, 999) == [name(1)]
+    assert index.expired(100, 1000) == [name(1), name(2)]
+    assert index.expired(10, 2000) == [name(2), name(3)]
+    assert index.expired(1000, 10000) == [name(1), name(2), name(3)]
+
+    assert index.expiring_before(100, 1000) == []
+    assert [e.name for e in index.expiring_before(101, 1000)] == [name(1)]
+    # in order of highest fee rate first
+    assert [e.name for e in index.expiring_before(201, 1001)] == [name(3), name(2), name(1)]
+
+    index.remove(name(3))
+    assert index.expired(1000, 10000) == [name(1), name(2)]
@@ -51,6 +51,8 @@ from chik.full_node.mempool_manager import (
     is_klvm_canonical,
     optional_max,
     optional_min,
+    prepare_spend_bundle,
+    prepared_from_item,
 )
 from chik.protocols import wallet_protocol
 from chik.protocols.full_node_protocol import RequestBlock, RespondBlock
@@ -2906,6 +2908,118 @@ async def test_create_block_generator_real_bundles(seed: int, old: bool, test_bu
     assert additions == set(new_block_gen.additions)
 
 
+@pytest.mark.anyio
+@pytest.mark.parametrize("old", [True, False])
+async def test_block_template(old: bool, transactions_1000: list[SpendBundle]) -> None:
+    bundles = transactions_1000[:20]
+    all_coins = [s.coin for b in bundles for s in b.coin_spends]
+    coins = TestCoins(all_coins, {})
+    mempool_manager = await setup_mempool(coins)
+    block_version = 0 if old else 1
+    create_block = mempool_manager.create_block_generator if old else mempool_manager.create_block_generator2
+
+    async def add_bundles(bundles: list[SpendBundle]) -> None:
+        for sb in bundles:
+            pre_validation = await mempool_manager.pre_validate_spendbundle(sb)
+            info = await mempool_manager.add_spend_bundle(sb, pre_validation, sb.name(), first_added_height=uint32(1))
+            assert info.status == MempoolInclusionStatus.SUCCESS
+
+    await add_bundles(bundles[:10])
+    assert mempool_manager.peak is not None
+    peak_hash = mempool_manager.peak.header_hash
+    assert mempool_manager.block_template_is_stale(block_version)
+    assert await mempool_manager.refresh_block_template(block_version, 10.0)
+    assert not mempool_manager.block_template_is_stale(block_version)
+    # nothing changed, so there's nothing to do
+    assert not await mempool_manager.refresh_block_template(block_version, 10.0)
+    # the template is only used for the block version it was created for
+    assert mempool_manager.block_template_is_stale(1 - block_version)
+
+    template = create_block(peak_hash, 10.0)
+    assert template is not None
+    assert create_block(peak_hash, 10.0) is template
+    assert set(template.removals) == {c for sb in bundles[:10] for c in sb.removals()}
+
+    # adding transactions invalidates the template
+    await add_bundles(bundles[10:])
+    assert mempool_manager.block_template_is_stale(block_version)
+    new_block_gen = create_block(peak_hash, 10.0)
+    assert new_block_gen is not None
+    assert new_block_gen is not template
+    assert set(new_block_gen.removals) == {c for sb in bundles for c in sb.removals()}
+
+    assert await mempool_manager.refresh_block_template(block_version, 10.0)
+    template = create_block(peak_hash, 10.0)
+    assert template is not None
+    assert set(template.removals) == set(new_block_gen.removals)
+    assert template.signature == new_block_gen.signature
+
+    # and so does a new peak
+    await advance_mempool(mempool_manager, [bundles[0].removals()[0].name()])
+    assert mempool_manager.block_template_is_stale(block_version)
+    assert create_block(peak_hash, 10.0) is None
+
+
+@pytest.mark.anyio
+async def test_new_peak_slow_path_readd(transactions_1000: list[SpendBundle]) -> None:
+    bundles = transactions_1000[:120]
+    all_coins = [s.coin for b in bundles for s in b.coin_spends]
+    coins = TestCoins(all_coins, {})
+    mempool_manager = await setup_mempool(coins)
+
+    for sb in bundles:
+        pre_validation = await mempool_manager.pre_validate_spendbundle(sb)
+        info = await mempool_manager.add_spend_bundle(sb, pre_validation, sb.name(), first_added_height=uint32(1))
+        assert info.status == MempoolInclusionStatus.SUCCESS
+
+    # the first bundles make it into the block
+    spent = [c.name() for sb in bundles[:10] for c in sb.removals()]
+    for coin_id in spent:
+        coins.spend_coin(coin_id)
+    # the remaining items are re-added in the original order
+    await advance_mempool(mempool_manager, spent, use_optimization=False)
+
+    assert [item.name for item in mempool_manager.mempool.all_items()] == [sb.name() for sb in bundles[10:]]
+    for sb in bundles[:10]:
+        assert not mempool_manager.seen(sb.name())
+    for sb in bundles[10:]:
+        assert mempool_manager.seen(sb.name())
+
+
+@pytest.mark.anyio
+async def test_prepared_from_item() -> None:
+    # rebuilding the result of prepare_spend_bundle() from a mempool item gives
+    # the same result as computing it from the spend bundle. This includes a
+    # fast forward spend that isn't marked as such in the item, because the
+    # singleton didn't have an unspent lineage when the item was added
+    singleton_spend = make_singleton_spend(bytes32([1] * 32), bytes32([2] * 32))
+    coins = TestCoins(coins=[singleton_spend.coin, TEST_COIN], lineage={})
+    mempool_manager = await setup_mempool(coins)
+    coin_spend = make_spend(
+        TEST_COIN, IDENTITY_PUZZLE, Program.to([[ConditionOpcode.CREATE_COIN, IDENTITY_PUZZLE_HASH, 42]])
+    )
+    sb = SpendBundle([singleton_spend, coin_spend], G2Element())
+    conds = make_test_conds(
+        spend_ids=[(singleton_spend.coin, ELIGIBLE_FOR_FF), (TEST_COIN, 0)],
+        created_coins=[[], [(IDENTITY_PUZZLE_HASH, 42, None)]],
+        cost=100_000_000,
+    )
+    info = await mempool_manager.add_spend_bundle(sb, conds, sb.name(), uint32(1))
+    assert info.status == MempoolInclusionStatus.SUCCESS
+    item = mempool_manager.get_mempool_item(sb.name())
+    assert item is not None
+    assert not item.bundle_coin_spends[singleton_spend.coin.name()].eligible_for_fast_forward
+
+    _, expected = prepare_spend_bundle(sb, conds)
+    assert expected is not None
+    assert expected.spends[singleton_spend.coin.name()][1].ff_puzzle_hash == singleton_spend.coin.puzzle_hash
+    assert len(expected.additions_dict) == 1
+    assert prepared_from_item(item) == expected
+
+    # an item without the spends to rebuild it from
+    assert prepared_from_item(dataclasses.replace(item, bundle_coin_spends={})) is None
+
+
 @pytest.mark.anyio
 async def test_spending_singleton_to_invalidate_existing_ff_spends() -> None:
     """
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import pytest
+import zstd
+from chik_rs.sized_ints import uint8
+
+from chik.protocols.outbound_message import Message
+from chik.protocols.protocol_message_types import ProtocolMessageTypes
+from chik.server.compression import (
+    CompressedPayload,
+    compress_payload,
+    concatenate_frames,
+    decompress_payload,
+    frame_content_size,
+    is_compressed_type,
+    uncompressed_size,
+)
+
+
+def test_round_trip() -> None:
+    data = b"foobar" * 1000
+    payload = compress_payload(data)
+    assert isinstance(payload, CompressedPayload)
+    assert len(payload) < len(data)
+    assert uncompressed_size(payload) == len(data)
+    assert uncompressed_size(data) == len(data)
+    assert decompress_payload(payload) == data
+    # the payload survives being put in a Message
+    msg = Message(uint8(ProtocolMessageTypes.respond_block.value), None, payload)
+    assert isinstance(msg.data, CompressedPayload)
+
+
+@pytest.mark.parametrize("size", [0, 1, 255, 256, 65791, 65792, 1000000])
+def test_frame_content_size(size: int) -> None:
+    assert frame_content_size(zstd.compress(bytes(size))) == size
+
+
+def test_concatenate_frames() -> None:
+    blobs = [bytes([i]) * (i * 100 + 1) for i in range(10)]
+    payload = concatenate_frames(b"prefix", [zstd.compress(b) for b in blobs])
+    expected = b"prefix" + b"".join(blobs)
+    assert payload.size == len(expected)
+    assert decompress_payload(payload) == expected
+
+
+def test_invalid_payloads() -> None:
+    payload = compress_payload(bytes(1000))
+    # larger than the limit
+    with pytest.raises(ValueError, match="too large"):
+        decompress_payload(payload, max_size=999)
+    assert decompress_payload(payload, max_size=1000) == bytes(1000)
+
+    with pytest.raises(ValueError, match="truncated"):
+        decompress_payload(payload[:-1])
+    with pytest.raises(ValueError, match="truncated"):
+        decompress_payload(payload + b"\x00")
+    with pytest.raises(ValueError, match="not a zstd frame"):
+        decompress_payload(CompressedPayload([b"not compressed"], 14))
+
+
+def test_compressed_types() -> None:
+    assert is_compressed_type(ProtocolMessageTypes.respond_blocks.value)
+    assert not is_compressed_type(ProtocolMessageTypes.new_peak.value)
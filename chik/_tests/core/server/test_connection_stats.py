@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from chik.protocols.protocol_message_types import ProtocolMessageTypes
+from chik.server.connection_stats import LATENCY_BUCKETS, ConnectionStats, Histogram, format_prometheus
+
+
+def test_histogram() -> None:
+    histogram = Histogram()
+    histogram.add(0.0005)
+    # the bounds are inclusive
+    histogram.add(0.001)
+    histogram.add(0.3)
+    histogram.add(1000)
+    assert histogram.count == 4
+    assert histogram.total == 0.0005 + 0.001 + 0.3 + 1000
+    assert histogram.counts[0] == 2
+    assert histogram.counts[LATENCY_BUCKETS.index(0.5)] == 1
+    assert histogram.counts[-1] == 1
+    assert sum(histogram.counts) == 4
+
+
+def test_connection_stats() -> None:
+    stats = ConnectionStats()
+    stats.add_handler_time(ProtocolMessageTypes.request_block.value, 0.02)
+    stats.add_queue_wait(ProtocolMessageTypes.request_block.value, 0.002)
+    stats.add_response_latency(ProtocolMessageTypes.request_blocks.value, 0.2)
+    # unknown message types are ignored
+    stats.add_handler_time(250, 0.02)
+    stats.message_queued(3)
+    stats.message_queued(1)
+
+    json_dict = stats.to_json_dict(outbound_queue=1)
+    assert json_dict["messages_in"] == 2
+    assert json_dict["messages_out"] == 2
+    assert json_dict["max_outbound_queue"] == 3
+    assert json_dict["outbound_queue"] == 1
+    assert list(json_dict["handler_time"]) == ["request_block"]
+    assert json_dict["response_latency"]["request_blocks"]["count"] == 1
+
+    text = format_prometheus([({"node_id": "ab", "peer_host": '1"2'}, stats, 1)])
+    labels = 'node_id="ab",peer_host="1\\"2",message_type="request_block"'
+    assert f'chik_peer_handler_seconds_bucket{{{labels},le="0.01"}} 0' in text
+    assert f'chik_peer_handler_seconds_bucket{{{labels},le="0.025"}} 1' in text
+    assert f'chik_peer_handler_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+    assert f"chik_peer_handler_seconds_count{{{labels}}} 1" in text
+    assert 'chik_peer_outbound_queue_max{node_id="ab",peer_host="1\\"2"} 3' in text
+    assert "# TYPE chik_peer_response_seconds histogram" in text
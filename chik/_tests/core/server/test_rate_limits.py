@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import math
 
 import pytest
 from chik_rs.sized_ints import uint32
@@ -13,7 +14,7 @@ from chik.protocols.protocol_message_types import ProtocolMessageTypes
 from chik.protocols.shared_protocol import Capability
 from chik.server.rate_limit_numbers import compose_rate_limits, get_rate_limits_to_use
 from chik.server.rate_limit_numbers import rate_limits as rl_numbers
-from chik.server.rate_limits import RateLimiter
+from chik.server.rate_limits import RateLimiter, TokenBucket
 from chik.server.server import ChikServer
 from chik.server.ws_connection import WSChikConnection
 from chik.simulator.block_tools import BlockTools
@@ -376,6 +377,51 @@ class TestRateLimits:
         assert ProtocolMessageTypes.request_block not in rl_1["rate_limits_tx"]
 
 
+def test_token_bucket() -> None:
+    bucket = TokenBucket.full(10, 60, 1000.0)
+    assert bucket.wait_time(10, 1000.0) == 0.0
+    assert bucket.wait_time(11, 1000.0) == math.inf
+    bucket.consume(10)
+    # refills at 10 / 60 per second
+    assert bucket.wait_time(1, 1000.0) == pytest.approx(6.0)
+    assert bucket.wait_time(1, 1003.0) == pytest.approx(3.0)
+    assert bucket.wait_time(1, 1006.0) == 0.0
+    # it never holds more than its capacity
+    assert bucket.wait_time(10, 10000.0) == 0.0
+    assert bucket.tokens == 10
+    # recording more than is available empties it
+    bucket.consume(20)
+    assert bucket.tokens == 0
+
+
+def test_send_delay() -> None:
+    r = RateLimiter(incoming=False)
+    message = make_msg(ProtocolMessageTypes.respond_peers, bytes([1]))
+    for i in range(10):
+        assert r.send_delay(message, rl_v2, rl_v2) == 0.0
+        assert r.process_msg_and_check(message, rl_v2, rl_v2) is None
+    assert r.process_msg_and_check(message, rl_v2, rl_v2) is not None
+    # respond_peers is limited to 10 messages per minute
+    assert 0 < r.send_delay(message, rl_v2, rl_v2) <= 6.0
+
+    too_large = make_msg(ProtocolMessageTypes.new_transaction, bytes([1] * 1024))
+    assert r.send_delay(too_large, rl_v2, rl_v2) == math.inf
+    assert r.process_msg_and_check(too_large, rl_v2, rl_v2) is not None
+
+    stats = r.get_stats()
+    assert stats["allowed"] == 10
+    assert stats["limited"] == 2
+    assert stats["limited_by_type"] == {"respond_peers": 1, "new_transaction": 1}
+
+
+@pytest.mark.parametrize("message_type", [ProtocolMessageTypes.respond_block, ProtocolMessageTypes.new_transaction])
+def test_max_message_size(message_type: ProtocolMessageTypes) -> None:
+    r = RateLimiter(incoming=True)
+    max_size = r.max_message_size(message_type, rl_v2, rl_v2)
+    assert r.send_delay(make_msg(message_type, bytes(max_size)), rl_v2, rl_v2) != math.inf
+    assert r.send_delay(make_msg(message_type, bytes(max_size + 1)), rl_v2, rl_v2) == math.inf
+
+
 @pytest.mark.anyio
 @pytest.mark.parametrize(
     "msg_type, size",
@@ -6,7 +6,7 @@ from typing import Callable, ClassVar, cast
 
 import pytest
 from chik_rs.sized_bytes import bytes32
-from chik_rs.sized_ints import int16, uint32
+from chik_rs.sized_ints import int16, uint32, uint64
 from packaging.version import Version
 
 from chik import __version__
@@ -14,7 +14,7 @@ from chik._tests.connection_utils import connect_and_get_peer
 from chik._tests.util.setup_nodes import SimulatorsAndWalletsServices
 from chik._tests.util.time_out_assert import time_out_assert
 from chik.full_node.full_node_api import FullNodeAPI
-from chik.protocols.full_node_protocol import RejectBlock, RequestBlock, RequestTransaction
+from chik.protocols.full_node_protocol import NewTransaction, RejectBlock, RequestBlock, RequestTransaction
 from chik.protocols.outbound_message import NodeType, make_msg
 from chik.protocols.protocol_message_types import ProtocolMessageTypes
 from chik.protocols.shared_protocol import Error, protocol_version
@@ -177,6 +177,57 @@ async def test_error_receive(
         await time_out_assert(10, error_log_found, True, wallet_connection)
 
 
+@pytest.mark.anyio
+async def test_broadcast_stats(
+    two_nodes: tuple[FullNodeAPI, FullNodeAPI, ChikServer, ChikServer, BlockTools], self_hostname: str
+) -> None:
+    _, _, server_1, server_2, _ = two_nodes
+    assert await server_1.start_client(PeerInfo(self_hostname, server_2.get_port()), None)
+
+    messages = [
+        make_msg(ProtocolMessageTypes.new_transaction, NewTransaction(bytes32([i] * 32), uint64(100), uint64(0)))
+        for i in range(3)
+    ]
+    await server_1.send_to_all(messages, NodeType.FULL_NODE)
+    # there's no one to broadcast to
+    await server_1.send_to_all(messages, NodeType.WALLET)
+    assert server_1.broadcast_stats.broadcasts == 3
+    assert server_1.broadcast_stats.sends == 3
+
+    def all_sent() -> int:
+        return server_1.broadcast_stats.broadcasts_by_type.get("new_transaction", 0)
+
+    await time_out_assert(10, all_sent, 3)
+    stats = server_1.get_broadcast_stats()
+    assert stats["max_fanout_time"] <= stats["total_fanout_time"]
+    assert stats["max_fanout_time_by_type"]["new_transaction"] == stats["max_fanout_time"]
+
+
+@pytest.mark.anyio
+async def test_connection_stats(
+    two_nodes: tuple[FullNodeAPI, FullNodeAPI, ChikServer, ChikServer, BlockTools], self_hostname: str
+) -> None:
+    _, _, server_1, server_2, _ = two_nodes
+    assert await server_1.start_client(PeerInfo(self_hostname, server_2.get_port()), None)
+
+    message = await server_1.call_api_of_specific(
+        FullNodeAPI.request_block, RequestBlock(uint32(42), False), server_2.node_id
+    )
+    assert isinstance(message, RejectBlock)
+
+    stats = server_1.all_connections[server_2.node_id].get_stats()
+    assert stats["response_latency"]["request_block"]["count"] == 1
+    assert stats["messages_out"] >= 1
+
+    def handled() -> int:
+        peer_stats = server_2.all_connections[server_1.node_id].get_stats()
+        return int(peer_stats["handler_time"].get("request_block", {}).get("count", 0))
+
+    await time_out_assert(10, handled, 1)
+    peer_stats = server_2.all_connections[server_1.node_id].get_stats()
+    assert peer_stats["queue_wait"]["request_block"]["count"] == 1
+
+
 @pytest.mark.anyio
 async def test_call_api_of_specific(
     two_nodes: tuple[FullNodeAPI, FullNodeAPI, ChikServer, ChikServer, BlockTools], self_hostname: str
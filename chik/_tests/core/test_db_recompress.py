@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import sqlite3
+from contextlib import closing
+
+from chik_rs import FullBlock
+
+from chik._tests.util.temp_file import TempFile
+from chik.cmds.db_recompress_func import recompress_blocks
+from chik.full_node.block_store import compress, decompress
+
+
+def test_recompress(default_400_blocks: list[FullBlock]) -> None:
+    blocks = default_400_blocks[:50]
+    with TempFile() as db_file:
+        with closing(sqlite3.connect(db_file)) as conn:
+            conn.execute("CREATE TABLE full_blocks(header_hash blob PRIMARY KEY, height bigint, block blob)")
+            conn.executemany(
+                "INSERT INTO full_blocks VALUES(?, ?, ?)", [(b.header_hash, b.height, compress(b)) for b in blocks]
+            )
+            # blocks moved to the archive are skipped
+            conn.execute("UPDATE full_blocks SET block=NULL WHERE height=0")
+            conn.commit()
+
+        count, old_size, new_size = recompress_blocks(db_file, level=19, batch_size=7)
+        assert count == len(blocks) - 1
+        assert new_size <= old_size
+
+        with closing(sqlite3.connect(db_file)) as conn:
+            with closing(conn.execute("SELECT block FROM full_blocks WHERE height > 0 ORDER BY height")) as cursor:
+                assert [decompress(row[0]) for row in cursor.fetchall()] == blocks[1:]
+
+        # the progress is recorded, there's nothing left to do at this level
+        assert recompress_blocks(db_file, level=19) == (0, 0, 0)
+        # but at a different level, all blocks are processed again
+        assert recompress_blocks(db_file, level=3)[0] == len(blocks) - 1
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import random
+import shutil
 import sqlite3
 from contextlib import closing
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 import pytest
 from chik_rs import FullBlock
@@ -17,6 +18,7 @@ from chik.consensus.block_body_validation import ForkInfo
 from chik.consensus.blockchain import Blockchain
 from chik.consensus.default_constants import DEFAULT_CONSTANTS
 from chik.consensus.multiprocess_validation import PreValidationResult
+from chik.full_node.block_archive import BlockArchive, archive_directory, segment_filename
 from chik.full_node.block_height_map import BlockHeightMap
 from chik.full_node.block_store import BlockStore
 from chik.full_node.coin_store import CoinStore
@@ -135,14 +137,14 @@ def test_db_validate_in_main_chain(invalid_in_chain: bool, default_config: dict[
             validate_v2(db_file, config=default_config, validate_blocks=False)
 
 
-async def make_db(db_file: Path, blocks: list[FullBlock]) -> None:
+async def make_db(db_file: Path, blocks: list[FullBlock], archive: Optional[BlockArchive] = None) -> None:
     async with DBWrapper2.managed(database=db_file, reader_count=1, db_version=2) as db_wrapper:
         async with db_wrapper.writer_maybe_transaction() as conn:
             # this is done by chik init normally
             await conn.execute("CREATE TABLE database_version(version int)")
             await conn.execute("INSERT INTO database_version VALUES (2)")
 
-        block_store = await BlockStore.create(db_wrapper)
+        block_store = await BlockStore.create(db_wrapper, archive=archive)
         coin_store = await CoinStore.create(db_wrapper)
         height_map = await BlockHeightMap.create(Path("."), db_wrapper)
 
@@ -156,6 +158,8 @@ async def make_db(db_file: Path, blocks: list[FullBlock]) -> None:
             fork_info = ForkInfo(block.height - 1, block.height - 1, block.prev_header_hash)
             _, err, _ = await bc.add_block(block, results, sub_slot_iters=sub_slot_iters, fork_info=fork_info)
             assert err is None
+        if archive is not None:
+            await block_store.archive_blocks(blocks[-1].height)
 
 
 @pytest.mark.anyio
@@ -175,3 +179,27 @@ async def test_db_validate_default_1000_blocks(
             default_1000_blocks[0].foliage.prev_block_hash.hex()
         )
         validate_v2(db_file, config=default_config, validate_blocks=True)
+
+
+@pytest.mark.anyio
+async def test_db_validate_block_archive(default_1000_blocks: list[FullBlock], default_config: dict[str, Any]) -> None:
+    default_config["full_node"]["network_overrides"]["constants"]["local"]["AGG_SIG_ME_ADDITIONAL_DATA"] = (
+        default_1000_blocks[0].foliage.prev_block_hash.hex()
+    )
+    with TempFile() as db_file:
+        archive = BlockArchive.open(archive_directory(db_file), segment_blocks=300)
+        try:
+            await make_db(db_file, default_1000_blocks, archive)
+            assert archive.archived_height() == 900
+        finally:
+            archive.close()
+
+        try:
+            # the archived blocks are validated from the segment files
+            validate_v2(db_file, config=default_config, validate_blocks=True)
+
+            segment_filename(archive_directory(db_file), 600).unlink()
+            with pytest.raises(RuntimeError, match="is missing from the block archive"):
+                validate_v2(db_file, config=default_config, validate_blocks=True)
+        finally:
+            shutil.rmtree(archive_directory(db_file))
@@ -13,7 +13,17 @@ from _pytest.fixtures import SubRequest
 
 from chik._tests.util.db_connection import DBConnection, PathDBConnection
 from chik._tests.util.misc import Marks, boolean_datacases, datacases
-from chik.util.db_wrapper import DBWrapper2, ForeignKeyError, InternalError, NestedForeignKeyDelayedRequestError
+from chik.util.db_wrapper import (
+    SQLITE_MAX_VARIABLE_NUMBER,
+    DBWrapper2,
+    ForeignKeyError,
+    InternalError,
+    NestedForeignKeyDelayedRequestError,
+    ReaderPriority,
+    bucketed_parameters,
+    db_reader_context,
+    generate_in_memory_db_uri,
+)
 from chik.util.task_referencer import create_referenced_task
 
 if TYPE_CHECKING:
@@ -562,3 +572,169 @@ async def test_delayed_foreign_key_request_fails_when_nested(initial: bool) -> N
             with pytest.raises(NestedForeignKeyDelayedRequestError):
                 async with db_wrapper.writer(foreign_key_enforcement_enabled=True):
                     pass  # pragma: no cover
+
+
+async def hold_reader(db_wrapper: DBWrapper2, acquired: asyncio.Event, release: asyncio.Event) -> None:
+    async with db_wrapper.reader_no_transaction() as connection:
+        await query_value(connection)
+        acquired.set()
+        await release.wait()
+
+
+@pytest.mark.anyio
+async def test_reader_pool_grows_and_shrinks() -> None:
+    async with DBWrapper2.managed(
+        database=generate_in_memory_db_uri(), uri=True, reader_count=1, max_reader_count=3, db_version=2
+    ) as db_wrapper:
+        await setup_table(db_wrapper)
+        db_wrapper._grow_wait = 0.01
+
+        release = asyncio.Event()
+        events = [asyncio.Event() for _ in range(3)]
+        tasks = [create_referenced_task(hold_reader(db_wrapper, e, release)) for e in events]
+        # all three readers are held at the same time, so the pool must have grown
+        await asyncio.wait_for(asyncio.gather(*(e.wait() for e in events)), timeout=5)
+        assert db_wrapper._num_read_connections == 3
+        assert db_wrapper.reader_stats.grown == 2
+        assert db_wrapper.reader_stats.waits >= 2
+
+        release.set()
+        await asyncio.gather(*tasks)
+
+        # readers idle for long enough are closed, down to reader_count
+        db_wrapper._idle_timeout = 0
+        output: list[int] = []
+        await sum_counter(db_wrapper, output)
+        assert db_wrapper._num_read_connections == 1
+        assert db_wrapper.reader_stats.shrunk == 2
+
+
+@pytest.mark.anyio
+async def test_reader_pool_priority() -> None:
+    async with DBWrapper2.managed(
+        database=generate_in_memory_db_uri(), uri=True, reader_count=1, db_version=2
+    ) as db_wrapper:
+        await setup_table(db_wrapper)
+
+        order: list[str] = []
+
+        async def read(name: str, priority: ReaderPriority) -> None:
+            with db_reader_context(name, priority):
+                async with db_wrapper.reader_no_transaction() as connection:
+                    await query_value(connection)
+                    order.append(name)
+
+        acquired = asyncio.Event()
+        release = asyncio.Event()
+        holder = create_referenced_task(hold_reader(db_wrapper, acquired, release))
+        await acquired.wait()
+
+        normal = create_referenced_task(read("normal", ReaderPriority.normal))
+        await asyncio.sleep(0.01)
+        high = create_referenced_task(read("high", ReaderPriority.high))
+        await asyncio.sleep(0.01)
+
+        # the reader pool doesn't grow, the high priority task is handed the
+        # connection first even though it started waiting last
+        release.set()
+        await asyncio.gather(holder, normal, high)
+        assert order == ["high", "normal"]
+
+        stats = db_wrapper.get_reader_stats()
+        assert stats["readers"] == 1
+        assert stats["grown"] == 0
+        assert stats["checkouts_by_caller"]["high"] == 1
+        assert stats["checkouts_by_caller"]["normal"] == 1
+        assert stats["checkouts_by_caller"]["other"] >= 1
+
+
+@pytest.mark.anyio
+async def test_reader_pool_cancelled_waiter() -> None:
+    async with DBWrapper2.managed(
+        database=generate_in_memory_db_uri(), uri=True, reader_count=1, db_version=2
+    ) as db_wrapper:
+        await setup_table(db_wrapper)
+
+        acquired = asyncio.Event()
+        release = asyncio.Event()
+        holder = create_referenced_task(hold_reader(db_wrapper, acquired, release))
+        await acquired.wait()
+
+        output: list[int] = []
+        waiter = create_referenced_task(sum_counter(db_wrapper, output))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        release.set()
+        await holder
+        with contextlib.suppress(asyncio.CancelledError):
+            await waiter
+
+        # the connection wasn't lost to the cancelled waiter
+        await sum_counter(db_wrapper, output)
+        assert output == [0]
+
+
+@pytest.mark.parametrize(
+    "count, expected",
+    [(1, 1), (2, 2), (3, 4), (5, 8), (100, 128), (SQLITE_MAX_VARIABLE_NUMBER, SQLITE_MAX_VARIABLE_NUMBER)],
+)
+def test_bucketed_parameters(count: int, expected: int) -> None:
+    values = list(range(count))
+    placeholders, params = bucketed_parameters(values)
+    assert placeholders == ",".join(["?"] * expected)
+    assert params[:count] == values
+    assert params[count:] == [values[-1]] * (expected - count)
+
+
+@pytest.mark.anyio
+async def test_bucketed_parameters_query() -> None:
+    async with DBConnection(2) as db_wrapper:
+        async with db_wrapper.writer_maybe_transaction() as conn:
+            await conn.execute("CREATE TABLE numbers(value INTEGER NOT NULL)")
+            await conn.executemany("INSERT INTO numbers VALUES(?)", [(i,) for i in range(20)])
+
+        # the padding doesn't change the result
+        placeholders, params = bucketed_parameters([3, 7, 11])
+        assert len(params) == 4
+        async with db_wrapper.reader_no_transaction() as conn:
+            async with conn.execute(f"SELECT value FROM numbers WHERE value IN ({placeholders})", params) as cursor:
+                assert sorted(row[0] for row in await cursor.fetchall()) == [3, 7, 11]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("statement_cache_size, expected", [(0, 3), (128, 4)])
+async def test_in_parameters(statement_cache_size: int, expected: int) -> None:
+    async with DBWrapper2.managed(
+        database=generate_in_memory_db_uri(), uri=True, reader_count=1, statement_cache_size=statement_cache_size
+    ) as db_wrapper:
+        # parameters are only padded when the statements can be cached
+        placeholders, params = db_wrapper.in_parameters([3, 7, 11])
+        assert placeholders == ",".join(["?"] * expected)
+        assert params[:3] == [3, 7, 11]
+        assert len(params) == expected
+
+
+@pytest.mark.anyio
+async def test_on_rollback() -> None:
+    undone: list[str] = []
+    async with DBConnection(2) as db_wrapper:
+        # outside of a transaction, there's nothing to roll back
+        db_wrapper.on_rollback(lambda: undone.append("none"))
+        with pytest.raises(RuntimeError):
+            async with db_wrapper.writer():
+                db_wrapper.on_rollback(lambda: undone.append("outer"))
+                async with db_wrapper.writer():
+                    db_wrapper.on_rollback(lambda: undone.append("committed"))
+                with pytest.raises(ValueError):
+                    async with db_wrapper.writer():
+                        db_wrapper.on_rollback(lambda: undone.append("nested"))
+                        raise ValueError
+                # only the nested transaction was rolled back so far
+                assert undone == ["nested"]
+                raise RuntimeError
+        # a nested transaction which was committed is rolled back with the enclosing one, in reverse order
+        assert undone == ["nested", "committed", "outer"]
+
+        async with db_wrapper.writer():
+            db_wrapper.on_rollback(lambda: undone.append("not rolled back"))
+        assert undone == ["nested", "committed", "outer"]
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from chik.harvester.disk_scheduler import DEMOTE_AFTER_MISSES, PROMOTE_AFTER_HITS, DiskScheduler
+from chik.util.task_referencer import create_referenced_task
+
+
+@pytest.mark.anyio
+async def test_concurrency_per_device() -> None:
+    lock = threading.Lock()
+    running: dict[int, int] = {1: 0, 2: 0}
+    max_running: dict[int, int] = {1: 0, 2: 0}
+
+    def lookup(device: int) -> int:
+        with lock:
+            running[device] += 1
+            max_running[device] = max(max_running[device], running[device])
+        time.sleep(0.01)
+        with lock:
+            running[device] -= 1
+        return device
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        scheduler = DiskScheduler(executor, 2)
+        deadline = time.monotonic() + 60
+        results = await asyncio.gather(
+            *(scheduler.run(device, f"/disk{device}", deadline, lookup, device) for device in [1, 2] * 10)
+        )
+
+    assert results == [1, 2] * 10
+    assert max_running == {1: 2, 2: 2}
+    stats = {s["device"]: s for s in scheduler.get_stats()}
+    assert stats[1]["lookups"] == 10
+    assert stats[1]["directories"] == ["/disk1"]
+    assert stats[1]["running"] == 0
+    assert stats[1]["waiting"] == 0
+
+
+@pytest.mark.anyio
+async def test_slow_device_does_not_starve_others() -> None:
+    release = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        scheduler = DiskScheduler(executor, 2)
+        deadline = time.monotonic() + 60
+        slow = [create_referenced_task(scheduler.run(1, "/slow", deadline, release.wait)) for _ in range(10)]
+        await asyncio.sleep(0)
+        # the lookups on the slow disk only hold 2 of the threads, the lookups
+        # on the other disk complete while they're stuck
+        results = await asyncio.wait_for(
+            asyncio.gather(*(scheduler.run(2, "/fast", deadline, lambda: 2) for _ in range(10))), timeout=10
+        )
+        assert results == [2] * 10
+        assert scheduler.disks[1].running == 2
+        assert len(scheduler.disks[1].waiting) == 8
+        release.set()
+        await asyncio.gather(*slow)
+
+
+@pytest.mark.anyio
+async def test_demoted_device_does_not_starve_others() -> None:
+    release = threading.Event()
+
+    # a concurrency as high as the number of threads lets one disk hold all of
+    # them, until it's demoted
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = DiskScheduler(executor, 2)
+        for _ in range(DEMOTE_AFTER_MISSES):
+            await scheduler.run(1, "/slow", time.monotonic() + 0.001, time.sleep, 0.01)
+        assert scheduler.disks[1].demoted
+
+        deadline = time.monotonic() + 60
+        slow = [create_referenced_task(scheduler.run(1, "/slow", deadline, release.wait)) for _ in range(10)]
+        await asyncio.sleep(0)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(scheduler.run(2, "/fast", deadline, lambda: 2) for _ in range(10))), timeout=10
+        )
+        assert results == [2] * 10
+        assert scheduler.disks[1].running == 1
+        release.set()
+        await asyncio.gather(*slow)
+
+
+@pytest.mark.anyio
+async def test_deadline_order() -> None:
+    order: list[int] = []
+    release = threading.Event()
+
+    def lookup(value: int) -> None:
+        if value == -1:
+            release.wait()
+        order.append(value)
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        scheduler = DiskScheduler(executor, 1)
+        now = time.monotonic()
+        # occupies the disk while the others are queued
+        blocker = create_referenced_task(scheduler.run(1, "/disk", now + 60, lookup, -1))
+        await asyncio.sleep(0)
+        tasks = [create_referenced_task(scheduler.run(1, "/disk", now + 60 - i, lookup, i)) for i in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+
+    assert order == [-1, 4, 3, 2, 1, 0]
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiter() -> None:
+    release = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        scheduler = DiskScheduler(executor, 1)
+        deadline = time.monotonic() + 60
+        blocker = create_referenced_task(scheduler.run(1, "/disk", deadline, release.wait))
+        await asyncio.sleep(0)
+        cancelled = create_referenced_task(scheduler.run(1, "/disk", deadline, lambda: None))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        release.set()
+        await blocker
+        # the cancelled lookup doesn't hold on to the disk
+        assert await scheduler.run(1, "/disk", deadline, lambda: 42) == 42
+
+    assert scheduler.disks[1].running == 0
+
+
+@pytest.mark.anyio
+async def test_demote_and_promote() -> None:
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        scheduler = DiskScheduler(executor, 4)
+        disk = scheduler._disk(1)
+
+        for _ in range(DEMOTE_AFTER_MISSES):
+            assert not disk.demoted
+            assert disk.limit == 4
+            # the deadline passes while the lookup is running
+            await scheduler.run(1, "/disk", time.monotonic() + 0.001, time.sleep, 0.01)
+        assert disk.demoted
+        assert disk.limit == 1
+        assert disk.missed_deadlines == DEMOTE_AFTER_MISSES
+
+        # lookups that only start after their deadline don't count
+        await scheduler.run(1, "/disk", time.monotonic() - 1, lambda: None)
+        assert disk.missed_deadlines == DEMOTE_AFTER_MISSES
+        assert disk.consecutive_hits == 0
+
+        for _ in range(PROMOTE_AFTER_HITS):
+            assert disk.demoted
+            await scheduler.run(1, "/disk", time.monotonic() + 60, lambda: None)
+        assert not disk.demoted
+        assert disk.limit == 4
+        assert scheduler.get_stats()[0]["demoted"] is False
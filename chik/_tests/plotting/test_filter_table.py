@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+import pytest
+from chik_rs import G1Element
+from chik_rs.sized_bytes import bytes32
+from chik_rs.sized_ints import uint64
+
+from chik.plotting.filter_table import PlotFilterTable
+from chik.plotting.util import PlotInfo
+from chik.types.blockchain_format.proof_of_space import passes_plot_filter
+
+
+@dataclass
+class FakeDiskProver:
+    plot_id: bytes32
+    size: int
+
+    def get_id(self) -> bytes32:
+        return self.plot_id
+
+    def get_size(self) -> int:
+        return self.size
+
+
+def create_table(count: int, seeded_random: random.Random) -> PlotFilterTable:
+    plots = {
+        Path(f"plot-{i}.plot"): PlotInfo(
+            prover=FakeDiskProver(bytes32.random(seeded_random), 32 + i % 3),  # type: ignore[arg-type]
+            pool_public_key=None,
+            pool_contract_puzzle_hash=None,
+            plot_public_key=G1Element(),
+            file_size=uint64(0),
+            time_modified=0,
+        )
+        for i in range(count)
+    }
+    table = PlotFilterTable.create(plots)
+    assert len(table) == count
+    assert table.paths == list(plots)
+    return table
+
+
+@pytest.mark.parametrize("prefix_bits", [0, 1, 2, 5, 9])
+def test_same_as_passes_plot_filter(prefix_bits: int, seeded_random: random.Random) -> None:
+    table = create_table(2000, seeded_random)
+    challenge_hash = bytes32.random(seeded_random)
+    sp_hash = bytes32.random(seeded_random)
+
+    expected = [
+        index
+        for index, info in enumerate(table.plot_infos)
+        if passes_plot_filter(prefix_bits, info.prover.get_id(), challenge_hash, sp_hash)
+    ]
+    assert table.passing(lambda size: prefix_bits, challenge_hash, sp_hash) == expected
+    if prefix_bits == 0:
+        assert len(expected) == len(table)
+
+
+def test_prefix_bits_by_size(seeded_random: random.Random) -> None:
+    table = create_table(2000, seeded_random)
+    challenge_hash = bytes32.random(seeded_random)
+    sp_hash = bytes32.random(seeded_random)
+
+    def prefix_bits(size: int) -> int:
+        return size - 32
+
+    expected = [
+        index
+        for index, info in enumerate(table.plot_infos)
+        if passes_plot_filter(prefix_bits(info.prover.get_size()), info.prover.get_id(), challenge_hash, sp_hash)
+    ]
+    assert table.passing(prefix_bits, challenge_hash, sp_hash) == expected
+
+
+def test_empty_table() -> None:
+    table = PlotFilterTable.create({})
+    assert len(table) == 0
+    assert table.passing(lambda size: 9, bytes32.zeros, bytes32.zeros) == []
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import logging
+import sqlite3
 import sys
 import time
 from collections.abc import Iterator
+from contextlib import closing
 from dataclasses import dataclass, replace
 from os import unlink
 from pathlib import Path
@@ -17,7 +19,7 @@ from chik_rs.sized_ints import uint16, uint32
 from chik._tests.plotting.util import get_test_plots
 from chik._tests.util.misc import boolean_datacases
 from chik._tests.util.time_out_assert import time_out_assert
-from chik.plotting.cache import CURRENT_VERSION, CacheDataV1
+from chik.plotting.cache import CURRENT_VERSION, CacheDataV1, DiskCacheEntry
 from chik.plotting.manager import Cache, PlotManager
 from chik.plotting.util import (
     PlotInfo,
@@ -518,9 +520,9 @@ async def test_plot_info_caching(environment, bt):
     assert plot_manager.failed_to_open_filenames == env.refresh_tester.plot_manager.failed_to_open_filenames
     assert plot_manager.no_key_filenames == env.refresh_tester.plot_manager.no_key_filenames
     plot_manager.stop_refreshing()
-    # Modify the content of the plot_manager.dat
+    # Corrupt the header of the cache database
     with open(plot_manager.cache.path(), "r+b") as file:
-        file.write(b"\xff\xff")  # Sets Cache.version to 65535
+        file.write(b"\xff\xff")
     # Make sure it just loads the plots normally if it fails to load the cache
     refresh_tester: PlotRefreshTester = PlotRefreshTester(env.root_path)
     plot_manager = refresh_tester.plot_manager
@@ -542,12 +544,14 @@ async def test_drop_too_large_cache_entries(environment, bt):
     assert len(env.dir_1) >= 6, "This test requires at least 6 cache entries"
     # Load the cache entries
     cache_path = env.refresh_tester.plot_manager.cache.path()
-    serialized = cache_path.read_bytes()
-    stored_cache: VersionedBlob = VersionedBlob.from_bytes(serialized)
-    cache_data: CacheDataV1 = CacheDataV1.from_bytes(stored_cache.blob)
+    with closing(sqlite3.connect(cache_path)) as db:
+        entries: list[tuple[str, DiskCacheEntry]] = [
+            (path, DiskCacheEntry.from_bytes(entry))
+            for path, entry in db.execute("SELECT path, entry FROM plot_cache ORDER BY path")
+        ]
 
     def modify_cache_entry(index: int, additional_data: int, modify_memo: bool) -> str:
-        path, cache_entry = cache_data.entries[index]
+        path, cache_entry = entries[index]
         prover_data = cache_entry.prover_data
         # Size of length hints in chikpos serialization currently depends on the platform
         size_length = 8 if sys.maxsize > 2**32 else 4
@@ -580,7 +584,7 @@ async def test_drop_too_large_cache_entries(environment, bt):
         filename_length_bytes = filename_length.to_bytes(size_length, byteorder=sys.byteorder)
         memo_length_bytes = memo_length.to_bytes(size_length, byteorder=sys.byteorder)
 
-        cache_data.entries[index] = (
+        entries[index] = (
             path,
             replace(
                 cache_entry,
@@ -589,13 +593,15 @@ async def test_drop_too_large_cache_entries(environment, bt):
         )
         return path
 
-    def assert_cache(expected: list[MockPlotInfo]) -> None:
-        test_cache = Cache(cache_path)
+    def assert_cache(test_cache: Cache, expected: list[MockPlotInfo]) -> None:
         assert len(test_cache) == 0
         test_cache.load()
+        expected_paths = {plot_info.prover.get_filename() for plot_info in expected}
+        # Entries are only checked once they are used
+        for plot_info in plot_infos:
+            path = plot_info.prover.get_filename()
+            assert (test_cache.get(Path(path)) is not None) == (path in expected_paths)
         assert len(test_cache) == len(expected)
-        for plot_info in expected:
-            assert test_cache.get(Path(plot_info.prover.get_filename())) is not None
 
     # Modify two entries, with and without memo modification, they both should remain in the cache after load
     modify_cache_entry(0, 1500, modify_memo=False)
@@ -609,12 +615,18 @@ async def test_drop_too_large_cache_entries(environment, bt):
     ]
 
     plot_infos = env.dir_1.plot_info_list()
+    valid_plot_infos = [info for info in plot_infos if info.prover.get_filename() not in invalid_entries]
     # Make sure the cache currently contains all plots from dir1
-    assert_cache(plot_infos)
-    # Write the modified cache entries to the file
-    cache_path.write_bytes(bytes(VersionedBlob(uint16(CURRENT_VERSION), bytes(cache_data))))
+    assert_cache(Cache(cache_path), plot_infos)
+    # Write the modified cache entries to the cache of an older version, they get dropped when it's imported
+    legacy_path = cache_path.parent / "legacy.dat"
+    legacy_path.write_bytes(bytes(VersionedBlob(uint16(CURRENT_VERSION), bytes(CacheDataV1(entries)))))
+    assert_cache(Cache(cache_path.parent / "imported.sqlite", legacy_path), valid_plot_infos)
+    # Write the modified cache entries to the database
+    with closing(sqlite3.connect(cache_path)) as db, db:
+        db.executemany("UPDATE plot_cache SET entry=? WHERE path=?", [(bytes(entry), path) for path, entry in entries])
     # And now test that plots in invalid_entries are not longer loaded
-    assert_cache([plot_info for plot_info in plot_infos if plot_info.prover.get_filename() not in invalid_entries])
+    assert_cache(Cache(cache_path), valid_plot_infos)
 
 
 @pytest.mark.anyio
@@ -779,3 +791,54 @@ async def test_recursive_plot_scan_symlinks(environment: Environment, follow_lin
     expected_result.loaded = expected_plot_list  # type: ignore[assignment]
     expected_result.processed = len(expected_plot_list)
     await env.refresh_tester.run(expected_result)
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="inotify is only available on Linux")
+@pytest.mark.anyio
+async def test_plot_watching(tmp_path: Path, bt) -> None:
+    plots: list[Path] = get_test_plots()
+    directory: Directory = Directory(tmp_path.resolve() / "plots", plots[0:3])
+    create_default_chik_config(tmp_path)
+    add_plot_directory(tmp_path, str(directory.path))
+
+    results: list[PlotRefreshResult] = []
+
+    def refresh_callback(event: PlotRefreshEvents, refresh_result: PlotRefreshResult) -> None:
+        if event == PlotRefreshEvents.done:
+            results.append(refresh_result)
+
+    plot_manager = PlotManager(tmp_path, refresh_callback, watch_directories=True)
+    plot_manager.set_public_keys(bt.plot_manager.farmer_public_keys, bt.plot_manager.pool_public_keys)
+    plot_manager.start_refreshing(sleep_interval_ms=10)
+    try:
+        await time_out_assert(10, len, 1, results)
+        assert plot_manager.watching()
+        assert plot_manager.plot_count() == 3
+        last_refresh_time = plot_manager.last_refresh_time
+
+        # Plots copied into the directory get loaded without a full refresh
+        copy(plots[3], directory.path)
+        await time_out_assert(10, len, 2, results)
+        assert [info.prover.get_filename() for info in results[1].loaded] == [str(directory.path / plots[3].name)]
+        assert results[1].processed == 1
+        assert plot_manager.plot_count() == 4
+
+        # And removed plots get dropped
+        unlink(directory.path / plots[0].name)
+        await time_out_assert(10, len, 3, results)
+        assert results[2].loaded == []
+        assert results[2].removed == [directory.path / plots[0].name]
+        assert plot_manager.plot_count() == 3
+
+        # Plots moved in from elsewhere
+        move(directory.path / plots[1].name, tmp_path / plots[1].name)
+        await time_out_assert(10, len, 4, results)
+        move(tmp_path / plots[1].name, directory.path / plots[1].name)
+        await time_out_assert(10, len, 5, results)
+        assert [info.prover.get_filename() for info in results[4].loaded] == [str(directory.path / plots[1].name)]
+        assert plot_manager.plot_count() == 3
+
+        assert plot_manager.last_refresh_time == last_refresh_time
+    finally:
+        plot_manager.stop_refreshing()
+    assert not plot_manager.watching()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import os
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from shutil import move
+
+import pytest
+
+from chik.plotting import watcher as watcher_module
+from chik.plotting.watcher import PlotChanges, PlotWatcher, create_observer
+
+
+def wait_for_changes(watcher: PlotWatcher, expected: PlotChanges) -> None:
+    changes = PlotChanges()
+    end = time.monotonic() + 5
+    while time.monotonic() < end:
+        new_changes = watcher.take_changes()
+        changes.changed = (changes.changed - new_changes.removed) | new_changes.changed
+        changes.removed = (changes.removed - new_changes.changed) | new_changes.removed
+        changes.rescan |= new_changes.rescan
+        if changes == expected:
+            return
+        time.sleep(0.01)
+    assert changes == expected
+
+
+@pytest.fixture(scope="function")
+def watcher() -> Iterator[PlotWatcher]:
+    observer = create_observer()
+    if observer is None:
+        pytest.skip("inotify is not available")
+    watcher = PlotWatcher(observer)
+    yield watcher
+    watcher.stop()
+
+
+def test_plot_changes(tmp_path: Path, watcher: PlotWatcher) -> None:
+    dir_1 = tmp_path / "1"
+    dir_2 = tmp_path / "2"
+    dir_1.mkdir()
+    dir_2.mkdir()
+    watcher.watch([dir_1, dir_2], recursive=False)
+    assert watcher.active()
+    assert not watcher.pending()
+
+    # Only plot files are reported, once they are written
+    (dir_1 / "a.plot").write_bytes(b"a")
+    (dir_1 / "b.plot").write_bytes(b"b")
+    (dir_1 / "._a.plot").write_bytes(b"a")
+    (dir_1 / "a.plot.tmp").write_bytes(b"a")
+    wait_for_changes(watcher, PlotChanges(changed={dir_1 / "a.plot", dir_1 / "b.plot"}))
+
+    move(dir_1 / "a.plot", dir_2 / "a.plot")
+    os.unlink(dir_1 / "b.plot")
+    wait_for_changes(watcher, PlotChanges(changed={dir_2 / "a.plot"}, removed={dir_1 / "a.plot", dir_1 / "b.plot"}))
+
+    # Plots which are moved in place after being written, i.e. the way plotters usually finish plots
+    (dir_2 / "c.plot.tmp").write_bytes(b"c")
+    watcher.take_changes()
+    move(dir_2 / "c.plot.tmp", dir_2 / "c.plot")
+    wait_for_changes(watcher, PlotChanges(changed={dir_2 / "c.plot"}))
+
+    # Not a recursive watch
+    (dir_1 / "sub").mkdir()
+    wait_for_changes(watcher, PlotChanges(rescan=True))
+    (dir_1 / "sub" / "d.plot").write_bytes(b"d")
+    time.sleep(0.1)
+    assert not watcher.pending()
+
+
+def test_new_files(tmp_path: Path, watcher: PlotWatcher, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(watcher_module, "CREATED_SETTLE_SECONDS", 0.5)
+    plot_dir = tmp_path / "plots"
+    plot_dir.mkdir()
+    watcher.watch([plot_dir], recursive=False)
+
+    # Files which are still being written aren't reported until they are closed
+    with open(plot_dir / "a.plot", "wb") as f:
+        for _ in range(3):
+            f.write(b"a")
+            f.flush()
+            time.sleep(0.2)
+            assert not watcher.pending()
+    wait_for_changes(watcher, PlotChanges(changed={plot_dir / "a.plot"}))
+
+    # Files moved in from outside the watched directories are only reported as created
+    (tmp_path / "b.plot").write_bytes(b"b")
+    move(tmp_path / "b.plot", plot_dir / "b.plot")
+    wait_for_changes(watcher, PlotChanges(changed={plot_dir / "b.plot"}))
+
+
+def test_recursive(tmp_path: Path, watcher: PlotWatcher) -> None:
+    (tmp_path / "sub").mkdir()
+    watcher.watch([tmp_path], recursive=True)
+    (tmp_path / "sub" / "a.plot").write_bytes(b"a")
+    wait_for_changes(watcher, PlotChanges(changed={tmp_path / "sub" / "a.plot"}))
+
+    # Directories moving in or out need a rescan to find their plots
+    move(tmp_path / "sub", tmp_path.parent / f"{tmp_path.name}-moved")
+    wait_for_changes(watcher, PlotChanges(rescan=True))
+
+
+def test_unwatch(tmp_path: Path, watcher: PlotWatcher) -> None:
+    dir_1 = tmp_path / "1"
+    dir_1.mkdir()
+    watcher.watch([dir_1, tmp_path / "missing"], recursive=False)
+    watcher.watch([], recursive=False)
+    (dir_1 / "a.plot").write_bytes(b"a")
+    time.sleep(0.1)
+    assert not watcher.pending()
+
+    watcher.stop()
+    assert not watcher.active()
+    # Watching after stopping does nothing, the plot directories are polled instead
+    watcher.watch([dir_1], recursive=False)
+    assert not watcher.active()
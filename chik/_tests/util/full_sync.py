@@ -23,6 +23,7 @@ from chik.consensus.block_body_validation import ForkInfo
 from chik.consensus.constants import replace_str_to_bytes
 from chik.consensus.default_constants import DEFAULT_CONSTANTS
 from chik.consensus.difficulty_adjustment import get_next_sub_slot_iters_and_difficulty
+from chik.full_node.block_archive import BlockArchive, archive_directory
 from chik.full_node.full_node import FullNode
 from chik.protocols.outbound_message import Message, NodeType
 from chik.server.server import ChikServer
@@ -44,6 +45,17 @@ class ExitOnError(logging.Handler):
         self.exit_with_failure = True
 
 
+# main chain blocks moved to the block archive have their "block" column set to
+# NULL in the database
+def block_blob(archive: BlockArchive, blob: Optional[bytes], height: int, header_hash: bytes) -> bytes:
+    if blob is not None:
+        return blob
+    archived = archive.get(height, bytes32(header_hash))
+    if archived is None:
+        raise RuntimeError(f"Block {header_hash.hex()} at height {height} is missing from the block archive")
+    return archived
+
+
 @contextmanager
 def enable_profiler(profile: bool, counter: int) -> Iterator[None]:
     if not profile:
@@ -170,6 +182,7 @@ async def run_sync_test(
             counter = 0
             monotonic = height
             prev_hash = None
+            archive = BlockArchive.open(archive_directory(Path(file)), read_only=True)
             async with aiosqlite.connect(file) as in_db:
                 await in_db.execute("pragma query_only")
                 rows = await in_db.execute(
@@ -189,7 +202,7 @@ async def run_sync_test(
                 async for r in rows:
                     batch_start_time = time.monotonic()
                     with enable_profiler(profile, height):
-                        block = FullBlock.from_bytes(zstd.decompress(r[2]))
+                        block = FullBlock.from_bytes(zstd.decompress(block_blob(archive, r[2], r[1], r[0])))
                         block_batch.append(block)
 
                         assert block.height == monotonic
@@ -252,5 +265,6 @@ async def run_sync_test(
                 logger.warning(f"worst time-per-block: {worst_batch_time_per_block:0.2f} s")
                 logger.warning(f"worst height: {worst_batch_height}")
                 logger.warning(f"end-height: {height}")
+            archive.close()
             if node_profiler:
                 (root_path / "profile-node").rename("./profile-node")
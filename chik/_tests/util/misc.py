@@ -478,25 +478,30 @@ def create_logger(file: TextIO = sys.stdout) -> logging.Logger:
 
 
 def invariant_check_mempool(mempool: Mempool) -> None:
-    cursor = mempool._db_conn.execute("SELECT COALESCE(SUM(cost), 0), COALESCE(SUM(fee), 0) FROM tx")
-    val = cursor.fetchone()
+    entries = list(mempool._index.all_entries())
+    val = (sum(e.cost for e in entries), sum(e.fee for e in entries))
     assert (mempool._total_cost, mempool._total_fee) == val
+    assert mempool._items.keys() == {e.name for e in entries}
+    assert [e.name for e in mempool._index.by_fee_rate()] == [
+        e.name for e in sorted(entries, key=lambda e: (-e.fee_per_cost, e.seq))
+    ]
 
-    cursor = mempool._db_conn.execute("SELECT coin_id, tx FROM spends")
-    for coin_id, item_id in cursor.fetchall():
-        item = mempool._items.get(item_id)
+    for entry in entries:
+        item = mempool._items.get(entry.name)
         assert item is not None
-        # item is expected to contain a spend of coin_id, but it might be a
-        # fast-forward spend, in which case the dictionary won't help us,
-        # but we'll have to do a linear search
-        if coin_id in item.bundle_coin_spends:
-            assert item.bundle_coin_spends[coin_id].coin_spend.coin.name() == coin_id
-            continue
-
-        assert any(
-            i.latest_singleton_lineage is not None and i.latest_singleton_lineage.coin_id == coin_id
-            for i in item.bundle_coin_spends.values()
-        )
+        for coin_id in entry.coin_ids:
+            assert entry in mempool._index.get_by_coin_id(coin_id)
+            # item is expected to contain a spend of coin_id, but it might be a
+            # fast-forward spend, in which case the dictionary won't help us,
+            # but we'll have to do a linear search
+            if coin_id in item.bundle_coin_spends:
+                assert item.bundle_coin_spends[coin_id].coin_spend.coin.name() == coin_id
+                continue
+
+            assert any(
+                i.latest_singleton_lineage is not None and i.latest_singleton_lineage.coin_id == coin_id
+                for i in item.bundle_coin_spends.values()
+            )
 
 
 async def wallet_height_at_least(wallet_node: WalletNode, h: uint32) -> bool:
@@ -12,6 +12,7 @@ from chik.consensus.default_constants import DEFAULT_CONSTANTS
 from chik.types.blockchain_format.coin import Coin
 from chik.util.hash import std_hash
 from chik.wallet.coin_selection import (
+    branch_and_bound_exact_match,
     check_for_exact_match,
     knapsack_coin_algorithm,
     select_coins,
@@ -481,6 +482,41 @@ class TestCoinSelection:
         # Just a sanity check, it's actually much faster than this time
         assert time.time() - start < 10000
 
+    def test_branch_and_bound_exact_match(self, a_hash: bytes32) -> None:
+        coin_amounts = [320, 203, 202, 201, 160, 150, 80, 40, 20, 6, 3]
+        coin_list: list[Coin] = [Coin(a_hash, std_hash(bytes([i])), uint64(a)) for i, a in enumerate(coin_amounts)]
+        for target in [3, 153, 541, 726, sum(coin_amounts)]:
+            result = branch_and_bound_exact_match(coin_list, uint128(target), 500)
+            assert result is not None
+            assert sum(coin.amount for coin in result) == target
+        # 5 can't be made of these coins, and 726 takes more than 3 coins
+        assert branch_and_bound_exact_match(coin_list, uint128(5), 500) is None
+        assert branch_and_bound_exact_match(coin_list, uint128(726), 3) is None
+        assert branch_and_bound_exact_match(coin_list, uint128(0), 500) is None
+
+    def test_branch_and_bound_dust(self, a_hash: bytes32) -> None:
+        coin_list: list[Coin] = [Coin(a_hash, std_hash(bytes([i])), uint64(2000)) for i in range(10)] + [
+            Coin(a_hash, std_hash(i.to_bytes(4, "big")), uint64(1)) for i in range(100000)
+        ]
+        # exact matches which would take too many dust coins are cut off right away
+        start = time.monotonic()
+        assert branch_and_bound_exact_match(coin_list, uint128(9999), 500) is None
+        assert time.monotonic() - start < 5
+        result = branch_and_bound_exact_match(coin_list, uint128(8003), 500)
+        assert result is not None
+        assert sorted(coin.amount for coin in result) == [1, 1, 1, 2000, 2000, 2000, 2000]
+
+    def test_knapsack_deadline(self, a_hash: bytes32) -> None:
+        coin_list: list[Coin] = [
+            Coin(a_hash, std_hash(i.to_bytes(4, "big")), uint64((i + 1) * 1000 + 1)) for i in range(1999)
+        ]
+        start = time.monotonic()
+        result = knapsack_coin_algorithm(coin_list, uint128(2000000), 9999999999999999, 500, deadline=start)
+        # it stops with the first set of coins it finds
+        assert result is not None
+        assert sum(coin.amount for coin in result) >= 2000000
+        assert time.monotonic() - start < 5
+
     @pytest.mark.anyio
     async def test_coin_selection_min_coin(self, a_hash: bytes32) -> None:
         spendable_amount = uint128(5000000 + 500 + 40050)
@@ -1000,3 +1000,81 @@ async def test_delete_wallet(seeded_random: random.Random) -> None:
             # Remove the wallet_id and make sure its removed fully
             await store.delete_wallet(wallet_id)
             assert (await store.get_coin_records(wallet_id=wallet_id)).records == []
+
+
+async def assert_unspent_coins_match_db(store: WalletCoinStore) -> None:
+    for wallet_id, coin_type in [
+        (0, CoinType.NORMAL),
+        (1, CoinType.NORMAL),
+        (1, CoinType.CLAWBACK),
+        (2, CoinType.NORMAL),
+        (2, CoinType.CLAWBACK),
+    ]:
+        unspent = store.get_unspent_coins(wallet_id, coin_type)
+        expected = await store.get_unspent_coins_for_wallet(wallet_id, coin_type)
+        assert set(unspent.records.values()) == expected
+        assert unspent.total == sum(record.coin.amount for record in expected)
+        amounts = [record.coin.amount for record in unspent.largest_first()]
+        assert amounts == sorted(amounts, reverse=True)
+
+
+@pytest.mark.anyio
+async def test_unspent_coins() -> None:
+    async with DBConnection(1) as db_wrapper:
+        store = await WalletCoinStore.create(db_wrapper)
+        for r in [record_1, record_2, record_3, record_4, record_5, record_6, record_7, record_8, record_9]:
+            await store.add_coin_record(r)
+            await assert_unspent_coins_match_db(store)
+        unspent = store.get_unspent_coins(0)
+        assert len(unspent) == 2
+        assert [r.coin for r in unspent.largest_first()] == [coin_1, coin_2]
+        assert [r.coin for r in unspent.largest_first({coin_1.name()})] == [coin_2]
+        assert unspent.amount_of({coin_1.name(), coin_3.name()}) == coin_1.amount
+
+        # replacing a record can move the coin to another wallet
+        await store.add_coin_record(replace(record_1, wallet_id=1))
+        await assert_unspent_coins_match_db(store)
+        await store.set_spent(coin_2.name(), uint32(12))
+        await assert_unspent_coins_match_db(store)
+        await store.delete_coin_record(coin_5.name())
+        await assert_unspent_coins_match_db(store)
+        # coins spent after the fork point are unspent again, the ones created after it are gone
+        await store.rollback_to_block(8)
+        await assert_unspent_coins_match_db(store)
+        await store.rollback_to_block(4)
+        await assert_unspent_coins_match_db(store)
+        await store.delete_wallet(uint32(2))
+        await assert_unspent_coins_match_db(store)
+
+        # a fresh store loads them from the database
+        store = await WalletCoinStore.create(db_wrapper)
+        await assert_unspent_coins_match_db(store)
+
+        # changes are undone when the transaction they were made in is rolled back
+        with pytest.raises(RuntimeError):
+            async with db_wrapper.writer():
+                await store.add_coin_record(record_2)
+                await store.delete_wallet(uint32(1))
+                assert coin_2.name() in store.get_unspent_coins(0)
+                raise RuntimeError
+        await assert_unspent_coins_match_db(store)
+
+        # including when only an enclosing transaction is rolled back
+        with pytest.raises(RuntimeError):
+            async with db_wrapper.writer():
+                async with db_wrapper.writer():
+                    await store.add_coin_record(record_2)
+                    await store.rollback_to_block(0)
+                await assert_unspent_coins_match_db(store)
+                raise RuntimeError
+        await assert_unspent_coins_match_db(store)
+
+        # while a nested transaction being rolled back keeps the changes of the enclosing one
+        async with db_wrapper.writer():
+            await store.add_coin_record(record_2)
+            with pytest.raises(RuntimeError):
+                async with db_wrapper.writer():
+                    await store.set_spent(coin_2.name(), uint32(12))
+                    raise RuntimeError
+            assert coin_2.name() in store.get_unspent_coins(0)
+        await assert_unspent_coins_match_db(store)
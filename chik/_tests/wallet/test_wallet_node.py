@@ -1,11 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import sys
 import time
 import types
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Optional, cast
 
 import pytest
 from chik_rs import CoinState, FullBlock, G1Element, PrivateKey
@@ -19,6 +20,7 @@ from chik.protocols import wallet_protocol
 from chik.protocols.outbound_message import Message, make_msg
 from chik.protocols.protocol_message_types import ProtocolMessageTypes
 from chik.server.api_protocol import Self
+from chik.server.ws_connection import WSChikConnection
 from chik.simulator.add_blocks_in_batches import add_blocks_in_batches
 from chik.simulator.block_tools import test_constants
 from chik.types.blockchain_format.coin import Coin
@@ -776,3 +778,52 @@ async def test_start_with_multiple_keys(
 
     await restart_with_fingerprint(fingerprint_2)
     assert wallet_node.wallet_state_manager.private_key == initial_sk
+
+
+@pytest.mark.anyio
+async def test_subscribe_and_add_states(root_path_populated_with_config: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    root_path = root_path_populated_with_config
+    config = load_config(root_path, "config.yaml", "wallet")
+    config["sync_subscriptions_in_flight"] = 3
+    node = WalletNode(config, root_path, test_constants)
+    peer = cast(WSChikConnection, None)
+    items = [bytes32(i.to_bytes(32, "big")) for i in range(10000)]
+    in_flight = 0
+    max_in_flight = 0
+    added: list[CoinState] = []
+    fail_after: Optional[int] = None
+
+    async def subscribe(batch: list[bytes32], _: WSChikConnection, min_height: int) -> list[CoinState]:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            # Later requests respond faster, the states are still added in order
+            await asyncio.sleep(0.01 * (10 - int.from_bytes(batch[0], "big") // 1000))
+        finally:
+            in_flight -= 1
+        return [
+            CoinState(Coin(ph, ph, uint64(amount)), None, uint32(min_height)) for ph in batch[:2] for amount in [1, 2]
+        ]
+
+    async def add_states_from_peer(states: list[CoinState], _: WSChikConnection) -> bool:
+        added.extend(states)
+        await asyncio.sleep(0.01)
+        return fail_after is None or len(added) < fail_after
+
+    monkeypatch.setattr(node, "add_states_from_peer", add_states_from_peer)
+
+    assert await node.subscribe_and_add_states(
+        items, subscribe, peer, 10, "puzzle hashes", lambda state: state.coin.amount == 1
+    )
+    assert max_in_flight == 3
+    assert [state.coin.puzzle_hash for state in added] == [ph for i in range(0, 10000, 1000) for ph in items[i : i + 2]]
+
+    # Adding states fails for the second batch
+    added.clear()
+    fail_after = 8
+    assert not await node.subscribe_and_add_states(items, subscribe, peer, 10, "puzzle hashes")
+    assert len(added) == 8
+    # The requests which were sent ahead are cancelled
+    await asyncio.sleep(0.2)
+    assert in_flight == 0
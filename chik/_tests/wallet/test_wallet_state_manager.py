@@ -5,7 +5,7 @@ from contextlib import asynccontextmanager
 from dataclasses import dataclass
 
 import pytest
-from chik_rs import CoinState, G2Element
+from chik_rs import AugSchemeMPL, CoinState, G2Element
 from chik_rs.sized_bytes import bytes32
 from chik_rs.sized_ints import uint32, uint64
 
@@ -16,15 +16,23 @@ from chik.types.blockchain_format.coin import Coin
 from chik.types.blockchain_format.program import Program
 from chik.types.coin_spend import make_spend
 from chik.types.peer_info import PeerInfo
+from chik.util.lru_cache import LRUCache
 from chik.wallet.derivation_record import DerivationRecord
-from chik.wallet.derive_keys import master_sk_to_wallet_sk, master_sk_to_wallet_sk_unhardened
+from chik.wallet.derive_keys import (
+    derive_wallet_keys,
+    master_pk_to_wallet_pk_unhardened,
+    master_pk_to_wallet_pk_unhardened_intermediate,
+    master_sk_to_wallet_sk,
+    master_sk_to_wallet_sk_unhardened,
+)
+from chik.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import puzzle_hash_for_pk
 from chik.wallet.transaction_record import TransactionRecord
 from chik.wallet.util.transaction_type import TransactionType
 from chik.wallet.util.wallet_types import WalletType
 from chik.wallet.wallet_request_types import PushTransactions
 from chik.wallet.wallet_rpc_api import MAX_DERIVATION_INDEX_DELTA
 from chik.wallet.wallet_spend_bundle import WalletSpendBundle
-from chik.wallet.wallet_state_manager import WalletStateManager
+from chik.wallet.wallet_state_manager import DERIVATION_BATCH_SIZE, WalletStateManager
 
 
 @asynccontextmanager
@@ -83,6 +91,57 @@ async def test_get_private_key(simulator_and_wallet: OldSimulatorsAndWallets, ha
     assert await wallet_state_manager.get_private_key(record.puzzle_hash) == expected_private_key
 
 
+@pytest.mark.anyio
+async def test_derive_keys(simulator_and_wallet: OldSimulatorsAndWallets) -> None:
+    _, [(wallet_node, _)], _ = simulator_and_wallet
+    wallet_state_manager: WalletStateManager = wallet_node.wallet_state_manager
+    master_sk = wallet_state_manager.get_master_private_key()
+    start = 100000
+    end = start + 2 * DERIVATION_BATCH_SIZE + 10
+    # large enough to be derived in batches, in the process pool
+    keys = await wallet_state_manager._derive_keys(start, end)
+    assert wallet_state_manager._derivation_executor is not None
+    assert sorted(keys.keys()) == list(range(start, end))
+    for index in [start, start + DERIVATION_BATCH_SIZE, end - 1]:
+        hardened_pk = master_sk_to_wallet_sk(master_sk, uint32(index)).get_g1()
+        unhardened_pk = master_pk_to_wallet_pk_unhardened(wallet_state_manager.root_pubkey, uint32(index))
+        expected = ((hardened_pk, puzzle_hash_for_pk(hardened_pk)), (unhardened_pk, puzzle_hash_for_pk(unhardened_pk)))
+        assert keys[index] == expected
+        assert wallet_state_manager._derived_keys.get(index) == expected
+    assert wallet_state_manager._derived_keys.get(end) is None
+
+    # only the missing keys are derived, on the event loop
+    wallet_state_manager._derived_keys.remove(start + 5)
+    keys = await wallet_state_manager._derive_keys(start, end + 1)
+    assert sorted(keys.keys()) == list(range(start, end + 1))
+    assert wallet_state_manager._derived_keys.get(start + 5) is not None
+    assert wallet_state_manager._derived_keys.get(end) is not None
+
+
+@pytest.mark.anyio
+async def test_derive_keys_cache_size(simulator_and_wallet: OldSimulatorsAndWallets) -> None:
+    _, [(wallet_node, _)], _ = simulator_and_wallet
+    wallet_state_manager: WalletStateManager = wallet_node.wallet_state_manager
+    wallet_state_manager._derived_keys = LRUCache(10)
+    # ranges larger than the cache are still returned in full
+    keys = await wallet_state_manager._derive_keys(200000, 200050)
+    assert sorted(keys.keys()) == list(range(200000, 200050))
+    assert len(wallet_state_manager._derived_keys.cache) == 10
+    assert list(wallet_state_manager._derived_keys.cache.keys()) == list(range(200040, 200050))
+
+
+def test_derive_wallet_keys_without_private_key() -> None:
+    master_sk = AugSchemeMPL.key_gen(bytes32.zeros)
+    root_pubkey = master_sk.get_g1()
+    hardened, unhardened = derive_wallet_keys(
+        None, bytes(master_pk_to_wallet_pk_unhardened_intermediate(root_pubkey)), 3, 5
+    )
+    assert hardened == []
+    assert [pubkey for pubkey, _ in unhardened] == [
+        bytes(master_sk_to_wallet_sk_unhardened(master_sk, uint32(index)).get_g1()) for index in [3, 4]
+    ]
+
+
 @pytest.mark.anyio
 async def test_get_private_key_failure(simulator_and_wallet: OldSimulatorsAndWallets) -> None:
     _, [(wallet_node, _)], _ = simulator_and_wallet
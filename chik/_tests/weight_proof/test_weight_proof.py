@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import random
+from typing import Any, Optional
+
 import pytest
 from chik_rs import BlockRecord, ConsensusConstants, FullBlock, HeaderBlock, SubEpochSummary
 from chik_rs.sized_bytes import bytes32
@@ -9,7 +12,14 @@ from chik._tests.util.blockchain_mock import BlockchainMock
 from chik.consensus.full_block_to_block_record import block_to_block_record
 from chik.consensus.generator_tools import get_block_header
 from chik.consensus.pot_iterations import validate_pospace_and_get_required_iters
-from chik.full_node.weight_proof import WeightProofHandler, _map_sub_epoch_summaries, _validate_summaries_weight
+from chik.full_node.weight_proof import (
+    SegmentKey,
+    WeightProofHandler,
+    _map_sub_epoch_summaries,
+    _validate_sub_epoch_segments,
+    _validate_summaries_weight,
+    vars_to_bytes,
+)
 from chik.simulator.block_tools import BlockTools
 
 
@@ -360,6 +370,60 @@ class TestWeightProof:
         assert valid
         assert fork_point == 0
 
+    @pytest.mark.anyio
+    async def test_weight_proof_verified_segments(
+        self, default_1000_blocks: list[FullBlock], blockchain_constants: ConsensusConstants
+    ) -> None:
+        blocks = default_1000_blocks
+        header_cache, height_to_hash, sub_blocks, summaries = await load_blocks_dont_validate(
+            blocks, blockchain_constants
+        )
+        wpf = WeightProofHandler(
+            blockchain_constants, BlockchainMock(sub_blocks, header_cache, height_to_hash, summaries)
+        )
+        wp = await wpf.get_proof_of_weight(blocks[-1].header_hash)
+        assert wp is not None
+        wpf_not_synced = WeightProofHandler(
+            blockchain_constants, BlockchainMock(sub_blocks, header_cache, height_to_hash, {})
+        )
+        valid, fork_point, summaries = await wpf_not_synced.validate_weight_proof(wp)
+        assert valid
+        assert fork_point == 0
+        executor = wpf_not_synced._executor
+        assert executor is not None
+
+        summary_bytes, wp_segment_bytes, _ = vars_to_bytes(summaries, wp)
+        peak_height = wp.recent_chain_data[-1].reward_chain_block.height
+
+        def segment_vdfs(verified: bool) -> Optional[dict[SegmentKey, list[Any]]]:
+            return _validate_sub_epoch_segments(
+                blockchain_constants,
+                random.Random(summaries[-2].get_hash()),
+                wp_segment_bytes,
+                summary_bytes,
+                peak_height,
+                0,
+                wpf_not_synced._verified_segments if verified else None,
+            )
+
+        # all segments with VDFs were recorded as verified, so none of their
+        # VDFs are returned to be validated again
+        all_vdfs = segment_vdfs(False)
+        assert all_vdfs is not None
+        assert len(all_vdfs) > 0
+        assert all(wpf_not_synced._verified_segments.get(key) for key in all_vdfs)
+        assert segment_vdfs(True) == {}
+
+        # the pool is reused and the segments aren't validated again
+        valid, fork_point, _ = await wpf_not_synced.validate_weight_proof(wp)
+        assert valid
+        assert fork_point == 0
+        assert wpf_not_synced._executor is executor
+        assert segment_vdfs(True) == {}
+
+        wpf_not_synced.shut_down()
+        assert wpf_not_synced._executor is None
+
     @pytest.mark.anyio
     async def test_check_num_of_samples(
         self, default_10000_blocks: list[FullBlock], blockchain_constants: ConsensusConstants
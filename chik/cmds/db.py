@@ -7,8 +7,11 @@ import click
 
 from chik.cmds.cmd_classes import ChikCliContext
 from chik.cmds.db_backup_func import db_backup_func
+from chik.cmds.db_recompress_func import db_recompress_func
+from chik.cmds.db_snapshot_func import db_snapshot_export_func, db_snapshot_import_func
 from chik.cmds.db_upgrade_func import db_upgrade_func
 from chik.cmds.db_validate_func import db_validate_func
+from chik.full_node.block_store import RECOMPRESS_LEVEL
 
 
 @click.group("db", help="Manage the blockchain database")
@@ -85,3 +88,70 @@ def db_backup_cmd(ctx: click.Context, db_backup_file: Optional[str], no_indexes:
         )
     except RuntimeError as e:
         print(f"FAILED: {e}")
+
+
+@db_cmd.command(
+    "recompress",
+    help="re-compress the blocks in the blockchain database at a higher zstd level, to save space. "
+    "This can be run while the full node is running, and resumes where it left off if interrupted",
+)
+@click.option("--db", "in_db_path", default=None, type=click.Path(), help="Specifies which database file to update")
+@click.option(
+    "--level", default=RECOMPRESS_LEVEL, type=click.IntRange(1, 22), show_default=True, help="the zstd level to use"
+)
+@click.option(
+    "--batch-size", default=100, type=click.IntRange(min=1), show_default=True, help="blocks to update per transaction"
+)
+@click.pass_context
+def db_recompress_cmd(ctx: click.Context, in_db_path: Optional[str], level: int, batch_size: int) -> None:
+    try:
+        db_recompress_func(
+            ChikCliContext.set_default(ctx).root_path,
+            None if in_db_path is None else Path(in_db_path),
+            level=level,
+            batch_size=batch_size,
+        )
+    except RuntimeError as e:
+        print(f"FAILED: {e}")
+
+
+@db_cmd.group("snapshot", help="Export or import the set of unspent coins")
+def db_snapshot_cmd() -> None:
+    pass
+
+
+@db_snapshot_cmd.command("export", help="write the unspent coins at the peak (or a given height) to a snapshot file")
+@click.option("--output", "out_path", required=True, type=click.Path(), help="specify the snapshot file to write")
+@click.option("--db", "in_db_path", default=None, type=click.Path(), help="Specifies which database file to read")
+@click.option(
+    "--height", default=None, type=int, help="take the snapshot at this main chain height instead of the peak"
+)
+@click.pass_context
+def db_snapshot_export_cmd(ctx: click.Context, out_path: str, in_db_path: Optional[str], height: Optional[int]) -> None:
+    try:
+        db_snapshot_export_func(
+            ChikCliContext.set_default(ctx).root_path,
+            Path(out_path),
+            None if in_db_path is None else Path(in_db_path),
+            height=height,
+        )
+    except RuntimeError as e:
+        print(f"FAILED: {e}")
+
+
+@db_snapshot_cmd.command(
+    "import",
+    help="load a snapshot file into the (empty) coin_record table of a database whose peak is the snapshot block",
+)
+@click.option("--input", "in_path", required=True, type=click.Path(), help="specify the snapshot file to read")
+@click.option("--db", "out_db_path", default=None, type=click.Path(), help="Specifies which database file to write")
+@click.pass_context
+def db_snapshot_import_cmd(ctx: click.Context, in_path: str, out_db_path: Optional[str]) -> None:
+    try:
+        db_snapshot_import_func(
+            ChikCliContext.set_default(ctx).root_path,
+            Path(in_path),
+            None if out_db_path is None else Path(out_db_path),
+        )
+    except RuntimeError as e:
+        print(f"FAILED: {e}")
@@ -28,9 +28,12 @@ def db_backup_func(
 
 
 def backup_db(source_db: Path, backup_db: Path, *, no_indexes: bool) -> None:
+    import shutil
     import sqlite3
     from contextlib import closing
 
+    from chik.full_node.block_archive import archive_directory, segment_files
+
     # VACUUM INTO is only available starting with SQLite version 3.27.0
     if not no_indexes and sqlite3.sqlite_version_info < (3, 27, 0):
         raise RuntimeError(
@@ -75,3 +78,16 @@ def backup_db(source_db: Path, backup_db: Path, *, no_indexes: bool) -> None:
                 f"backup failed with error: '{e}'"
                 f"\n\tYour backup file {backup_db} is probably left over in an insconsistent state."
             )
+
+    # blocks moved to the block archive aren't in the database anymore (their
+    # "block" column is NULL), so the archive segments are part of the backup.
+    # Segments are never modified once written. Copying them after the
+    # database means every block the backup is missing is in a copied segment
+    # (segments added in the meantime hold blocks the backup still has)
+    source_archive = archive_directory(source_db)
+    if source_archive.exists():
+        backup_archive = archive_directory(backup_db)
+        print(f"copying block archive to: {backup_archive}")
+        backup_archive.mkdir(exist_ok=True)
+        for segment in segment_files(source_archive):
+            shutil.copyfile(segment, backup_archive / segment.name)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import sqlite3
+import sys
+from contextlib import closing
+from pathlib import Path
+from time import monotonic
+from typing import Any, Callable, Optional
+
+from chik.full_node.block_store import recompress_blob
+from chik.util.config import load_config
+from chik.util.path import path_from_root
+
+
+def db_recompress_func(
+    root_path: Path,
+    in_db_path: Optional[Path] = None,
+    *,
+    level: int,
+    batch_size: int,
+) -> None:
+    if in_db_path is None:
+        config: dict[str, Any] = load_config(root_path, "config.yaml")["full_node"]
+        selected_network: str = config["selected_network"]
+        db_pattern: str = config["database_path"]
+        db_path_replaced: str = db_pattern.replace("CHALLENGE", selected_network)
+        in_db_path = path_from_root(root_path, db_path_replaced)
+    if not in_db_path.exists():
+        raise RuntimeError(f"Database file doesn't exist. {in_db_path}")
+
+    start_time = monotonic()
+
+    def progress(blocks: int, old_size: int, new_size: int) -> None:
+        print(f"\r{blocks:10d} blocks {old_size / 1024 / 1024:0.1f} MiB -> {new_size / 1024 / 1024:0.1f} MiB", end="")
+        sys.stdout.flush()
+
+    print(f"recompressing blocks in blockchain database: {in_db_path} at zstd level {level}")
+    try:
+        blocks, old_size, new_size = recompress_blocks(
+            in_db_path, level=level, batch_size=batch_size, progress=progress
+        )
+    except sqlite3.Error as e:
+        raise RuntimeError(f"recompressing failed with error: '{e}'")
+
+    print(
+        f"\n\nRecompressed {blocks} blocks, saving {(old_size - new_size) / 1024 / 1024:0.1f} MiB, "
+        f"in {monotonic() - start_time:.2f} seconds"
+    )
+    print("The freed space is reused by new blocks. Run `chik db backup` to create a compacted copy of the database\n")
+
+
+def recompress_blocks(
+    db_path: Path,
+    *,
+    level: int,
+    batch_size: int = 100,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+) -> tuple[int, int, int]:
+    """
+    Re-compresses the blocks stored in the full_blocks table at the specified
+    zstd level, in batches of batch_size blocks, each in its own transaction.
+    This is safe to run while the full node is running. Progress is recorded
+    in the DB, so an interrupted run resumes where it left off (when run at
+    the same level). Returns the number of blocks processed along with their
+    total size before and after.
+    """
+    blocks = 0
+    old_size = 0
+    new_size = 0
+    # wait for the full node to finish writing, rather than failing
+    with closing(sqlite3.connect(db_path, timeout=60, isolation_level=None)) as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS block_recompression(key int PRIMARY KEY, level int, last_rowid bigint)"
+        )
+        with closing(conn.execute("SELECT level, last_rowid FROM block_recompression WHERE key=0")) as cursor:
+            row = cursor.fetchone()
+        last_rowid = row[1] if row is not None and row[0] == level else 0
+
+        while True:
+            with closing(
+                conn.execute(
+                    "SELECT rowid, header_hash, block FROM full_blocks "
+                    "WHERE rowid > ? AND block IS NOT NULL ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size),
+                )
+            ) as cursor:
+                rows = cursor.fetchall()
+            if len(rows) == 0:
+                break
+
+            updates = []
+            for rowid, header_hash, block in rows:
+                new_block = recompress_blob(block, level)
+                old_size += len(block)
+                if len(new_block) < len(block):
+                    updates.append((new_block, header_hash, block))
+                    new_size += len(new_block)
+                else:
+                    new_size += len(block)
+                last_rowid = rowid
+            blocks += len(rows)
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # the full node may have replaced the block (with a compact
+                # version) since we read it, in which case we leave it alone
+                conn.executemany("UPDATE full_blocks SET block=? WHERE header_hash=? AND block=?", updates)
+                conn.execute("INSERT OR REPLACE INTO block_recompression VALUES(0, ?, ?)", (level, last_rowid))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if progress is not None:
+                progress(blocks, old_size, new_size)
+
+    return blocks, old_size, new_size
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import sqlite3
+import sys
+from contextlib import closing
+from pathlib import Path
+from time import monotonic
+from typing import Any, Optional
+
+from chik.full_node.coin_snapshot import CoinSnapshotError, export_coin_snapshot, import_coin_snapshot
+from chik.util.config import load_config
+from chik.util.path import path_from_root
+
+
+def _default_db_path(root_path: Path) -> Path:
+    config: dict[str, Any] = load_config(root_path, "config.yaml")["full_node"]
+    selected_network: str = config["selected_network"]
+    db_pattern: str = config["database_path"]
+    db_path_replaced: str = db_pattern.replace("CHALLENGE", selected_network)
+    return path_from_root(root_path, db_path_replaced)
+
+
+def db_snapshot_export_func(
+    root_path: Path,
+    out_path: Path,
+    in_db_path: Optional[Path] = None,
+    *,
+    height: Optional[int] = None,
+) -> None:
+    if in_db_path is None:
+        in_db_path = _default_db_path(root_path)
+    if not in_db_path.exists():
+        raise RuntimeError(f"Database file doesn't exist. {in_db_path}")
+    if out_path.exists():
+        raise RuntimeError(f"Output file already exists. {out_path}")
+
+    start_time = monotonic()
+
+    def progress(done: int, total: int) -> None:
+        print(f"\r{done // 1000:10d}k / {total // 1000}k coins", end="")
+        sys.stdout.flush()
+
+    print(f"reading from blockchain database: {in_db_path}")
+    print(f"writing to snapshot file: {out_path}")
+    try:
+        with closing(sqlite3.connect(in_db_path, isolation_level=None)) as conn:
+            with open(out_path, "xb") as f:
+                header = export_coin_snapshot(conn, f, height, progress)
+    except (CoinSnapshotError, sqlite3.Error) as e:
+        out_path.unlink(missing_ok=True)
+        raise RuntimeError(f"snapshot export failed with error: '{e}'")
+
+    print(
+        f"\n\nExported {header.coin_count} unspent coins at height {header.height} "
+        f"({header.header_hash.hex()}) in {monotonic() - start_time:.2f} seconds\n"
+    )
+
+
+def db_snapshot_import_func(
+    root_path: Path,
+    in_path: Path,
+    out_db_path: Optional[Path] = None,
+) -> None:
+    if out_db_path is None:
+        out_db_path = _default_db_path(root_path)
+    if not in_path.exists():
+        raise RuntimeError(f"Snapshot file doesn't exist. {in_path}")
+    # the database needs the blocks up to the snapshot block
+    if not out_db_path.exists():
+        raise RuntimeError(f"Database file doesn't exist. {out_db_path}")
+
+    start_time = monotonic()
+
+    def progress(stage: str, done: int, total: int) -> None:
+        if stage == "coins":
+            print(f"\r-- loading coins {done // 1000:10d}k / {total // 1000}k", end="")
+        else:
+            print(f"\r-- creating indexes {done} / {total}                    ", end="")
+        sys.stdout.flush()
+
+    print(f"reading from snapshot file: {in_path}")
+    print(f"writing to blockchain database: {out_db_path}")
+    try:
+        with closing(sqlite3.connect(out_db_path, isolation_level=None)) as conn:
+            conn.execute("PRAGMA synchronous=off")
+            with open(in_path, "rb") as f:
+                header = import_coin_snapshot(conn, f, progress)
+    except (CoinSnapshotError, sqlite3.Error) as e:
+        raise RuntimeError(f"snapshot import failed with error: '{e}'")
+
+    print(
+        f"\n\nImported {header.coin_count} unspent coins at height {header.height} "
+        f"({header.header_hash.hex()}) in {monotonic() - start_time:.2f} seconds\n"
+    )
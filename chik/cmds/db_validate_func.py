@@ -37,12 +37,18 @@ def validate_v2(in_path: Path, *, config: dict[str, Any], validate_blocks: bool)
 
     import zstd
 
+    from chik.full_node.block_archive import BlockArchive, archive_directory
+
     if not in_path.exists():
         print(f"input file doesn't exist. {in_path}")
         raise RuntimeError(f"can't find {in_path}")
 
+    # main chain blocks moved to the block archive have their "block" column
+    # set to NULL, those are validated from the archive
+    archive = BlockArchive.open(archive_directory(in_path), read_only=True)
+
     print(f"opening file for reading: {in_path}")
-    with closing(sqlite3.connect(in_path)) as in_db:
+    with closing(sqlite3.connect(in_path)) as in_db, closing(archive):
         # read the database version
         try:
             with closing(in_db.execute("SELECT * FROM database_version")) as cursor:
@@ -104,7 +110,12 @@ def validate_v2(in_path: Path, *, config: dict[str, Any], validate_blocks: bool)
                     continue
 
                 if validate_blocks:
-                    block = FullBlock.from_bytes(zstd.decompress(row[4]))
+                    blob = row[4]
+                    if blob is None:
+                        blob = archive.get(height, bytes32(hh))
+                        if blob is None:
+                            raise RuntimeError(f"Block {hh.hex()} at height {height} is missing from the block archive")
+                    block = FullBlock.from_bytes(zstd.decompress(blob))
                     block_record = BlockRecord.from_bytes(row[5])
                     actual_header_hash = block.header_hash
                     actual_prev_hash = block.prev_header_hash
@@ -119,6 +119,14 @@ class Blockchain:
 
     _log_coins: bool
 
+    # When > 0, the coin store buffers coin set changes in memory and they are
+    # flushed to the DB once there are this many. The peak stored in the DB is
+    # only updated when flushing, to keep it consistent with the coin set in
+    # the DB.
+    _write_behind_max_pending: int
+    # the peak that will be written to the DB on the next flush
+    _deferred_peak: Optional[bytes32]
+
     @staticmethod
     async def create(
         coin_store: CoinStoreProtocol,
@@ -156,6 +164,8 @@ class Blockchain:
         self.coin_store = coin_store
         self.block_store = block_store
         self._shut_down = False
+        self._write_behind_max_pending = 0
+        self._deferred_peak = None
         await self._load_chain_from_store(height_map)
         self._seen_compact_proofs = set()
         return self
@@ -164,6 +174,33 @@ class Blockchain:
         self._shut_down = True
         self.pool.shutdown(wait=True)
 
+    async def set_write_behind(self, max_pending: int) -> None:
+        """
+        Enables (max_pending > 0) or disables (max_pending == 0) buffering the
+        coin set changes of new blocks in memory, and writing them to the DB in
+        batches of (at least) max_pending coin additions and spends. This must
+        be called while holding priority_mutex, since it changes how add_block()
+        writes coin set changes.
+        """
+        if max_pending == 0:
+            await self.flush_write_behind()
+        self.coin_store.set_write_behind(max_pending > 0)
+        self._write_behind_max_pending = max_pending
+
+    async def flush_write_behind(self) -> None:
+        """
+        Writes any coin set changes buffered in memory to the DB, along with the
+        peak they correspond to. This must be called while holding
+        priority_mutex.
+        """
+        if self._deferred_peak is None and self.coin_store.pending_count() == 0:
+            return
+        async with self.block_store.db_wrapper.writer():
+            await self.coin_store.flush_pending()
+            if self._deferred_peak is not None:
+                await self.block_store.set_peak(self._deferred_peak)
+        self._deferred_peak = None
+
     async def _load_chain_from_store(self, height_map: BlockHeightMap) -> None:
         """
         Initializes the state of the Blockchain class from the database.
@@ -419,6 +456,13 @@ class Blockchain:
         previous_peak_height = self._peak_height
         prev_fork_peak = (fork_info.peak_height, fork_info.peak_hash)
 
+        # coin set changes buffered in the coin store are all on top of the
+        # current peak. If this block is not, it may cause a reorg. Write them
+        # out first, so they aren't lost if this block's DB transaction is
+        # rolled back
+        if self._write_behind_max_pending > 0 and not extending_main_chain:
+            await self.flush_write_behind()
+
         try:
             # Always add the block to the database
             async with self.block_store.db_wrapper.writer():
@@ -457,6 +501,10 @@ class Blockchain:
             # restore fork_info to the state before adding the block
             fork_info.rollback(prev_fork_peak[1], prev_fork_peak[0])
             self.block_store.rollback_cache_block(header_hash)
+            # drop any coin set changes this block buffered in the coin store
+            self.coin_store.rollback_pending(
+                previous_peak_height if extending_main_chain and previous_peak_height is not None else -1
+            )
             self._peak_height = previous_peak_height
             log.error(
                 f"Error while adding block {header_hash} height {block.height},"
@@ -467,6 +515,9 @@ class Blockchain:
         # This is done outside the try-except in case it fails, since we do not want to revert anything if it does
         await self.__height_map.maybe_flush()
 
+        if 0 < self._write_behind_max_pending <= self.coin_store.pending_count():
+            await self.flush_write_behind()
+
         if state_change_summary is not None:
             # new coin records added
             return AddBlockResult.NEW_PEAK, None, state_change_summary
@@ -591,11 +642,18 @@ class Blockchain:
 
         # we made it to the end successfully
         # Rollback sub_epoch_summaries
-        await self.block_store.rollback(fork_info.fork_height)
+        # when the block extends the peak, there's nothing above the fork point
+        # to take out of the main chain. While syncing, the indexes this
+        # update would use may not exist
+        if peak is not None and block_record.prev_hash != peak.header_hash:
+            await self.block_store.rollback(fork_info.fork_height)
         await self.block_store.set_in_chain([(br.header_hash,) for br in records_to_add])
 
         # Changes the peak to be the new peak
-        await self.block_store.set_peak(block_record.header_hash)
+        if self._write_behind_max_pending > 0:
+            self._deferred_peak = block_record.header_hash
+        else:
+            await self.block_store.set_peak(block_record.header_hash)
 
         return records_to_add, StateChangeSummary(
             block_record,
@@ -144,6 +144,34 @@ class CoinStoreProtocol(Protocol):
         Rolls back the blockchain to the specified block index
         """
 
+    async def refresh_indexes(self) -> None:
+        """
+        Picks the indexes used by queries based on which ones exist. This needs
+        to be called after indexes are dropped or created
+        """
+
+    def set_write_behind(self, enabled: bool) -> None:
+        """
+        Enables or disables buffering of coin additions and spends in memory
+        """
+
+    def pending_count(self) -> int:
+        """
+        Returns the number of coin additions and spends buffered in memory (in
+        write-behind mode) that have not been written to the database yet
+        """
+
+    async def flush_pending(self) -> None:
+        """
+        Writes all buffered coin additions and spends to the database
+        """
+
+    def rollback_pending(self, block_index: int) -> None:
+        """
+        Discards buffered coin additions and spends above the specified block
+        index, without touching the database
+        """
+
     # DEPRECATED: do not use in new code
     async def is_empty(self) -> bool:
         """
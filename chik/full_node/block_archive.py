@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import dataclasses
+import logging
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from chik_rs.sized_bytes import bytes32
+
+log = logging.getLogger(__name__)
+
+# Blocks deep enough below the peak are moved out of the full_blocks table
+# into segment files, each holding the (compressed) main chain blocks of
+# SEGMENT_BLOCKS consecutive heights (the archive of a node always uses the
+# same segment size). A segment file is laid out as:
+#
+#   header: magic (8 bytes) | version (uint32) | start height (uint32) | count (uint32)
+#   blobs:  the compressed blocks, exactly as they were stored in full_blocks
+#   index:  count entries of header hash (32 bytes) | offset (uint64) | length (uint32)
+#
+# The index is at the end of the file, so segments can be written in a single
+# pass. Segments are written to a temporary file and renamed once complete,
+# they are never modified after that.
+SEGMENT_BLOCKS = 10000
+SEGMENT_MAGIC = b"CHIKBLKS"
+SEGMENT_VERSION = 1
+HEADER = struct.Struct(">8sIII")
+INDEX_ENTRY = struct.Struct(">32sQI")
+
+
+class BlockArchiveError(Exception):
+    pass
+
+
+def archive_directory(db_path: Path) -> Path:
+    """
+    The block archive of a blockchain database is kept next to it
+    """
+    return db_path.with_name(db_path.stem + "-archive")
+
+
+def segment_filename(directory: Path, start_height: int) -> Path:
+    return directory / f"blocks-{start_height:010d}.seg"
+
+
+def segment_files(directory: Path) -> list[Path]:
+    """
+    Returns the complete segment files in directory, in height order
+    """
+    return sorted(directory.glob("blocks-*.seg"))
+
+
+@dataclasses.dataclass
+class SegmentWriter:
+    """
+    Writes the blocks of one segment, in height order. Nothing is visible to
+    readers until finish() is called.
+    """
+
+    path: Path
+    start_height: int
+    segment_blocks: int
+    _file: BinaryIO
+    _index: list[tuple[bytes32, int, int]] = dataclasses.field(default_factory=list)
+    _offset: int = HEADER.size
+
+    @classmethod
+    def create(cls, path: Path, start_height: int, segment_blocks: int) -> SegmentWriter:
+        f = open(path.with_suffix(".tmp"), "wb")
+        f.write(HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, start_height, segment_blocks))
+        return cls(path, start_height, segment_blocks, f)
+
+    def add(self, blocks: list[tuple[bytes32, bytes]]) -> None:
+        for header_hash, blob in blocks:
+            self._file.write(blob)
+            self._index.append((header_hash, self._offset, len(blob)))
+            self._offset += len(blob)
+
+    def finish(self) -> None:
+        if len(self._index) != self.segment_blocks:
+            raise BlockArchiveError(
+                f"segment at height {self.start_height} has {len(self._index)} blocks, expected {self.segment_blocks}"
+            )
+        for entry in self._index:
+            self._file.write(INDEX_ENTRY.pack(*entry))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path.with_suffix(".tmp"), self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        self.path.with_suffix(".tmp").unlink(missing_ok=True)
+
+
+@dataclasses.dataclass
+class BlockArchive:
+    """
+    The cold tier of the block store. Holds the compressed main chain blocks
+    of all heights below archived_height(), in memory mapped segment files.
+    """
+
+    directory: Path
+    segment_blocks: int = SEGMENT_BLOCKS
+    # the number of segments, they are always contiguous from height 0
+    _segment_count: int = 0
+    _maps: dict[int, mmap.mmap] = dataclasses.field(default_factory=dict)
+
+    @classmethod
+    def open(cls, directory: Path, segment_blocks: int = SEGMENT_BLOCKS, *, read_only: bool = False) -> BlockArchive:
+        """
+        Opens the archive in directory. An existing archive keeps the segment
+        size it was created with. With read_only, the directory is left
+        untouched, so it's safe to use while a full node is adding segments.
+        """
+        if not read_only:
+            directory.mkdir(parents=True, exist_ok=True)
+            # remove any segment that was being written when we stopped
+            for tmp in directory.glob("blocks-*.tmp"):
+                tmp.unlink()
+        first = segment_filename(directory, 0)
+        if first.exists():
+            with open(first, "rb") as f:
+                header = f.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise BlockArchiveError(f"invalid block archive segment: {first}")
+            segment_blocks = HEADER.unpack(header)[3]
+        self = cls(directory, segment_blocks)
+        while segment_filename(directory, self.archived_height()).exists():
+            self._segment_count += 1
+        log.info(f"block archive {directory} has blocks up to height {self.archived_height()}")
+        return self
+
+    def archived_height(self) -> int:
+        """
+        All main chain blocks below this height are in the archive.
+        """
+        return self._segment_count * self.segment_blocks
+
+    def _map(self, segment: int) -> mmap.mmap:
+        m = self._maps.get(segment)
+        if m is not None:
+            return m
+        path = segment_filename(self.directory, segment * self.segment_blocks)
+        with open(path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, start_height, count = HEADER.unpack_from(m, 0)
+        if (
+            magic != SEGMENT_MAGIC
+            or version != SEGMENT_VERSION
+            or start_height != segment * self.segment_blocks
+            or count != self.segment_blocks
+            or len(m) < HEADER.size + count * INDEX_ENTRY.size
+        ):
+            m.close()
+            raise BlockArchiveError(f"invalid block archive segment: {path}")
+        self._maps[segment] = m
+        return m
+
+    def get(self, height: int, header_hash: bytes32) -> Optional[bytes]:
+        """
+        Returns the compressed block at the specified height, or None if it's
+        not archived, or the archived block at this height has a different
+        header hash.
+        """
+        segment = height // self.segment_blocks
+        if height < 0 or segment >= self._segment_count:
+            return None
+        m = self._map(segment)
+        entry = len(m) - (self.segment_blocks - height % self.segment_blocks) * INDEX_ENTRY.size
+        archived_hash, offset, length = INDEX_ENTRY.unpack_from(m, entry)
+        if archived_hash != header_hash:
+            return None
+        return m[offset : offset + length]
+
+    def new_segment(self) -> SegmentWriter:
+        start_height = self.archived_height()
+        return SegmentWriter.create(segment_filename(self.directory, start_height), start_height, self.segment_blocks)
+
+    def add_segment(self, writer: SegmentWriter) -> None:
+        """
+        Makes the segment written by writer (and finished) visible to readers
+        """
+        assert writer.start_height == self.archived_height()
+        assert segment_filename(self.directory, writer.start_height).exists()
+        self._segment_count += 1
+
+    def close(self) -> None:
+        for m in self._maps.values():
+            m.close()
+        self._maps.clear()
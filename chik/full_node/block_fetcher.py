@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from chik_rs import FullBlock
+from chik_rs.sized_ints import uint32
+
+from chik.full_node.full_node_api import FullNodeAPI
+from chik.protocols.full_node_protocol import RequestBlocks, RespondBlocks
+from chik.protocols.outbound_message import make_msg
+from chik.protocols.protocol_message_types import ProtocolMessageTypes
+from chik.server.ws_connection import WSChikConnection
+from chik.util.network import is_localhost
+from chik.util.task_referencer import create_referenced_task
+
+
+@dataclass
+class PeerSlot:
+    peer: WSChikConnection
+    # the timestamp (time.monotonic()) of when the next request_blocks message
+    # is allowed to be sent to this peer
+    next_request: float
+    in_flight: int = 0
+
+
+@dataclass(eq=False)
+class _Attempt:
+    slot: PeerSlot
+    started: float
+    task: asyncio.Task[Optional[list[FullBlock]]]
+
+
+@dataclass
+class _Batch:
+    start: uint32
+    end: uint32
+    attempts: list[_Attempt] = field(default_factory=list)
+    # peers that failed to serve this batch (timed out or sent a bad response)
+    failed: set[int] = field(default_factory=set)
+    result: Optional[tuple[WSChikConnection, list[FullBlock]]] = None
+
+
+@dataclass
+class BlockFetcher:
+    """
+    Downloads the (inclusive) block range [start_height, end_height] from the
+    peers returned by get_peers(), keeping up to "window" batches of
+    batch_size blocks in flight at any given time, spread across peers.
+
+    Responses may arrive out of order, they are buffered and handed to the
+    output queue strictly in height order. If the oldest outstanding batch
+    takes longer than straggler_timeout to arrive, while later batches are
+    already waiting behind it (or it's one of the last batches), the same
+    request is also sent to a different peer. Whichever response arrives first
+    is used. Peers that time out or respond with something other than the
+    requested blocks are closed and the batch is re-requested from another
+    peer.
+    """
+
+    log: logging.Logger
+    get_peers: Callable[[], list[WSChikConnection]]
+    peers_changed: asyncio.Event
+    start_height: int
+    end_height: int
+    batch_size: int
+    window: int = 8
+    max_in_flight_per_peer: int = 2
+    # the rate limit for respond_blocks is 100 messages / 60 seconds.
+    # But the limit is scaled to 30% for outbound messages, so that's 30
+    # messages per 60 seconds.
+    # That's 2 seconds per request.
+    seconds_per_request: float = 2.0
+    straggler_timeout: float = 5.0
+    _slots: list[PeerSlot] = field(default_factory=list)
+    _batches: list[_Batch] = field(default_factory=list)
+
+    def _refresh_peers(self, now: float) -> None:
+        existing = {id(s.peer): s for s in self._slots}
+        slots = []
+        for peer in self.get_peers():
+            slot = existing.get(id(peer))
+            slots.append(slot if slot is not None else PeerSlot(peer, now))
+        random.shuffle(slots)
+        self._slots = slots
+        self.log.info(f"peers with peak: {len(self._slots)}")
+
+    def _pick_peer(self, batch: _Batch) -> Optional[PeerSlot]:
+        busy = {id(a.slot.peer) for a in batch.attempts}
+        candidates = [
+            s
+            for s in self._slots
+            if not s.peer.closed
+            and s.in_flight < self.max_in_flight_per_peer
+            and id(s.peer) not in batch.failed
+            and id(s.peer) not in busy
+        ]
+        if len(candidates) == 0:
+            return None
+        return min(candidates, key=lambda s: (s.in_flight, s.next_request))
+
+    def _any_peer_left(self, batch: _Batch) -> bool:
+        return any(not s.peer.closed and id(s.peer) not in batch.failed for s in self._slots)
+
+    async def _request(self, slot: PeerSlot, batch: _Batch) -> Optional[list[FullBlock]]:
+        peer = slot.peer
+        start = time.monotonic()
+        wait_until = slot.next_request
+        # update the timestamp, now that we're (about to be) sending a
+        # request. It's OK for the timestamp to fall behind wall-clock time.
+        # It just means we're allowed to send more requests to catch up
+        if is_localhost(peer.peer_info.host):
+            # we don't apply rate limits to localhost, and our tests depend on
+            # it
+            slot.next_request = max(slot.next_request, start - 0.1) + 0.1
+        else:
+            slot.next_request = max(slot.next_request, start - self.seconds_per_request) + self.seconds_per_request
+        if start < wait_until:
+            # rate limit ourselves, since we sent a message to this peer too
+            # recently
+            await asyncio.sleep(wait_until - start)
+            start = time.monotonic()
+
+        request = RequestBlocks(batch.start, batch.end, True)
+        # rather than having our outbound rate limiter drop the request (and
+        # retry it later), wait until it allows it
+        delay = peer.send_delay(make_msg(ProtocolMessageTypes.request_blocks, request))
+        if delay > 0:
+            await asyncio.sleep(min(delay, self.straggler_timeout))
+            start = time.monotonic()
+
+        # the fewer peers we have, the more willing we should be to wait for
+        # them.
+        timeout = int(30 + 30 / max(1, len(self._slots)))
+        response = await peer.call_api(FullNodeAPI.request_blocks, request, timeout=timeout)
+        end = time.monotonic()
+        if response is None:
+            self.log.info(f"peer timed out after {end - start:.1f} s")
+            return None
+        if (
+            not isinstance(response, RespondBlocks)
+            or len(response.blocks) == 0
+            or response.blocks[0].height != batch.start
+            or response.blocks[-1].height != batch.end
+        ):
+            self.log.info(f"peer sent invalid response to request_blocks {batch.start} to {batch.end}")
+            return None
+        if end - start > self.straggler_timeout:
+            self.log.info(f"peer took {end - start:.1f} s to respond to request_blocks")
+            # this isn't a great peer, reduce its priority to prefer any peers
+            # that had to wait for it
+            slot.next_request = max(slot.next_request, end)
+        return response.blocks
+
+    def _issue(self, batch: _Batch) -> bool:
+        slot = self._pick_peer(batch)
+        if slot is None:
+            return False
+        slot.in_flight += 1
+        task = create_referenced_task(self._request(slot, batch))
+        batch.attempts.append(_Attempt(slot, time.monotonic(), task))
+        return True
+
+    def _cancel_attempts(self, batch: _Batch) -> None:
+        for a in batch.attempts:
+            if a.task.done():
+                if not a.task.cancelled():
+                    # retrieve the exception, to not have it logged as unhandled
+                    a.task.exception()
+            else:
+                a.task.cancel()
+            a.slot.in_flight -= 1
+        batch.attempts = []
+
+    async def _handle_done(self, batch: _Batch, attempt: _Attempt) -> None:
+        if attempt not in batch.attempts:
+            # this attempt was already cancelled, since another peer responded
+            # first
+            return
+        batch.attempts.remove(attempt)
+        attempt.slot.in_flight -= 1
+        blocks: Optional[list[FullBlock]] = None
+        if not attempt.task.cancelled():
+            exc = attempt.task.exception()
+            if exc is not None:
+                self.log.info(f"request_blocks {batch.start} to {batch.end} failed: {exc}")
+            else:
+                blocks = attempt.task.result()
+
+        if batch.result is not None:
+            return
+        if blocks is None:
+            batch.failed.add(id(attempt.slot.peer))
+            await attempt.slot.peer.close()
+            return
+        batch.result = (attempt.slot.peer, blocks)
+        # if this batch had been re-issued to another peer as well, we no
+        # longer need that response
+        self._cancel_attempts(batch)
+
+    async def run(self, output_queue: asyncio.Queue[Optional[tuple[WSChikConnection, list[FullBlock]]]]) -> bool:
+        """
+        Returns True if all blocks were fetched and put on the output queue.
+        The caller is responsible for sending the end-of-stream marker.
+        """
+        self._refresh_peers(time.monotonic())
+        # block request ranges are *inclusive*, this requires some gymnastics
+        # of this range (+1 to make it exclusive, like normal ranges) and then
+        # -1 when forming the request message
+        self._batches = [
+            _Batch(uint32(h), uint32(min(self.end_height, h + self.batch_size - 1)))
+            for h in range(self.start_height, self.end_height + 1, self.batch_size)
+        ]
+        next_issue = 0
+        next_emit = 0
+        try:
+            while next_emit < len(self._batches):
+                if self.peers_changed.is_set():
+                    self.peers_changed.clear()
+                    self._refresh_peers(time.monotonic())
+
+                # re-issue batches whose requests failed, oldest first
+                for b in self._batches[next_emit:next_issue]:
+                    if b.result is None and len(b.attempts) == 0:
+                        if not self._issue(b) and not self._any_peer_left(b):
+                            self.log.error(f"failed fetching {b.start} to {b.end} from peers")
+                            return False
+
+                # slide the window forward
+                while next_issue < len(self._batches) and next_issue < next_emit + self.window:
+                    if not self._issue(self._batches[next_issue]):
+                        break
+                    next_issue += 1
+
+                # the oldest batch is holding up the pipeline, ask another peer
+                # as well
+                head = self._batches[next_emit]
+                now = time.monotonic()
+                if (
+                    head.result is None
+                    and len(head.attempts) == 1
+                    and now - head.attempts[0].started > self.straggler_timeout
+                    and (
+                        next_issue == len(self._batches)
+                        or any(b.result is not None for b in self._batches[next_emit + 1 : next_issue])
+                    )
+                ):
+                    if self._issue(head):
+                        self.log.info(f"re-requesting straggling blocks {head.start} to {head.end} from another peer")
+
+                while next_emit < len(self._batches) and self._batches[next_emit].result is not None:
+                    b = self._batches[next_emit]
+                    assert b.result is not None
+                    start = time.monotonic()
+                    await output_queue.put(b.result)
+                    end = time.monotonic()
+                    if end - start > 1:
+                        self.log.info(
+                            f"sync pipeline back-pressure. stalled {end - start:0.2f} seconds on prevalidate block"
+                        )
+                    # release the blocks, they're owned by the queue now
+                    b.result = (b.result[0], [])
+                    next_emit += 1
+                if next_emit >= len(self._batches):
+                    break
+
+                in_flight = {a.task: (b, a) for b in self._batches[next_emit:next_issue] for a in b.attempts}
+                if len(in_flight) == 0:
+                    if not any(not s.peer.closed for s in self._slots):
+                        head = self._batches[next_emit]
+                        self.log.error(f"failed fetching {head.start} to {head.end} from peers")
+                        return False
+                    # all peers are at their in-flight limit or have failed
+                    # this batch. Wait for the peer set to change
+                    await asyncio.sleep(0.1)
+                    continue
+                done, _ = await asyncio.wait(
+                    in_flight.keys(), timeout=self.straggler_timeout / 2, return_when=asyncio.FIRST_COMPLETED
+                )
+                for t in done:
+                    b, a = in_flight[t]
+                    await self._handle_done(b, a)
+            return True
+        finally:
+            for b in self._batches:
+                self._cancel_attempts(b)
@@ -1,21 +1,40 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import mmap
+import os
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from types import TracebackType
+from typing import Optional, Union
 
 import aiofiles
 from chik_rs import SubEpochSummary
 from chik_rs.sized_bytes import bytes32
-from chik_rs.sized_ints import uint32
+from chik_rs.sized_ints import uint8, uint32
+from typing_extensions import Self
 
 from chik.util.db_wrapper import DBWrapper2
 from chik.util.files import write_file_async
+from chik.util.hash import std_hash
 from chik.util.streamable import Streamable, streamable
 
 log = logging.getLogger(__name__)
 
+# the height-to-hash file is a flat array of 32 byte block hashes, indexed by
+# height. Next to it is a small header file recording how many of those
+# records are valid, along with a checksum of the last TAIL_RECORDS of them.
+# This lets other processes map the file read-only and know how much of it to
+# trust, and lets us detect a torn tail after a crash.
+HEADER_VERSION = 1
+TAIL_RECORDS = 64
+
+# when appending to the height-to-hash file, grow it by at least this many
+# records at a time, to avoid resizing the file and the mapping for every
+# block
+GROW_RECORDS = 1024
+
 
 @streamable
 @dataclass(frozen=True)
@@ -23,6 +42,93 @@ class SesCache(Streamable):
     content: list[tuple[uint32, bytes]]
 
 
+@streamable
+@dataclass(frozen=True)
+class HeightToHashHeader(Streamable):
+    version: uint8
+    record_count: uint32
+    tail_checksum: bytes32
+
+
+def header_filename(height_to_hash_filename: Path) -> Path:
+    return height_to_hash_filename.with_name(height_to_hash_filename.name + ".header")
+
+
+def tail_checksum(buf: Union[bytes, bytearray, mmap.mmap], record_count: int) -> bytes32:
+    start = max(0, record_count - TAIL_RECORDS) * 32
+    return std_hash(bytes(buf[start : record_count * 32]) + record_count.to_bytes(4, "big"))
+
+
+def valid_record_count(height_to_hash_filename: Path, buf: Union[bytes, bytearray, mmap.mmap]) -> int:
+    """
+    Returns the number of valid records in buf, the contents of the
+    height-to-hash file. If the header file is missing (e.g. the file was
+    written by an older version) or doesn't match the file, all complete records
+    in the file are assumed to be valid.
+    """
+    file_records = len(buf) // 32
+    try:
+        with open(header_filename(height_to_hash_filename), "rb") as f:
+            header = HeightToHashHeader.from_bytes(f.read())
+    except Exception as e:
+        log.debug(f"Failed to load height-to-hash header: {e}")
+        return file_records
+
+    if (
+        header.version != HEADER_VERSION
+        or header.record_count > file_records
+        or tail_checksum(buf, header.record_count) != header.tail_checksum
+    ):
+        log.info("height-to-hash header does not match the file, ignoring it")
+        return file_records
+    return int(header.record_count)
+
+
+class HeightToHashReader:
+    """
+    A read-only, memory mapped view of a height-to-hash file, for processes
+    other than the full node (which owns the file and is the only writer).
+    Only the records that were valid at the time the file was opened can be
+    read. The view does not follow changes made by the full node afterwards.
+    """
+
+    _mmap: Optional[mmap.mmap]
+    _count: int
+
+    def __init__(self, filename: Path) -> None:
+        self._mmap = None
+        with open(filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size >= 32:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._count = 0 if self._mmap is None else valid_record_count(filename, self._mmap)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_hash(self, height: int) -> bytes32:
+        assert height < self._count
+        assert self._mmap is not None
+        idx = height * 32
+        return bytes32(self._mmap[idx : idx + 32])
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._count = 0
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
 class BlockHeightMap:
     db: DBWrapper2
 
@@ -30,10 +136,15 @@ class BlockHeightMap:
     # and back in time on startup.
 
     # Defines the path from genesis to the peak, no orphan blocks
-    # this buffer contains all block hashes that are part of the current peak
-    # ordered by height. i.e. __height_to_hash[0..32] is the genesis hash
-    # __height_to_hash[32..64] is the hash for height 1 and so on
-    __height_to_hash: bytearray
+    # this memory mapped file contains all block hashes that are part of the
+    # current peak ordered by height. i.e. __height_to_hash[0..32] is the
+    # genesis hash __height_to_hash[32..64] is the hash for height 1 and so on.
+    # The mapping may be larger than the number of valid records, to leave room
+    # for appending. It's None when there are no records
+    __height_to_hash: Optional[mmap.mmap]
+
+    # the number of valid records in __height_to_hash
+    __count: int
 
     # All sub-epoch summaries that have been included in the blockchain from the beginning until and including the peak
     # (height_included, SubEpochSummary). Note: ONLY for the blocks in the path to the peak
@@ -44,11 +155,6 @@ class BlockHeightMap:
     # disk
     __counter: int
 
-    # this is the lowest height whose hash has been updated since the last flush
-    # to disk. When it's time to write to disk, we can start flushing from this
-    # offset
-    __first_dirty: int
-
     # the file we're saving the height-to-hash cache to
     __height_to_hash_filename: Path
 
@@ -65,8 +171,8 @@ class BlockHeightMap:
         self.db = db
 
         self.__counter = 0
-        self.__first_dirty = 0
-        self.__height_to_hash = bytearray()
+        self.__count = 0
+        self.__height_to_hash = None
         self.__sub_epoch_summaries = {}
         suffix = "" if (selected_network is None or selected_network == "mainnet") else f"-{selected_network}"
         self.__height_to_hash_filename = blockchain_dir / f"height-to-hash{suffix}"
@@ -89,8 +195,7 @@ class BlockHeightMap:
                     return self
 
         try:
-            async with aiofiles.open(self.__height_to_hash_filename, "rb") as f:
-                self.__height_to_hash = bytearray(await f.read())
+            self.__open_file()
         except Exception as e:
             # it's OK if this file doesn't exist, we can rebuild it
             log.info(f"Failed to load height-to-hash: {e}")
@@ -106,16 +211,14 @@ class BlockHeightMap:
         prev_hash: bytes32 = row[1]
         height = row[2]
 
-        # allocate memory for height to hash map
-        # this may also truncate it, if thie file on disk had an invalid size
-        new_size = (height + 1) * 32
-        size = len(self.__height_to_hash)
-        if size > new_size:
-            del self.__height_to_hash[new_size:]
+        # allocate room for the height to hash map
+        # this may also truncate it, if the file on disk had more records than
+        # the chain
+        if self.__count > height + 1:
+            self.__truncate(height + 1)
         else:
-            self.__height_to_hash += bytearray([0] * (new_size - size))
-
-        self.__first_dirty = height + 1
+            self.__reserve(height + 1)
+            self.__count = height + 1
 
         if self.get_hash(height) != peak:
             self.__set_hash(height, peak)
@@ -123,10 +226,7 @@ class BlockHeightMap:
         if row[3] is not None:
             self.__sub_epoch_summaries[height] = row[3]
 
-        log.info(
-            f"Loaded sub-epoch-summaries: {len(self.__sub_epoch_summaries)} "
-            f"height-to-hash: {len(self.__height_to_hash) // 32}"
-        )
+        log.info(f"Loaded sub-epoch-summaries: {len(self.__sub_epoch_summaries)} height-to-hash: {self.__count}")
 
         # prepopulate the height -> hash mapping
         # run this unconditionally in to ensure both the height-to-hash and sub
@@ -140,7 +240,7 @@ class BlockHeightMap:
     def update_height(self, height: uint32, header_hash: bytes32, ses: Optional[SubEpochSummary]) -> None:
         # we're only updating the last hash. If we've reorged, we already rolled
         # back, making this the new peak
-        assert height * 32 <= len(self.__height_to_hash)
+        assert height <= self.__count
         self.__set_hash(height, header_hash)
         if ses is not None:
             self.__sub_epoch_summaries[height] = bytes(ses)
@@ -149,27 +249,75 @@ class BlockHeightMap:
         if self.__counter < 1000:
             return
 
-        assert (len(self.__height_to_hash) % 32) == 0
-        offset = self.__first_dirty * 32
-
         ses_buf = bytes(SesCache([(k, v) for (k, v) in self.__sub_epoch_summaries.items()]))
 
         self.__counter = 0
 
-        try:
-            async with aiofiles.open(self.__height_to_hash_filename, "r+b") as f:
-                map_buf = self.__height_to_hash[offset:].copy()
-                await f.seek(offset)
-                await f.write(map_buf)
-        except Exception:
-            # if the file doesn't exist, write the whole buffer
-            async with aiofiles.open(self.__height_to_hash_filename, "wb") as f:
-                map_buf = self.__height_to_hash.copy()
-                await f.write(map_buf)
-
-        self.__first_dirty = len(self.__height_to_hash) // 32
+        # drop any room we reserved for appending (or records that were rolled
+        # back), so the file size matches the number of records again
+        self.__truncate(self.__count)
+        if self.__height_to_hash is not None:
+            await asyncio.to_thread(self.__height_to_hash.flush)
+            checksum = tail_checksum(self.__height_to_hash, self.__count)
+        else:
+            checksum = tail_checksum(b"", 0)
+
+        header = HeightToHashHeader(uint8(HEADER_VERSION), uint32(self.__count), checksum)
+        await write_file_async(header_filename(self.__height_to_hash_filename), bytes(header))
         await write_file_async(self.__ses_filename, ses_buf)
 
+    def close(self) -> None:
+        # drop any room reserved for appending, or left behind by rollbacks
+        self.__truncate(self.__count)
+        if self.__height_to_hash is not None:
+            self.__height_to_hash.close()
+            self.__height_to_hash = None
+
+    def __open_file(self) -> None:
+        fd = os.open(self.__height_to_hash_filename, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        try:
+            # ignore any trailing partial record
+            size = os.fstat(fd).st_size // 32 * 32
+            if size == 0:
+                return
+            self.__height_to_hash = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.__count = valid_record_count(self.__height_to_hash_filename, self.__height_to_hash)
+
+    # resize the file to size bytes and map it again. mmap.resize() isn't
+    # available on all platforms (e.g. macOS), and Windows can't resize a file
+    # while it's mapped, so the old mapping is closed first
+    def __remap(self, size: int) -> None:
+        if self.__height_to_hash is not None:
+            self.__height_to_hash.close()
+            self.__height_to_hash = None
+        fd = os.open(self.__height_to_hash_filename, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o600)
+        try:
+            os.ftruncate(fd, size)
+            if size > 0:
+                self.__height_to_hash = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    # make sure the file, and the mapping of it, has room for at least count
+    # records
+    def __reserve(self, count: int) -> None:
+        size = count * 32
+        if self.__height_to_hash is None:
+            self.__remap(max(size, GROW_RECORDS * 32))
+            return
+        current = len(self.__height_to_hash)
+        if current < size:
+            self.__remap(max(size, current + max(GROW_RECORDS * 32, current // 8 // 32 * 32)))
+
+    # shrink the file to count records
+    def __truncate(self, count: int) -> None:
+        self.__count = min(self.__count, count)
+        if self.__height_to_hash is None or len(self.__height_to_hash) == count * 32:
+            return
+        self.__remap(count * 32)
+
     # load height-to-hash map entries from the DB starting at height back in
     # time until we hit a match in the existing map, at which point we can
     # assume all previous blocks have already been populated
@@ -230,18 +378,22 @@ class BlockHeightMap:
             log.info(f"Done validating at height {height}")
 
     def __set_hash(self, height: int, block_hash: bytes32) -> None:
+        if height >= self.__count:
+            self.__reserve(height + 1)
+            self.__count = height + 1
+        assert self.__height_to_hash is not None
         idx = height * 32
         self.__height_to_hash[idx : idx + 32] = block_hash
         self.__counter += 1
-        self.__first_dirty = min(self.__first_dirty, height)
 
     def get_hash(self, height: uint32) -> bytes32:
+        assert height < self.__count
+        assert self.__height_to_hash is not None
         idx = height * 32
-        assert idx + 32 <= len(self.__height_to_hash)
         return bytes32(self.__height_to_hash[idx : idx + 32])
 
     def contains_height(self, height: uint32) -> bool:
-        return height * 32 < len(self.__height_to_hash)
+        return height < self.__count
 
     def rollback(self, fork_height: int) -> None:
         # fork height may be -1, in which case all blocks are different and we
@@ -255,8 +407,10 @@ class BlockHeightMap:
         for height in heights_to_delete:
             del self.__sub_epoch_summaries[height]
 
-        del self.__height_to_hash[(fork_height + 1) * 32 :]
-        self.__first_dirty = min(self.__first_dirty, fork_height + 1)
+        # this is called for every new peak, so the file is left as is. Records
+        # past the count are overwritten as the chain grows again, and the
+        # file is shrunk to size the next time it's flushed
+        self.__count = min(self.__count, fork_height + 1)
 
         if len(heights_to_delete) > 0:
             log.log(
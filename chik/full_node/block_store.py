@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import dataclasses
 import logging
 import sqlite3
@@ -11,6 +12,7 @@ from chik_rs import BlockRecord, FullBlock, SubEpochChallengeSegment, SubEpochSe
 from chik_rs.sized_bytes import bytes32
 from chik_rs.sized_ints import uint32
 
+from chik.full_node.block_archive import BlockArchive
 from chik.full_node.full_block_utils import GeneratorBlockInfo, block_info_from_block, generator_from_block
 from chik.util.db_wrapper import DBWrapper2, execute_fetchone
 from chik.util.errors import Err
@@ -33,22 +35,45 @@ def decompress_blob(block_bytes: bytes) -> bytes:
     return ret
 
 
+# New blocks are compressed at the default zstd level, to keep adding them
+# cheap. "chik db recompress" re-compresses stored blocks at this (much
+# slower, but denser) level. zstd frames are self-describing and decompression
+# speed doesn't depend on the level, so blocks compressed either way are read
+# the same.
+RECOMPRESS_LEVEL = 19
+
+
+def recompress_blob(block_bytes: bytes, level: int = RECOMPRESS_LEVEL) -> bytes:
+    ret: bytes = zstd.compress(zstd.decompress(block_bytes), level)
+    return ret
+
+
+# the number of blocks archive_blocks() reads, or drops from full_blocks, at a
+# time. Dropping them needs the write lock, which is only held for one chunk
+ARCHIVE_CHUNK_BLOCKS = 500
+
+
 @typing_extensions.final
 @dataclasses.dataclass
 class BlockStore:
     block_cache: LRUCache[bytes32, FullBlock]
     db_wrapper: DBWrapper2
     ses_challenge_cache: LRUCache[bytes32, list[SubEpochChallengeSegment]]
+    # main chain blocks moved out of the full_blocks table have their "block"
+    # column set to NULL, and are read from here instead
+    archive: Optional[BlockArchive] = None
 
     @classmethod
-    async def create(cls, db_wrapper: DBWrapper2, *, use_cache: bool = True) -> BlockStore:
+    async def create(
+        cls, db_wrapper: DBWrapper2, *, use_cache: bool = True, archive: Optional[BlockArchive] = None
+    ) -> BlockStore:
         if db_wrapper.db_version != 2:
             raise RuntimeError(f"BlockStore does not support database schema v{db_wrapper.db_version}")
 
         if use_cache:
-            self = cls(LRUCache(1000), db_wrapper, LRUCache(50))
+            self = cls(LRUCache(1000), db_wrapper, LRUCache(50), archive)
         else:
-            self = cls(LRUCache(0), db_wrapper, LRUCache(0))
+            self = cls(LRUCache(0), db_wrapper, LRUCache(0), archive)
 
         async with self.db_wrapper.writer_maybe_transaction() as conn:
             log.info("DB: Creating block store tables and indexes.")
@@ -99,6 +124,74 @@ class BlockStore:
 
         return self
 
+    def _blob(self, blob: Optional[bytes], height: int, header_hash: bytes) -> bytes:
+        """
+        Returns the compressed block from a full_blocks row, or from the
+        archive if it has been moved there.
+        """
+        if blob is not None:
+            return blob
+        archived = None if self.archive is None else self.archive.get(height, bytes32(header_hash))
+        if archived is None:
+            raise ValueError(f"Block {bytes32(header_hash).hex()} at height {height} is missing from the block archive")
+        return archived
+
+    async def archive_blocks(self, max_height: int) -> int:
+        """
+        Moves the main chain blocks of all complete archive segments at or
+        below max_height from the full_blocks table into the archive. Returns
+        the number of blocks moved.
+        """
+        if self.archive is None:
+            return 0
+
+        archived = 0
+        while self.archive.archived_height() + self.archive.segment_blocks - 1 <= max_height:
+            start = self.archive.archived_height()
+            end = start + self.archive.segment_blocks
+            # the blocks are copied in chunks, without holding the write lock,
+            # so adding new blocks isn't held up while the segment is written
+            writer = self.archive.new_segment()
+            try:
+                for chunk_start in range(start, end, ARCHIVE_CHUNK_BLOCKS):
+                    async with self.db_wrapper.reader_no_transaction() as conn:
+                        async with conn.execute(
+                            "SELECT header_hash, height, block FROM full_blocks "
+                            "WHERE height >= ? AND height < ? AND in_main_chain=1 ORDER BY height",
+                            (chunk_start, min(chunk_start + ARCHIVE_CHUNK_BLOCKS, end)),
+                        ) as cursor:
+                            rows = await cursor.fetchall()
+                    blocks = [(bytes32(row[0]), self._blob(row[2], row[1], row[0])) for row in rows]
+                    await asyncio.to_thread(writer.add, blocks)
+                await asyncio.to_thread(writer.finish)
+            except BaseException:
+                writer.abort()
+                raise
+            self.archive.add_segment(writer)
+
+            # a block may have been replaced (by replace_proof()) after we
+            # copied it. Only drop the blocks that are identical to the
+            # archived copy, the ones that changed are still read from
+            # full_blocks
+            for chunk_start in range(start, end, ARCHIVE_CHUNK_BLOCKS):
+                chunk_end = min(chunk_start + ARCHIVE_CHUNK_BLOCKS, end)
+                async with self.db_wrapper.writer() as conn:
+                    async with conn.execute(
+                        "SELECT header_hash, height FROM full_blocks "
+                        "WHERE height >= ? AND height < ? AND in_main_chain=1 AND block IS NOT NULL",
+                        (chunk_start, chunk_end),
+                    ) as cursor:
+                        rows = await cursor.fetchall()
+                    updates = []
+                    for row in rows:
+                        blob = self.archive.get(row[1], bytes32(row[0]))
+                        if blob is not None:
+                            updates.append((row[0], blob))
+                    await conn.executemany("UPDATE full_blocks SET block=NULL WHERE header_hash=? AND block=?", updates)
+            log.info(f"moved blocks {start} - {end - 1} to the block archive")
+            archived += end - start
+        return archived
+
     async def rollback(self, height: int) -> None:
         async with self.db_wrapper.writer_maybe_transaction() as conn:
             await conn.execute("UPDATE full_blocks SET in_main_chain=0 WHERE height>? AND in_main_chain=1", (height,))
@@ -202,10 +295,12 @@ class BlockStore:
         if cached is not None:
             return cached
         async with self.db_wrapper.reader_no_transaction() as conn:
-            async with conn.execute("SELECT block from full_blocks WHERE header_hash=?", (header_hash,)) as cursor:
+            async with conn.execute(
+                "SELECT block, height from full_blocks WHERE header_hash=?", (header_hash,)
+            ) as cursor:
                 row = await cursor.fetchone()
         if row is not None:
-            block = decompress(row[0])
+            block = decompress(self._blob(row[0], row[1], header_hash))
             self.block_cache.put(header_hash, block)
             return block
         return None
@@ -215,14 +310,29 @@ class BlockStore:
         if cached is not None:
             return bytes(cached)
         async with self.db_wrapper.reader_no_transaction() as conn:
-            async with conn.execute("SELECT block from full_blocks WHERE header_hash=?", (header_hash,)) as cursor:
+            async with conn.execute(
+                "SELECT block, height from full_blocks WHERE header_hash=?", (header_hash,)
+            ) as cursor:
                 row = await cursor.fetchone()
         if row is not None:
-            ret: bytes = zstd.decompress(row[0])
+            ret: bytes = zstd.decompress(self._blob(row[0], row[1], header_hash))
             return ret
 
         return None
 
+    async def get_compressed_full_block(self, header_hash: bytes32) -> Optional[bytes]:
+        """
+        Returns the serialized block the way it's stored, zstd compressed
+        """
+        async with self.db_wrapper.reader_no_transaction() as conn:
+            async with conn.execute(
+                "SELECT block, height from full_blocks WHERE header_hash=?", (header_hash,)
+            ) as cursor:
+                row = await cursor.fetchone()
+        if row is not None:
+            return self._blob(row[0], row[1], header_hash)
+        return None
+
     async def get_full_blocks_at(self, heights: list[uint32]) -> list[FullBlock]:
         """
         Returns all blocks at the given heights, including orphans.
@@ -230,12 +340,13 @@ class BlockStore:
         if len(heights) == 0:
             return []
 
-        formatted_str = f"SELECT block from full_blocks WHERE height in ({'?,' * (len(heights) - 1)}?)"
+        placeholders, params = self.db_wrapper.in_parameters(heights)
+        formatted_str = f"SELECT block, height, header_hash from full_blocks WHERE height in ({placeholders})"
         async with self.db_wrapper.reader_no_transaction() as conn:
-            async with conn.execute(formatted_str, heights) as cursor:
+            async with conn.execute(formatted_str, params) as cursor:
                 ret: list[FullBlock] = []
                 for row in await cursor.fetchall():
-                    ret.append(decompress(row[0]))
+                    ret.append(decompress(self._blob(row[0], row[1], row[2])))
                 return ret
 
     async def get_block_info(self, header_hash: bytes32) -> Optional[GeneratorBlockInfo]:
@@ -250,7 +361,7 @@ class BlockStore:
             row = await execute_fetchone(conn, formatted_str, (header_hash,))
             if row is None:
                 return None
-            block_bytes = memoryview(zstd.decompress(row[0]))
+            block_bytes = memoryview(zstd.decompress(self._blob(row[0], row[1], header_hash)))
 
             try:
                 return block_info_from_block(block_bytes)
@@ -274,7 +385,7 @@ class BlockStore:
             row = await execute_fetchone(conn, formatted_str, (header_hash,))
             if row is None:
                 return None
-            block_bytes = memoryview(zstd.decompress(row[0]))
+            block_bytes = memoryview(zstd.decompress(self._blob(row[0], row[1], header_hash)))
 
             try:
                 return generator_from_block(block_bytes)
@@ -291,13 +402,14 @@ class BlockStore:
             return {}
 
         generators: dict[uint32, bytes] = {}
+        placeholders, params = self.db_wrapper.in_parameters(list(heights))
         formatted_str = (
-            f"SELECT block, height from full_blocks WHERE in_main_chain=1 AND height in ({'?,' * (len(heights) - 1)}?)"
+            f"SELECT block, height, header_hash from full_blocks WHERE in_main_chain=1 AND height in ({placeholders})"
         )
         async with self.db_wrapper.reader_no_transaction() as conn:
-            async with conn.execute(formatted_str, list(heights)) as cursor:
+            async with conn.execute(formatted_str, params) as cursor:
                 async for row in cursor:
-                    block_bytes = memoryview(zstd.decompress(row[0]))
+                    block_bytes = memoryview(zstd.decompress(self._blob(row[0], row[1], row[2])))
 
                     try:
                         gen = generator_from_block(block_bytes)
@@ -326,12 +438,11 @@ class BlockStore:
             return []
 
         all_blocks: dict[bytes32, BlockRecord] = {}
+        placeholders, params = self.db_wrapper.in_parameters(header_hashes)
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
-                "SELECT header_hash,block_record "
-                "FROM full_blocks "
-                f"WHERE header_hash in ({'?,' * (len(header_hashes) - 1)}?)",
-                header_hashes,
+                f"SELECT header_hash,block_record FROM full_blocks WHERE header_hash in ({placeholders})",
+                params,
             ) as cursor:
                 for row in await cursor.fetchall():
                     block_rec = BlockRecord.from_bytes(row[1])
@@ -373,15 +484,14 @@ class BlockStore:
             return []
 
         assert len(header_hashes) < self.db_wrapper.host_parameter_limit
-        formatted_str = (
-            f"SELECT header_hash, block from full_blocks WHERE header_hash in ({'?,' * (len(header_hashes) - 1)}?)"
-        )
+        placeholders, params = self.db_wrapper.in_parameters(header_hashes)
+        formatted_str = f"SELECT header_hash, block, height from full_blocks WHERE header_hash in ({placeholders})"
         all_blocks: dict[bytes32, bytes] = {}
         async with self.db_wrapper.reader_no_transaction() as conn:
-            async with conn.execute(formatted_str, header_hashes) as cursor:
+            async with conn.execute(formatted_str, params) as cursor:
                 for row in await cursor.fetchall():
                     header_hash = bytes32(row[0])
-                    all_blocks[header_hash] = decompress_blob(row[1])
+                    all_blocks[header_hash] = decompress_blob(self._blob(row[1], row[2], header_hash))
 
         ret: list[bytes] = []
         for hh in header_hashes:
@@ -401,15 +511,14 @@ class BlockStore:
         if len(header_hashes) == 0:
             return []
 
-        formatted_str = (
-            f"SELECT header_hash, block from full_blocks WHERE header_hash in ({'?,' * (len(header_hashes) - 1)}?)"
-        )
+        placeholders, params = self.db_wrapper.in_parameters(header_hashes)
+        formatted_str = f"SELECT header_hash, block, height from full_blocks WHERE header_hash in ({placeholders})"
         all_blocks: dict[bytes32, FullBlock] = {}
         async with self.db_wrapper.reader_no_transaction() as conn:
-            async with conn.execute(formatted_str, header_hashes) as cursor:
+            async with conn.execute(formatted_str, params) as cursor:
                 for row in await cursor.fetchall():
                     header_hash = bytes32(row[0])
-                    full_block: FullBlock = decompress(row[1])
+                    full_block: FullBlock = decompress(self._blob(row[1], row[2], header_hash))
                     all_blocks[header_hash] = full_block
                     self.block_cache.put(header_hash, full_block)
         ret: list[FullBlock] = []
@@ -471,13 +580,14 @@ class BlockStore:
         assert self.db_wrapper.db_version == 2
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
-                "SELECT block FROM full_blocks WHERE height >= ? AND height <= ? AND in_main_chain=1",
+                "SELECT block, height, header_hash FROM full_blocks "
+                "WHERE height >= ? AND height <= ? AND in_main_chain=1",
                 (start, stop),
             ) as cursor:
                 rows: list[sqlite3.Row] = list(await cursor.fetchall())
                 if len(rows) != (stop - start) + 1:
                     raise ValueError(f"Some blocks in range {start}-{stop} were not found.")
-                return [decompress_blob(row[0]) for row in rows]
+                return [decompress_blob(self._blob(row[0], row[1], row[2])) for row in rows]
 
     async def get_peak(self) -> Optional[tuple[bytes32, uint32]]:
         async with self.db_wrapper.reader_no_transaction() as conn:
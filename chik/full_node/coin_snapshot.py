@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import struct
+from collections.abc import Iterator
+from contextlib import closing
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Optional
+
+import zstd
+from chik_rs import Coin
+from chik_rs.sized_bytes import bytes32
+from chik_rs.sized_ints import uint8, uint32, uint64
+
+from chik.full_node.coin_store import COIN_RECORD_FF_UNSPENT_INDEX, COIN_RECORD_INDEXES, COIN_RECORD_TABLE
+from chik.util.streamable import Streamable, streamable
+
+# A coin snapshot is the set of unspent coins as of a specific block, stored in
+# a compact, columnar file. The file layout is:
+#
+#   SNAPSHOT_MAGIC
+#   uint32 (big endian) length of the header, followed by the serialized
+#   CoinSnapshotHeader
+#   zero or more chunks, each one prefixed by its uint32 (big endian)
+#   compressed length. A zero length marks the end of the chunks
+#   the serialized CoinSnapshotFooter
+#
+# Each chunk is zstd compressed and holds up to CHUNK_ROWS coins, one column at
+# a time: puzzle hashes (32 bytes each), parent coin ids (32 bytes each),
+# amounts (8 bytes each), confirmed heights (4 bytes each), timestamps (8 bytes
+# each) and flags (1 byte each). All integers are big endian.
+#
+# Coin IDs are not stored, they are computed from the parent, puzzle hash and
+# amount. Coins are stored in coin ID order and the footer commits to the full
+# set of coins, which is checked on import.
+
+SNAPSHOT_MAGIC = b"CHIKCOIN"
+SNAPSHOT_VERSION = 1
+CHUNK_ROWS = 100_000
+
+FLAG_COINBASE = 1
+# the coin has the same puzzle hash and amount as its parent. This is stored as
+# spent_index -1 in the coin_record table, while the coin is unspent
+FLAG_SAME_AS_PARENT = 2
+
+
+@streamable
+@dataclass(frozen=True)
+class CoinSnapshotHeader(Streamable):
+    version: uint8
+    height: uint32
+    header_hash: bytes32
+    coin_count: uint64
+
+
+@streamable
+@dataclass(frozen=True)
+class CoinSnapshotFooter(Streamable):
+    commitment: bytes32
+
+
+@dataclass(frozen=True)
+class SnapshotCoin:
+    coin_id: bytes32
+    puzzle_hash: bytes32
+    parent: bytes32
+    amount: uint64
+    confirmed_index: uint32
+    timestamp: uint64
+    flags: int
+
+
+class CoinSnapshotError(Exception):
+    pass
+
+
+class _Commitment:
+    def __init__(self, header: CoinSnapshotHeader) -> None:
+        self._hash = hashlib.sha256(bytes(header))
+
+    def update(self, coin: SnapshotCoin) -> None:
+        # the puzzle hash, parent and amount are committed to by the coin ID
+        self._hash.update(coin.coin_id)
+        self._hash.update(struct.pack(">IQB", coin.confirmed_index, coin.timestamp, coin.flags))
+
+    def digest(self) -> bytes32:
+        return bytes32(self._hash.digest())
+
+
+def _encode_chunk(coins: list[SnapshotCoin]) -> bytes:
+    columns = [
+        b"".join(c.puzzle_hash for c in coins),
+        b"".join(c.parent for c in coins),
+        b"".join(c.amount.to_bytes(8, "big") for c in coins),
+        b"".join(c.confirmed_index.to_bytes(4, "big") for c in coins),
+        b"".join(c.timestamp.to_bytes(8, "big") for c in coins),
+        bytes(c.flags for c in coins),
+    ]
+    return struct.pack(">I", len(coins)) + b"".join(columns)
+
+
+def _decode_chunk(buf: bytes) -> list[SnapshotCoin]:
+    (count,) = struct.unpack_from(">I", buf, 0)
+    if len(buf) != 4 + count * (32 + 32 + 8 + 4 + 8 + 1):
+        raise CoinSnapshotError("invalid chunk size")
+    ph_offset = 4
+    parent_offset = ph_offset + count * 32
+    amount_offset = parent_offset + count * 32
+    height_offset = amount_offset + count * 8
+    timestamp_offset = height_offset + count * 4
+    flags_offset = timestamp_offset + count * 8
+    ret = []
+    for i in range(count):
+        puzzle_hash = bytes32(buf[ph_offset + i * 32 : ph_offset + (i + 1) * 32])
+        parent = bytes32(buf[parent_offset + i * 32 : parent_offset + (i + 1) * 32])
+        amount = uint64.from_bytes(buf[amount_offset + i * 8 : amount_offset + (i + 1) * 8])
+        ret.append(
+            SnapshotCoin(
+                Coin(parent, puzzle_hash, amount).name(),
+                puzzle_hash,
+                parent,
+                amount,
+                uint32.from_bytes(buf[height_offset + i * 4 : height_offset + (i + 1) * 4]),
+                uint64.from_bytes(buf[timestamp_offset + i * 8 : timestamp_offset + (i + 1) * 8]),
+                buf[flags_offset + i],
+            )
+        )
+    return ret
+
+
+def _write_frame(f: BinaryIO, buf: bytes) -> None:
+    f.write(struct.pack(">I", len(buf)))
+    f.write(buf)
+
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    buf = f.read(size)
+    if len(buf) != size:
+        raise CoinSnapshotError("unexpected end of snapshot file")
+    return buf
+
+
+def _read_frame(f: BinaryIO) -> bytes:
+    (size,) = struct.unpack(">I", _read_exact(f, 4))
+    return _read_exact(f, size)
+
+
+def export_coin_snapshot(
+    conn: sqlite3.Connection,
+    out: BinaryIO,
+    height: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> CoinSnapshotHeader:
+    """
+    Write the set of coins that were unspent as of the main-chain block at
+    height (or the current peak, if height is None) in the v2 blockchain
+    database conn to out. progress is called with the number of coins written
+    so far and the total.
+    """
+    # make sure the peak, the count and the coins all come from the same
+    # database snapshot, in case the node is running
+    conn.execute("BEGIN")
+    try:
+        if height is None:
+            with closing(
+                conn.execute(
+                    "SELECT full_blocks.header_hash, full_blocks.height FROM current_peak "
+                    "INNER JOIN full_blocks ON current_peak.hash = full_blocks.header_hash WHERE current_peak.key = 0"
+                )
+            ) as cursor:
+                row = cursor.fetchone()
+        else:
+            with closing(
+                conn.execute(
+                    "SELECT header_hash, height FROM full_blocks WHERE height = ? AND in_main_chain = 1", (height,)
+                )
+            ) as cursor:
+                row = cursor.fetchone()
+        if row is None:
+            raise CoinSnapshotError("no block found to take the snapshot at")
+        header_hash = bytes32(row[0])
+        height = int(row[1])
+
+        where = "c.confirmed_index <= ? AND (c.spent_index <= 0 OR c.spent_index > ?)"
+        with closing(conn.execute(f"SELECT COUNT(*) FROM coin_record c WHERE {where}", (height, height))) as cursor:
+            count_row = cursor.fetchone()
+        assert count_row is not None
+        header = CoinSnapshotHeader(uint8(SNAPSHOT_VERSION), uint32(height), header_hash, uint64(count_row[0]))
+
+        out.write(SNAPSHOT_MAGIC)
+        _write_frame(out, bytes(header))
+        commitment = _Commitment(header)
+        written = 0
+        # coins spent after the snapshot height no longer have spent_index -1,
+        # so whether a coin has the same puzzle hash and amount as its parent
+        # is determined by looking at the parent (which is never pruned)
+        with closing(
+            conn.execute(
+                "SELECT c.coin_name, c.puzzle_hash, c.coin_parent, c.amount, c.confirmed_index, c.timestamp, "
+                "c.coinbase, (p.puzzle_hash = c.puzzle_hash AND p.amount = c.amount) "
+                "FROM coin_record c LEFT JOIN coin_record p ON p.coin_name = c.coin_parent "
+                f"WHERE {where} ORDER BY c.coin_name",
+                (height, height),
+            )
+        ) as cursor:
+            while True:
+                rows = cursor.fetchmany(CHUNK_ROWS)
+                if len(rows) == 0:
+                    break
+                coins = [
+                    SnapshotCoin(
+                        bytes32(r[0]),
+                        bytes32(r[1]),
+                        bytes32(r[2]),
+                        uint64.from_bytes(r[3]),
+                        uint32(r[4]),
+                        uint64(r[5]),
+                        FLAG_COINBASE if r[6] else (FLAG_SAME_AS_PARENT if r[7] else 0),
+                    )
+                    for r in rows
+                ]
+                for c in coins:
+                    commitment.update(c)
+                _write_frame(out, zstd.compress(_encode_chunk(coins)))
+                written += len(coins)
+                if progress is not None:
+                    progress(written, header.coin_count)
+        out.write(struct.pack(">I", 0))
+        out.write(bytes(CoinSnapshotFooter(commitment.digest())))
+    finally:
+        conn.execute("ROLLBACK")
+    if written != header.coin_count:
+        raise CoinSnapshotError(f"expected {header.coin_count} coins but exported {written}")
+    return header
+
+
+def read_coin_snapshot(f: BinaryIO) -> tuple[CoinSnapshotHeader, Iterator[list[SnapshotCoin]]]:
+    """
+    Parses the header of the snapshot file f and returns it together with an
+    iterator of chunks of coins, in coin ID order. The iterator raises
+    CoinSnapshotError if the file is malformed or the coins don't match the
+    commitment in the footer. This is only checked once the last chunk has been
+    read, so callers must not commit anything before the iterator is exhausted.
+    """
+    if _read_exact(f, len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise CoinSnapshotError("not a coin snapshot file")
+    header = CoinSnapshotHeader.from_bytes(_read_frame(f))
+    if header.version != SNAPSHOT_VERSION:
+        raise CoinSnapshotError(f"unsupported coin snapshot version {header.version}")
+
+    def chunks() -> Iterator[list[SnapshotCoin]]:
+        commitment = _Commitment(header)
+        count = 0
+        last_id: Optional[bytes32] = None
+        while True:
+            buf = _read_frame(f)
+            if len(buf) == 0:
+                break
+            coins = _decode_chunk(zstd.decompress(buf))
+            for c in coins:
+                if last_id is not None and c.coin_id <= last_id:
+                    raise CoinSnapshotError("coins in snapshot are not sorted by coin ID")
+                if c.confirmed_index > header.height:
+                    raise CoinSnapshotError(f"coin {c.coin_id.hex()} confirmed after the snapshot height")
+                last_id = c.coin_id
+                commitment.update(c)
+            count += len(coins)
+            yield coins
+        footer = CoinSnapshotFooter.from_bytes(_read_exact(f, 32))
+        if count != header.coin_count:
+            raise CoinSnapshotError(f"expected {header.coin_count} coins, found {count}")
+        if commitment.digest() != footer.commitment:
+            raise CoinSnapshotError("coin snapshot commitment mismatch")
+
+    return header, chunks()
+
+
+def import_coin_snapshot(
+    conn: sqlite3.Connection,
+    f: BinaryIO,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+) -> CoinSnapshotHeader:
+    """
+    Load the coin snapshot f into an empty coin_record table in the v2
+    blockchain database conn, creating the table if needed. The secondary
+    indexes are (re-)created after all coins have been inserted. The peak of
+    the database must be the block the snapshot was taken at, the node can't
+    sync on top of a coin set without the blocks leading up to it. progress is
+    called with the stage, the number of items done and the total.
+    """
+    header, chunks = read_coin_snapshot(f)
+
+    with closing(
+        conn.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type='table' AND name IN ('coin_record', 'full_blocks', 'current_peak')"
+        )
+    ) as cursor:
+        tables = {r[0] for r in cursor.fetchall()}
+    peak: Optional[bytes32] = None
+    if "full_blocks" in tables and "current_peak" in tables:
+        with closing(
+            conn.execute(
+                "SELECT full_blocks.header_hash FROM current_peak "
+                "INNER JOIN full_blocks ON current_peak.hash = full_blocks.header_hash WHERE current_peak.key = 0"
+            )
+        ) as cursor:
+            row = cursor.fetchone()
+        if row is not None:
+            peak = bytes32(row[0])
+    if peak != header.header_hash:
+        raise CoinSnapshotError(
+            f"the peak of the database must be the snapshot block {header.header_hash.hex()} at height "
+            f"{header.height}, the blocks have to be present to continue syncing from there"
+        )
+    if "coin_record" in tables:
+        with closing(conn.execute("SELECT 1 FROM coin_record LIMIT 1")) as cursor:
+            if cursor.fetchone() is not None:
+                raise CoinSnapshotError("the coin_record table is not empty")
+
+    conn.execute("BEGIN")
+    try:
+        # indexes are built once all coins are loaded
+        conn.execute("DROP TABLE IF EXISTS coin_record")
+        conn.execute(COIN_RECORD_TABLE)
+        loaded = 0
+        for coins in chunks:
+            conn.executemany(
+                "INSERT INTO coin_record VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        c.coin_id,
+                        c.confirmed_index,
+                        -1 if c.flags & FLAG_SAME_AS_PARENT else 0,
+                        1 if c.flags & FLAG_COINBASE else 0,
+                        c.puzzle_hash,
+                        c.parent,
+                        c.amount.stream_to_bytes(),
+                        c.timestamp,
+                    )
+                    for c in coins
+                ),
+            )
+            loaded += len(coins)
+            if progress is not None:
+                progress("coins", loaded, header.coin_count)
+
+        indexes = [sql for _, sql in COIN_RECORD_INDEXES] + [COIN_RECORD_FF_UNSPENT_INDEX]
+        for i, index in enumerate(indexes):
+            conn.execute(index)
+            if progress is not None:
+                progress("indexes", i + 1, len(indexes))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return header
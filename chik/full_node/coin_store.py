@@ -5,7 +5,7 @@ import logging
 import sqlite3
 import time
 from collections.abc import Collection
-from typing import Any, ClassVar, Optional
+from typing import ClassVar, Optional
 
 import typing_extensions
 from aiosqlite import Cursor
@@ -22,6 +22,57 @@ from chik.util.db_wrapper import SQLITE_MAX_VARIABLE_NUMBER, DBWrapper2
 log = logging.getLogger(__name__)
 
 
+# the coin_record table and its indexes. These are also created by the coin
+# snapshot import
+COIN_RECORD_TABLE = (
+    "CREATE TABLE IF NOT EXISTS coin_record("
+    "coin_name blob PRIMARY KEY,"
+    " confirmed_index bigint,"
+    " spent_index bigint,"  # if this is zero, it means the coin has not been spent
+    " coinbase int,"
+    " puzzle_hash blob,"
+    " coin_parent blob,"
+    " amount blob,"  # we use a blob of 8 bytes to store uint64
+    " timestamp bigint)"
+)
+
+COIN_RECORD_INDEXES = [
+    # Useful for reorg lookups
+    ("coin_confirmed_index", "CREATE INDEX IF NOT EXISTS coin_confirmed_index on coin_record(confirmed_index)"),
+    ("coin_spent_index", "CREATE INDEX IF NOT EXISTS coin_spent_index on coin_record(spent_index)"),
+    ("coin_puzzle_hash", "CREATE INDEX IF NOT EXISTS coin_puzzle_hash on coin_record(puzzle_hash)"),
+    ("coin_parent_index", "CREATE INDEX IF NOT EXISTS coin_parent_index on coin_record(coin_parent)"),
+]
+
+# This partial index optimizes fast forward singleton latest unspent queries
+COIN_RECORD_FF_UNSPENT_INDEX = """
+    CREATE INDEX IF NOT EXISTS coin_record_ph_ff_unspent_idx
+        ON coin_record(puzzle_hash, spent_index)
+        WHERE spent_index = -1
+    """
+
+
+@dataclasses.dataclass
+class PendingCoin:
+    """
+    A coin added by a block whose coin set changes are buffered in memory, and
+    not yet written to the DB.
+    """
+
+    coin: Coin
+    confirmed_index: uint32
+    # the value spent_index has in the DB while the coin is unspent. -1 for
+    # coins with the same puzzle hash and amount as their parent (potential
+    # fast forward singletons) and 0 otherwise
+    unspent_index: int
+    coinbase: bool
+    timestamp: uint64
+    spent_index: uint32 = uint32(0)
+
+    def to_coin_record(self) -> CoinRecord:
+        return CoinRecord(self.coin, self.confirmed_index, self.spent_index, self.coinbase, self.timestamp)
+
+
 @typing_extensions.final
 @dataclasses.dataclass
 class CoinStore:
@@ -30,9 +81,25 @@ class CoinStore:
     """
 
     db_wrapper: DBWrapper2
+    # the indexes of the coin_record table. Some of them are dropped while
+    # their creation is deferred during long sync, and queries can't name
+    # missing indexes in INDEXED BY clauses
+    _indexes: set[str] = dataclasses.field(default_factory=set)
     # Fall back to the `coin_puzzle_hash` index if the ff unspent index
-    # does not exist.
-    _unspent_lineage_for_ph_idx: str = "coin_puzzle_hash"
+    # does not exist. None if neither exists
+    _unspent_lineage_for_ph_idx: Optional[str] = "coin_puzzle_hash"
+
+    # In write-behind mode, new_block() buffers the coin set changes in memory
+    # instead of writing them to the DB. They are written by flush_pending().
+    # This is used during long sync, to batch the DB writes of many blocks.
+    # get_coin_record(), get_coin_records(), get_coins_added_at_height() and
+    # get_coins_removed_at_height() take the buffered changes into account,
+    # the other queries only see what has been flushed.
+    _write_behind: bool = False
+    # coins added by buffered blocks
+    _pending_coins: dict[bytes32, PendingCoin] = dataclasses.field(default_factory=dict)
+    # coins in the DB spent by buffered blocks, coin ID -> spent height
+    _pending_spends: dict[bytes32, uint32] = dataclasses.field(default_factory=dict)
 
     @classmethod
     async def create(cls, db_wrapper: DBWrapper2) -> CoinStore:
@@ -44,30 +111,11 @@ class CoinStore:
             log.info("DB: Creating coin store tables and indexes.")
             # the coin_name is unique in this table because the CoinStore always
             # only represent a single peak
-            await conn.execute(
-                "CREATE TABLE IF NOT EXISTS coin_record("
-                "coin_name blob PRIMARY KEY,"
-                " confirmed_index bigint,"
-                " spent_index bigint,"  # if this is zero, it means the coin has not been spent
-                " coinbase int,"
-                " puzzle_hash blob,"
-                " coin_parent blob,"
-                " amount blob,"  # we use a blob of 8 bytes to store uint64
-                " timestamp bigint)"
-            )
-
-            # Useful for reorg lookups
-            log.info("DB: Creating index coin_confirmed_index")
-            await conn.execute("CREATE INDEX IF NOT EXISTS coin_confirmed_index on coin_record(confirmed_index)")
-
-            log.info("DB: Creating index coin_spent_index")
-            await conn.execute("CREATE INDEX IF NOT EXISTS coin_spent_index on coin_record(spent_index)")
-
-            log.info("DB: Creating index coin_puzzle_hash")
-            await conn.execute("CREATE INDEX IF NOT EXISTS coin_puzzle_hash on coin_record(puzzle_hash)")
+            await conn.execute(COIN_RECORD_TABLE)
 
-            log.info("DB: Creating index coin_parent_index")
-            await conn.execute("CREATE INDEX IF NOT EXISTS coin_parent_index on coin_record(coin_parent)")
+            for name, sql in COIN_RECORD_INDEXES:
+                log.info(f"DB: Creating index {name}")
+                await conn.execute(sql)
 
             async with conn.execute("SELECT 1 FROM coin_record LIMIT 1") as cursor:
                 is_new_db = await cursor.fetchone() is None
@@ -78,21 +126,34 @@ class CoinStore:
                 # complex migrations that affect the huge coin records table.
                 # The performance benefit outweighs the cost of this partial
                 # index as it only includes rows where spent_index is -1.
-                await conn.execute(
-                    """
-                    CREATE INDEX IF NOT EXISTS coin_record_ph_ff_unspent_idx
-                        ON coin_record(puzzle_hash, spent_index)
-                        WHERE spent_index = -1
-                    """
-                )
+                await conn.execute(COIN_RECORD_FF_UNSPENT_INDEX)
+        await self.refresh_indexes()
+
+        return self
+
+    async def refresh_indexes(self) -> None:
+        """
+        Picks the indexes used by queries based on which ones exist. This needs
+        to be called after indexes are dropped or created.
+        """
+        async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
-                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'coin_record_ph_ff_unspent_idx'"
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'coin_record'"
             ) as cursor:
-                has_ff_unspent_idx = await cursor.fetchone() is not None
-            if has_ff_unspent_idx:
-                self._unspent_lineage_for_ph_idx = "coin_record_ph_ff_unspent_idx"
+                self._indexes = {row[0] for row in await cursor.fetchall()}
+        if "coin_record_ph_ff_unspent_idx" in self._indexes:
+            self._unspent_lineage_for_ph_idx = "coin_record_ph_ff_unspent_idx"
+        elif "coin_puzzle_hash" in self._indexes:
+            self._unspent_lineage_for_ph_idx = "coin_puzzle_hash"
+        else:
+            self._unspent_lineage_for_ph_idx = None
 
-        return self
+    def indexed_by(self, index: str) -> str:
+        """
+        Returns an INDEXED BY clause for the index, or an empty string if it
+        doesn't exist.
+        """
+        return f"INDEXED BY {index} " if index in self._indexes else ""
 
     async def num_unspent(self) -> int:
         async with self.db_wrapper.reader_no_transaction() as conn:
@@ -115,6 +176,15 @@ class CoinStore:
         Only called for blocks which are blocks (and thus have rewards and transactions)
         """
 
+        if height == 0:
+            assert len(included_reward_coins) == 0
+        else:
+            assert len(included_reward_coins) >= 2
+
+        if self._write_behind:
+            self._buffer_block(height, timestamp, included_reward_coins, tx_additions, tx_removals)
+            return
+
         start = time.monotonic()
 
         db_values_to_insert = []
@@ -136,11 +206,6 @@ class CoinStore:
                 )
             )
 
-        if height == 0:
-            assert len(included_reward_coins) == 0
-        else:
-            assert len(included_reward_coins) >= 2
-
         for coin in included_reward_coins:
             db_values_to_insert.append(
                 (
@@ -170,8 +235,106 @@ class CoinStore:
             + "blockchain database is on a fast drive",
         )
 
+    def set_write_behind(self, enabled: bool) -> None:
+        """
+        Enables or disables write-behind mode. Any buffered changes must be
+        flushed by the caller (with flush_pending()) before disabling it.
+        """
+        assert enabled or self.pending_count() == 0
+        self._write_behind = enabled
+
+    def pending_count(self) -> int:
+        return len(self._pending_coins) + len(self._pending_spends)
+
+    def _buffer_block(
+        self,
+        height: uint32,
+        timestamp: uint64,
+        included_reward_coins: Collection[Coin],
+        tx_additions: Collection[tuple[bytes32, Coin, bool]],
+        tx_removals: list[bytes32],
+    ) -> None:
+        for coin_id, coin, same_as_parent in tx_additions:
+            if coin_id in self._pending_coins:
+                raise ValueError(f"Invalid operation to add coin {coin_id.hex()}, it already exists")
+            self._pending_coins[coin_id] = PendingCoin(coin, height, -1 if same_as_parent else 0, False, timestamp)
+        for coin in included_reward_coins:
+            coin_id = coin.name()
+            if coin_id in self._pending_coins:
+                raise ValueError(f"Invalid operation to add coin {coin_id.hex()}, it already exists")
+            self._pending_coins[coin_id] = PendingCoin(coin, height, 0, True, timestamp)
+
+        assert len(tx_removals) == 0 or height > 0
+        for coin_id in tx_removals:
+            pending = self._pending_coins.get(coin_id)
+            if pending is not None:
+                if pending.spent_index > 0:
+                    raise ValueError(f"Invalid operation to set spent, coin {coin_id.hex()} is already spent")
+                pending.spent_index = height
+            else:
+                if coin_id in self._pending_spends:
+                    raise ValueError(f"Invalid operation to set spent, coin {coin_id.hex()} is already spent")
+                # whether this coin exists (and is unspent) in the DB is checked
+                # when flushing
+                self._pending_spends[coin_id] = height
+
+    async def flush_pending(self) -> None:
+        if self.pending_count() == 0:
+            return
+
+        start = time.monotonic()
+        db_values_to_insert = [
+            (
+                coin_id,
+                p.confirmed_index,
+                p.spent_index if p.spent_index > 0 else p.unspent_index,
+                1 if p.coinbase else 0,
+                p.coin.puzzle_hash,
+                p.coin.parent_coin_info,
+                p.coin.amount.stream_to_bytes(),
+                p.timestamp,
+            )
+            for coin_id, p in self._pending_coins.items()
+        ]
+        spends_by_height: dict[uint32, list[bytes32]] = {}
+        for coin_id, height in self._pending_spends.items():
+            spends_by_height.setdefault(height, []).append(coin_id)
+
+        async with self.db_wrapper.writer_maybe_transaction() as conn:
+            await conn.executemany("INSERT INTO coin_record VALUES(?, ?, ?, ?, ?, ?, ?, ?)", db_values_to_insert)
+            for height, coin_ids in spends_by_height.items():
+                await self._set_spent(coin_ids, height)
+
+        end = time.monotonic()
+        log.log(
+            logging.WARNING if end - start > 10 else logging.DEBUG,
+            f"It took {end - start:0.2f}s to flush {len(db_values_to_insert)} additions and "
+            f"{len(self._pending_spends)} removals to the coin store. Make sure "
+            "blockchain database is on a fast drive",
+        )
+        self._pending_coins.clear()
+        self._pending_spends.clear()
+
+    def rollback_pending(self, block_index: int) -> None:
+        for coin_id in [coin_id for coin_id, p in self._pending_coins.items() if p.confirmed_index > block_index]:
+            del self._pending_coins[coin_id]
+        for p in self._pending_coins.values():
+            if p.spent_index > block_index:
+                p.spent_index = uint32(0)
+        for coin_id in [coin_id for coin_id, height in self._pending_spends.items() if height > block_index]:
+            del self._pending_spends[coin_id]
+
+    def _apply_pending_spend(self, record: CoinRecord) -> CoinRecord:
+        spent_height = self._pending_spends.get(record.coin.name())
+        if spent_height is None:
+            return record
+        return dataclasses.replace(record, spent_block_index=spent_height)
+
     # Checks DB and DiffStores for CoinRecord with coin_name and returns it
     async def get_coin_record(self, coin_name: bytes32) -> Optional[CoinRecord]:
+        pending = self._pending_coins.get(coin_name)
+        if pending is not None:
+            return pending.to_coin_record()
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
                 "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
@@ -182,7 +345,10 @@ class CoinStore:
                 if row is not None:
                     coin = self.row_to_coin(row)
                     spent_index = uint32(0) if row[1] <= 0 else uint32(row[1])
-                    return CoinRecord(coin, row[0], spent_index, row[2], row[6])
+                    record = CoinRecord(coin, row[0], spent_index, row[2], row[6])
+                    if len(self._pending_spends) > 0:
+                        record = self._apply_pending_spend(record)
+                    return record
         return None
 
     async def get_coin_records(self, names: Collection[bytes32]) -> list[CoinRecord]:
@@ -191,15 +357,27 @@ class CoinStore:
 
         coins: list[CoinRecord] = []
 
+        if len(self._pending_coins) > 0:
+            db_names = []
+            for name in names:
+                pending = self._pending_coins.get(name)
+                if pending is not None:
+                    coins.append(pending.to_coin_record())
+                else:
+                    db_names.append(name)
+            names = db_names
+            if len(names) == 0:
+                return coins
+
         async with self.db_wrapper.reader_no_transaction() as conn:
             cursors: list[Cursor] = []
             for batch in to_batches(names, SQLITE_MAX_VARIABLE_NUMBER):
-                names_db: tuple[Any, ...] = tuple(batch.entries)
+                placeholders, names_db = self.db_wrapper.in_parameters(batch.entries)
                 cursors.append(
                     await conn.execute(
                         f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
                         f"coin_parent, amount, timestamp FROM coin_record "
-                        f"WHERE coin_name in ({','.join(['?'] * len(names_db))}) ",
+                        f"WHERE coin_name in ({placeholders}) ",
                         names_db,
                     )
                 )
@@ -209,6 +387,8 @@ class CoinStore:
                     coin = self.row_to_coin(row)
                     spent_index = uint32(0) if row[1] <= 0 else uint32(row[1])
                     record = CoinRecord(coin, row[0], spent_index, row[2], row[6])
+                    if len(self._pending_spends) > 0:
+                        record = self._apply_pending_spend(record)
                     coins.append(record)
 
         return coins
@@ -225,8 +405,12 @@ class CoinStore:
                 for row in rows:
                     coin = self.row_to_coin(row)
                     spent_index = uint32(0) if row[1] <= 0 else uint32(row[1])
-                    coins.append(CoinRecord(coin, row[0], spent_index, row[2], row[6]))
-                return coins
+                    record = CoinRecord(coin, row[0], spent_index, row[2], row[6])
+                    if len(self._pending_spends) > 0:
+                        record = self._apply_pending_spend(record)
+                    coins.append(record)
+        coins.extend(p.to_coin_record() for p in self._pending_coins.values() if p.confirmed_index == height)
+        return coins
 
     async def get_coins_removed_at_height(self, height: uint32) -> list[CoinRecord]:
         # Special case to avoid querying all unspent coins (spent_index=0)
@@ -244,7 +428,11 @@ class CoinStore:
                         coin = self.row_to_coin(row)
                         coin_record = CoinRecord(coin, row[0], row[1], row[2], row[6])
                         coins.append(coin_record)
-                return coins
+        coins.extend(p.to_coin_record() for p in self._pending_coins.values() if p.spent_index == height)
+        pending_spends = [coin_id for coin_id, h in self._pending_spends.items() if h == height]
+        if len(pending_spends) > 0:
+            coins.extend(await self.get_coin_records(pending_spends))
+        return coins
 
     # Checks DB and DiffStores for CoinRecords with puzzle_hash and returns them
     async def get_coin_records_by_puzzle_hash(
@@ -259,7 +447,8 @@ class CoinStore:
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
                 f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
-                f"coin_parent, amount, timestamp FROM coin_record INDEXED BY coin_puzzle_hash WHERE puzzle_hash=? "
+                f"coin_parent, amount, timestamp FROM coin_record {self.indexed_by('coin_puzzle_hash')}"
+                f"WHERE puzzle_hash=? "
                 f"AND confirmed_index>=? AND confirmed_index<? "
                 f"{'' if include_spent_coins else 'AND spent_index <= 0'}",
                 (puzzle_hash, start_height, end_height),
@@ -281,14 +470,13 @@ class CoinStore:
             return []
 
         coins = set()
-        puzzle_hashes_db: tuple[Any, ...]
-        puzzle_hashes_db = tuple(puzzle_hashes)
+        placeholders, puzzle_hashes_db = self.db_wrapper.in_parameters(puzzle_hashes)
 
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
                 f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
-                f"coin_parent, amount, timestamp FROM coin_record INDEXED BY coin_puzzle_hash "
-                f"WHERE puzzle_hash in ({'?,' * (len(puzzle_hashes) - 1)}?) "
+                f"coin_parent, amount, timestamp FROM coin_record {self.indexed_by('coin_puzzle_hash')}"
+                f"WHERE puzzle_hash in ({placeholders}) "
                 f"AND confirmed_index>=? AND confirmed_index<? "
                 f"{'' if include_spent_coins else 'AND spent_index <= 0'}",
                 (*puzzle_hashes_db, start_height, end_height),
@@ -310,15 +498,16 @@ class CoinStore:
             return []
 
         coins = set()
+        placeholders, names_db = self.db_wrapper.in_parameters(names)
 
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
                 f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
                 f"coin_parent, amount, timestamp FROM coin_record INDEXED BY sqlite_autoindex_coin_record_1 "
-                f"WHERE coin_name in ({'?,' * (len(names) - 1)}?) "
+                f"WHERE coin_name in ({placeholders}) "
                 f"AND confirmed_index>=? AND confirmed_index<? "
                 f"{'' if include_spent_coins else 'AND spent_index <= 0'}",
-                [*names, start_height, end_height],
+                [*names_db, start_height, end_height],
             ) as cursor:
                 for row in await cursor.fetchall():
                     coin = self.row_to_coin(row)
@@ -351,11 +540,11 @@ class CoinStore:
         coins: set[CoinState] = set()
         async with self.db_wrapper.reader_no_transaction() as conn:
             for batch in to_batches(puzzle_hashes, SQLITE_MAX_VARIABLE_NUMBER):
-                puzzle_hashes_db: tuple[Any, ...] = tuple(batch.entries)
+                placeholders, puzzle_hashes_db = self.db_wrapper.in_parameters(batch.entries)
                 async with conn.execute(
                     f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
-                    f"coin_parent, amount, timestamp FROM coin_record INDEXED BY coin_puzzle_hash "
-                    f"WHERE puzzle_hash in ({'?,' * (len(batch.entries) - 1)}?) "
+                    f"coin_parent, amount, timestamp FROM coin_record {self.indexed_by('coin_puzzle_hash')}"
+                    f"WHERE puzzle_hash in ({placeholders}) "
                     f"AND (confirmed_index>=? OR spent_index>=?)"
                     f"{'' if include_spent_coins else ' AND spent_index <= 0'}"
                     " LIMIT ?",
@@ -383,10 +572,10 @@ class CoinStore:
         coins = set()
         async with self.db_wrapper.reader_no_transaction() as conn:
             for batch in to_batches(parent_ids, SQLITE_MAX_VARIABLE_NUMBER):
-                parent_ids_db: tuple[Any, ...] = tuple(batch.entries)
+                placeholders, parent_ids_db = self.db_wrapper.in_parameters(batch.entries)
                 async with conn.execute(
                     f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, coin_parent, amount, timestamp "
-                    f"FROM coin_record WHERE coin_parent in ({'?,' * (len(batch.entries) - 1)}?) "
+                    f"FROM coin_record WHERE coin_parent in ({placeholders}) "
                     f"AND confirmed_index>=? AND confirmed_index<? "
                     f"{'' if include_spent_coins else 'AND spent_index <= 0'}",
                     (*parent_ids_db, start_height, end_height),
@@ -413,19 +602,21 @@ class CoinStore:
         coins: list[CoinState] = []
         async with self.db_wrapper.reader_no_transaction() as conn:
             for batch in to_batches(coin_ids, SQLITE_MAX_VARIABLE_NUMBER):
-                coin_ids_db: tuple[Any, ...] = tuple(batch.entries)
+                placeholders, coin_ids_db = self.db_wrapper.in_parameters(batch.entries)
 
                 max_height_sql = ""
+                max_height_params: tuple[int, ...] = ()
                 if max_height != uint32.MAXIMUM:
-                    max_height_sql = f"AND confirmed_index<={max_height} AND spent_index<={max_height}"
+                    max_height_sql = "AND confirmed_index<=? AND spent_index<=?"
+                    max_height_params = (max_height, max_height)
 
                 async with conn.execute(
                     f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, coin_parent, amount, timestamp "
-                    f"FROM coin_record WHERE coin_name in ({'?,' * (len(batch.entries) - 1)}?) "
+                    f"FROM coin_record WHERE coin_name in ({placeholders}) "
                     f"AND (confirmed_index>=? OR spent_index>=?) {max_height_sql}"
                     f"{'' if include_spent_coins else 'AND spent_index <= 0'}"
                     " LIMIT ?",
-                    (*coin_ids_db, min_height, min_height, max_items - len(coins)),
+                    (*coin_ids_db, min_height, min_height, *max_height_params, max_items - len(coins)),
                 ) as cursor:
                     for row in await cursor.fetchall():
                         coins.append(self.row_to_coin_state(row))
@@ -464,8 +655,8 @@ class CoinStore:
         coin_states: list[CoinState]
 
         async with self.db_wrapper.reader() as conn:
-            puzzle_hashes_db = tuple(puzzle_hashes)
-            puzzle_hash_count = len(puzzle_hashes_db)
+            placeholders, puzzle_hashes_list = self.db_wrapper.in_parameters(puzzle_hashes)
+            puzzle_hashes_db = tuple(puzzle_hashes_list)
 
             require_spent = "spent_index>0"
             require_unspent = "spent_index <= 0"
@@ -483,8 +674,8 @@ class CoinStore:
 
             cursor = await conn.execute(
                 f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
-                f"coin_parent, amount, timestamp FROM coin_record INDEXED BY coin_puzzle_hash "
-                f"WHERE puzzle_hash in ({'?,' * (puzzle_hash_count - 1)}?) "
+                f"coin_parent, amount, timestamp FROM coin_record {self.indexed_by('coin_puzzle_hash')}"
+                f"WHERE puzzle_hash in ({placeholders}) "
                 f"AND (confirmed_index>=? OR spent_index>=?) "
                 f"{height_filter} {amount_filter}"
                 f"ORDER BY MAX(confirmed_index, spent_index) ASC "
@@ -506,7 +697,7 @@ class CoinStore:
                     f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
                     f"coin_parent, amount, timestamp FROM coin_record INDEXED BY sqlite_autoindex_coin_record_1 "
                     f"WHERE coin_name IN (SELECT coin_id FROM hints "
-                    f"WHERE hint IN ({'?,' * (puzzle_hash_count - 1)}?)) "
+                    f"WHERE hint IN ({placeholders})) "
                     f"AND (confirmed_index>=? OR spent_index>=?) "
                     f"{height_filter} {amount_filter}"
                     f"ORDER BY MAX(confirmed_index, spent_index) ASC "
@@ -560,6 +751,9 @@ class CoinStore:
         coin_changes: dict[bytes32, CoinRecord] = {}
         # Add coins that are confirmed in the reverted blocks to the list of updated coins.
         async with self.db_wrapper.writer_maybe_transaction() as conn:
+            # any buffered changes are written first, to have them rolled back
+            # (and reported) like any other
+            await self.flush_pending()
             rows = await conn.execute_fetchall(
                 "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
                 "coin_parent, amount, timestamp, coin_name FROM coin_record WHERE confirmed_index>?",
@@ -593,8 +787,8 @@ class CoinStore:
             # spent_index to -1 as a potential fast forward singleton unspent
             # otherwise we set it to 0 as a normal unspent.
             await conn.execute(
-                """
-                UPDATE coin_record INDEXED BY coin_spent_index
+                f"""
+                UPDATE coin_record {self.indexed_by("coin_spent_index")}
                 SET spent_index = CASE
                     WHEN
                         coinbase = 0 AND
@@ -642,13 +836,17 @@ class CoinStore:
 
     # Lookup the most recent unspent lineage that matches a puzzle hash
     async def get_unspent_lineage_info_for_puzzle_hash(self, puzzle_hash: bytes32) -> Optional[UnspentLineageInfo]:
+        if self._unspent_lineage_for_ph_idx is None:
+            indexed_by = ""
+        else:
+            indexed_by = f"INDEXED BY {self._unspent_lineage_for_ph_idx} "
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
                 "SELECT unspent.coin_name, "
                 "unspent.coin_parent, "
                 "parent.coin_parent "
                 "FROM coin_record AS unspent "
-                f"INDEXED BY {self._unspent_lineage_for_ph_idx} "
+                f"{indexed_by}"
                 "LEFT JOIN coin_record AS parent ON unspent.coin_parent = parent.coin_name "
                 "WHERE unspent.spent_index = -1 "
                 "AND parent.spent_index > 0 "
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import logging
+import time
+
+from chik.util.db_wrapper import DBWrapper2
+
+log = logging.getLogger(__name__)
+
+# Secondary indexes that aren't needed to validate and add blocks. While
+# syncing a long way behind the peak, these are dropped to avoid maintaining
+# them on every insert, and rebuilt in one pass once the sync is done.
+# coin_confirmed_index is kept, it's needed to roll back the coin store in a
+# reorg. Queries naming a deferred index in an INDEXED BY clause leave the
+# clause out while it's missing (see refresh_indexes() of the stores).
+DEFERRABLE_INDEXES = (
+    # coin store
+    "coin_puzzle_hash",
+    "coin_spent_index",
+    "coin_parent_index",
+    "coin_record_ph_ff_unspent_idx",
+    # block store
+    "height",
+    "main_chain",
+    "is_fully_compactified",
+    # hint store
+    "hint_index",
+)
+
+
+async def _create_table(db_wrapper: DBWrapper2) -> None:
+    async with db_wrapper.writer_maybe_transaction() as conn:
+        # the CREATE INDEX statements of dropped indexes. They are recorded in
+        # the same transaction the index is dropped in, so if the node is
+        # restarted before they're rebuilt, that will happen on startup
+        await conn.execute("CREATE TABLE IF NOT EXISTS deferred_indexes(name text PRIMARY KEY, sql text)")
+
+
+async def drop_deferrable_indexes(db_wrapper: DBWrapper2) -> list[str]:
+    """
+    Drops the indexes in DEFERRABLE_INDEXES (that exist), recording how to
+    rebuild them. Returns the names of the dropped indexes.
+    """
+    await _create_table(db_wrapper)
+    dropped: list[str] = []
+    async with db_wrapper.writer() as conn:
+        for name in DEFERRABLE_INDEXES:
+            async with conn.execute("SELECT sql FROM sqlite_master WHERE type='index' AND name=?", (name,)) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                continue
+            await conn.execute("INSERT OR REPLACE INTO deferred_indexes VALUES(?, ?)", (name, row[0]))
+            await conn.execute(f"DROP INDEX {name}")
+            dropped.append(name)
+    if len(dropped) > 0:
+        log.info(f"DB: deferred building indexes: {', '.join(dropped)}")
+    return dropped
+
+
+async def has_deferred_indexes(db_wrapper: DBWrapper2) -> bool:
+    async with db_wrapper.reader_no_transaction() as conn:
+        async with conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='deferred_indexes'") as cursor:
+            if await cursor.fetchone() is None:
+                return False
+        async with conn.execute("SELECT 1 FROM deferred_indexes LIMIT 1") as cursor:
+            return await cursor.fetchone() is not None
+
+
+async def rebuild_deferred_indexes(db_wrapper: DBWrapper2) -> int:
+    """
+    Creates all indexes dropped by drop_deferrable_indexes(), one at a time,
+    logging the progress. Returns the number of indexes built.
+    """
+    if not await has_deferred_indexes(db_wrapper):
+        return 0
+
+    async with db_wrapper.reader_no_transaction() as conn:
+        async with conn.execute("SELECT name, sql FROM deferred_indexes ORDER BY rowid") as cursor:
+            indexes = [(str(row[0]), str(row[1])) for row in await cursor.fetchall()]
+
+    for i, (name, sql) in enumerate(indexes):
+        log.info(f"DB: [{i + 1}/{len(indexes)}] creating index {name}")
+        start = time.monotonic()
+        async with db_wrapper.writer() as conn:
+            async with conn.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (name,)) as cursor:
+                exists = await cursor.fetchone() is not None
+            # the store may have re-created it already
+            if not exists:
+                await conn.execute(sql)
+            await conn.execute("DELETE FROM deferred_indexes WHERE name=?", (name,))
+        log.info(f"DB: [{i + 1}/{len(indexes)}] created index {name} in {time.monotonic() - start:0.2f}s")
+    return len(indexes)
@@ -49,10 +49,13 @@ from chik.consensus.make_sub_epoch_summary import next_sub_epoch_summary
 from chik.consensus.multiprocess_validation import PreValidationResult, pre_validate_block
 from chik.consensus.pot_iterations import calculate_sp_iters
 from chik.consensus.signage_point import SignagePoint
+from chik.full_node.block_archive import BlockArchive, archive_directory
+from chik.full_node.block_fetcher import BlockFetcher
 from chik.full_node.block_height_map import BlockHeightMap
 from chik.full_node.block_store import BlockStore
 from chik.full_node.check_fork_next_block import check_fork_next_block
 from chik.full_node.coin_store import CoinStore
+from chik.full_node.deferred_indexes import drop_deferrable_indexes, rebuild_deferred_indexes
 from chik.full_node.full_node_api import FullNodeAPI
 from chik.full_node.full_node_store import FullNodeStore, FullNodeStorePeakResult, UnfinishedBlockEntry
 from chik.full_node.hint_management import get_hints_and_subscription_coin_ids
@@ -65,7 +68,7 @@ from chik.full_node.tx_processing_queue import TransactionQueue, TransactionQueu
 from chik.full_node.weight_proof import WeightProofHandler
 from chik.protocols import farmer_protocol, full_node_protocol, timelord_protocol, wallet_protocol
 from chik.protocols.farmer_protocol import SignagePointSourceData, SPSubSlotSourceData, SPVDFSourceData
-from chik.protocols.full_node_protocol import RequestBlocks, RespondBlock, RespondBlocks, RespondSignagePoint
+from chik.protocols.full_node_protocol import RequestBlocks, RespondBlock, RespondSignagePoint
 from chik.protocols.outbound_message import Message, NodeType, make_msg
 from chik.protocols.protocol_message_types import ProtocolMessageTypes
 from chik.protocols.shared_protocol import Capability
@@ -86,10 +89,9 @@ from chik.util.bech32m import encode_puzzle_hash
 from chik.util.config import process_config_start_method
 from chik.util.db_synchronous import db_synchronous_on
 from chik.util.db_version import lookup_db_version, set_db_version_async
-from chik.util.db_wrapper import DBWrapper2, manage_connection
+from chik.util.db_wrapper import DBWrapper2, ReaderPriority, db_reader_context, manage_connection
 from chik.util.errors import ConsensusError, Err, TimestampError, ValidationError
 from chik.util.limited_semaphore import LimitedSemaphore
-from chik.util.network import is_localhost
 from chik.util.path import path_from_root
 from chik.util.profiler import enable_profiler, mem_profile_task, profile_task
 from chik.util.safe_cancel_task import cancel_task_safe
@@ -140,6 +142,8 @@ class FullNode:
     full_node_peers: Optional[FullNodePeers] = None
     sync_store: SyncStore = dataclasses.field(default_factory=SyncStore)
     uncompact_task: Optional[asyncio.Task[None]] = None
+    archive_task: Optional[asyncio.Task[None]] = None
+    block_template_task: Optional[asyncio.Task[None]] = None
     compact_vdf_requests: set[bytes32] = dataclasses.field(default_factory=set)
     # TODO: Logging isn't setup yet so the log entries related to parsing the
     #       config would end up on stdout if handled here.
@@ -235,6 +239,8 @@ class FullNode:
             self.db_path,
             db_version=db_version,
             reader_count=self.config.get("db_readers", 4),
+            max_reader_count=self.config.get("db_readers_max"),
+            statement_cache_size=self.config.get("db_statement_cache_size", 0),
             log_path=sql_log_path,
             synchronous=db_sync,
         ) as self._db_wrapper:
@@ -255,7 +261,18 @@ class FullNode:
                                 # empty except it has the database_version table
                                 pass
 
-            self._block_store = await BlockStore.create(self.db_wrapper)
+            # if the node was stopped during a long sync, before the indexes
+            # whose creation was deferred were built, build them now
+            await rebuild_deferred_indexes(self.db_wrapper)
+            # old blocks are moved out of the DB into archive files, once
+            # they are block_archive_depth below the peak. Even if that's
+            # disabled, previously archived blocks are still read from there
+            block_archive_depth = int(self.config.get("block_archive_depth", 0))
+            archive_dir = archive_directory(self.db_path)
+            block_archive: Optional[BlockArchive] = None
+            if block_archive_depth > 0 or archive_dir.exists():
+                block_archive = BlockArchive.open(archive_dir)
+            self._block_store = await BlockStore.create(self.db_wrapper, archive=block_archive)
             self._hint_store = await HintStore.create(self.db_wrapper)
             self._coin_store = await CoinStore.create(self.db_wrapper)
             self.log.info("Initializing blockchain from disk")
@@ -346,6 +363,13 @@ class FullNode:
                 )
             if self.wallet_sync_task is None or self.wallet_sync_task.done():
                 self.wallet_sync_task = create_referenced_task(self._wallets_sync_task_handler())
+            if block_archive_depth > 0:
+                self.archive_task = create_referenced_task(self.archive_blocks(block_archive_depth))
+            block_template_refresh_interval = float(self.config.get("block_template_refresh_interval", 0))
+            if block_template_refresh_interval > 0:
+                self.block_template_task = create_referenced_task(
+                    self.refresh_block_template(block_template_refresh_interval)
+                )
 
             self.initialized = True
 
@@ -362,11 +386,15 @@ class FullNode:
                 # blockchain is created in _start and in certain cases it may not exist here during _close
                 if self._blockchain is not None:
                     self.blockchain.shut_down()
+                # the block template is created in the mempool manager's
+                # thread pool
+                cancel_task_safe(task=self.block_template_task, log=self.log)
                 # same for mempool_manager
                 if self._mempool_manager is not None:
                     self.mempool_manager.shut_down()
                 if self.uncompact_task is not None:
                     self.uncompact_task.cancel()
+                cancel_task_safe(task=self.archive_task, log=self.log)
                 if self._transaction_queue_task is not None:
                     self._transaction_queue_task.cancel()
                 cancel_task_safe(task=self.wallet_sync_task, log=self.log)
@@ -397,6 +425,15 @@ class FullNode:
                             self.log.info(f"Awaiting long sync task {one_sync_task.get_name()}")
                             await one_sync_task
                 await asyncio.gather(*self._segment_task_list, return_exceptions=True)
+                if self.archive_task is not None:
+                    await asyncio.gather(self.archive_task, return_exceptions=True)
+                if self.block_template_task is not None:
+                    await asyncio.gather(self.block_template_task, return_exceptions=True)
+                if self.weight_proof_handler is not None:
+                    self.weight_proof_handler.shut_down()
+                height_map.close()
+                if block_archive is not None:
+                    block_archive.close()
 
     @property
     def block_store(self) -> BlockStore:
@@ -484,6 +521,11 @@ class FullNode:
                 "peak_height": peak_height,
                 "peak_weight": peak_weight,
                 "peak_hash": peak_hash,
+                "rate_limits": {
+                    "inbound": con.inbound_rate_limiter.get_stats(),
+                    "outbound": con.outbound_rate_limiter.get_stats(),
+                },
+                "stats": con.get_stats(),
             }
             con_info.append(con_dict)
 
@@ -1052,7 +1094,23 @@ class FullNode:
                     self.get_peers_with_peak(target_peak.header_hash),
                     node_next_block_check,
                 )
-                await self.sync_from_fork_point(fork_point, target_peak.height, target_peak.header_hash, summaries)
+                # when far behind the peak, don't maintain the indexes that
+                # aren't needed to validate blocks while syncing. They are
+                # built once the sync is done
+                bulk_sync_min_blocks = int(self.config.get("bulk_sync_min_blocks", 0))
+                if 0 < bulk_sync_min_blocks <= target_peak.height - fork_point:
+                    await drop_deferrable_indexes(self.db_wrapper)
+                    await self.coin_store.refresh_indexes()
+                    await self.hint_store.refresh_indexes()
+                # optionally buffer coin set changes in memory while syncing,
+                # and write them to the DB in large batches. Write-behind is
+                # enabled and disabled (flushing the buffered changes) while
+                # holding the priority_mutex, which is held for the whole sync
+                await self.blockchain.set_write_behind(int(self.config.get("coin_write_behind_max_pending", 0)))
+                try:
+                    await self.sync_from_fork_point(fork_point, target_peak.height, target_peak.header_hash, summaries)
+                finally:
+                    await self.blockchain.set_write_behind(0)
         except asyncio.CancelledError:
             self.log.warning("Syncing failed, CancelledError")
         except Exception as e:
@@ -1177,110 +1235,25 @@ class FullNode:
         # validating the next batch while still adding the first batch to the
         # chain.
         blockchain = AugmentedBlockchain(self.blockchain)
-        peers_with_peak: list[WSChikConnection] = self.get_peers_with_peak(peak_hash)
 
         async def fetch_blocks(output_queue: asyncio.Queue[Optional[tuple[WSChikConnection, list[FullBlock]]]]) -> None:
-            # the rate limit for respond_blocks is 100 messages / 60 seconds.
-            # But the limit is scaled to 30% for outbound messages, so that's 30
-            # messages per 60 seconds.
-            # That's 2 seconds per request.
-            seconds_per_request = 2
-            start_height, end_height = 0, 0
-
-            # the timestamp of when the next request_block message is allowed to
-            # be sent. It's initialized to the current time, and bumped by the
-            # seconds_per_request every time we send a request. This ensures we
-            # won't exceed the 100 requests / 60 seconds rate limit.
-            # Whichever peer has the lowest timestamp is the one we request
-            # from. peers that take more than 5 seconds to respond are pushed to
-            # the end of the queue, to be less likely to request from.
-
-            # This should be cleaned up to not be a hard coded value, and maybe
-            # allow higher request rates (and align the request_blocks and
-            # respond_blocks rate limits).
-            now = time.monotonic()
-            new_peers_with_peak: list[tuple[WSChikConnection, float]] = [(c, now) for c in peers_with_peak[:]]
-            self.log.info(f"peers with peak: {len(new_peers_with_peak)}")
-            random.shuffle(new_peers_with_peak)
+            # keep several request_blocks messages in flight, to different
+            # peers, and hand the responses to the validation stage in order.
+            # The per-peer rate limit (see BlockFetcher.seconds_per_request)
+            # still applies to each individual peer.
+            fetcher = BlockFetcher(
+                log=self.log,
+                get_peers=lambda: self.get_peers_with_peak(peak_hash),
+                peers_changed=self.sync_store.peers_changed,
+                start_height=fork_point_height,
+                end_height=target_peak_sb_height,
+                batch_size=batch_size,
+                window=max(1, int(self.config.get("sync_blocks_in_flight", 8))),
+            )
             try:
-                # block request ranges are *inclusive*, this requires some
-                # gymnastics of this range (+1 to make it exclusive, like normal
-                # ranges) and then -1 when forming the request message
-                for start_height in range(fork_point_height, target_peak_sb_height + 1, batch_size):
-                    end_height = min(target_peak_sb_height, start_height + batch_size - 1)
-                    request = RequestBlocks(uint32(start_height), uint32(end_height), True)
-                    new_peers_with_peak.sort(key=lambda pair: pair[1])
-                    fetched = False
-                    for idx, (peer, timestamp) in enumerate(new_peers_with_peak):
-                        if peer.closed:
-                            continue
-
-                        start = time.monotonic()
-                        if start < timestamp:
-                            # rate limit ourselves, since we sent a message to
-                            # this peer too recently
-                            await asyncio.sleep(timestamp - start)
-                            start = time.monotonic()
-
-                        # update the timestamp, now that we're sending a request
-                        # it's OK for the timestamp to fall behind wall-clock
-                        # time. It just means we're allowed to send more
-                        # requests to catch up
-                        if is_localhost(peer.peer_info.host):
-                            # we don't apply rate limits to localhost, and our
-                            # tests depend on it
-                            bump = 0.1
-                        else:
-                            bump = seconds_per_request
-
-                        new_peers_with_peak[idx] = (
-                            new_peers_with_peak[idx][0],
-                            new_peers_with_peak[idx][1] + bump,
-                        )
-                        # the fewer peers we have, the more willing we should be
-                        # to wait for them.
-                        timeout = int(30 + 30 / len(new_peers_with_peak))
-                        response = await peer.call_api(FullNodeAPI.request_blocks, request, timeout=timeout)
-                        end = time.monotonic()
-                        if response is None:
-                            self.log.info(f"peer timed out after {end - start:.1f} s")
-                            await peer.close()
-                        elif isinstance(response, RespondBlocks):
-                            if end - start > 5:
-                                self.log.info(f"peer took {end - start:.1f} s to respond to request_blocks")
-                                # this isn't a great peer, reduce its priority
-                                # to prefer any peers that had to wait for it.
-                                # By setting the next allowed timestamp to now,
-                                # means that any other peer that has waited for
-                                # this will have its next allowed timestamp in
-                                # the passed, and be preferred multiple times
-                                # over this peer.
-                                new_peers_with_peak[idx] = (
-                                    new_peers_with_peak[idx][0],
-                                    end,
-                                )
-                            start = time.monotonic()
-                            await output_queue.put((peer, response.blocks))
-                            end = time.monotonic()
-                            if end - start > 1:
-                                self.log.info(
-                                    f"sync pipeline back-pressure. stalled {end - start:0.2f} "
-                                    "seconds on prevalidate block"
-                                )
-                            fetched = True
-                            break
-                    if fetched is False:
-                        self.log.error(f"failed fetching {start_height} to {end_height} from peers")
-                        return
-                    if self.sync_store.peers_changed.is_set():
-                        existing_peers = {id(c): timestamp for c, timestamp in new_peers_with_peak}
-                        peers = self.get_peers_with_peak(peak_hash)
-                        new_peers_with_peak = [(c, existing_peers.get(id(c), end)) for c in peers]
-                        random.shuffle(new_peers_with_peak)
-                        self.sync_store.peers_changed.clear()
-                        self.log.info(f"peers with peak: {len(new_peers_with_peak)}")
+                await fetcher.run(output_queue)
             except Exception as e:
-                self.log.error(f"Exception fetching {start_height} to {end_height} from peer {e}")
+                self.log.error(f"Exception fetching {fork_point_height} to {target_peak_sb_height} from peers {e}")
             finally:
                 # finished signal with None
                 await output_queue.put(None)
@@ -1642,14 +1615,15 @@ class FullNode:
                     assert expected_sub_slot_iters == vs.ssi
                     assert expected_difficulty == vs.difficulty
             block_rec = blockchain.block_record(block.header_hash)
-            result, error, state_change_summary = await self.blockchain.add_block(
-                block,
-                pre_validation_results[i],
-                vs.ssi,
-                fork_info,
-                prev_ses_block=vs.prev_ses_block,
-                block_record=block_rec,
-            )
+            with db_reader_context("add_block", ReaderPriority.high):
+                result, error, state_change_summary = await self.blockchain.add_block(
+                    block,
+                    pre_validation_results[i],
+                    vs.ssi,
+                    fork_info,
+                    prev_ses_block=vs.prev_ses_block,
+                    block_record=block_rec,
+                )
             if error is None:
                 blockchain.remove_extra_block(header_hash)
 
@@ -1738,6 +1712,9 @@ class FullNode:
             return None
 
         async with self.blockchain.priority_mutex.acquire(priority=BlockchainMutexPriority.high):
+            if await rebuild_deferred_indexes(self.db_wrapper) > 0:
+                await self.coin_store.refresh_indexes()
+                await self.hint_store.refresh_indexes()
             peak: Optional[BlockRecord] = self.blockchain.get_peak()
             peak_fb: Optional[FullBlock] = await self.blockchain.get_full_peak()
             if peak_fb is not None:
@@ -2165,9 +2142,10 @@ class FullNode:
                 else:
                     if fork_info is None:
                         fork_info = ForkInfo(block.height - 1, block.height - 1, block.prev_header_hash)
-                    (added, error_code, state_change_summary) = await self.blockchain.add_block(
-                        block, pre_validation_result, ssi, fork_info
-                    )
+                    with db_reader_context("add_block", ReaderPriority.high):
+                        (added, error_code, state_change_summary) = await self.blockchain.add_block(
+                            block, pre_validation_result, ssi, fork_info
+                        )
                 add_block_time = time.monotonic() - add_block_start
                 if added == AddBlockResult.ALREADY_HAVE_BLOCK:
                     return None
@@ -3355,6 +3333,41 @@ class FullNode:
             self.log.error(f"Exception in broadcast_uncompact_blocks: {e}")
             self.log.error(f"Exception Stack: {error_stack}")
 
+    async def archive_blocks(self, depth: int) -> None:
+        """
+        Periodically moves main chain blocks more than depth blocks below the
+        peak out of the DB, into the block archive.
+        """
+        while not self._shut_down:
+            await asyncio.sleep(60)
+            if self.sync_store.get_sync_mode() or self.sync_store.get_long_sync():
+                continue
+            peak = self.blockchain.get_peak()
+            if peak is None:
+                continue
+            try:
+                await self.block_store.archive_blocks(peak.height - depth)
+            except Exception as e:
+                self.log.error(f"Exception in archive_blocks: {e} {traceback.format_exc()}")
+
+    async def refresh_block_template(self, interval: float) -> None:
+        """
+        Periodically creates a block generator from the mempool, whenever the
+        peak or the mempool changed, so it's ready when a farmer finds a proof
+        """
+        while not self._shut_down:
+            await asyncio.sleep(interval)
+            if self.sync_store.get_sync_mode() or self.sync_store.get_long_sync():
+                continue
+            block_version = self.config.get("block_creation", 0)
+            block_timeout = self.config.get("block_creation_timeout", 2.0)
+            if block_version not in {0, 1}:
+                block_version = 0
+            try:
+                await self.mempool_manager.refresh_block_template(block_version, block_timeout)
+            except Exception as e:
+                self.log.error(f"Exception in refresh_block_template: {e} {traceback.format_exc()}")
+
 
 async def node_next_block_check(
     peer: WSChikConnection, potential_peek: uint32, blockchain: BlockchainInterface
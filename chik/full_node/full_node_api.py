@@ -61,6 +61,7 @@ from chik.protocols.wallet_protocol import (
     RespondSESInfo,
 )
 from chik.server.api_protocol import ApiMetadata
+from chik.server.compression import concatenate_frames
 from chik.server.server import ChikServer
 from chik.server.ws_connection import WSChikConnection
 from chik.types.block_protocol import BlockInfo
@@ -343,8 +344,12 @@ class FullNodeAPI:
             return make_msg(ProtocolMessageTypes.respond_block, full_node_protocol.RespondBlock(block))
         return make_msg(ProtocolMessageTypes.reject_block, RejectBlock(request.height))
 
-    @metadata.request(reply_types=[ProtocolMessageTypes.respond_blocks, ProtocolMessageTypes.reject_blocks])
-    async def request_blocks(self, request: full_node_protocol.RequestBlocks) -> Optional[Message]:
+    @metadata.request(
+        peer_required=True, reply_types=[ProtocolMessageTypes.respond_blocks, ProtocolMessageTypes.reject_blocks]
+    )
+    async def request_blocks(
+        self, request: full_node_protocol.RequestBlocks, peer: Optional[WSChikConnection] = None
+    ) -> Optional[Message]:
         # note that we treat the request range as *inclusive*, but we check the
         # size before we bump end_height. So MAX_BLOCK_COUNT_PER_REQUESTS is off
         # by one
@@ -379,6 +384,29 @@ class FullNodeAPI:
                 ProtocolMessageTypes.respond_blocks,
                 full_node_protocol.RespondBlocks(request.start_height, request.end_height, blocks),
             )
+        elif peer is not None and peer.supports_compression():
+            # the message will be sent compressed, so we pass the blocks
+            # through the way they're stored, without decompressing them
+            compressed_blocks: list[bytes] = []
+            for i in range(request.start_height, request.end_height + 1):
+                header_hash_i = self.full_node.blockchain.height_to_hash(uint32(i))
+                if header_hash_i is None:
+                    reject = RejectBlocks(request.start_height, request.end_height)
+                    return make_msg(ProtocolMessageTypes.reject_blocks, reject)
+                compressed = await self.full_node.block_store.get_compressed_full_block(header_hash_i)
+                if compressed is None:
+                    reject = RejectBlocks(request.start_height, request.end_height)
+                    return make_msg(ProtocolMessageTypes.reject_blocks, reject)
+                compressed_blocks.append(compressed)
+            prefix = (
+                uint32(request.start_height).stream_to_bytes()
+                + uint32(request.end_height).stream_to_bytes()
+                + uint32(len(compressed_blocks)).stream_to_bytes()
+            )
+            # make_msg() would turn the CompressedPayload into plain bytes
+            msg = Message(
+                uint8(ProtocolMessageTypes.respond_blocks.value), None, concatenate_frames(prefix, compressed_blocks)
+            )
         else:
             blocks_bytes: list[bytes] = []
             for i in range(request.start_height, request.end_height + 1):
@@ -1966,7 +1994,7 @@ class FullNodeAPI:
             for batch in to_batches(puzzle_hashes, SQLITE_MAX_VARIABLE_NUMBER):
                 hints_db: tuple[bytes, ...] = tuple(batch.entries)
                 cursor = await conn.execute(
-                    f"SELECT coin_id from hints INDEXED BY hint_index "
+                    f"SELECT coin_id from hints {self.full_node.hint_store.indexed_by('hint_index')}"
                     f"WHERE hint IN ({'?,' * (len(batch.entries) - 1)}?)",
                     hints_db,
                 )
@@ -107,6 +107,8 @@ class FullNodeRpcApi:
             "/get_block": self.get_block,
             "/get_blocks": self.get_blocks,
             "/get_block_count_metrics": self.get_block_count_metrics,
+            "/get_db_reader_stats": self.get_db_reader_stats,
+            "/get_broadcast_stats": self.get_broadcast_stats,
             "/get_block_record_by_height": self.get_block_record_by_height,
             "/get_block_record": self.get_block_record,
             "/get_block_records": self.get_block_records,
@@ -444,6 +446,12 @@ class FullNodeRpcApi:
             }
         }
 
+    async def get_db_reader_stats(self, _: dict[str, Any]) -> EndpointResult:
+        return {"stats": self.service.db_wrapper.get_reader_stats()}
+
+    async def get_broadcast_stats(self, _: dict[str, Any]) -> EndpointResult:
+        return {"stats": self.service.server.get_broadcast_stats()}
+
     async def get_block_records(self, request: dict[str, Any]) -> EndpointResult:
         if "start" not in request:
             raise ValueError("No start in request")
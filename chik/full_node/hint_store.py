@@ -16,6 +16,10 @@ log = logging.getLogger(__name__)
 @dataclasses.dataclass
 class HintStore:
     db_wrapper: DBWrapper2
+    # the indexes of the hints table. hint_index is dropped while its creation
+    # is deferred during long sync, and queries can't name it in INDEXED BY
+    # clauses then
+    _indexes: set[str] = dataclasses.field(default_factory=set)
 
     @classmethod
     async def create(cls, db_wrapper: DBWrapper2) -> HintStore:
@@ -29,8 +33,27 @@ class HintStore:
             await conn.execute("CREATE TABLE IF NOT EXISTS hints(coin_id blob, hint blob, UNIQUE (coin_id, hint))")
             log.info("DB: Creating index hint_index")
             await conn.execute("CREATE INDEX IF NOT EXISTS hint_index on hints(hint)")
+        await self.refresh_indexes()
         return self
 
+    async def refresh_indexes(self) -> None:
+        """
+        Picks the indexes used by queries based on which ones exist. This needs
+        to be called after indexes are dropped or created.
+        """
+        async with self.db_wrapper.reader_no_transaction() as conn:
+            async with conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'hints'"
+            ) as cursor:
+                self._indexes = {row[0] for row in await cursor.fetchall()}
+
+    def indexed_by(self, index: str) -> str:
+        """
+        Returns an INDEXED BY clause for the index, or an empty string if it
+        doesn't exist.
+        """
+        return f"INDEXED BY {index} " if index in self._indexes else ""
+
     async def get_coin_ids(self, hint: bytes, *, max_items: int = 50000) -> list[bytes32]:
         async with self.db_wrapper.reader_no_transaction() as conn:
             cursor = await conn.execute("SELECT coin_id from hints WHERE hint=? LIMIT ?", (hint, max_items))
@@ -45,7 +68,7 @@ class HintStore:
             for batch in to_batches(hints, SQLITE_MAX_VARIABLE_NUMBER):
                 hints_db: tuple[bytes, ...] = tuple(batch.entries)
                 cursor = await conn.execute(
-                    f"SELECT coin_id from hints INDEXED BY hint_index "
+                    f"SELECT coin_id from hints {self.indexed_by('hint_index')}"
                     f"WHERE hint IN ({'?,' * (len(batch.entries) - 1)}?) LIMIT ?",
                     (*hints_db, max_items),
                 )
@@ -1,8 +1,7 @@
 from __future__ import annotations
 
 import logging
-import sqlite3
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
@@ -34,13 +33,12 @@ from chik.full_node.eligible_coin_spends import (
 )
 from chik.full_node.fee_estimation import FeeMempoolInfo, MempoolInfo, MempoolItemInfo
 from chik.full_node.fee_estimator_interface import FeeEstimatorInterface
+from chik.full_node.mempool_index import MempoolIndex, MempoolIndexEntry
 from chik.types.blockchain_format.serialized_program import SerializedProgram
 from chik.types.klvm_cost import KLVMCost
 from chik.types.generator_types import NewBlockGenerator
 from chik.types.internal_mempool_item import InternalMempoolItem
 from chik.types.mempool_item import MempoolItem
-from chik.util.batches import to_batches
-from chik.util.db_wrapper import SQLITE_MAX_VARIABLE_NUMBER
 from chik.util.errors import Err
 
 log = logging.getLogger(__name__)
@@ -60,8 +58,7 @@ PRIORITY_TX_THRESHOLD = 3
 MIN_COST_THRESHOLD = 6_000_000
 
 # We impose a limit on the fee a single transaction can pay in order to have the
-# sum of all fees in the mempool be less than 2^63. That's the limit of sqlite's
-# integers, which we rely on for computing fee per cost as well as the fee sum
+# sum of all fees in the mempool be less than 2^63
 MEMPOOL_ITEM_FEE_LIMIT = 2**50
 
 
@@ -85,9 +82,10 @@ class MempoolRemoveReason(Enum):
 
 
 class Mempool:
-    _db_conn: sqlite3.Connection
-    # it's expensive to serialize and deserialize G2Element, so we keep those in
-    # this separate dictionary
+    # the fee, cost and timelocks of the items, ordered by fee rate, spent
+    # coins and expiry
+    _index: MempoolIndex
+    # the spend bundles and conditions of the items
     _items: dict[bytes32, InternalMempoolItem]
 
     # the most recent block height and timestamp that we know of
@@ -97,78 +95,54 @@ class Mempool:
     _total_fee: int
     _total_cost: int
 
+    # incremented every time the mempool changes in a way that could affect
+    # the block we'd create from it
+    _generation: int
+
     def __init__(self, mempool_info: MempoolInfo, fee_estimator: FeeEstimatorInterface):
-        self._db_conn = sqlite3.connect(":memory:")
+        self._index = MempoolIndex()
         self._items = {}
         self._block_height = uint32(0)
         self._timestamp = uint64(0)
         self._total_fee = 0
         self._total_cost = 0
-
-        with self._db_conn:
-            # name means SpendBundle hash
-            # assert_height may be NIL
-            # the seq field indicates the order of items being added to the
-            # mempool. It's used as a tie-breaker for items with the same fee
-            # rate
-            # TODO: In the future, for the "fee_per_cost" field, opt for
-            # "GENERATED ALWAYS AS (CAST(fee AS REAL) / cost) VIRTUAL"
-            self._db_conn.execute(
-                """CREATE TABLE tx(
-                name BLOB,
-                cost INT NOT NULL,
-                fee INT NOT NULL,
-                assert_height INT,
-                assert_before_height INT,
-                assert_before_seconds INT,
-                fee_per_cost REAL,
-                seq INTEGER PRIMARY KEY AUTOINCREMENT)
-                """
-            )
-            self._db_conn.execute("CREATE INDEX name_idx ON tx(name)")
-            self._db_conn.execute("CREATE INDEX feerate ON tx(fee_per_cost)")
-            self._db_conn.execute(
-                "CREATE INDEX assert_before ON tx(assert_before_height, assert_before_seconds) "
-                "WHERE assert_before_height IS NOT NULL OR assert_before_seconds IS NOT NULL"
-            )
-
-            # This table maps coin IDs to spend bundles hashes
-            self._db_conn.execute(
-                """CREATE TABLE spends(
-                coin_id BLOB NOT NULL,
-                tx BLOB NOT NULL,
-                UNIQUE(coin_id, tx))
-                """
-            )
-            self._db_conn.execute("CREATE INDEX spend_by_coin ON spends(coin_id)")
-            self._db_conn.execute("CREATE INDEX spend_by_bundle ON spends(tx)")
+        self._generation = 0
 
         self.mempool_info: MempoolInfo = mempool_info
         self.fee_estimator: FeeEstimatorInterface = fee_estimator
 
-    def __del__(self) -> None:
-        self._db_conn.close()
-
-    def _row_to_item(self, row: sqlite3.Row) -> MempoolItem:
-        name = bytes32(row[0])
-        fee = int(row[2])
-        assert_height = row[3]
-        assert_before_height = row[4]
-        assert_before_seconds = row[5]
-        item = self._items[name]
+    def _entry_to_item(self, entry: MempoolIndexEntry) -> MempoolItem:
+        item = self._items[entry.name]
 
         return MempoolItem(
             item.spend_bundle,
-            uint64(fee),
+            uint64(entry.fee),
             item.conds,
-            name,
+            entry.name,
             uint32(item.height_added_to_mempool),
-            assert_height,
-            assert_before_height,
-            assert_before_seconds,
+            entry.assert_height,
+            entry.assert_before_height,
+            entry.assert_before_seconds,
             bundle_coin_spends=item.bundle_coin_spends,
         )
 
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def items_for_block(self) -> list[tuple[int, InternalMempoolItem]]:
+        """
+        Returns the fee and item of all items, highest fee rate first. This is
+        a snapshot, which remains valid while the mempool is modified. It can
+        be passed to create_block_generator() and create_block_generator2() to
+        create a block from it, e.g. in a different thread.
+        """
+        return [(entry.fee, self._items[entry.name]) for entry in self._index.by_fee_rate()]
+
+    def _items_by_fee_rate(self) -> Iterator[tuple[int, InternalMempoolItem]]:
+        for entry in self._index.by_fee_rate():
+            yield entry.fee, self._items[entry.name]
+
     def total_mempool_fees(self) -> int:
         return self._total_fee
 
@@ -176,15 +150,11 @@ class Mempool:
         return KLVMCost(uint64(self._total_cost))
 
     def all_items(self) -> Iterator[MempoolItem]:
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT * FROM tx")
-            for row in cursor:
-                yield self._row_to_item(row)
+        for entry in list(self._index.all_entries()):
+            yield self._entry_to_item(entry)
 
     def all_item_ids(self) -> list[bytes32]:
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT name FROM tx")
-            return [bytes32(row[0]) for row in cursor]
+        return [entry.name for entry in self._index.all_entries()]
 
     def items_with_coin_ids(self, coin_ids: set[bytes32]) -> list[bytes32]:
         """
@@ -246,48 +216,22 @@ class Mempool:
     # TODO: move "process_mempool_items()" into this class in order to do this a
     # bit more efficiently
     def items_by_feerate(self) -> Iterator[MempoolItem]:
-        cursor = self._db_conn.execute("SELECT * FROM tx ORDER BY fee_per_cost DESC, seq ASC")
-        for row in cursor:
-            yield self._row_to_item(row)
+        for entry in list(self._index.by_fee_rate()):
+            yield self._entry_to_item(entry)
 
     def size(self) -> int:
-        cursor = self._db_conn.execute("SELECT COUNT(name) FROM tx")
-        row = cursor.fetchone()
-        return int(row[0])
+        return len(self._index)
 
     def get_item_by_id(self, item_id: bytes32) -> Optional[MempoolItem]:
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT * FROM tx WHERE name=?", (item_id,))
-            row = cursor.fetchone()
-            return None if row is None else self._row_to_item(row)
+        entry = self._index.get(item_id)
+        return None if entry is None else self._entry_to_item(entry)
 
-    # TODO: we need a bulk lookup function like this too
     def get_items_by_coin_id(self, spent_coin_id: bytes32) -> Iterator[MempoolItem]:
-        cursor = self._db_conn.execute(
-            """
-            SELECT *
-            FROM tx
-            WHERE name IN (
-                SELECT tx
-                FROM spends
-                WHERE coin_id = ?
-            )
-            """,
-            (spent_coin_id,),
-        )
-        for row in cursor:
-            yield self._row_to_item(row)
+        for entry in self._index.get_by_coin_id(spent_coin_id):
+            yield self._entry_to_item(entry)
 
     def get_items_by_coin_ids(self, spent_coin_ids: list[bytes32]) -> list[MempoolItem]:
-        items: list[MempoolItem] = []
-        for batch in to_batches(spent_coin_ids, SQLITE_MAX_VARIABLE_NUMBER):
-            args = ",".join(["?"] * len(batch.entries))
-            cursor = self._db_conn.execute(
-                f"SELECT * FROM tx WHERE name IN (SELECT tx FROM spends WHERE coin_id IN ({args}))",
-                tuple(batch.entries),
-            )
-            items.extend(self._row_to_item(row) for row in cursor)
-        return items
+        return [self._entry_to_item(entry) for entry in self._index.get_by_coin_ids(spent_coin_ids)]
 
     def get_min_fee_rate(self, cost: int) -> Optional[float]:
         """
@@ -301,21 +245,16 @@ class Mempool:
         current_cost = self._total_cost
 
         # Iterates through all spends in increasing fee per cost
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT cost,fee_per_cost FROM tx ORDER BY fee_per_cost ASC, seq DESC")
-
-            item_cost: int
-            fee_per_cost: float
-            for item_cost, fee_per_cost in cursor:
-                current_cost -= item_cost
-                # Removing one at a time, until our transaction of size cost fits
-                if current_cost + cost <= self.mempool_info.max_size_in_cost:
-                    return fee_per_cost
-
-            log.info(
-                f"Transaction with cost {cost} does not fit in mempool of max cost {self.mempool_info.max_size_in_cost}"
-            )
-            return None
+        for entry in self._index.by_fee_rate_ascending():
+            current_cost -= entry.cost
+            # Removing one at a time, until our transaction of size cost fits
+            if current_cost + cost <= self.mempool_info.max_size_in_cost:
+                return entry.fee_per_cost
+
+        log.info(
+            f"Transaction with cost {cost} does not fit in mempool of max cost {self.mempool_info.max_size_in_cost}"
+        )
+        return None
 
     def new_tx_block(self, block_height: uint32, timestamp: uint64) -> MempoolRemoveInfo:
         """
@@ -323,12 +262,7 @@ class Mempool:
         timestamp. (we don't know about which coins were spent in this new block
         here, so those are handled separately)
         """
-        with self._db_conn:
-            cursor = self._db_conn.execute(
-                "SELECT name FROM tx WHERE assert_before_seconds <= ? OR assert_before_height <= ?",
-                (timestamp, block_height),
-            )
-            to_remove = [bytes32(row[0]) for row in cursor]
+        to_remove = self._index.expired(block_height, timestamp)
 
         self._block_height = block_height
         self._timestamp = timestamp
@@ -342,37 +276,19 @@ class Mempool:
         if items == []:
             return MempoolRemoveInfo([], reason)
 
+        self._generation += 1
         removed_items: list[MempoolItemInfo] = []
-        if reason != MempoolRemoveReason.BLOCK_INCLUSION:
-            for batch in to_batches(items, SQLITE_MAX_VARIABLE_NUMBER):
-                args = ",".join(["?"] * len(batch.entries))
-                with self._db_conn:
-                    cursor = self._db_conn.execute(
-                        f"SELECT name, cost, fee FROM tx WHERE name in ({args})", batch.entries
-                    )
-                    for row in cursor:
-                        name = bytes32(row[0])
-                        internal_item = self._items[name]
-                        item = MempoolItemInfo(int(row[1]), int(row[2]), internal_item.height_added_to_mempool)
-                        removed_items.append(item)
-
-        removed_internal_items = [self._items.pop(name) for name in items]
-
-        for batch in to_batches(items, SQLITE_MAX_VARIABLE_NUMBER):
-            args = ",".join(["?"] * len(batch.entries))
-            with self._db_conn:
-                cursor = self._db_conn.execute(
-                    f"SELECT SUM(cost), SUM(fee) FROM tx WHERE name in ({args})", batch.entries
-                )
-                cost_to_remove, fee_to_remove = cursor.fetchone()
-
-                self._db_conn.execute(f"DELETE FROM tx WHERE name in ({args})", batch.entries)
-                self._db_conn.execute(f"DELETE FROM spends WHERE tx in ({args})", batch.entries)
-
-            self._total_cost -= cost_to_remove
-            self._total_fee -= fee_to_remove
-            assert self._total_cost >= 0
-            assert self._total_fee >= 0
+        removed_internal_items: list[InternalMempoolItem] = []
+        for name in items:
+            entry = self._index.remove(name)
+            internal_item = self._items.pop(name)
+            removed_internal_items.append(internal_item)
+            if reason != MempoolRemoveReason.BLOCK_INCLUSION:
+                removed_items.append(MempoolItemInfo(entry.cost, entry.fee, internal_item.height_added_to_mempool))
+            self._total_cost -= entry.cost
+            self._total_fee -= entry.fee
+        assert self._total_cost >= 0
+        assert self._total_fee >= 0
 
         if reason != MempoolRemoveReason.BLOCK_INCLUSION:
             info = FeeMempoolInfo(
@@ -402,89 +318,67 @@ class Mempool:
             item.assert_before_seconds is not None and item.assert_before_seconds < time_cutoff
         ):
             # this lists only transactions that expire soon, in order of
-            # lowest fee rate along with the cumulative cost of such
-            # transactions counting from highest to lowest fee rate
-            cursor = self._db_conn.execute(
-                """
-                SELECT name,
-                    fee_per_cost,
-                    SUM(cost) OVER (ORDER BY fee_per_cost DESC, seq ASC) AS cumulative_cost
-                FROM tx
-                WHERE assert_before_seconds IS NOT NULL AND assert_before_seconds < ?
-                    OR assert_before_height IS NOT NULL AND assert_before_height < ?
-                ORDER BY cumulative_cost DESC
-                """,
-                (time_cutoff, block_cutoff),
-            )
+            # highest fee rate. We go through them in reverse, along with the
+            # cumulative cost of such transactions counting from highest to
+            # lowest fee rate
+            expiring = self._index.expiring_before(block_cutoff, time_cutoff)
+            cumulative_cost = sum(entry.cost for entry in expiring)
             to_remove: list[bytes32] = []
-            for row in cursor:
-                name, fee_per_cost, cumulative_cost = row
-
+            for entry in reversed(expiring):
                 # there's space for us, stop pruning
                 if cumulative_cost + item.cost <= self.mempool_info.max_block_klvm_cost:
                     break
 
                 # we can't evict any more transactions, abort (and don't
                 # evict what we put aside in "to_remove" list)
-                if fee_per_cost > item.fee_per_cost:
+                if entry.fee_per_cost > item.fee_per_cost:
                     return MempoolAddInfo([], Err.INVALID_FEE_LOW_FEE)
-                to_remove.append(name)
+                to_remove.append(entry.name)
+                cumulative_cost -= entry.cost
 
             removals.append(self.remove_from_pool(to_remove, MempoolRemoveReason.EXPIRED))
 
             # if we don't find any entries, it's OK to add this entry
 
         if self._total_cost + item.cost > self.mempool_info.max_size_in_cost:
-            # pick the items with the lowest fee per cost to remove
-            cursor = self._db_conn.execute(
-                """SELECT name FROM tx
-                WHERE name NOT IN (
-                    SELECT name FROM (
-                        SELECT name,
-                        SUM(cost) OVER (ORDER BY fee_per_cost DESC, seq ASC) AS total_cost
-                        FROM tx) AS tx_with_cost
-                    WHERE total_cost <= ?)
-                """,
-                (self.mempool_info.max_size_in_cost - item.cost,),
-            )
-            to_remove = [bytes32(row[0]) for row in cursor]
+            # pick the items with the lowest fee per cost to remove, until
+            # the ones with the highest fee per cost leave enough space
+            total_cost = self._total_cost
+            to_remove = []
+            for entry in self._index.by_fee_rate_ascending():
+                if total_cost <= self.mempool_info.max_size_in_cost - item.cost:
+                    break
+                to_remove.append(entry.name)
+                total_cost -= entry.cost
             removals.append(self.remove_from_pool(to_remove, MempoolRemoveReason.POOL_FULL))
 
-        with self._db_conn as conn:
-            # TODO: In the future, for the "fee_per_cost" field, opt for
-            # "GENERATED ALWAYS AS (CAST(fee AS REAL) / cost) VIRTUAL"
-            conn.execute(
-                "INSERT INTO "
-                "tx(name,cost,fee,assert_height,assert_before_height,assert_before_seconds,fee_per_cost) "
-                "VALUES(?, ?, ?, ?, ?, ?, ?)",
-                (
-                    item.name,
-                    item.cost,
-                    item.fee,
-                    item.assert_height,
-                    item.assert_before_height,
-                    item.assert_before_seconds,
-                    item.fee / item.cost,
-                ),
-            )
-            all_coin_spends = []
-            # item.name is a property
-            # only compute its name once (the spend bundle name)
-            item_name = item.name
-            for coin_id, bcs in item.bundle_coin_spends.items():
-                # any FF spend should be indexed by its latest singleton coin
-                # ID, this way we'll find it when the singleton is spent
-                if bcs.latest_singleton_lineage is not None:
-                    all_coin_spends.append((bcs.latest_singleton_lineage.coin_id, item_name))
-                else:
-                    all_coin_spends.append((coin_id, item_name))
-            conn.executemany("INSERT OR IGNORE INTO spends VALUES(?, ?)", all_coin_spends)
+        # item.name is a property
+        # only compute its name once (the spend bundle name)
+        item_name = item.name
+        coin_ids = []
+        for coin_id, bcs in item.bundle_coin_spends.items():
+            # any FF spend should be indexed by its latest singleton coin
+            # ID, this way we'll find it when the singleton is spent
+            if bcs.latest_singleton_lineage is not None:
+                coin_ids.append(bcs.latest_singleton_lineage.coin_id)
+            else:
+                coin_ids.append(coin_id)
+        self._index.add(
+            item_name,
+            item.cost,
+            item.fee,
+            item.assert_height,
+            item.assert_before_height,
+            item.assert_before_seconds,
+            coin_ids,
+        )
 
         self._items[item_name] = InternalMempoolItem(
             item.spend_bundle, item.conds, item.height_added_to_mempool, item.bundle_coin_spends
         )
         self._total_cost += item.cost
         self._total_fee += item.fee
+        self._generation += 1
 
         info = FeeMempoolInfo(self.mempool_info, self.total_mempool_cost(), self.total_mempool_fees(), datetime.now())
         self.fee_estimator.add_mempool_item(info, MempoolItemInfo(item.cost, item.fee, item.height_added_to_mempool))
@@ -492,8 +386,10 @@ class Mempool:
 
     # each tuple holds new_coin_id, current_coin_id, mempool item name
     def update_spend_index(self, spends_to_update: list[tuple[bytes32, bytes32, bytes32]]) -> None:
-        with self._db_conn as conn:
-            conn.executemany("UPDATE OR REPLACE spends SET coin_id=? WHERE coin_id=? AND tx=?", spends_to_update)
+        for new_coin_id, current_coin_id, item_name in spends_to_update:
+            self._index.update_coin_id(new_coin_id, current_coin_id, item_name)
+        # the singleton lineage of these items changed
+        self._generation += 1
 
     def at_full_capacity(self, cost: int) -> bool:
         """
@@ -507,13 +403,15 @@ class Mempool:
         constants: ConsensusConstants,
         height: uint32,
         timeout: float,
+        items: Optional[Iterable[tuple[int, InternalMempoolItem]]] = None,
     ) -> Optional[NewBlockGenerator]:
         """
         height is needed in case we fast-forward a transaction and we need to
         re-run its puzzle.
+        items (as returned by items_for_block()) defaults to the current items.
         """
 
-        mempool_bundle = self.create_bundle_from_mempool_items(constants, height, timeout)
+        mempool_bundle = self.create_bundle_from_mempool_items(constants, height, timeout, items)
         if mempool_bundle is None:
             return None
 
@@ -570,7 +468,11 @@ class Mempool:
         )
 
     def create_bundle_from_mempool_items(
-        self, constants: ConsensusConstants, height: uint32, timeout: float = 1.0
+        self,
+        constants: ConsensusConstants,
+        height: uint32,
+        timeout: float = 1.0,
+        items: Optional[Iterable[tuple[int, InternalMempoolItem]]] = None,
     ) -> Optional[tuple[SpendBundle, list[Coin]]]:
         cost_sum = 0  # Checks that total cost does not exceed block maximum
         fee_sum = 0  # Checks that total fees don't exceed 64 bits
@@ -590,13 +492,10 @@ class Mempool:
         sigs: list[G2Element] = []
         log.info(f"Starting to make block, max cost: {self.mempool_info.max_block_klvm_cost}")
         bundle_creation_start = monotonic()
-        cursor = self._db_conn.execute("SELECT name, fee FROM tx ORDER BY fee_per_cost DESC, seq ASC")
         skipped_items = 0
-        for row in cursor:
-            name = bytes32(row[0])
-            fee = int(row[1])
-            item = self._items[name]
-
+        if items is None:
+            items = self._items_by_fee_rate()
+        for fee, item in items:
             current_time = monotonic()
             if current_time - bundle_creation_start >= timeout:
                 log.info(f"exiting early, already spent {current_time - bundle_creation_start:0.2f} s")
@@ -687,7 +586,11 @@ class Mempool:
         return agg, additions
 
     def create_block_generator2(
-        self, constants: ConsensusConstants, height: uint32, timeout: float
+        self,
+        constants: ConsensusConstants,
+        height: uint32,
+        timeout: float,
+        items: Optional[Iterable[tuple[int, InternalMempoolItem]]] = None,
     ) -> Optional[NewBlockGenerator]:
         fee_sum = 0  # Checks that total fees don't exceed 64 bits
         additions: list[Coin] = []
@@ -697,7 +600,6 @@ class Mempool:
         singleton_ff = SingletonFastForward()
         log.info(f"Starting to make block, max cost: {self.mempool_info.max_block_klvm_cost}")
         generator_creation_start = monotonic()
-        cursor = self._db_conn.execute("SELECT name, fee FROM tx ORDER BY fee_per_cost DESC, seq ASC")
         builder = BlockBuilder()
         skipped_items = 0
         # the total (estimated) cost of the transactions added so far
@@ -710,15 +612,14 @@ class Mempool:
         # this cost only includes conditions and execution cost, not byte-cost
         batch_cost = 0
 
-        for row in cursor:
+        if items is None:
+            items = self._items_by_fee_rate()
+        for fee, item in items:
             current_time = monotonic()
             if current_time - generator_creation_start >= timeout:
                 log.info(f"exiting early, already spent {current_time - generator_creation_start:0.2f} s")
                 break
 
-            name = bytes32(row[0])
-            fee = int(row[1])
-            item = self._items[name]
             try:
                 assert item.conds is not None
                 cost = item.conds.condition_cost + item.conds.execution_cost
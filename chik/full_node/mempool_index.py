@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import math
+from collections.abc import Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
+from typing import Optional
+
+from chik_rs.sized_bytes import bytes32
+from chik_rs.sized_ints import uint32, uint64
+from sortedcontainers import SortedDict
+
+
+@dataclass
+class MempoolIndexEntry:
+    name: bytes32
+    cost: int
+    fee: int
+    assert_height: Optional[uint32]
+    assert_before_height: Optional[uint32]
+    assert_before_seconds: Optional[uint64]
+    fee_per_cost: float
+    # the order of items being added to the mempool. It's used as a
+    # tie-breaker for items with the same fee rate
+    seq: int
+    # the coin IDs this item is indexed by (see MempoolIndex.get_by_coin_id())
+    coin_ids: set[bytes32] = field(default_factory=set)
+
+    @property
+    def fee_rate_key(self) -> tuple[float, int]:
+        # sorts by highest fee rate first, then in the order items were added
+        return (-self.fee_per_cost, self.seq)
+
+
+@dataclass
+class MempoolIndex:
+    """
+    Keeps track of the items in the mempool, ordered by fee rate, by the coins
+    they spend and by when they expire.
+    """
+
+    _entries: dict[bytes32, MempoolIndexEntry] = field(default_factory=dict)
+    _by_fee_rate: SortedDict[tuple[float, int], MempoolIndexEntry] = field(default_factory=SortedDict)
+    # maps coin IDs to the names of the items spending them
+    _by_coin_id: dict[bytes32, set[bytes32]] = field(default_factory=dict)
+    # items with an assert_before_height or assert_before_seconds condition,
+    # keyed by (height or timestamp, seq)
+    _by_before_height: SortedDict[tuple[int, int], MempoolIndexEntry] = field(default_factory=SortedDict)
+    _by_before_seconds: SortedDict[tuple[int, int], MempoolIndexEntry] = field(default_factory=SortedDict)
+    _next_seq: int = 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: bytes32) -> bool:
+        return name in self._entries
+
+    def get(self, name: bytes32) -> Optional[MempoolIndexEntry]:
+        return self._entries.get(name)
+
+    def add(
+        self,
+        name: bytes32,
+        cost: int,
+        fee: int,
+        assert_height: Optional[uint32],
+        assert_before_height: Optional[uint32],
+        assert_before_seconds: Optional[uint64],
+        coin_ids: Iterable[bytes32],
+    ) -> MempoolIndexEntry:
+        assert name not in self._entries
+        entry = MempoolIndexEntry(
+            name,
+            cost,
+            fee,
+            assert_height,
+            assert_before_height,
+            assert_before_seconds,
+            fee / cost,
+            self._next_seq,
+            set(coin_ids),
+        )
+        self._next_seq += 1
+        self._entries[name] = entry
+        self._by_fee_rate[entry.fee_rate_key] = entry
+        for coin_id in entry.coin_ids:
+            self._by_coin_id.setdefault(coin_id, set()).add(name)
+        if assert_before_height is not None:
+            self._by_before_height[assert_before_height, entry.seq] = entry
+        if assert_before_seconds is not None:
+            self._by_before_seconds[assert_before_seconds, entry.seq] = entry
+        return entry
+
+    def remove(self, name: bytes32) -> MempoolIndexEntry:
+        entry = self._entries.pop(name)
+        del self._by_fee_rate[entry.fee_rate_key]
+        for coin_id in entry.coin_ids:
+            self._remove_coin_id(coin_id, name)
+        if entry.assert_before_height is not None:
+            del self._by_before_height[entry.assert_before_height, entry.seq]
+        if entry.assert_before_seconds is not None:
+            del self._by_before_seconds[entry.assert_before_seconds, entry.seq]
+        return entry
+
+    def _remove_coin_id(self, coin_id: bytes32, name: bytes32) -> None:
+        names = self._by_coin_id[coin_id]
+        names.discard(name)
+        if len(names) == 0:
+            del self._by_coin_id[coin_id]
+
+    def update_coin_id(self, new_coin_id: bytes32, current_coin_id: bytes32, name: bytes32) -> None:
+        """
+        Re-indexes the item called name, from current_coin_id to new_coin_id.
+        Does nothing if the item isn't indexed by current_coin_id.
+        """
+        entry = self._entries.get(name)
+        if entry is None or current_coin_id not in entry.coin_ids:
+            return
+        entry.coin_ids.discard(current_coin_id)
+        self._remove_coin_id(current_coin_id, name)
+        entry.coin_ids.add(new_coin_id)
+        self._by_coin_id.setdefault(new_coin_id, set()).add(name)
+
+    def all_entries(self) -> Iterator[MempoolIndexEntry]:
+        """
+        In the order the items were added
+        """
+        return iter(self._entries.values())
+
+    def by_fee_rate(self) -> Iterator[MempoolIndexEntry]:
+        """
+        Highest fee rate first, then in the order the items were added. The
+        index may not be modified while iterating.
+        """
+        return iter(self._by_fee_rate.values())
+
+    def by_fee_rate_ascending(self) -> Iterator[MempoolIndexEntry]:
+        """
+        The reverse order of by_fee_rate()
+        """
+        values: Sequence[MempoolIndexEntry] = self._by_fee_rate.values()
+        return reversed(values)
+
+    def get_by_coin_id(self, coin_id: bytes32) -> list[MempoolIndexEntry]:
+        return self.get_by_coin_ids([coin_id])
+
+    def get_by_coin_ids(self, coin_ids: Iterable[bytes32]) -> list[MempoolIndexEntry]:
+        """
+        Returns the items indexed by any of coin_ids (each one once), in the
+        order they were added.
+        """
+        names: set[bytes32] = set()
+        for coin_id in coin_ids:
+            names.update(self._by_coin_id.get(coin_id, ()))
+        return sorted((self._entries[name] for name in names), key=lambda e: e.seq)
+
+    def expired(self, height: int, timestamp: int) -> list[bytes32]:
+        """
+        Returns the names of the items with an assert_before_height at or below
+        height, or an assert_before_seconds at or below timestamp.
+        """
+        entries = {e.seq: e for e in self._iter_up_to(self._by_before_height, height, True)}
+        entries.update((e.seq, e) for e in self._iter_up_to(self._by_before_seconds, timestamp, True))
+        return [entries[seq].name for seq in sorted(entries)]
+
+    def expiring_before(self, height: int, timestamp: int) -> list[MempoolIndexEntry]:
+        """
+        Returns the items with an assert_before_height below height, or an
+        assert_before_seconds below timestamp, in the order of by_fee_rate().
+        """
+        entries = {e.seq: e for e in self._iter_up_to(self._by_before_height, height, False)}
+        entries.update((e.seq, e) for e in self._iter_up_to(self._by_before_seconds, timestamp, False))
+        return sorted(entries.values(), key=lambda e: e.fee_rate_key)
+
+    @staticmethod
+    def _iter_up_to(
+        index: SortedDict[tuple[int, int], MempoolIndexEntry], limit: int, inclusive: bool
+    ) -> Iterator[MempoolIndexEntry]:
+        # the keys are (limit, seq) pairs, and seq is always greater than 0
+        maximum = (limit, math.inf) if inclusive else (limit, 0)
+        for key in index.irange(maximum=maximum, inclusive=(True, False)):
+            yield index[key]
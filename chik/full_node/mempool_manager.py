@@ -12,6 +12,7 @@ from chik_rs import (
     ELIGIBLE_FOR_DEDUP,
     ELIGIBLE_FOR_FF,
     BLSCache,
+    CoinSpend,
     ConsensusConstants,
     SpendBundle,
     SpendBundleConditions,
@@ -144,6 +145,107 @@ class NewPeakItem:
     conds: SpendBundleConditions
 
 
+@dataclass
+class PreparedSpendBundle:
+    """
+    The parts of validating a spend bundle that don't depend on the coin set
+    or the mempool, and can be computed once (and in a different thread)
+    """
+
+    removal_names: set[bytes32]
+    additions_dict: dict[bytes32, Coin]
+    addition_amount: int
+    # maps coin ID to its spend. Spends that don't support fast forward have
+    # ff_puzzle_hash set to None
+    spends: dict[bytes32, tuple[CoinSpend, EligibilityAndAdditions]]
+
+
+def prepare_spend_bundle(
+    new_spend: SpendBundle, conds: SpendBundleConditions
+) -> tuple[Optional[Err], Optional[PreparedSpendBundle]]:
+    removal_names: set[bytes32] = set()
+    additions_dict: dict[bytes32, Coin] = {}
+    addition_amount: int = 0
+    # Map of coin ID to eligibility information
+    eligibility_and_additions: dict[bytes32, EligibilityAndAdditions] = {}
+    for spend in conds.spends:
+        coin_id = bytes32(spend.coin_id)
+        removal_names.add(coin_id)
+        spend_additions = []
+        for puzzle_hash, amount, _ in spend.create_coin:
+            child_coin = Coin(coin_id, puzzle_hash, uint64(amount))
+            spend_additions.append(child_coin)
+            additions_dict[child_coin.name()] = child_coin
+            addition_amount += child_coin.amount
+        is_eligible_for_dedup = bool(spend.flags & ELIGIBLE_FOR_DEDUP)
+        is_eligible_for_ff = bool(spend.flags & ELIGIBLE_FOR_FF)
+        eligibility_and_additions[coin_id] = EligibilityAndAdditions(
+            is_eligible_for_dedup=is_eligible_for_dedup,
+            spend_additions=spend_additions,
+            ff_puzzle_hash=bytes32(spend.puzzle_hash) if is_eligible_for_ff else None,
+        )
+    spends: dict[bytes32, tuple[CoinSpend, EligibilityAndAdditions]] = {}
+    for coin_spend in new_spend.coin_spends:
+        coin_id = coin_spend.coin.name()
+        eligibility_info = eligibility_and_additions.get(
+            coin_id,
+            EligibilityAndAdditions(is_eligible_for_dedup=False, spend_additions=[], ff_puzzle_hash=None),
+        )
+
+        if eligibility_info.is_eligible_for_dedup and not is_klvm_canonical(bytes(coin_spend.solution)):
+            return Err.INVALID_COIN_SOLUTION, None
+
+        if eligibility_info.ff_puzzle_hash is not None and not supports_fast_forward(coin_spend):
+            eligibility_info = EligibilityAndAdditions(
+                is_eligible_for_dedup=eligibility_info.is_eligible_for_dedup,
+                spend_additions=eligibility_info.spend_additions,
+                ff_puzzle_hash=None,
+            )
+        spends[coin_id] = (coin_spend, eligibility_info)
+
+    if removal_names != spends.keys():
+        # If you reach here it's probably because your program reveal doesn't match the coin's puzzle hash
+        return Err.INVALID_SPEND_BUNDLE, None
+
+    return None, PreparedSpendBundle(removal_names, additions_dict, addition_amount, spends)
+
+
+def prepared_from_item(item: MempoolItem) -> Optional[PreparedSpendBundle]:
+    """
+    Rebuilds the result of prepare_spend_bundle() for an item that has been
+    validated before, from its bundle_coin_spends. That result only depends on
+    the spend bundle and its conditions, so the checks (e.g. the canonical
+    encoding of solutions) don't need to be run again. Returns None if the item
+    doesn't have the spends to rebuild it from.
+    """
+    flags = {bytes32(spend.coin_id): spend.flags for spend in item.conds.spends}
+    if flags.keys() != item.bundle_coin_spends.keys():
+        return None
+    additions_dict: dict[bytes32, Coin] = {}
+    addition_amount = 0
+    spends: dict[bytes32, tuple[CoinSpend, EligibilityAndAdditions]] = {}
+    for coin_id, bcs in item.bundle_coin_spends.items():
+        for child_coin in bcs.additions:
+            additions_dict[child_coin.name()] = child_coin
+            addition_amount += child_coin.amount
+        # eligible_for_fast_forward is also cleared if the singleton had no
+        # unspent lineage when the item was validated, which may have changed
+        ff_puzzle_hash = None
+        if bcs.eligible_for_fast_forward or (
+            bool(flags[coin_id] & ELIGIBLE_FOR_FF) and supports_fast_forward(bcs.coin_spend)
+        ):
+            ff_puzzle_hash = bcs.coin_spend.coin.puzzle_hash
+        spends[coin_id] = (
+            bcs.coin_spend,
+            EligibilityAndAdditions(
+                is_eligible_for_dedup=bcs.eligible_for_dedup,
+                spend_additions=bcs.additions,
+                ff_puzzle_hash=ff_puzzle_hash,
+            ),
+        )
+    return PreparedSpendBundle(set(spends.keys()), additions_dict, addition_amount, spends)
+
+
 # For block overhead cost calculation
 QUOTE_BYTES = 2
 QUOTE_EXECUTION_COST = 20
@@ -301,6 +403,19 @@ def check_removals(
     return None, []
 
 
+@dataclass(frozen=True)
+class BlockTemplate:
+    """
+    A block generator created ahead of time, from the mempool as it was at
+    the specified generation, on top of the transaction block peak_hash.
+    """
+
+    peak_hash: bytes32
+    generation: int
+    block_version: int
+    generator: Optional[NewBlockGenerator]
+
+
 class MempoolManager:
     pool: Executor
     constants: ConsensusConstants
@@ -319,6 +434,7 @@ class MempoolManager:
     _worker_queue_size: int
     max_block_klvm_cost: uint64
     max_tx_klvm_cost: uint64
+    _block_template: Optional[BlockTemplate]
 
     def __init__(
         self,
@@ -371,6 +487,7 @@ class MempoolManager:
             KLVMCost(uint64(self.max_block_klvm_cost)),
         )
         self.mempool: Mempool = Mempool(mempool_info, self.fee_estimator)
+        self._block_template = None
 
     def shut_down(self) -> None:
         self.pool.shutdown(wait=True)
@@ -391,6 +508,9 @@ class MempoolManager:
         """
         if self.peak is None or self.peak.header_hash != last_tb_header_hash:
             return None
+        template = self._current_block_template(0)
+        if template is not None:
+            return template.generator
         return self.mempool.create_block_generator(self.constants, self.peak.height, timeout)
 
     def create_block_generator2(self, last_tb_header_hash: bytes32, timeout: float) -> Optional[NewBlockGenerator]:
@@ -399,8 +519,59 @@ class MempoolManager:
         """
         if self.peak is None or self.peak.header_hash != last_tb_header_hash:
             return None
+        template = self._current_block_template(1)
+        if template is not None:
+            return template.generator
         return self.mempool.create_block_generator2(self.constants, self.peak.height, timeout)
 
+    def _current_block_template(self, block_version: int) -> Optional[BlockTemplate]:
+        """
+        Returns the block template, if it was created from the current peak
+        and mempool
+        """
+        template = self._block_template
+        if (
+            template is None
+            or self.peak is None
+            or template.peak_hash != self.peak.header_hash
+            or template.generation != self.mempool.generation
+            or template.block_version != block_version
+        ):
+            return None
+        return template
+
+    def block_template_is_stale(self, block_version: int) -> bool:
+        return self.peak is not None and self._current_block_template(block_version) is None
+
+    async def refresh_block_template(self, block_version: int, timeout: float) -> bool:
+        """
+        Creates a block generator from the current mempool, in the thread
+        pool, and keeps it around to be returned by create_block_generator()
+        (block_version 0) or create_block_generator2() (block_version 1), as
+        long as neither the peak nor the mempool change. This moves the work of
+        creating a block off of the path of responding to a signage point.
+        Returns True if the template was updated.
+        """
+        if self.peak is None or not self.block_template_is_stale(block_version):
+            return False
+        peak = self.peak
+        generation = self.mempool.generation
+        items = self.mempool.items_for_block()
+        if block_version == 1:
+            create_block = self.mempool.create_block_generator2
+        else:
+            create_block = self.mempool.create_block_generator
+        generator = await asyncio.get_running_loop().run_in_executor(
+            self.pool, create_block, self.constants, peak.height, timeout, items
+        )
+        # if a new peak arrived while we were creating the block, the items
+        # may have been modified (e.g. their singleton lineage) and the
+        # generator is not valid anymore
+        if self.peak is None or self.peak.header_hash != peak.header_hash or self.mempool.generation != generation:
+            return False
+        self._block_template = BlockTemplate(peak.header_hash, generation, block_version, generator)
+        return True
+
     def get_filter(self) -> bytes:
         all_transactions: set[bytes32] = set()
         byte_array_list = []
@@ -503,6 +674,7 @@ class MempoolManager:
         get_unspent_lineage_info_for_puzzle_hash: Optional[
             Callable[[bytes32], Awaitable[Optional[UnspentLineageInfo]]]
         ] = None,
+        prepared: Optional[PreparedSpendBundle] = None,
     ) -> SpendBundleAddInfo:
         """
         Validates and adds to mempool a new_spend with the given NPCResult, and spend_name, and the current mempool.
@@ -514,6 +686,7 @@ class MempoolManager:
             new_spend: spend bundle to validate and add
             conds: result of running the klvm transaction in a fake block
             spend_name: hash of the spend bundle data, passed in as an optimization
+            prepared: the result of prepare_spend_bundle(), if it has already been computed
 
         Returns:
             Optional[uint64]: cost of the entire transaction, None iff status is FAILED
@@ -540,6 +713,7 @@ class MempoolManager:
             first_added_height,
             get_coin_records,
             get_unspent_lineage_info_for_puzzle_hash,
+            prepared,
         )
         if err is None:
             # No error, immediately add to mempool, after removing conflicting TXs.
@@ -571,6 +745,7 @@ class MempoolManager:
         first_added_height: uint32,
         get_coin_records: Callable[[Collection[bytes32]], Awaitable[list[CoinRecord]]],
         get_unspent_lineage_info_for_puzzle_hash: Callable[[bytes32], Awaitable[Optional[UnspentLineageInfo]]],
+        prepared: Optional[PreparedSpendBundle] = None,
     ) -> tuple[Optional[Err], Optional[MempoolItem], list[bytes32]]:
         """
         Validates new_spend with the given SpendBundleConditions, and
@@ -584,6 +759,7 @@ class MempoolManager:
             first_added_height: The block height that `new_spend`  first entered this node's mempool.
                 Used to estimate how long a spend has taken to be included on the chain.
                 This value could differ node to node. Not preserved across full_node restarts.
+            prepared: the result of prepare_spend_bundle(), if it has already been computed
 
         Returns:
             Optional[Err]: Err is set if we cannot add to the mempool, None if we will immediately add to mempool
@@ -596,42 +772,18 @@ class MempoolManager:
 
         cost = conds.cost
 
-        removal_names: set[bytes32] = set()
-        additions_dict: dict[bytes32, Coin] = {}
-        addition_amount: int = 0
-        # Map of coin ID to eligibility information
-        eligibility_and_additions: dict[bytes32, EligibilityAndAdditions] = {}
-        for spend in conds.spends:
-            coin_id = bytes32(spend.coin_id)
-            removal_names.add(coin_id)
-            spend_additions = []
-            for puzzle_hash, amount, _ in spend.create_coin:
-                child_coin = Coin(coin_id, puzzle_hash, uint64(amount))
-                spend_additions.append(child_coin)
-                additions_dict[child_coin.name()] = child_coin
-                addition_amount += child_coin.amount
-            is_eligible_for_dedup = bool(spend.flags & ELIGIBLE_FOR_DEDUP)
-            is_eligible_for_ff = bool(spend.flags & ELIGIBLE_FOR_FF)
-            eligibility_and_additions[coin_id] = EligibilityAndAdditions(
-                is_eligible_for_dedup=is_eligible_for_dedup,
-                spend_additions=spend_additions,
-                ff_puzzle_hash=bytes32(spend.puzzle_hash) if is_eligible_for_ff else None,
-            )
-        removal_names_from_coin_spends: set[bytes32] = set()
-        bundle_coin_spends: dict[bytes32, BundleCoinSpend] = {}
-        for coin_spend in new_spend.coin_spends:
-            coin_id = coin_spend.coin.name()
-            removal_names_from_coin_spends.add(coin_id)
-            eligibility_info = eligibility_and_additions.get(
-                coin_id,
-                EligibilityAndAdditions(is_eligible_for_dedup=False, spend_additions=[], ff_puzzle_hash=None),
-            )
-
-            supports_dedup = eligibility_info.is_eligible_for_dedup
-            if supports_dedup and not is_klvm_canonical(bytes(coin_spend.solution)):
-                return Err.INVALID_COIN_SOLUTION, None, []
+        if prepared is None:
+            err, prepared = prepare_spend_bundle(new_spend, conds)
+            if err is not None:
+                return err, None, []
+        assert prepared is not None
+        removal_names = prepared.removal_names
+        additions_dict = prepared.additions_dict
+        addition_amount = prepared.addition_amount
 
-            mark_as_fast_forward = eligibility_info.ff_puzzle_hash is not None and supports_fast_forward(coin_spend)
+        bundle_coin_spends: dict[bytes32, BundleCoinSpend] = {}
+        for coin_id, (coin_spend, eligibility_info) in prepared.spends.items():
+            mark_as_fast_forward = eligibility_info.ff_puzzle_hash is not None
             lineage_info = None
             if mark_as_fast_forward:
                 # Make sure the fast forward spend still has a version that is
@@ -643,16 +795,12 @@ class MempoolManager:
                     mark_as_fast_forward = False
             bundle_coin_spends[coin_id] = BundleCoinSpend(
                 coin_spend=coin_spend,
-                eligible_for_dedup=supports_dedup,
+                eligible_for_dedup=eligibility_info.is_eligible_for_dedup,
                 eligible_for_fast_forward=mark_as_fast_forward,
                 additions=eligibility_info.spend_additions,
                 latest_singleton_lineage=lineage_info,
             )
 
-        if removal_names != removal_names_from_coin_spends:
-            # If you reach here it's probably because your program reveal doesn't match the coin's puzzle hash
-            return Err.INVALID_SPEND_BUNDLE, None, []
-
         # fast forward spends are only allowed when bundled with other, non-FF, spends
         # in order to evict an FF spend, it must be associated with a normal
         # spend that can be included in a block or invalidated some other way
@@ -944,36 +1092,8 @@ class MempoolManager:
             self.mempool = Mempool(old_pool.mempool_info, old_pool.fee_estimator)
             self.seen_bundle_hashes = {}
 
-            # in order to make this a bit quicker, we look-up all the spends in
-            # a single query, rather than one at a time.
-            coin_records: dict[bytes32, CoinRecord] = {}
-
-            removals: set[bytes32] = set()
-            for item in old_pool.all_items():
-                for s in item.spend_bundle.coin_spends:
-                    removals.add(s.coin.name())
-
-            for record in await self.get_coin_records(removals):
-                name = record.coin.name()
-                coin_records[name] = record
-
-            async def local_get_coin_records(names: Collection[bytes32]) -> list[CoinRecord]:
-                ret: list[CoinRecord] = []
-                for name in names:
-                    r = coin_records.get(name)
-                    if r is not None:
-                        ret.append(r)
-                return ret
-
-            for item in old_pool.all_items():
-                info = await self.add_spend_bundle(
-                    item.spend_bundle,
-                    item.conds,
-                    item.spend_bundle_name,
-                    item.height_added_to_mempool,
-                    local_get_coin_records,
-                    lineage_cache.get_unspent_lineage_info,
-                )
+            readded = await self._readd_items(list(old_pool.all_items()), lineage_cache)
+            for item, info in readded:
                 # Only add to `seen` if inclusion worked, so it can be resubmitted in case of a reorg
                 if info.status == MempoolInclusionStatus.SUCCESS:
                     self.add_and_maybe_pop_seen(item.spend_bundle_name)
@@ -987,15 +1107,7 @@ class MempoolManager:
         potential_txs = self._pending_cache.drain(new_peak.height)
         potential_txs.update(self._conflict_cache.drain())
         txs_added = []
-        for item in potential_txs.values():
-            info = await self.add_spend_bundle(
-                item.spend_bundle,
-                item.conds,
-                item.spend_bundle_name,
-                item.height_added_to_mempool,
-                self.get_coin_records,
-                lineage_cache.get_unspent_lineage_info,
-            )
+        for item, info in await self._readd_items(list(potential_txs.values()), lineage_cache):
             if info.status == MempoolInclusionStatus.SUCCESS:
                 txs_added.append(NewPeakItem(item.spend_bundle_name, item.spend_bundle, item.conds))
             mempool_item_removals.extend(info.removals)
@@ -1009,6 +1121,59 @@ class MempoolManager:
         log.log(logging.WARNING if duration > 1 else logging.INFO, f"new_peak() took {duration:0.2f} seconds")
         return NewPeakInfo(txs_added, mempool_item_removals)
 
+    async def _readd_items(
+        self, items: list[MempoolItem], lineage_cache: LineageInfoCache
+    ) -> list[tuple[MempoolItem, SpendBundleAddInfo]]:
+        """
+        Adds items back into the mempool (in order), e.g. after the mempool
+        has been re-created or the pending and conflict caches have been
+        drained. The checks that don't depend on the coin set were already run
+        when the items were first validated, their results are rebuilt from
+        the items rather than computed again. That gives us the removals of all
+        items up front, so their coin records can be looked up at once.
+        """
+        if len(items) == 0:
+            return []
+
+        prepared: list[Optional[PreparedSpendBundle]] = []
+        for item in items:
+            p = prepared_from_item(item)
+            if p is None:
+                _, p = prepare_spend_bundle(item.spend_bundle, item.conds)
+            prepared.append(p)
+
+        removals: set[bytes32] = set()
+        for p in prepared:
+            if p is not None:
+                removals.update(p.removal_names)
+        coin_records: dict[bytes32, CoinRecord] = {}
+        for record in await self.get_coin_records(removals):
+            coin_records[record.coin.name()] = record
+
+        async def local_get_coin_records(names: Collection[bytes32]) -> list[CoinRecord]:
+            ret: list[CoinRecord] = []
+            for name in names:
+                r = coin_records.get(name)
+                if r is not None:
+                    ret.append(r)
+            return ret
+
+        ret: list[tuple[MempoolItem, SpendBundleAddInfo]] = []
+        # if preparing an item failed, p is None and add_spend_bundle() fails
+        # it with the same error
+        for item, p in zip(items, prepared):
+            info = await self.add_spend_bundle(
+                item.spend_bundle,
+                item.conds,
+                item.spend_bundle_name,
+                item.height_added_to_mempool,
+                local_get_coin_records,
+                lineage_cache.get_unspent_lineage_info,
+                p,
+            )
+            ret.append((item, info))
+        return ret
+
     def get_items_not_in_filter(self, mempool_filter: PyBIP158, limit: int = 100) -> list[SpendBundle]:
         items: list[SpendBundle] = []
 
@@ -6,7 +6,7 @@ import math
 import pathlib
 import random
 import tempfile
-from concurrent.futures.process import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool, ProcessPoolExecutor
 from multiprocessing.context import BaseContext
 from typing import IO, Optional
 
@@ -48,11 +48,19 @@ from chik.types.weight_proof import (
 from chik.util.batches import to_batches
 from chik.util.block_cache import BlockCache
 from chik.util.hash import std_hash
+from chik.util.lru_cache import LRUCache
 from chik.util.setproctitle import getproctitle, setproctitle
 from chik.util.task_referencer import create_referenced_task
 
 log = logging.getLogger(__name__)
 
+# the number of sub epoch segments whose VDFs are remembered as valid, so
+# later weight proofs only need to validate the segments that are new
+VERIFIED_SEGMENTS_CACHE_SIZE = 10000
+
+# identifies the VDFs of a sampled segment, by (segment hash, sub slot iters)
+SegmentKey = tuple[bytes32, uint64]
+
 
 def _create_shutdown_file() -> IO[bytes]:
     return tempfile.NamedTemporaryFile(prefix="chik_full_node_weight_proof_handler_executor_shutdown_trigger")
@@ -76,6 +84,24 @@ class WeightProofHandler:
         self.lock = asyncio.Lock()
         self._num_processes = 4
         self.multiprocessing_context = multiprocessing_context
+        # created on first use and kept for later validations
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._verified_segments: LRUCache[SegmentKey, bool] = LRUCache(VERIFIED_SEGMENTS_CACHE_SIZE)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._num_processes,
+                mp_context=self.multiprocessing_context,
+                initializer=setproctitle,
+                initargs=(f"{getproctitle()}_weight_proof_worker",),
+            )
+        return self._executor
+
+    def shut_down(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
 
     async def get_proof_of_weight(self, tip: bytes32) -> Optional[WeightProof]:
         tip_rec = self.blockchain.try_block_record(tip)
@@ -609,30 +635,29 @@ class WeightProofHandler:
 
         fork_point, ses_fork_idx = self.get_fork_point(summaries)
         # timing reference: 1 second
-        # TODO: Consider implementing an async polling closer for the executor.
-        with ProcessPoolExecutor(
-            max_workers=self._num_processes,
-            mp_context=self.multiprocessing_context,
-            initializer=setproctitle,
-            initargs=(f"{getproctitle()}_weight_proof_worker",),
-        ) as executor:
-            # The shutdown file manager must be inside of the executor manager so that
-            # we request the workers close prior to waiting for them to close.
-            with _create_shutdown_file() as shutdown_file:
-                task = create_referenced_task(
-                    validate_weight_proof_inner(
-                        self.constants,
-                        executor,
-                        shutdown_file.name,
-                        self._num_processes,
-                        weight_proof,
-                        summaries,
-                        sub_epoch_weight_list,
-                        False,
-                        ses_fork_idx,
-                    )
+        # The executor outlives this validation, removing the shutdown file when
+        # we're done (or cancelled) stops the workers still validating our VDFs
+        with _create_shutdown_file() as shutdown_file:
+            task = create_referenced_task(
+                validate_weight_proof_inner(
+                    self.constants,
+                    self._get_executor(),
+                    shutdown_file.name,
+                    self._num_processes,
+                    weight_proof,
+                    summaries,
+                    sub_epoch_weight_list,
+                    False,
+                    ses_fork_idx,
+                    self._verified_segments,
                 )
+            )
+            try:
                 valid, _ = await task
+            except BrokenProcessPool:
+                # a worker died, the next validation starts a new pool
+                self.shut_down()
+                raise
         return valid, fork_point, summaries
 
     def get_fork_point(self, received_summaries: list[SubEpochSummary]) -> tuple[uint32, int]:
@@ -930,7 +955,12 @@ def _validate_sub_epoch_segments(
     summaries_bytes: list[bytes],
     height: uint32,
     validate_from: int = 0,
-) -> Optional[list[tuple[VDFProof, ClassgroupElement, VDFInfo]]]:
+    verified_segments: Optional[LRUCache[SegmentKey, bool]] = None,
+) -> Optional[dict[SegmentKey, list[tuple[VDFProof, ClassgroupElement, VDFInfo]]]]:
+    """
+    Returns the VDFs left to validate, by segment. The VDFs of segments in
+    verified_segments were validated before and aren't returned again.
+    """
     summaries = summaries_from_bytes(summaries_bytes)
     sub_epoch_segments: SubEpochSegments = SubEpochSegments.from_bytes(weight_proof_bytes)
     rc_sub_slot_hash = constants.GENESIS_CHALLENGE
@@ -940,7 +970,7 @@ def _validate_sub_epoch_segments(
     prev_ses: Optional[SubEpochSummary] = None
     segments_by_sub_epoch = map_segments_by_sub_epoch(sub_epoch_segments.challenge_segments)
     curr_ssi = constants.SUB_SLOT_ITERS_STARTING
-    vdfs_to_validate = []
+    vdfs_to_validate: dict[SegmentKey, list[tuple[VDFProof, ClassgroupElement, VDFInfo]]] = {}
     for sub_epoch_n, segments in segments_by_sub_epoch.items():
         prev_ssi = curr_ssi
         curr_difficulty, curr_ssi = _get_curr_diff_ssi(constants, sub_epoch_n, summaries)
@@ -971,10 +1001,13 @@ def _validate_sub_epoch_segments(
                 sampled_seg_index == idx,
                 height,
             )
-            vdfs_to_validate.extend(vdf_list)
             if not valid_segment:
                 log.error(f"failed to validate sub_epoch {segment.sub_epoch_n} segment {idx} slots")
                 return None
+            # the VDFs of a segment only depend on the segment and the sub slot iters
+            segment_key = (segment.get_hash(), curr_ssi)
+            if len(vdf_list) > 0 and (verified_segments is None or verified_segments.get(segment_key) is None):
+                vdfs_to_validate[segment_key] = vdf_list
             prev_ses = None
             total_blocks += 1
             total_slot_iters += slot_iters
@@ -1661,6 +1694,7 @@ async def validate_weight_proof_inner(
     sub_epoch_weight_list: list[uint128],
     skip_segment_validation: bool,
     validate_from: int,
+    verified_segments: Optional[LRUCache[SegmentKey, bool]] = None,
 ) -> tuple[bool, list[BlockRecord]]:
     assert len(weight_proof.sub_epochs) > 0
     if len(weight_proof.sub_epochs) == 0:
@@ -1686,14 +1720,16 @@ async def validate_weight_proof_inner(
     )
 
     if not skip_segment_validation:
-        vdfs_to_validate = _validate_sub_epoch_segments(
-            constants, rng, wp_segment_bytes, summary_bytes, peak_height, validate_from
+        segment_vdfs = _validate_sub_epoch_segments(
+            constants, rng, wp_segment_bytes, summary_bytes, peak_height, validate_from, verified_segments
         )
         await asyncio.sleep(0)  # break up otherwise multi-second sync code
 
-        if vdfs_to_validate is None:
+        if segment_vdfs is None:
             return False, []
 
+        vdfs_to_validate = [vdf for vdf_list in segment_vdfs.values() for vdf in vdf_list]
+        log.debug(f"validating {len(vdfs_to_validate)} VDFs of {len(segment_vdfs)} sub epoch segments")
         vdf_tasks = []
         for batch in to_batches(vdfs_to_validate, num_processes):
             byte_chunks = []
@@ -1715,6 +1751,10 @@ async def validate_weight_proof_inner(
             if not validated:
                 return False, []
 
+        if verified_segments is not None:
+            for segment_key in segment_vdfs:
+                verified_segments.put(segment_key, True)
+
     valid_recent_blocks, records_bytes = await recent_blocks_validation_task
 
     if not valid_recent_blocks or records_bytes is None:
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, TypeVar
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# the time we have to look up proofs for a signage point. Lookups finishing
+# later risk losing rewards
+LOOKUP_DEADLINE_SECONDS = 8.0
+# a disk is demoted after missing this many deadlines in a row, and promoted
+# again after meeting this many in a row
+DEMOTE_AFTER_MISSES = 3
+PROMOTE_AFTER_HITS = 10
+
+
+@dataclass
+class DiskStats:
+    """
+    The lookups scheduled on one device (file system), by st_dev
+    """
+
+    device: int
+    concurrency: int
+    running: int = 0
+    # (deadline, sequence number, future to wake up the lookup)
+    waiting: list[tuple[float, int, asyncio.Future[None]]] = field(default_factory=list, repr=False)
+    directories: set[str] = field(default_factory=set)
+    lookups: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    missed_deadlines: int = 0
+    consecutive_misses: int = 0
+    consecutive_hits: int = 0
+    # demoted disks may only run one lookup at a time, so they can't hold up
+    # the threads other disks need
+    demoted: bool = False
+
+    @property
+    def limit(self) -> int:
+        return 1 if self.demoted else self.concurrency
+
+    def to_json_dict(self) -> dict[str, Any]:
+        return {
+            "device": self.device,
+            "directories": sorted(self.directories),
+            "running": self.running,
+            "waiting": len(self.waiting),
+            "lookups": self.lookups,
+            "average_time": self.total_time / self.lookups if self.lookups > 0 else 0.0,
+            "max_time": self.max_time,
+            "missed_deadlines": self.missed_deadlines,
+            "demoted": self.demoted,
+        }
+
+
+class DiskScheduler:
+    """
+    Runs blocking plot lookups in the executor, with at most concurrency
+    lookups per device at a time. Waiting lookups of a device run in the order
+    of their deadlines. A device that keeps missing deadlines is demoted to one
+    lookup at a time, so a slow or failing disk can't hold all the threads.
+    """
+
+    def __init__(self, executor: Executor, concurrency: int) -> None:
+        self.executor = executor
+        self.concurrency = max(1, concurrency)
+        self.disks: dict[int, DiskStats] = {}
+        self._seq = itertools.count()
+
+    def _disk(self, device: int) -> DiskStats:
+        disk = self.disks.get(device)
+        if disk is None:
+            disk = DiskStats(device, self.concurrency)
+            self.disks[device] = disk
+        return disk
+
+    async def run(self, device: int, directory: str, deadline: float, function: Callable[..., T], *args: Any) -> T:
+        """
+        deadline is in time.monotonic() time
+        """
+        disk = self._disk(device)
+        disk.directories.add(directory)
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(disk.waiting, (deadline, next(self._seq), waiter))
+        self._wake_up(disk)
+        try:
+            # _wake_up() takes a slot for us before waking us up
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                disk.running -= 1
+                self._wake_up(disk)
+            raise
+
+        start = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            now = time.monotonic()
+            # lookups that only started after their deadline (because they
+            # were waiting for the disk) don't say much about the disk itself
+            self._record(disk, now - start, None if start > deadline else now > deadline)
+            disk.running -= 1
+            self._wake_up(disk)
+
+    def _wake_up(self, disk: DiskStats) -> None:
+        while disk.running < disk.limit and len(disk.waiting) > 0:
+            _, _, waiter = heapq.heappop(disk.waiting)
+            if waiter.done():
+                # cancelled
+                continue
+            disk.running += 1
+            waiter.set_result(None)
+
+    def _record(self, disk: DiskStats, duration: float, missed: Optional[bool]) -> None:
+        disk.lookups += 1
+        disk.total_time += duration
+        disk.max_time = max(disk.max_time, duration)
+        if missed is None:
+            return
+        if missed:
+            disk.missed_deadlines += 1
+            disk.consecutive_misses += 1
+            disk.consecutive_hits = 0
+            if not disk.demoted and disk.consecutive_misses >= DEMOTE_AFTER_MISSES:
+                disk.demoted = True
+                log.warning(
+                    f"Plots in {sorted(disk.directories)} missed {disk.consecutive_misses} lookup deadlines in a row. "
+                    "Limiting lookups on this disk to one at a time. The disk may be slow or failing."
+                )
+        else:
+            disk.consecutive_hits += 1
+            disk.consecutive_misses = 0
+            if disk.demoted and disk.consecutive_hits >= PROMOTE_AFTER_HITS:
+                disk.demoted = False
+                log.info(f"Plots in {sorted(disk.directories)} are meeting lookup deadlines again")
+                self._wake_up(disk)
+
+    def get_stats(self) -> list[dict[str, Any]]:
+        return [disk.to_json_dict() for disk in self.disks.values()]
@@ -14,6 +14,7 @@ from chik_rs import ConsensusConstants
 from chik_rs.sized_ints import uint32
 from typing_extensions import Literal
 
+from chik.harvester.disk_scheduler import DiskScheduler
 from chik.plot_sync.sender import Sender
 from chik.plotting.manager import PlotManager
 from chik.plotting.util import (
@@ -25,6 +26,8 @@ from chik.plotting.util import (
     DEFAULT_MAX_COMPRESSION_LEVEL_ALLOWED,
     DEFAULT_PARALLEL_DECOMPRESSOR_COUNT,
     DEFAULT_USE_GPU_HARVESTING,
+    DEFAULT_WATCH_PLOT_DIRECTORIES,
+    DEFAULT_WATCHED_REFRESH_INTERVAL_SECONDS,
     HarvestingMode,
     PlotRefreshEvents,
     PlotRefreshResult,
@@ -56,6 +59,7 @@ class Harvester:
     root_path: Path
     _shut_down: bool
     executor: ThreadPoolExecutor
+    disk_scheduler: DiskScheduler
     state_changed_callback: Optional[StateChangedProtocol] = None
     constants: ConsensusConstants
     _refresh_lock: asyncio.Lock
@@ -91,12 +95,21 @@ class Harvester:
         self.log.info(f"Using plots_refresh_parameter: {refresh_parameter}")
 
         self.plot_manager = PlotManager(
-            root_path, refresh_parameter=refresh_parameter, refresh_callback=self._plot_refresh_callback
+            root_path,
+            refresh_parameter=refresh_parameter,
+            refresh_callback=self._plot_refresh_callback,
+            watch_directories=config.get("watch_plot_directories", DEFAULT_WATCH_PLOT_DIRECTORIES),
+            watched_refresh_interval_seconds=config.get(
+                "watched_plots_refresh_interval_seconds", DEFAULT_WATCHED_REFRESH_INTERVAL_SECONDS
+            ),
         )
         self._shut_down = False
         self.executor = concurrent.futures.ThreadPoolExecutor(
             max_workers=config["num_threads"], thread_name_prefix="harvester-"
         )
+        self.disk_scheduler = DiskScheduler(
+            self.executor, config.get("disk_concurrency", max(1, config["num_threads"] // 4))
+        )
         self._server = None
         self.constants = constants
         self.state_changed_callback: Optional[StateChangedProtocol] = None
@@ -14,6 +14,7 @@ from chik.consensus.pot_iterations import (
     calculate_iterations_quality,
     calculate_sp_interval_iters,
 )
+from chik.harvester.disk_scheduler import LOOKUP_DEADLINE_SECONDS
 from chik.harvester.harvester import Harvester
 from chik.plotting.util import PlotInfo, parse_plot_info
 from chik.protocols import harvester_protocol
@@ -27,7 +28,6 @@ from chik.types.blockchain_format.proof_of_space import (
     calculate_pos_challenge,
     calculate_prefix_bits,
     generate_plot_public_key,
-    passes_plot_filter,
 )
 from chik.wallet.derive_keys import master_sk_to_local_sk
 
@@ -92,10 +92,9 @@ class HarvesterAPI:
         )
 
         start = time.monotonic()
+        deadline = start + LOOKUP_DEADLINE_SECONDS
         assert len(new_challenge.challenge_hash) == 32
 
-        loop = asyncio.get_running_loop()
-
         def blocking_lookup(filename: Path, plot_info: PlotInfo) -> list[tuple[bytes32, ProofOfSpace]]:
             # Uses the DiskProver object to lookup qualities. This is a blocking call,
             # so it should be run in a thread pool.
@@ -222,8 +221,8 @@ class HarvesterAPI:
             all_responses: list[harvester_protocol.NewProofOfSpace] = []
             if self.harvester._shut_down:
                 return filename, []
-            proofs_of_space_and_q: list[tuple[bytes32, ProofOfSpace]] = await loop.run_in_executor(
-                self.harvester.executor, blocking_lookup, filename, plot_info
+            proofs_of_space_and_q: list[tuple[bytes32, ProofOfSpace]] = await self.harvester.disk_scheduler.run(
+                plot_info.device, str(filename.parent), deadline, blocking_lookup, filename, plot_info
             )
             for quality_str, proof_of_space in proofs_of_space_and_q:
                 all_responses.append(
@@ -240,33 +239,20 @@ class HarvesterAPI:
                 )
             return filename, all_responses
 
-        awaitables = []
-        passed = 0
-        total = 0
-        with self.harvester.plot_manager:
-            self.harvester.log.debug("new_signage_point_harvester lock acquired")
-            for try_plot_filename, try_plot_info in self.harvester.plot_manager.plots.items():
-                # Passes the plot filter (does not check sp filter yet though, since we have not reached sp)
-                # This is being executed at the beginning of the slot
-                total += 1
-
-                # TODO: todo_v2_plots support v2 plots in PlotManager
-                filter_prefix_bits = uint8(
-                    calculate_prefix_bits(
-                        self.harvester.constants,
-                        new_challenge.peak_height,
-                        PlotSize.make_v1(try_plot_info.prover.get_size()),
-                    )
-                )
-                if passes_plot_filter(
-                    filter_prefix_bits,
-                    try_plot_info.prover.get_id(),
-                    new_challenge.challenge_hash,
-                    new_challenge.sp_hash,
-                ):
-                    passed += 1
-                    awaitables.append(lookup_challenge(try_plot_filename, try_plot_info))
-            self.harvester.log.debug(f"new_signage_point_harvester {passed} plots passed the plot filter")
+        def filter_prefix_bits(size: int) -> int:
+            # TODO: todo_v2_plots support v2 plots in PlotManager
+            return calculate_prefix_bits(self.harvester.constants, new_challenge.peak_height, PlotSize.make_v1(size))
+
+        # Passes the plot filter (does not check sp filter yet though, since we have not reached sp)
+        # This is being executed at the beginning of the slot
+        plot_table = self.harvester.plot_manager.plot_filter_table()
+        total = len(plot_table)
+        awaitables = [
+            lookup_challenge(plot_table.paths[index], plot_table.plot_infos[index])
+            for index in plot_table.passing(filter_prefix_bits, new_challenge.challenge_hash, new_challenge.sp_hash)
+        ]
+        passed = len(awaitables)
+        self.harvester.log.debug(f"new_signage_point_harvester {passed} plots passed the plot filter")
 
         # Concurrently executes all lookups on disk, to take advantage of multiple disk parallelism
         time_taken = time.monotonic() - start
@@ -274,7 +260,7 @@ class HarvesterAPI:
         for filename_sublist_awaitable in asyncio.as_completed(awaitables):
             filename, sublist = await filename_sublist_awaitable
             time_taken = time.monotonic() - start
-            if time_taken > 8:
+            if time_taken > LOOKUP_DEADLINE_SECONDS:
                 self.harvester.log.warning(
                     f"Looking up qualities on {filename} took: {time_taken}. This should be below 8 seconds"
                     f" to minimize risk of losing rewards."
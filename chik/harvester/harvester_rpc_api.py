@@ -29,6 +29,7 @@ class HarvesterRpcApi:
             "/remove_plot_directory": self.remove_plot_directory,
             "/get_harvester_config": self.get_harvester_config,
             "/update_harvester_config": self.update_harvester_config,
+            "/get_disk_stats": self.get_disk_stats,
         }
 
     async def _state_changed(self, change: str, change_data: Optional[dict[str, Any]] = None) -> list[WsRpcMessage]:
@@ -62,6 +63,9 @@ class HarvesterRpcApi:
             "not_found_filenames": not_found,
         }
 
+    async def get_disk_stats(self, _: dict[str, Any]) -> EndpointResult:
+        return {"disks": self.service.disk_scheduler.get_stats()}
+
     async def refresh_plots(self, _: dict[str, Any]) -> EndpointResult:
         self.service.plot_manager.trigger_refresh()
         return {}
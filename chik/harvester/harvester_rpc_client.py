@@ -17,6 +17,12 @@ class HarvesterRpcClient(RpcClient):
     async def get_plots(self) -> dict[str, Any]:
         return await self.fetch("get_plots", {})
 
+    async def get_disk_stats(self) -> list[dict[str, Any]]:
+        response = await self.fetch("get_disk_stats", {})
+        # TODO: casting due to lack of type checked deserialization
+        result = cast(list[dict[str, Any]], response["disks"])
+        return result
+
     async def refresh_plots(self) -> None:
         await self.fetch("refresh_plots", {})
 
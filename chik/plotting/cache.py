@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import logging
+import sqlite3
+import threading
 import time
 import traceback
-from collections.abc import ItemsView, KeysView, ValuesView
+from collections.abc import ItemsView, ValuesView
 from dataclasses import dataclass, field
 from math import ceil
 from pathlib import Path
@@ -11,7 +13,7 @@ from typing import Optional
 
 from chik_rs import G1Element
 from chik_rs.sized_bytes import bytes32
-from chik_rs.sized_ints import uint16, uint64
+from chik_rs.sized_ints import uint64
 from chikpos import DiskProver
 
 from chik.plotting.util import parse_plot_info
@@ -21,6 +23,7 @@ from chik.wallet.derive_keys import master_sk_to_local_sk
 
 log = logging.getLogger(__name__)
 
+# The version of the cache file of older versions, which is imported if there is no cache database yet
 CURRENT_VERSION: int = 2
 
 
@@ -74,6 +77,16 @@ class CacheEntry:
 
         return cls(prover, farmer_public_key, pool_public_key, pool_contract_puzzle_hash, plot_public_key, time.time())
 
+    def to_disk_cache_entry(self) -> DiskCacheEntry:
+        return DiskCacheEntry(
+            bytes(self.prover),
+            self.farmer_public_key,
+            self.pool_public_key,
+            self.pool_contract_puzzle_hash,
+            self.plot_public_key,
+            uint64(int(self.last_use)),
+        )
+
     def bump_last_use(self) -> None:
         self.last_use = time.time()
 
@@ -81,133 +94,271 @@ class CacheEntry:
         return time.time() - self.last_use > expiry_seconds
 
 
+# Experimental measurements of the C2 size, used if they are above the estimates,
+# see https://github.com/Chik-Network/chik-blockchain/issues/16063
+MEASURED_C2_SIZES: dict[int, int] = {
+    32: 738,
+    33: 1083,
+    34: 1771,
+    35: 3147,
+    36: 5899,
+    37: 11395,
+    38: 22395,
+    39: 44367,
+}
+# The stored last use of an entry is only updated once it's older than this,
+# to avoid rewriting all entries after every refresh
+LAST_USE_RESOLUTION_SECONDS = 24 * 60 * 60
+# How often save() looks for entries with an outdated last use
+LAST_USE_SCAN_INTERVAL_SECONDS = 60 * 60
+
+
+def suspicious_entry_size(prover: DiskProver, prover_size: int) -> bool:
+    # TODO, drop the below entry dropping after few versions or whenever we force a cache recreation.
+    #       it's here to filter invalid cache entries coming from bladebit RAM plotting.
+    #       Related: - https://github.com/Chik-Network/chik-blockchain/issues/13084
+    #                - https://github.com/Chik-Network/chikpos/pull/337
+    k = prover.get_size()
+    # Estimated C2 size + memo size + 2000 (static data + path)
+    # static data: version(2) + table pointers (<=96) + id(32) + k(1) => ~130
+    # path: up to ~1870, all above will lead to false positive.
+    # See https://github.com/Chik-Network/chikpos/blob/3ee062b86315823dd775453ad320b8be892c7df3/src/prover_disk.hpp#L282-L287  # noqa: E501
+    check_size = ceil(2**k / 100_000_000) * ceil(k / 8) + len(prover.get_memo()) + 2000
+    if k in MEASURED_C2_SIZES:
+        check_size = max(check_size, MEASURED_C2_SIZES[k])
+    return prover_size > check_size
+
+
 @dataclass
 class Cache:
+    """
+    The cache entries are stored in an SQLite database, one row per plot, and
+    save() only writes the rows which changed. load() only reads the paths and
+    the last use of the entries, an entry is read and its DiskProver created
+    the first time it's requested with get().
+    """
+
     _path: Path
-    _changed: bool = False
+    # The cache file of older versions, imported if there is no database yet
+    _legacy_path: Optional[Path] = None
+    # The entries which were requested or added since the cache was loaded
     _data: dict[Path, CacheEntry] = field(default_factory=dict)
+    # The last use of all entries in the database, as stored
+    _stored: dict[Path, float] = field(default_factory=dict)
+    # Entries which need to be written to, or removed from the database
+    _updated: set[Path] = field(default_factory=set)
+    _removed: set[Path] = field(default_factory=set)
+    _last_use_saved: float = field(default_factory=time.time)
+    _db: Optional[sqlite3.Connection] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
     expiry_seconds: int = 7 * 24 * 60 * 60  # Keep the cache entries alive for 7 days after its last access
 
     def __post_init__(self) -> None:
         self._path.parent.mkdir(parents=True, exist_ok=True)
 
     def __len__(self) -> int:
-        return len(self._data)
+        return len(self.keys())
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS plot_cache("
+                "path text PRIMARY KEY, "
+                "last_use int NOT NULL, "
+                "entry blob NOT NULL)"
+            )
+        return self._db
+
+    def _close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
 
     def update(self, path: Path, entry: CacheEntry) -> None:
-        self._data[path] = entry
-        self._changed = True
+        with self._lock:
+            self._data[path] = entry
+            self._updated.add(path)
+            self._removed.discard(path)
 
     def remove(self, cache_keys: list[Path]) -> None:
-        for key in cache_keys:
-            if key in self._data:
-                del self._data[key]
-                self._changed = True
+        with self._lock:
+            for key in cache_keys:
+                self._data.pop(key, None)
+                self._updated.discard(key)
+                if self._stored.pop(key, None) is not None:
+                    self._removed.add(key)
 
     def save(self) -> None:
         try:
-            disk_cache_entries: dict[str, DiskCacheEntry] = {
-                str(path): DiskCacheEntry(
-                    bytes(cache_entry.prover),
-                    cache_entry.farmer_public_key,
-                    cache_entry.pool_public_key,
-                    cache_entry.pool_contract_puzzle_hash,
-                    cache_entry.plot_public_key,
-                    uint64(int(cache_entry.last_use)),
-                )
-                for path, cache_entry in self.items()
-            }
-            cache_data: CacheDataV1 = CacheDataV1(
-                [(plot_id, cache_entry) for plot_id, cache_entry in disk_cache_entries.items()]
+            with self._lock:
+                if self._db is not None and not self._path.exists():
+                    log.warning(f"Cache {self._path} was removed, creating a new one")
+                    self._close()
+                    # The entries which were never requested were only in the removed database
+                    self._stored.clear()
+                    self._removed.clear()
+                    self._updated.update(self._data.keys())
+                db = self._connection()
+                now = time.time()
+                last_use_updates: list[tuple[int, str]] = []
+                if now - self._last_use_saved > LAST_USE_SCAN_INTERVAL_SECONDS:
+                    for path, cache_entry in self._data.items():
+                        stored = self._stored.get(path)
+                        if stored is not None and cache_entry.last_use - stored > LAST_USE_RESOLUTION_SECONDS:
+                            last_use_updates.append((int(cache_entry.last_use), str(path)))
+                    self._last_use_saved = now
+                updated_entries = [
+                    (
+                        str(path),
+                        int(self._data[path].last_use),
+                        bytes(self._data[path].to_disk_cache_entry()),
+                    )
+                    for path in self._updated
+                ]
+                with db:
+                    db.executemany("DELETE FROM plot_cache WHERE path=?", [(str(path),) for path in self._removed])
+                    db.executemany("INSERT OR REPLACE INTO plot_cache VALUES(?, ?, ?)", updated_entries)
+                    db.executemany("UPDATE plot_cache SET last_use=? WHERE path=?", last_use_updates)
+                for path in self._updated:
+                    self._stored[path] = float(int(self._data[path].last_use))
+                for last_use, path_str in last_use_updates:
+                    self._stored[Path(path_str)] = float(last_use)
+                removed = len(self._removed)
+                self._updated.clear()
+                self._removed.clear()
+            log.info(
+                f"Saved cache entries: {len(updated_entries)} written, {removed} removed, "
+                f"{len(last_use_updates)} last use updates"
             )
-            disk_cache: VersionedBlob = VersionedBlob(uint16(CURRENT_VERSION), bytes(cache_data))
-            serialized: bytes = bytes(disk_cache)
-            self._path.write_bytes(serialized)
-            self._changed = False
-            log.info(f"Saved {len(serialized)} bytes of cached data")
         except Exception as e:
             log.error(f"Failed to save cache: {e}, {traceback.format_exc()}")
 
     def load(self) -> None:
         try:
-            serialized = self._path.read_bytes()
-            log.info(f"Loaded {len(serialized)} bytes of cached data")
-            stored_cache: VersionedBlob = VersionedBlob.from_bytes(serialized)
-            if stored_cache.version == CURRENT_VERSION:
+            with self._lock:
+                import_legacy = not self._path.exists() and self._legacy_path is not None and self._legacy_path.exists()
                 start = time.time()
-                cache_data: CacheDataV1 = CacheDataV1.from_bytes(stored_cache.blob)
                 self._data = {}
-                estimated_c2_sizes: dict[int, int] = {}
-                measured_sizes: dict[int, int] = {
-                    32: 738,
-                    33: 1083,
-                    34: 1771,
-                    35: 3147,
-                    36: 5899,
-                    37: 11395,
-                    38: 22395,
-                    39: 44367,
+                self._updated.clear()
+                self._removed.clear()
+                self._last_use_saved = start
+                self._stored = {
+                    Path(path): float(last_use)
+                    for path, last_use in self._connection().execute("SELECT path, last_use FROM plot_cache")
                 }
-                for path, cache_entry in cache_data.entries:
-                    new_entry = CacheEntry(
-                        DiskProver.from_bytes(cache_entry.prover_data),
-                        cache_entry.farmer_public_key,
-                        cache_entry.pool_public_key,
-                        cache_entry.pool_contract_puzzle_hash,
-                        cache_entry.plot_public_key,
-                        float(cache_entry.last_use),
-                    )
-                    # TODO, drop the below entry dropping after few versions or whenever we force a cache recreation.
-                    #       it's here to filter invalid cache entries coming from bladebit RAM plotting.
-                    #       Related: - https://github.com/Chik-Network/chik-blockchain/issues/13084
-                    #                - https://github.com/Chik-Network/chikpos/pull/337
-                    k = new_entry.prover.get_size()
-                    if k not in estimated_c2_sizes:
-                        estimated_c2_sizes[k] = ceil(2**k / 100_000_000) * ceil(k / 8)
-                    memo_size = len(new_entry.prover.get_memo())
-                    prover_size = len(cache_entry.prover_data)
-                    # Estimated C2 size + memo size + 2000 (static data + path)
-                    # static data: version(2) + table pointers (<=96) + id(32) + k(1) => ~130
-                    # path: up to ~1870, all above will lead to false positive.
-                    # See https://github.com/Chik-Network/chikpos/blob/3ee062b86315823dd775453ad320b8be892c7df3/src/prover_disk.hpp#L282-L287  # noqa: E501
-
-                    # Use experimental measurements if more than estimates
-                    # https://github.com/Chik-Network/chik-blockchain/issues/16063
-                    check_size = estimated_c2_sizes[k] + memo_size + 2000
-                    if k in measured_sizes:
-                        check_size = max(check_size, measured_sizes[k])
-
-                    if prover_size > check_size:
-                        log.warning(
-                            "Suspicious cache entry dropped. Recommended: stop the harvester, remove "
-                            f"{self._path}, restart. Entry: size {prover_size}, path {path}"
-                        )
-                    else:
-                        self._data[Path(path)] = new_entry
-
-                log.info(f"Parsed {len(self._data)} cache entries in {time.time() - start:.2f}s")
+            log.info(f"Loaded {len(self._stored)} cache entries in {time.time() - start:.2f}s")
+            if import_legacy:
+                self._import_legacy()
+        except sqlite3.DatabaseError as e:
+            log.error(f"Failed to load cache, starting with an empty one: {e}, {traceback.format_exc()}")
+            with self._lock:
+                self._close()
+                self._path.unlink(missing_ok=True)
+                self._stored = {}
+                self._connection()
+        except Exception as e:
+            log.error(f"Failed to load cache: {e}, {traceback.format_exc()}")
 
-            else:
+    def _import_legacy(self) -> None:
+        assert self._legacy_path is not None
+        try:
+            serialized = self._legacy_path.read_bytes()
+            stored_cache: VersionedBlob = VersionedBlob.from_bytes(serialized)
+            if stored_cache.version != CURRENT_VERSION:
                 raise ValueError(f"Invalid cache version {stored_cache.version}. Expected version {CURRENT_VERSION}.")
-        except FileNotFoundError:
-            log.debug(f"Cache {self._path} not found")
+            start = time.time()
+            cache_data: CacheDataV1 = CacheDataV1.from_bytes(stored_cache.blob)
+            for path, cache_entry in cache_data.entries:
+                new_entry = self._create_entry(path, cache_entry, float(cache_entry.last_use))
+                if new_entry is not None:
+                    self.update(Path(path), new_entry)
+            self.save()
+            with self._lock:
+                # Imported entries are created again on their first use, like the entries loaded from the database
+                self._data.clear()
+            log.info(
+                f"Imported {len(self._stored)} cache entries from {self._legacy_path} in {time.time() - start:.2f}s"
+            )
         except Exception as e:
-            log.error(f"Failed to load cache: {e}, {traceback.format_exc()}")
+            log.error(f"Failed to import cache {self._legacy_path}: {e}, {traceback.format_exc()}")
+
+    def _create_entry(self, path: str, cache_entry: DiskCacheEntry, last_use: float) -> Optional[CacheEntry]:
+        new_entry = CacheEntry(
+            DiskProver.from_bytes(cache_entry.prover_data),
+            cache_entry.farmer_public_key,
+            cache_entry.pool_public_key,
+            cache_entry.pool_contract_puzzle_hash,
+            cache_entry.plot_public_key,
+            last_use,
+        )
+        prover_size = len(cache_entry.prover_data)
+        if suspicious_entry_size(new_entry.prover, prover_size):
+            log.warning(
+                "Suspicious cache entry dropped. Recommended: stop the harvester, remove "
+                f"{self._path}, restart. Entry: size {prover_size}, path {path}"
+            )
+            return None
+        return new_entry
 
-    def keys(self) -> KeysView[Path]:
-        return self._data.keys()
+    def keys(self) -> set[Path]:
+        with self._lock:
+            return self._stored.keys() | self._data.keys()
 
     def values(self) -> ValuesView[CacheEntry]:
+        """
+        Only the entries which were requested or added since the cache was loaded
+        """
         return self._data.values()
 
     def items(self) -> ItemsView[Path, CacheEntry]:
+        """
+        Only the entries which were requested or added since the cache was loaded
+        """
         return self._data.items()
 
+    def expired_unused(self) -> list[Path]:
+        """
+        Returns the expired entries which weren't requested since the cache was loaded
+        """
+        now = time.time()
+        with self._lock:
+            return [
+                path
+                for path, last_use in self._stored.items()
+                if path not in self._data and now - last_use > self.expiry_seconds
+            ]
+
     def get(self, path: Path) -> Optional[CacheEntry]:
-        return self._data.get(path)
+        with self._lock:
+            entry = self._data.get(path)
+            if entry is not None or path not in self._stored:
+                return entry
+            row = (
+                self._connection()
+                .execute("SELECT last_use, entry FROM plot_cache WHERE path=?", (str(path),))
+                .fetchone()
+            )
+        new_entry: Optional[CacheEntry] = None
+        if row is not None:
+            try:
+                new_entry = self._create_entry(str(path), DiskCacheEntry.from_bytes(row[1]), float(row[0]))
+            except Exception as e:
+                log.error(f"Failed to parse cache entry of {path}: {e}, {traceback.format_exc()}")
+        with self._lock:
+            if new_entry is None:
+                if self._stored.pop(path, None) is not None:
+                    self._removed.add(path)
+            else:
+                self._data[path] = new_entry
+        return new_entry
 
     def changed(self) -> bool:
-        return self._changed
+        return (
+            len(self._updated) > 0
+            or len(self._removed) > 0
+            or time.time() - self._last_use_saved > LAST_USE_SCAN_INTERVAL_SECONDS
+        )
 
     def path(self) -> Path:
         return self._path
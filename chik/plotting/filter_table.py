@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable
+
+from chik_rs.sized_bytes import bytes32
+
+from chik.plotting.util import PlotInfo
+
+
+@dataclass(frozen=True)
+class PlotFilterTable:
+    """
+    The plot IDs of all plots in one flat buffer, to apply the plot filter to
+    all of them in a single pass. The PlotManager rebuilds it when its plots
+    change, so it can be used without holding the PlotManager lock.
+    """
+
+    paths: list[Path]
+    plot_infos: list[PlotInfo]
+    # the 32 byte plot IDs, concatenated, in the same order as paths
+    plot_ids: bytes
+    # the k size of each plot
+    sizes: bytes
+
+    @classmethod
+    def create(cls, plots: Mapping[Path, PlotInfo]) -> PlotFilterTable:
+        paths = list(plots.keys())
+        plot_infos = list(plots.values())
+        return cls(
+            paths,
+            plot_infos,
+            b"".join(info.prover.get_id() for info in plot_infos),
+            bytes(info.prover.get_size() for info in plot_infos),
+        )
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def passing(self, prefix_bits: Callable[[int], int], challenge_hash: bytes32, signage_point: bytes32) -> list[int]:
+        """
+        Returns the indices of the plots passing the plot filter, in order.
+        prefix_bits returns the number of prefix bits of the filter, given the
+        k size of a plot (see calculate_prefix_bits()). This is equivalent to
+        calling passes_plot_filter() for every plot.
+        """
+        # a plot passes if the top prefix bits of the 64 bit integer at the
+        # start of the hash are 0, i.e. if the integer is below the threshold
+        thresholds = {size: 1 << (64 - prefix_bits(size)) for size in set(self.sizes)}
+        suffix = challenge_hash + signage_point
+        plot_ids = self.plot_ids
+        ret: list[int] = []
+        if len(thresholds) == 1:
+            # the common case, all plots use the same filter
+            threshold = next(iter(thresholds.values()))
+            for index, offset in enumerate(range(0, len(plot_ids), 32)):
+                digest = sha256(plot_ids[offset : offset + 32] + suffix).digest()
+                if int.from_bytes(digest[:8], "big") < threshold:
+                    ret.append(index)
+        else:
+            sizes = self.sizes
+            for index, offset in enumerate(range(0, len(plot_ids), 32)):
+                digest = sha256(plot_ids[offset : offset + 32] + suffix).digest()
+                if int.from_bytes(digest[:8], "big") < thresholds[sizes[index]]:
+                    ret.append(index)
+        return ret
@@ -13,7 +13,10 @@ from chikpos import DiskProver, decompressor_context_queue
 
 from chik.consensus.pos_quality import UI_ACTUAL_SPACE_CONSTANT_FACTOR, _expected_plot_size
 from chik.plotting.cache import Cache, CacheEntry
+from chik.plotting.filter_table import PlotFilterTable
 from chik.plotting.util import (
+    DEFAULT_RECURSIVE_PLOT_SCAN,
+    DEFAULT_WATCHED_REFRESH_INTERVAL_SECONDS,
     HarvestingMode,
     PlotInfo,
     PlotRefreshEvents,
@@ -21,7 +24,9 @@ from chik.plotting.util import (
     PlotsRefreshParameter,
     get_plot_filenames,
 )
+from chik.plotting.watcher import PlotChanges, PlotWatcher, create_observer
 from chik.util.batches import to_batches
+from chik.util.config import load_config
 
 log = logging.getLogger(__name__)
 
@@ -41,10 +46,16 @@ class PlotManager:
     refresh_parameter: PlotsRefreshParameter
     log: Any
     _lock: threading.Lock
+    # built from plots on demand, reset whenever plots change
+    _filter_table: Optional[PlotFilterTable]
     _refresh_thread: Optional[threading.Thread]
     _refreshing_enabled: bool
     _refresh_callback: Callable
     _initial: bool
+    # applies changes to the plot directories between full refreshes, if watching them is enabled
+    _watcher: PlotWatcher
+    _watch_directories: bool
+    _watched_refresh_interval_seconds: int
     max_compression_level_allowed: int
     context_count: int
 
@@ -55,6 +66,8 @@ class PlotManager:
         match_str: Optional[str] = None,
         open_no_key_filenames: bool = False,
         refresh_parameter: PlotsRefreshParameter = PlotsRefreshParameter(),
+        watch_directories: bool = False,
+        watched_refresh_interval_seconds: int = DEFAULT_WATCHED_REFRESH_INTERVAL_SECONDS,
     ):
         self.root_path = root_path
         self.plots = {}
@@ -66,19 +79,24 @@ class PlotManager:
         self.pool_public_keys = []
         # Since `compression_level` property was added to Cache structure,
         # previous cache file formats needs to be reset
-        # When user downgrades harvester, it looks 'plot_manager.dat` while
-        # latest harvester reads/writes 'plot_manager_v2.dat`
-        self.cache = Cache(self.root_path.resolve() / "cache" / "plot_manager_v2.dat")
+        # When user downgrades harvester, it looks 'plot_manager.dat` or 'plot_manager_v2.dat` while
+        # latest harvester reads/writes 'plot_manager_v3.sqlite`, which is created from 'plot_manager_v2.dat`
+        cache_path = self.root_path.resolve() / "cache"
+        self.cache = Cache(cache_path / "plot_manager_v3.sqlite", cache_path / "plot_manager_v2.dat")
         self.match_str = match_str
         self.open_no_key_filenames = open_no_key_filenames
         self.last_refresh_time = 0
         self.refresh_parameter = refresh_parameter
         self.log = logging.getLogger(__name__)
         self._lock = threading.Lock()
+        self._filter_table = None
         self._refresh_thread = None
         self._refreshing_enabled = False
         self._refresh_callback = refresh_callback
         self._initial = True
+        self._watcher = PlotWatcher()
+        self._watch_directories = watch_directories
+        self._watched_refresh_interval_seconds = watched_refresh_interval_seconds
         self.max_compression_level_allowed = 0
         self.context_count = 0
 
@@ -129,6 +147,7 @@ class PlotManager:
         with self:
             self.last_refresh_time = time.time()
             self.plots.clear()
+            self._filter_table = None
             self.plot_filename_paths.clear()
             self.failed_to_open_filenames.clear()
             self.no_key_filenames.clear()
@@ -151,6 +170,12 @@ class PlotManager:
         with self:
             return len(self.plots)
 
+    def plot_filter_table(self) -> PlotFilterTable:
+        with self:
+            if self._filter_table is None:
+                self._filter_table = PlotFilterTable.create(self.plots)
+            return self._filter_table
+
     def get_duplicates(self) -> list[Path]:
         result = []
         for plot_filename, paths_entry in self.plot_filename_paths.items():
@@ -160,12 +185,21 @@ class PlotManager:
         return result
 
     def needs_refresh(self) -> bool:
-        return time.time() - self.last_refresh_time > float(self.refresh_parameter.interval_seconds)
+        interval = float(self.refresh_parameter.interval_seconds)
+        if self._watcher.active() and not self._initial:
+            # Full refreshes are only needed to catch changes the watcher doesn't see, like changes made to network
+            # file systems by other machines
+            interval = max(interval, float(self._watched_refresh_interval_seconds))
+        return time.time() - self.last_refresh_time > interval
+
+    def watching(self) -> bool:
+        return self._watcher.active()
 
     def start_refreshing(self, sleep_interval_ms: int = 1000):
         self._refreshing_enabled = True
         if self._refresh_thread is None or not self._refresh_thread.is_alive():
             self.cache.load()
+            self._watcher = PlotWatcher(create_observer() if self._watch_directories else None)
             self._refresh_thread = threading.Thread(target=self._refresh_task, args=(sleep_interval_ms,))
             self._refresh_thread.start()
 
@@ -174,6 +208,7 @@ class PlotManager:
         if self._refresh_thread is not None and self._refresh_thread.is_alive():
             self._refresh_thread.join()
             self._refresh_thread = None
+        self._watcher.stop()
 
     def trigger_refresh(self) -> None:
         log.debug("trigger_refresh")
@@ -182,105 +217,165 @@ class PlotManager:
     def _refresh_task(self, sleep_interval_ms: int):
         while self._refreshing_enabled:
             try:
-                while not self.needs_refresh() and self._refreshing_enabled:
+                while not self.needs_refresh() and not self._watcher.pending() and self._refreshing_enabled:
                     time.sleep(sleep_interval_ms / 1000.0)
 
                 if not self._refreshing_enabled:
                     return
 
-                plot_filenames: dict[Path, list[Path]] = get_plot_filenames(self.root_path)
-                plot_directories: set[Path] = set(plot_filenames.keys())
-                plot_paths: set[Path] = set()
-                for paths in plot_filenames.values():
-                    plot_paths.update(paths)
-
-                total_result: PlotRefreshResult = PlotRefreshResult()
-                total_size = len(plot_paths)
-
-                self._refresh_callback(PlotRefreshEvents.started, PlotRefreshResult(remaining=total_size))
-
-                # First drop all plots we have in plot_filename_paths but not longer in the filesystem or set in config
-                for path in list(self.failed_to_open_filenames.keys()):
-                    if path not in plot_paths:
-                        del self.failed_to_open_filenames[path]
-
-                for path in self.no_key_filenames.copy():
-                    if path not in plot_paths:
-                        self.no_key_filenames.remove(path)
-
-                filenames_to_remove: list[str] = []
-                for plot_filename, paths_entry in self.plot_filename_paths.items():
-                    loaded_path, duplicated_paths = paths_entry
-                    loaded_plot = Path(loaded_path) / Path(plot_filename)
-                    if loaded_plot not in plot_paths:
-                        filenames_to_remove.append(plot_filename)
-                        with self:
-                            if loaded_plot in self.plots:
-                                del self.plots[loaded_plot]
-                        total_result.removed.append(loaded_plot)
-                        # No need to check the duplicates here since we drop the whole entry
-                        continue
-
-                    paths_to_remove: list[str] = []
-                    for path_str in duplicated_paths:
-                        loaded_plot = Path(path_str) / Path(plot_filename)
-                        if loaded_plot not in plot_paths:
-                            paths_to_remove.append(path_str)
-                    for path_str in paths_to_remove:
-                        duplicated_paths.remove(path_str)
-
-                for filename in filenames_to_remove:
-                    del self.plot_filename_paths[filename]
-
-                for batch in to_batches(sorted(list(plot_paths)), self.refresh_parameter.batch_size):
-                    batch_result: PlotRefreshResult = self.refresh_batch(batch.entries, plot_directories)
-                    if not self._refreshing_enabled:
-                        self.log.debug("refresh_plots: Aborted")
-                        break
-                    # Set the remaining files since `refresh_batch()` doesn't know them but we want to report it
-                    batch_result.remaining = batch.remaining
-                    total_result.loaded += batch_result.loaded
-                    total_result.processed += batch_result.processed
-                    total_result.duration += batch_result.duration
-
-                    self._refresh_callback(PlotRefreshEvents.batch_processed, batch_result)
-                    if batch.remaining == 0:
-                        break
-                    batch_sleep = self.refresh_parameter.batch_sleep_milliseconds
-                    self.log.debug(f"refresh_plots: Sleep {batch_sleep} milliseconds")
-                    time.sleep(float(batch_sleep) / 1000.0)
-
-                if self._refreshing_enabled:
-                    self._refresh_callback(PlotRefreshEvents.done, total_result)
-
-                # Reset the initial refresh indication
-                self._initial = False
-
-                # Cleanup unused cache
-                self.log.debug(f"_refresh_task: cached entries before cleanup: {len(self.cache)}")
-                remove_paths: list[Path] = []
-                for path, cache_entry in self.cache.items():
-                    if cache_entry.expired(Cache.expiry_seconds) and path not in self.plots:
-                        remove_paths.append(path)
-                    elif path in self.plots:
-                        cache_entry.bump_last_use()
-                self.cache.remove(remove_paths)
-                self.log.debug(f"_refresh_task: cached entries removed: {len(remove_paths)}")
-
-                if self.cache.changed():
-                    self.cache.save()
-
-                self.last_refresh_time = time.time()
-
-                self.log.debug(
-                    f"_refresh_task: total_result.loaded {len(total_result.loaded)}, "
-                    f"total_result.removed {len(total_result.removed)}, "
-                    f"total_duration {total_result.duration:.2f} seconds"
-                )
+                changes = self._watcher.take_changes()
+                if self.needs_refresh() or changes.rescan:
+                    self._full_refresh()
+                else:
+                    self._incremental_refresh(changes)
             except Exception as e:
                 log.error(f"_refresh_callback raised: {e} with the traceback: {traceback.format_exc()}")
                 self.reset()
 
+    def _full_refresh(self) -> None:
+        config = load_config(self.root_path, "config.yaml")
+        plot_filenames: dict[Path, list[Path]] = get_plot_filenames(self.root_path, config)
+        plot_directories: set[Path] = set(plot_filenames.keys())
+        plot_paths: set[Path] = set()
+        for paths in plot_filenames.values():
+            plot_paths.update(paths)
+
+        # Changes which happen from here on are applied incrementally after this refresh
+        self._watcher.watch(
+            plot_directories, config["harvester"].get("recursive_plot_scan", DEFAULT_RECURSIVE_PLOT_SCAN)
+        )
+
+        total_result: PlotRefreshResult = PlotRefreshResult()
+        total_size = len(plot_paths)
+
+        self._refresh_callback(PlotRefreshEvents.started, PlotRefreshResult(remaining=total_size))
+
+        # First drop all plots we have in plot_filename_paths but not longer in the filesystem or set in config
+        for path in list(self.failed_to_open_filenames.keys()):
+            if path not in plot_paths:
+                del self.failed_to_open_filenames[path]
+
+        for path in self.no_key_filenames.copy():
+            if path not in plot_paths:
+                self.no_key_filenames.remove(path)
+
+        filenames_to_remove: list[str] = []
+        for plot_filename, paths_entry in self.plot_filename_paths.items():
+            loaded_path, duplicated_paths = paths_entry
+            loaded_plot = Path(loaded_path) / Path(plot_filename)
+            if loaded_plot not in plot_paths:
+                filenames_to_remove.append(plot_filename)
+                with self:
+                    if loaded_plot in self.plots:
+                        del self.plots[loaded_plot]
+                        self._filter_table = None
+                total_result.removed.append(loaded_plot)
+                # No need to check the duplicates here since we drop the whole entry
+                continue
+
+            paths_to_remove: list[str] = []
+            for path_str in duplicated_paths:
+                loaded_plot = Path(path_str) / Path(plot_filename)
+                if loaded_plot not in plot_paths:
+                    paths_to_remove.append(path_str)
+            for path_str in paths_to_remove:
+                duplicated_paths.remove(path_str)
+
+        for filename in filenames_to_remove:
+            del self.plot_filename_paths[filename]
+
+        self._refresh_paths(sorted(list(plot_paths)), plot_directories, total_result)
+
+        self.last_refresh_time = time.time()
+
+    def _incremental_refresh(self, changes: PlotChanges) -> None:
+        """
+        Applies the changes collected by the watcher, without listing the plot directories.
+        """
+        total_result: PlotRefreshResult = PlotRefreshResult()
+        plot_paths: set[Path] = set(changes.changed)
+
+        for path in changes.removed:
+            self.failed_to_open_filenames.pop(path, None)
+            self.no_key_filenames.discard(path)
+            paths_entry = self.plot_filename_paths.get(path.name)
+            if paths_entry is None:
+                continue
+            loaded_path, duplicated_paths = paths_entry
+            if Path(loaded_path) / path.name == path:
+                del self.plot_filename_paths[path.name]
+                with self:
+                    if path in self.plots:
+                        del self.plots[path]
+                        self._filter_table = None
+                total_result.removed.append(path)
+                # One of the duplicates, if there are any, gets loaded instead
+                plot_paths.update(Path(path_str) / path.name for path_str in duplicated_paths)
+            else:
+                duplicated_paths.discard(str(path.parent))
+
+        for path in changes.changed:
+            # The file was rewritten, so give it another chance to open
+            self.failed_to_open_filenames.pop(path, None)
+
+        self.log.debug(
+            f"_incremental_refresh: changed {len(changes.changed)}, removed {len(changes.removed)}, "
+            f"to process {len(plot_paths)}"
+        )
+        self._refresh_callback(PlotRefreshEvents.started, PlotRefreshResult(remaining=len(plot_paths)))
+        self._refresh_paths(sorted(list(plot_paths)), {path.parent for path in plot_paths}, total_result)
+
+    def _refresh_paths(
+        self, plot_paths: list[Path], plot_directories: set[Path], total_result: PlotRefreshResult
+    ) -> None:
+        for batch in to_batches(plot_paths, self.refresh_parameter.batch_size):
+            batch_result: PlotRefreshResult = self.refresh_batch(batch.entries, plot_directories)
+            if not self._refreshing_enabled:
+                self.log.debug("refresh_plots: Aborted")
+                break
+            # Set the remaining files since `refresh_batch()` doesn't know them but we want to report it
+            batch_result.remaining = batch.remaining
+            total_result.loaded += batch_result.loaded
+            total_result.processed += batch_result.processed
+            total_result.duration += batch_result.duration
+
+            self._refresh_callback(PlotRefreshEvents.batch_processed, batch_result)
+            # Store the entries of the plots opened in this batch right away
+            if self.cache.changed():
+                self.cache.save()
+            if batch.remaining == 0:
+                break
+            batch_sleep = self.refresh_parameter.batch_sleep_milliseconds
+            self.log.debug(f"refresh_plots: Sleep {batch_sleep} milliseconds")
+            time.sleep(float(batch_sleep) / 1000.0)
+
+        if self._refreshing_enabled:
+            self._refresh_callback(PlotRefreshEvents.done, total_result)
+
+        # Reset the initial refresh indication
+        self._initial = False
+
+        # Cleanup unused cache
+        self.log.debug(f"_refresh_task: cached entries before cleanup: {len(self.cache)}")
+        remove_paths: list[Path] = []
+        for path, cache_entry in self.cache.items():
+            if cache_entry.expired(Cache.expiry_seconds) and path not in self.plots:
+                remove_paths.append(path)
+            elif path in self.plots:
+                cache_entry.bump_last_use()
+        remove_paths += self.cache.expired_unused()
+        self.cache.remove(remove_paths)
+        self.log.debug(f"_refresh_task: cached entries removed: {len(remove_paths)}")
+
+        if self.cache.changed():
+            self.cache.save()
+
+        self.log.debug(
+            f"_refresh_task: total_result.loaded {len(total_result.loaded)}, "
+            f"total_result.removed {len(total_result.removed)}, "
+            f"total_duration {total_result.duration:.2f} seconds"
+        )
+
     def refresh_batch(self, plot_paths: list[Path], plot_directories: set[Path]) -> PlotRefreshResult:
         start_time: float = time.time()
         result: PlotRefreshResult = PlotRefreshResult(processed=len(plot_paths))
@@ -399,6 +494,7 @@ class PlotManager:
                     cache_entry.plot_public_key,
                     stat_info.st_size,
                     stat_info.st_mtime,
+                    stat_info.st_dev,
                 )
 
                 cache_entry.bump_last_use()
@@ -424,6 +520,7 @@ class PlotManager:
                 if new_plot is not None:
                     plots_refreshed[Path(new_plot.prover.get_filename())] = new_plot
             self.plots.update(plots_refreshed)
+            self._filter_table = None
 
         result.duration = time.time() - start_time
 
@@ -26,6 +26,8 @@ DEFAULT_USE_GPU_HARVESTING = False
 DEFAULT_GPU_INDEX = 0
 DEFAULT_ENFORCE_GPU_INDEX = False
 DEFAULT_RECURSIVE_PLOT_SCAN = False
+DEFAULT_WATCH_PLOT_DIRECTORIES = True
+DEFAULT_WATCHED_REFRESH_INTERVAL_SECONDS = 3600
 
 
 @streamable
@@ -45,6 +47,8 @@ class PlotInfo:
     plot_public_key: G1Element
     file_size: int
     time_modified: float
+    # the st_dev of the file system the plot is on
+    device: int = 0
 
 
 class PlotRefreshEvents(Enum):
@@ -105,10 +109,11 @@ def get_plot_directories(root_path: Path, config: Optional[dict] = None) -> list
     return config["harvester"]["plot_directories"] or []
 
 
-def get_plot_filenames(root_path: Path) -> dict[Path, list[Path]]:
+def get_plot_filenames(root_path: Path, config: Optional[dict] = None) -> dict[Path, list[Path]]:
     # Returns a map from directory to a list of all plots in the directory
     all_files: dict[Path, list[Path]] = {}
-    config = load_config(root_path, "config.yaml")
+    if config is None:
+        config = load_config(root_path, "config.yaml")
     recursive_scan: bool = config["harvester"].get("recursive_plot_scan", DEFAULT_RECURSIVE_PLOT_SCAN)
     recursive_follow_links: bool = config["harvester"].get("recursive_follow_links", False)
     for directory_name in get_plot_directories(root_path, config):
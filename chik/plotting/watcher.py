@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import logging
+import sys
+import threading
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Union
+
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers.api import BaseObserver, ObservedWatch
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class PlotChanges:
+    # plot files which were written or moved into a plot directory
+    changed: set[Path] = field(default_factory=set)
+    # plot files which were deleted or moved out of a plot directory
+    removed: set[Path] = field(default_factory=set)
+    # set if the changes can't be applied incrementally, i.e. if a directory
+    # appeared or disappeared, or if events were lost
+    rescan: bool = False
+
+    def empty(self) -> bool:
+        return len(self.changed) == 0 and len(self.removed) == 0 and not self.rescan
+
+
+# see PlotWatcher._settle_created()
+CREATED_SETTLE_SECONDS = 3.0
+
+
+def to_path(path: Union[str, bytes]) -> Path:
+    return Path(path if isinstance(path, str) else path.decode())
+
+
+def is_plot_file(path: Path) -> bool:
+    return path.suffix == ".plot" and not path.name.startswith("._")
+
+
+def create_observer() -> Optional[BaseObserver]:
+    """
+    Returns an inotify observer, or None if inotify isn't available on this
+    platform, in which case the plot directories are polled.
+    """
+    if sys.platform != "linux":
+        return None
+    try:
+        from watchdog.observers.inotify import InotifyObserver
+    except ImportError:
+        return None
+    return InotifyObserver()
+
+
+class PlotWatcher(FileSystemEventHandler):
+    """
+    Collects changes to the plot files in the plot directories, to be applied
+    by the PlotManager's refresh thread, which takes them with take_changes().
+    The events are delivered on the observer's thread.
+    """
+
+    _observer: Optional[BaseObserver]
+    _watches: dict[Path, ObservedWatch]
+    _recursive: bool
+    _lock: threading.Lock
+    _changes: PlotChanges
+    # new plot files which haven't been closed after writing yet, along with
+    # the time of their last event
+    _created: dict[Path, float]
+
+    def __init__(self, observer: Optional[BaseObserver] = None) -> None:
+        self._observer = observer
+        self._watches = {}
+        self._recursive = False
+        self._lock = threading.Lock()
+        self._changes = PlotChanges()
+        self._created = {}
+
+    def active(self) -> bool:
+        return self._observer is not None
+
+    def watch(self, directories: Iterable[Path], recursive: bool) -> None:
+        """
+        Updates the set of watched directories. Falls back to polling, i.e.
+        stops watching, if a directory can't be watched (e.g. because the
+        inotify watch limit is reached).
+        """
+        if self._observer is None:
+            return
+        directories = set(directories)
+        if recursive != self._recursive:
+            for watch in self._watches.values():
+                self._observer.unschedule(watch)
+            self._watches.clear()
+            self._recursive = recursive
+        for directory in list(self._watches.keys()):
+            # directories which were deleted need to be watched again if they reappear
+            if directory not in directories or not directory.is_dir():
+                self._observer.unschedule(self._watches.pop(directory))
+        try:
+            for directory in directories:
+                if directory not in self._watches and directory.is_dir():
+                    self._watches[directory] = self._observer.schedule(self, str(directory), recursive=recursive)
+            if not self._observer.is_alive():
+                self._observer.start()
+        except OSError as e:
+            log.warning(f"Failed to watch the plot directories, falling back to polling: {e}")
+            self.stop()
+
+    def stop(self) -> None:
+        if self._observer is None:
+            return
+        observer = self._observer
+        self._observer = None
+        self._watches.clear()
+        if observer.is_alive():
+            observer.stop()
+            observer.join()
+
+    def pending(self) -> bool:
+        with self._lock:
+            self._settle_created()
+            return not self._changes.empty()
+
+    def take_changes(self) -> PlotChanges:
+        with self._lock:
+            self._settle_created()
+            changes = self._changes
+            self._changes = PlotChanges()
+            return changes
+
+    def _settle_created(self) -> None:
+        # inotify reports files moved in from outside the watched directories
+        # as created, and they're never closed after writing. Created files
+        # without any writes for CREATED_SETTLE_SECONDS are treated like that
+        now = time.monotonic()
+        for plot_path, last_event in list(self._created.items()):
+            if now - last_event >= CREATED_SETTLE_SECONDS:
+                del self._created[plot_path]
+                self._changes.removed.discard(plot_path)
+                self._changes.changed.add(plot_path)
+
+    def _add(self, path: Union[str, bytes]) -> None:
+        plot_path = to_path(path)
+        if is_plot_file(plot_path):
+            with self._lock:
+                self._created.pop(plot_path, None)
+                self._changes.removed.discard(plot_path)
+                self._changes.changed.add(plot_path)
+
+    def _remove(self, path: Union[str, bytes]) -> None:
+        plot_path = to_path(path)
+        if is_plot_file(plot_path):
+            with self._lock:
+                self._created.pop(plot_path, None)
+                self._changes.changed.discard(plot_path)
+                self._changes.removed.add(plot_path)
+
+    def _rescan(self) -> None:
+        with self._lock:
+            self._changes.rescan = True
+
+    def on_closed(self, event: FileSystemEvent) -> None:
+        if not event.is_directory:
+            self._add(event.src_path)
+
+    def on_created(self, event: FileSystemEvent) -> None:
+        # A new file is most likely still being written, it's only picked up
+        # once it's closed after writing (or see _settle_created())
+        if event.is_directory:
+            self._rescan()
+        else:
+            plot_path = to_path(event.src_path)
+            if is_plot_file(plot_path):
+                with self._lock:
+                    self._created[plot_path] = time.monotonic()
+
+    def on_modified(self, event: FileSystemEvent) -> None:
+        if not event.is_directory:
+            plot_path = to_path(event.src_path)
+            with self._lock:
+                if plot_path in self._created:
+                    self._created[plot_path] = time.monotonic()
+
+    def on_deleted(self, event: FileSystemEvent) -> None:
+        if event.is_directory:
+            self._rescan()
+        else:
+            self._remove(event.src_path)
+
+    def on_moved(self, event: FileSystemEvent) -> None:
+        if event.is_directory:
+            self._rescan()
+        else:
+            self._remove(event.src_path)
+            self._add(event.dest_path)
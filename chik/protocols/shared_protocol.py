@@ -45,6 +45,10 @@ class Capability(IntEnum):
     # This is between a full node and receiving wallet
     MEMPOOL_UPDATES = 5
 
+    # the data of bulk response messages (see chik.server.compression) is sent
+    # zstd compressed
+    COMPRESSED_MESSAGES = 6
+
 
 # These are the default capabilities used in all outgoing handshakes.
 # "1" means the capability is supported and enabled.
@@ -56,14 +60,17 @@ _capabilities: list[tuple[uint16, str]] = [
 _mempool_updates = [
     (uint16(Capability.MEMPOOL_UPDATES.value), "1"),
 ]
+_compressed_messages = [
+    (uint16(Capability.COMPRESSED_MESSAGES.value), "1"),
+]
 
 default_capabilities = {
-    NodeType.FULL_NODE: _capabilities + _mempool_updates,
+    NodeType.FULL_NODE: _capabilities + _mempool_updates + _compressed_messages,
     NodeType.HARVESTER: _capabilities,
     NodeType.FARMER: _capabilities,
     NodeType.TIMELORD: _capabilities,
     NodeType.INTRODUCER: _capabilities,
-    NodeType.WALLET: _capabilities,
+    NodeType.WALLET: _capabilities + _compressed_messages,
     NodeType.DATA_LAYER: _capabilities,
 }
 
@@ -26,6 +26,7 @@ from typing_extensions import Protocol, final
 from chik import __version__
 from chik.protocols.outbound_message import NodeType
 from chik.rpc.util import wrap_http_handler
+from chik.server.connection_stats import format_prometheus
 from chik.server.server import (
     ChikServer,
     ssl_context_for_client,
@@ -134,6 +135,7 @@ def default_get_connections(server: ChikServer, request_node_type: Optional[Node
             "bytes_read": con.bytes_read,
             "bytes_written": con.bytes_written,
             "last_message_time": con.last_message_time,
+            "stats": con.get_stats(),
         }
         for con in connections
     ]
@@ -199,7 +201,10 @@ class RpcServer(Generic[_T_RpcApiProtocol]):
             hostname=self_hostname,
             port=rpc_port,
             max_request_body_size=max_request_body_size,
-            routes=[web.post(route, wrap_http_handler(func, route)) for (route, func) in self._get_routes().items()],
+            routes=[
+                *(web.post(route, wrap_http_handler(func, route)) for (route, func) in self._get_routes().items()),
+                web.get("/metrics", self.metrics),
+            ],
             ssl_context=self.ssl_context,
             prefer_ipv6=self.prefer_ipv6,
         )
@@ -289,6 +294,27 @@ class RpcServer(Generic[_T_RpcApiProtocol]):
         con_info = self.rpc_api.service.get_connections(request_node_type=request_node_type)
         return {"connections": con_info}
 
+    async def metrics(self, request: web.Request) -> web.Response:
+        """
+        Serves the message latency and throughput telemetry of the peer
+        connections in the Prometheus text format, to be scraped.
+        """
+        server = self.rpc_api.service.server
+        connections = [] if server is None else server.get_connections()
+        text = format_prometheus(
+            (
+                {
+                    "node_id": con.peer_node_id.hex(),
+                    "peer_host": con.peer_info.host,
+                    "node_type": "unknown" if con.connection_type is None else con.connection_type.name.lower(),
+                },
+                con.stats,
+                con.outgoing_queue.qsize(),
+            )
+            for con in connections
+        )
+        return web.Response(text=text, content_type="text/plain")
+
     async def open_connection(self, request: dict[str, Any]) -> EndpointResult:
         host = request["host"]
         port = request["port"]
@@ -7,6 +7,7 @@ from typing import TYPE_CHECKING, Any, Callable, get_type_hints
 
 import aiohttp
 
+from chik.util.db_wrapper import db_reader_context
 from chik.util.json_util import obj_to_response
 from chik.util.streamable import Streamable
 from chik.wallet.util.blind_signer_tl import BLIND_SIGNER_TRANSLATION
@@ -77,7 +78,8 @@ def wrap_http_handler(
     async def inner(request: aiohttp.web.Request) -> aiohttp.web.StreamResponse:
         request_data = await request.json()
         try:
-            res_object = await f(request_data)
+            with db_reader_context(f"rpc:{route}"):
+                res_object = await f(request_data)
             if res_object is None:
                 res_object = {}
             if "success" not in res_object:
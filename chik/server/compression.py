@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import zstd
+from typing_extensions import Self
+
+from chik.protocols.protocol_message_types import ProtocolMessageTypes
+
+# When both peers advertise Capability.COMPRESSED_MESSAGES, the data of these
+# message types is sent zstd compressed, in the format described by
+# CompressedPayload. Both sides must agree on this set, so changing it requires
+# a new capability.
+COMPRESSED_MESSAGE_TYPES: frozenset[ProtocolMessageTypes] = frozenset(
+    {
+        ProtocolMessageTypes.respond_proof_of_weight,
+        ProtocolMessageTypes.respond_block,
+        ProtocolMessageTypes.respond_blocks,
+        ProtocolMessageTypes.respond_header_blocks,
+        ProtocolMessageTypes.respond_block_headers,
+        ProtocolMessageTypes.respond_puzzle_state,
+        ProtocolMessageTypes.respond_coin_state,
+    }
+)
+_COMPRESSED_TYPE_VALUES = frozenset(t.value for t in COMPRESSED_MESSAGE_TYPES)
+
+COMPRESSION_LEVEL = 3
+
+# we won't decompress messages larger than this, to protect against
+# decompression bombs. This matches the largest max_size in the rate limits
+MAX_DECOMPRESSED_SIZE = 100 * 1024 * 1024
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+LENGTH_BYTES = 4
+
+
+def is_compressed_type(message_type: int) -> bool:
+    return message_type in _COMPRESSED_TYPE_VALUES
+
+
+class CompressedPayload(bytes):
+    """
+    Message data in the compressed wire format. It's a sequence of zstd frames,
+    each prefixed by its length (as a 4 byte big-endian integer). The message
+    data is the concatenation of the decompressed frames.
+
+    Splitting the data into frames allows passing through blobs that are
+    already compressed, like blocks from the BlockStore, without recompressing
+    them. size is the size of the data once decompressed.
+    """
+
+    size: int
+
+    def __new__(cls, frames: Sequence[bytes], size: int) -> Self:
+        payload = super().__new__(cls, b"".join(len(f).to_bytes(LENGTH_BYTES, "big") + f for f in frames))
+        payload.size = size
+        return payload
+
+
+def frame_content_size(frame: bytes) -> int:
+    """
+    Returns the decompressed size of a zstd frame, as declared in its header.
+    Raises ValueError if it's not a zstd frame or if the size isn't declared.
+    """
+    if len(frame) < 6 or frame[:4] != ZSTD_MAGIC:
+        raise ValueError("not a zstd frame")
+    descriptor = frame[4]
+    size_flag = descriptor >> 6
+    single_segment = (descriptor >> 5) & 1
+    dict_id_size = (0, 1, 2, 4)[descriptor & 3]
+    offset = 5 + (0 if single_segment else 1) + dict_id_size
+    if size_flag == 0:
+        if not single_segment:
+            raise ValueError("zstd frame without content size")
+        field_size = 1
+    else:
+        field_size = (0, 2, 4, 8)[size_flag]
+    if len(frame) < offset + field_size:
+        raise ValueError("truncated zstd frame header")
+    size = int.from_bytes(frame[offset : offset + field_size], "little")
+    if field_size == 2:
+        size += 256
+    return size
+
+
+def compress_payload(data: bytes, level: int = COMPRESSION_LEVEL) -> CompressedPayload:
+    return CompressedPayload([zstd.compress(data, level)], len(data))
+
+
+def concatenate_frames(prefix: bytes, frames: Sequence[bytes], level: int = COMPRESSION_LEVEL) -> CompressedPayload:
+    """
+    Builds the payload of prefix followed by the decompressed contents of
+    frames, without recompressing the frames (unless they don't declare their
+    size).
+    """
+    all_frames = [zstd.compress(prefix, level)]
+    size = len(prefix)
+    for frame in frames:
+        try:
+            size += frame_content_size(frame)
+        except ValueError:
+            data = zstd.decompress(frame)
+            frame = zstd.compress(data, level)
+            size += len(data)
+        all_frames.append(frame)
+    return CompressedPayload(all_frames, size)
+
+
+def decompress_payload(payload: bytes, max_size: int = MAX_DECOMPRESSED_SIZE) -> bytes:
+    """
+    Raises ValueError if payload is malformed, or if it would decompress to
+    more than max_size bytes.
+    """
+    frames: list[bytes] = []
+    total_size = 0
+    offset = 0
+    while offset < len(payload):
+        if offset + LENGTH_BYTES > len(payload):
+            raise ValueError("truncated compressed payload")
+        frame_size = int.from_bytes(payload[offset : offset + LENGTH_BYTES], "big")
+        offset += LENGTH_BYTES
+        if offset + frame_size > len(payload):
+            raise ValueError("truncated compressed payload")
+        frame = payload[offset : offset + frame_size]
+        offset += frame_size
+        total_size += frame_content_size(frame)
+        if total_size > max_size:
+            raise ValueError(f"compressed payload too large: {total_size} > {max_size}")
+        frames.append(frame)
+
+    ret = b"".join(zstd.decompress(frame) for frame in frames)
+    if len(ret) != total_size:
+        raise ValueError("compressed payload size mismatch")
+    return ret
+
+
+def uncompressed_size(data: bytes) -> int:
+    """
+    The size of message data, as seen by the rate limiter
+    """
+    if isinstance(data, CompressedPayload):
+        return data.size
+    return len(data)
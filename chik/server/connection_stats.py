@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import bisect
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+from chik.protocols.protocol_message_types import ProtocolMessageTypes
+
+# the upper bounds (in seconds) of the latency histogram buckets. There's an
+# implicit last bucket for everything above the last bound
+LATENCY_BUCKETS: tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class Histogram:
+    """
+    Counts samples in the LATENCY_BUCKETS buckets, along with their total,
+    the way Prometheus histograms do.
+    """
+
+    counts: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    count: int = 0
+    total: float = 0.0
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def to_json_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "buckets": [*LATENCY_BUCKETS, "+Inf"],
+            "counts": self.counts,
+        }
+
+
+@dataclass
+class ConnectionStats:
+    """
+    Latency telemetry of a single connection, by message type. All times are
+    in seconds.
+    """
+
+    # the time from reading a message off the socket until its handler starts
+    queue_wait: dict[ProtocolMessageTypes, Histogram] = field(default_factory=dict)
+    # the time our handler takes to process a message from the peer
+    handler_time: dict[ProtocolMessageTypes, Histogram] = field(default_factory=dict)
+    # the time from queuing a request to the peer until its response arrives.
+    # Requests that time out are not included
+    response_latency: dict[ProtocolMessageTypes, Histogram] = field(default_factory=dict)
+    messages_in: int = 0
+    messages_out: int = 0
+    max_outbound_queue: int = 0
+
+    @staticmethod
+    def _add(histograms: dict[ProtocolMessageTypes, Histogram], message_type: int, value: float) -> None:
+        try:
+            key = ProtocolMessageTypes(message_type)
+        except ValueError:
+            return
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = Histogram()
+            histograms[key] = histogram
+        histogram.add(value)
+
+    def add_queue_wait(self, message_type: int, value: float) -> None:
+        self._add(self.queue_wait, message_type, value)
+
+    def add_handler_time(self, message_type: int, value: float) -> None:
+        self.messages_in += 1
+        self._add(self.handler_time, message_type, value)
+
+    def add_response_latency(self, message_type: int, value: float) -> None:
+        self._add(self.response_latency, message_type, value)
+
+    def message_queued(self, queue_size: int) -> None:
+        self.messages_out += 1
+        self.max_outbound_queue = max(self.max_outbound_queue, queue_size)
+
+    def to_json_dict(self, outbound_queue: int) -> dict[str, Any]:
+        return {
+            "messages_in": self.messages_in,
+            "messages_out": self.messages_out,
+            "outbound_queue": outbound_queue,
+            "max_outbound_queue": self.max_outbound_queue,
+            "queue_wait": {t.name: h.to_json_dict() for t, h in self.queue_wait.items()},
+            "handler_time": {t.name: h.to_json_dict() for t, h in self.handler_time.items()},
+            "response_latency": {t.name: h.to_json_dict() for t, h in self.response_latency.items()},
+        }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict[str, str]) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_prometheus(connections: Iterable[tuple[dict[str, str], ConnectionStats, int]]) -> str:
+    """
+    Renders the stats of connections in the Prometheus text exposition format.
+    Each connection is given as (labels identifying the peer, its stats, the
+    current size of its outbound queue).
+    """
+    histograms = [
+        ("chik_peer_queue_wait_seconds", "Time from receiving a message until its handler starts", "queue_wait"),
+        ("chik_peer_handler_seconds", "Time spent handling messages from the peer", "handler_time"),
+        ("chik_peer_response_seconds", "Time from sending a request until its response arrives", "response_latency"),
+    ]
+    gauges = [
+        ("chik_peer_messages_in_total", "counter", "Messages from the peer that were handled"),
+        ("chik_peer_messages_out_total", "counter", "Messages queued to be sent to the peer"),
+        ("chik_peer_outbound_queue", "gauge", "Messages waiting to be sent to the peer"),
+        ("chik_peer_outbound_queue_max", "gauge", "The largest number of messages waiting to be sent to the peer"),
+    ]
+    connections = list(connections)
+    lines: list[str] = []
+    for name, help_text, attribute in histograms:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for peer_labels, stats, _ in connections:
+            per_type: dict[ProtocolMessageTypes, Histogram] = getattr(stats, attribute)
+            for message_type, histogram in per_type.items():
+                labels = {**peer_labels, "message_type": message_type.name}
+                cumulative = 0
+                for bound, count in zip([*map(str, LATENCY_BUCKETS), "+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    for name, metric_type, help_text in gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for peer_labels, stats, outbound_queue in connections:
+            value = {
+                "chik_peer_messages_in_total": stats.messages_in,
+                "chik_peer_messages_out_total": stats.messages_out,
+                "chik_peer_outbound_queue": outbound_queue,
+                "chik_peer_outbound_queue_max": stats.max_outbound_queue,
+            }[name]
+            lines.append(f"{name}{_labels(peer_labels)} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,46 +1,221 @@
 from __future__ import annotations
 
-import dataclasses
 import logging
+import math
 import time
 from collections import Counter
-from typing import Optional
+from dataclasses import dataclass
+from typing import Any, Optional
 
 from chik.protocols.outbound_message import Message
 from chik.protocols.protocol_message_types import ProtocolMessageTypes
 from chik.protocols.shared_protocol import Capability
+from chik.server.compression import uncompressed_size
 from chik.server.rate_limit_numbers import RLSettings, Unlimited, get_rate_limits_to_use
 
 log = logging.getLogger(__name__)
 
 
+@dataclass
+class TokenBucket:
+    """
+    Allows up to capacity units to be used at once, and refills at rate units
+    per second. Usage exceeding the limit may still be recorded (e.g. for
+    messages we've already received), which empties the bucket.
+    """
+
+    capacity: float
+    rate: float
+    tokens: float
+    last_update: float
+
+    @classmethod
+    def full(cls, capacity: float, period: float, now: float) -> TokenBucket:
+        return cls(capacity, capacity / period, capacity, now)
+
+    def _refill(self, now: float) -> None:
+        if now > self.last_update:
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_update) * self.rate)
+            self.last_update = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Returns the number of seconds until amount units are available. 0 if
+        they're available now and math.inf if they never will be.
+        """
+        self._refill(now)
+        if self.tokens >= amount:
+            return 0.0
+        if amount > self.capacity or self.rate <= 0:
+            return math.inf
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens = max(0.0, self.tokens - amount)
+
+
+@dataclass(frozen=True)
+class ResolvedLimit:
+    """
+    The rate limit of a message type, with the percentage_of_limit applied
+    """
+
+    max_size: int
+    # None for message types that aren't rate limited
+    frequency: Optional[float]
+    max_total_size: Optional[float]
+    # whether the message also counts towards the aggregate limit of non-tx
+    # messages
+    non_tx: bool
+
+
 # TODO: only full node disconnects based on rate limits
 class RateLimiter:
     incoming: bool
     reset_seconds: int
-    current_minute: int
-    message_counts: Counter[ProtocolMessageTypes]
-    message_cumulative_sizes: Counter[ProtocolMessageTypes]
     percentage_of_limit: int
-    non_tx_message_counts: int = 0
-    non_tx_cumulative_size: int = 0
+    # the number of messages (by type) that were allowed, and that were over
+    # the limit
+    allowed: Counter[ProtocolMessageTypes]
+    limited: Counter[ProtocolMessageTypes]
 
     def __init__(self, incoming: bool, reset_seconds: int = 60, percentage_of_limit: int = 100):
         """
-        The incoming parameter affects whether counters are incremented
-        unconditionally or not. For incoming messages, the counters are always
-        incremented. For outgoing messages, the counters are only incremented
-        if they are allowed to be sent by the rate limiter, since we won't send
-        the messages otherwise.
+        The incoming parameter affects whether usage is recorded
+        unconditionally or not. For incoming messages, it's always recorded.
+        For outgoing messages, it's only recorded if they are allowed to be
+        sent by the rate limiter, since we won't send the messages otherwise.
+
+        The limits apply per reset_seconds. Rather than resetting the
+        counters at fixed intervals, each limit is a token bucket that refills
+        continuously, so the full limit is never exceeded in any period of
+        reset_seconds (except for the initial burst).
         """
         self.incoming = incoming
         self.reset_seconds = reset_seconds
-        self.current_minute = int(time.time() // reset_seconds)
-        self.message_counts = Counter()
-        self.message_cumulative_sizes = Counter()
         self.percentage_of_limit = percentage_of_limit
-        self.non_tx_message_counts = 0
-        self.non_tx_cumulative_size = 0
+        self.allowed = Counter()
+        self.limited = Counter()
+        # the capabilities the limits were resolved for. The limits only
+        # change once the handshake with the peer is done
+        self._capabilities: Optional[tuple[list[Capability], list[Capability]]] = None
+        self._rate_limits: dict[str, Any] = {}
+        self._limits: dict[ProtocolMessageTypes, ResolvedLimit] = {}
+        self._count_buckets: dict[ProtocolMessageTypes, TokenBucket] = {}
+        self._size_buckets: dict[ProtocolMessageTypes, TokenBucket] = {}
+        self._non_tx_count: Optional[TokenBucket] = None
+        self._non_tx_size: Optional[TokenBucket] = None
+
+    def _resolve(self, our_capabilities: list[Capability], peer_capabilities: list[Capability]) -> None:
+        caps = self._capabilities
+        if caps is not None and caps[0] is our_capabilities and caps[1] is peer_capabilities:
+            return
+        self._capabilities = (our_capabilities, peer_capabilities)
+        self._rate_limits = get_rate_limits_to_use(our_capabilities, peer_capabilities)
+        self._limits = {}
+        self._count_buckets = {}
+        self._size_buckets = {}
+        proportion_of_limit = self.percentage_of_limit / 100
+        now = time.monotonic()
+        self._non_tx_count = TokenBucket.full(
+            self._rate_limits["non_tx_freq"] * proportion_of_limit, self.reset_seconds, now
+        )
+        self._non_tx_size = TokenBucket.full(
+            self._rate_limits["non_tx_max_total_size"] * proportion_of_limit, self.reset_seconds, now
+        )
+
+    def _get_limit(self, message_type: ProtocolMessageTypes) -> ResolvedLimit:
+        limit = self._limits.get(message_type)
+        if limit is not None:
+            return limit
+
+        rate_limits = self._rate_limits
+        proportion_of_limit = self.percentage_of_limit / 100
+        non_tx = False
+        settings = rate_limits["default_settings"]
+        if message_type in rate_limits["rate_limits_tx"]:
+            settings = rate_limits["rate_limits_tx"][message_type]
+        elif message_type in rate_limits["rate_limits_other"]:
+            settings = rate_limits["rate_limits_other"][message_type]
+            non_tx = isinstance(settings, RLSettings)
+        else:  # pragma: no cover
+            log.warning(f"Message type {message_type} not found in rate limits (scale factor: {proportion_of_limit})")
+
+        if isinstance(settings, Unlimited):
+            # this message type is not rate limited. This is used for
+            # response messages and must be combined with banning peers
+            # sending unsolicited responses of this type
+            limit = ResolvedLimit(settings.max_size, None, None, False)
+        else:
+            assert isinstance(settings, RLSettings)
+            max_total_size = settings.max_total_size
+            if max_total_size is None:
+                max_total_size = settings.frequency * settings.max_size
+            limit = ResolvedLimit(
+                settings.max_size,
+                settings.frequency * proportion_of_limit,
+                max_total_size * proportion_of_limit,
+                non_tx,
+            )
+        self._limits[message_type] = limit
+        return limit
+
+    def _buckets(self, message_type: ProtocolMessageTypes, limit: ResolvedLimit) -> tuple[TokenBucket, TokenBucket]:
+        count_bucket = self._count_buckets.get(message_type)
+        if count_bucket is None:
+            assert limit.frequency is not None and limit.max_total_size is not None
+            now = time.monotonic()
+            count_bucket = TokenBucket.full(limit.frequency, self.reset_seconds, now)
+            self._count_buckets[message_type] = count_bucket
+            self._size_buckets[message_type] = TokenBucket.full(limit.max_total_size, self.reset_seconds, now)
+        return count_bucket, self._size_buckets[message_type]
+
+    def _check(
+        self, message_type: ProtocolMessageTypes, size: int, limit: ResolvedLimit, now: float
+    ) -> tuple[float, Optional[str]]:
+        """
+        Returns the number of seconds until a message of this type and size
+        may be sent (math.inf if never), along with the limit being hit.
+        """
+        proportion_of_limit = self.percentage_of_limit / 100
+        if size > limit.max_size:
+            return math.inf, f"message size: {size} > {limit.max_size}"
+        if limit.frequency is None:
+            return 0.0, None
+
+        wait = 0.0
+        reason: Optional[str] = None
+        checks: list[tuple[str, TokenBucket, float]] = []
+        if limit.non_tx:
+            assert self._non_tx_count is not None and self._non_tx_size is not None
+            checks.append(("non-tx count", self._non_tx_count, 1))
+            checks.append(("non-tx size", self._non_tx_size, size))
+        count_bucket, size_bucket = self._buckets(message_type, limit)
+        checks.append(("message count", count_bucket, 1))
+        checks.append(("cumulative size", size_bucket, size))
+        for name, bucket, amount in checks:
+            bucket_wait = bucket.wait_time(amount, now)
+            if bucket_wait > wait:
+                wait = bucket_wait
+                reason = " ".join(
+                    [
+                        f"{name}: {bucket.capacity - bucket.tokens + amount:0.0f}",
+                        f"> {bucket.capacity}",
+                        f"(scale factor: {proportion_of_limit})",
+                    ]
+                )
+        return wait, reason
+
+    def _record(self, message_type: ProtocolMessageTypes, size: int, limit: ResolvedLimit) -> None:
+        if limit.frequency is None:
+            return
+        if limit.non_tx:
+            assert self._non_tx_count is not None and self._non_tx_size is not None
+            self._non_tx_count.consume(1)
+            self._non_tx_size.consume(size)
+        count_bucket, size_bucket = self._buckets(message_type, limit)
+        count_bucket.consume(1)
+        size_bucket.consume(size)
 
     def process_msg_and_check(
         self, message: Message, our_capabilities: list[Capability], peer_capabilities: list[Capability]
@@ -50,104 +225,58 @@ class RateLimiter:
         exceeded, and the message should be blocked. Returns None if the limit was not
         hit and the message is good to be sent or received.
         """
-
-        current_minute = int(time.time() // self.reset_seconds)
-        if current_minute != self.current_minute:
-            self.current_minute = current_minute
-            self.message_counts = Counter()
-            self.message_cumulative_sizes = Counter()
-            self.non_tx_message_counts = 0
-            self.non_tx_cumulative_size = 0
         try:
             message_type = ProtocolMessageTypes(message.type)
         except Exception as e:
             log.warning(f"Invalid message: {message.type}, {e}")
             return None
 
-        new_message_counts: int = self.message_counts[message_type] + 1
-        new_cumulative_size: int = self.message_cumulative_sizes[message_type] + len(message.data)
-        new_non_tx_count: int = self.non_tx_message_counts
-        new_non_tx_size: int = self.non_tx_cumulative_size
-        proportion_of_limit: float = self.percentage_of_limit / 100
-
-        ret: bool = False
-        rate_limits = get_rate_limits_to_use(our_capabilities, peer_capabilities)
+        self._resolve(our_capabilities, peer_capabilities)
+        limit = self._get_limit(message_type)
+        size = uncompressed_size(message.data)
+        wait, reason = self._check(message_type, size, limit, time.monotonic())
+        if wait == 0.0:
+            self.allowed[message_type] += 1
+        else:
+            self.limited[message_type] += 1
+        if self.incoming or wait == 0.0:
+            # now that we determined that it's OK to send the message, record
+            # it. Alternatively, if this was an incoming message, we already
+            # received it and it counts unconditionally
+            self._record(message_type, size, limit)
+        return reason
 
+    def send_delay(
+        self, message: Message, our_capabilities: list[Capability], peer_capabilities: list[Capability]
+    ) -> float:
+        """
+        Returns the number of seconds until message is allowed, without
+        recording it. 0 if it's allowed now, math.inf if it will never be
+        allowed (e.g. because it's too large).
+        """
         try:
-            limits: RLSettings = rate_limits["default_settings"]
-            if message_type in rate_limits["rate_limits_tx"]:
-                limits = rate_limits["rate_limits_tx"][message_type]
-            elif message_type in rate_limits["rate_limits_other"]:
-                limits = rate_limits["rate_limits_other"][message_type]
-                if isinstance(limits, RLSettings):
-                    non_tx_freq = rate_limits["non_tx_freq"]
-                    non_tx_max_total_size = rate_limits["non_tx_max_total_size"]
-                    new_non_tx_count = self.non_tx_message_counts + 1
-                    new_non_tx_size = self.non_tx_cumulative_size + len(message.data)
-                    if new_non_tx_count > non_tx_freq * proportion_of_limit:
-                        return " ".join(
-                            [
-                                f"non-tx count: {new_non_tx_count}",
-                                f"> {non_tx_freq * proportion_of_limit}",
-                                f"(scale factor: {proportion_of_limit})",
-                            ]
-                        )
-                    if new_non_tx_size > non_tx_max_total_size * proportion_of_limit:
-                        return " ".join(
-                            [
-                                f"non-tx size: {new_non_tx_size}",
-                                f"> {non_tx_max_total_size * proportion_of_limit}",
-                                f"(scale factor: {proportion_of_limit})",
-                            ]
-                        )
-            else:  # pragma: no cover
-                log.warning(
-                    f"Message type {message_type} not found in rate limits (scale factor: {proportion_of_limit})",
-                )
+            message_type = ProtocolMessageTypes(message.type)
+        except Exception:
+            return 0.0
+        self._resolve(our_capabilities, peer_capabilities)
+        size = uncompressed_size(message.data)
+        return self._check(message_type, size, self._get_limit(message_type), time.monotonic())[0]
+
+    def max_message_size(
+        self,
+        message_type: ProtocolMessageTypes,
+        our_capabilities: list[Capability],
+        peer_capabilities: list[Capability],
+    ) -> int:
+        """
+        The largest (uncompressed) message of this type the limits allow
+        """
+        self._resolve(our_capabilities, peer_capabilities)
+        return self._get_limit(message_type).max_size
 
-            if isinstance(limits, Unlimited):
-                # this message type is not rate limited. This is used for
-                # response messages and must be combined with banning peers
-                # sending unsolicited responses of this type
-                if len(message.data) > limits.max_size:
-                    return f"message size: {len(message.data)} > {limits.max_size}"
-                ret = True
-                return None
-            elif isinstance(limits, RLSettings):
-                if limits.max_total_size is None:
-                    limits = dataclasses.replace(limits, max_total_size=limits.frequency * limits.max_size)
-                assert limits.max_total_size is not None
-
-                if new_message_counts > limits.frequency * proportion_of_limit:
-                    return " ".join(
-                        [
-                            f"message count: {new_message_counts}"
-                            f"> {limits.frequency * proportion_of_limit}"
-                            f"(scale factor: {proportion_of_limit})"
-                        ]
-                    )
-                if len(message.data) > limits.max_size:
-                    return f"message size: {len(message.data)} > {limits.max_size}"
-                if new_cumulative_size > limits.max_total_size * proportion_of_limit:
-                    return " ".join(
-                        [
-                            f"cumulative size: {new_cumulative_size}",
-                            f"> {limits.max_total_size * proportion_of_limit}",
-                            f"(scale factor: {proportion_of_limit})",
-                        ]
-                    )
-
-                ret = True
-                return None
-            else:  # pragma: no cover
-                return f"Internal Error, unknown rate limit for message: {message_type}, limit: {limits}"
-        finally:
-            if self.incoming or ret:
-                # now that we determined that it's OK to send the message, commit the
-                # updates to the counters. Alternatively, if this was an
-                # incoming message, we already received it and it should
-                # increment the counters unconditionally
-                self.message_counts[message_type] = new_message_counts
-                self.message_cumulative_sizes[message_type] = new_cumulative_size
-                self.non_tx_message_counts = new_non_tx_count
-                self.non_tx_cumulative_size = new_non_tx_size
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "allowed": sum(self.allowed.values()),
+            "limited": sum(self.limited.values()),
+            "limited_by_type": {message_type.name: count for message_type, count in self.limited.items()},
+        }
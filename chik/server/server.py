@@ -34,7 +34,7 @@ from chik.protocols.protocol_timing import INVALID_PROTOCOL_BAN_SECONDS
 from chik.server.api_protocol import ApiProtocol
 from chik.server.introducer_peers import IntroducerPeers
 from chik.server.ssl_context import private_ssl_paths, public_ssl_paths
-from chik.server.ws_connection import ConnectionCallback, WSChikConnection
+from chik.server.ws_connection import Broadcast, ConnectionCallback, WSChikConnection
 from chik.ssl.ssl_check import verify_ssl_certs_and_keys
 from chik.types.peer_info import PeerInfo
 from chik.util.errors import Err, ProtocolError
@@ -113,6 +113,29 @@ def calculate_node_id(cert_path: Path) -> bytes32:
     return bytes32(der_cert.fingerprint(hashes.SHA256()))
 
 
+@dataclass
+class BroadcastStats:
+    # the number of messages broadcast (to at least one peer)
+    broadcasts: int = 0
+    # the number of times those messages were queued, one per peer
+    sends: int = 0
+    # the time from queuing a broadcast until the last peer has sent it
+    total_fanout_time: float = 0.0
+    max_fanout_time: float = 0.0
+    broadcasts_by_type: dict[str, int] = field(default_factory=dict)
+    max_fanout_time_by_type: dict[str, float] = field(default_factory=dict)
+
+    def to_json_dict(self) -> dict[str, Any]:
+        return {
+            "broadcasts": self.broadcasts,
+            "sends": self.sends,
+            "total_fanout_time": self.total_fanout_time,
+            "max_fanout_time": self.max_fanout_time,
+            "broadcasts_by_type": dict(self.broadcasts_by_type),
+            "max_fanout_time_by_type": dict(self.max_fanout_time_by_type),
+        }
+
+
 @final
 @dataclass
 class ChikServer:
@@ -143,6 +166,7 @@ class ChikServer:
     received_message_callback: Optional[ConnectionCallback] = None
     banned_peers: dict[str, float] = field(default_factory=dict)
     invalid_protocol_ban_seconds: int = INVALID_PROTOCOL_BAN_SECONDS
+    broadcast_stats: BroadcastStats = field(default_factory=BroadcastStats)
 
     @classmethod
     def create(
@@ -600,10 +624,14 @@ class ChikServer:
         exclude: Optional[bytes32] = None,
     ) -> None:
         await self.validate_broadcast_message_type(messages, node_type)
-        for _, connection in self.all_connections.items():
-            if connection.connection_type is node_type and connection.peer_node_id != exclude:
-                for message in messages:
-                    await connection.send_message(message)
+        self._broadcast(
+            messages,
+            [
+                connection
+                for connection in self.all_connections.values()
+                if connection.connection_type is node_type and connection.peer_node_id != exclude
+            ],
+        )
 
     async def send_to_all_if(
         self,
@@ -613,10 +641,45 @@ class ChikServer:
         exclude: Optional[bytes32] = None,
     ) -> None:
         await self.validate_broadcast_message_type(messages, node_type)
-        for _, connection in self.all_connections.items():
-            if connection.connection_type is node_type and connection.peer_node_id != exclude and predicate(connection):
-                for message in messages:
-                    await connection.send_message(message)
+        self._broadcast(
+            messages,
+            [
+                connection
+                for connection in self.all_connections.values()
+                if connection.connection_type is node_type
+                and connection.peer_node_id != exclude
+                and predicate(connection)
+            ],
+        )
+
+    def _broadcast(self, messages: list[Message], connections: list[WSChikConnection]) -> None:
+        """
+        Queues the messages to all connections. Each message is serialized
+        once, rather than once per connection.
+        """
+        if len(connections) == 0:
+            return
+        for message in messages:
+            broadcast = Broadcast(message, bytes(message), self._broadcast_done)
+            for connection in connections:
+                connection.send_broadcast(broadcast)
+            if broadcast.pending > 0:
+                self.broadcast_stats.broadcasts += 1
+                self.broadcast_stats.sends += broadcast.pending
+
+    def _broadcast_done(self, broadcast: Broadcast, duration: float) -> None:
+        stats = self.broadcast_stats
+        message_type = ProtocolMessageTypes(broadcast.message.type).name
+        stats.total_fanout_time += duration
+        stats.max_fanout_time = max(stats.max_fanout_time, duration)
+        stats.broadcasts_by_type[message_type] = stats.broadcasts_by_type.get(message_type, 0) + 1
+        stats.max_fanout_time_by_type[message_type] = max(
+            stats.max_fanout_time_by_type.get(message_type, 0.0), duration
+        )
+        self.log.debug(f"broadcast of {message_type} ({len(broadcast.encoded)} bytes) took {duration:0.3f} s")
+
+    def get_broadcast_stats(self) -> dict[str, Any]:
+        return self.broadcast_stats.to_json_dict()
 
     async def send_to_specific(self, messages: list[Message], node_id: bytes32) -> None:
         if node_id in self.all_connections:
@@ -30,8 +30,11 @@ from chik.protocols.protocol_timing import (
 from chik.protocols.shared_protocol import Capability, Error, Handshake, protocol_version
 from chik.server.api_protocol import ApiMetadata, ApiProtocol
 from chik.server.capabilities import known_active_capabilities
+from chik.server.compression import CompressedPayload, compress_payload, decompress_payload, is_compressed_type
+from chik.server.connection_stats import ConnectionStats
 from chik.server.rate_limits import RateLimiter
 from chik.types.peer_info import PeerInfo
+from chik.util.db_wrapper import db_reader_context
 from chik.util.errors import ApiError, ConsensusError, Err, ProtocolError, TimestampError
 from chik.util.log_exceptions import log_exceptions
 
@@ -53,6 +56,27 @@ def create_default_last_message_time_dict() -> dict[ProtocolMessageTypes, float]
     return {message_type: -math.inf for message_type in ProtocolMessageTypes}
 
 
+@dataclass
+class Broadcast:
+    """
+    A message sent to many connections at once. It's serialized once and the
+    buffer is shared by all connections. Once every connection has sent it (or
+    given up on it), on_done is called with the time it took.
+    """
+
+    message: Message
+    encoded: bytes
+    on_done: Optional[Callable[[Broadcast, float], None]] = None
+    start: float = field(default_factory=time.monotonic)
+    # the number of connections that have yet to send the message
+    pending: int = 0
+
+    def done(self) -> None:
+        self.pending -= 1
+        if self.pending == 0 and self.on_done is not None:
+            self.on_done(self, time.monotonic() - self.start)
+
+
 class ConnectionClosedCallbackProtocol(Protocol):
     async def __call__(
         self,
@@ -92,7 +116,7 @@ class WSChikConnection:
     # Messaging
     received_message_callback: Optional[ConnectionCallback] = field(repr=False)
     incoming_queue: asyncio.Queue[Message] = field(default_factory=asyncio.Queue, repr=False)
-    outgoing_queue: asyncio.Queue[Message] = field(default_factory=asyncio.Queue, repr=False)
+    outgoing_queue: asyncio.Queue[Union[Message, Broadcast]] = field(default_factory=asyncio.Queue, repr=False)
     api_tasks: dict[bytes32, asyncio.Task[None]] = field(default_factory=dict, repr=False)
     # Contains task ids of api tasks which should not be canceled
     execute_tasks: set[bytes32] = field(default_factory=set, repr=False)
@@ -102,6 +126,10 @@ class WSChikConnection:
     bytes_read: int = 0
     bytes_written: int = 0
     last_message_time: float = 0
+    stats: ConnectionStats = field(default_factory=ConnectionStats, repr=False)
+    # when the messages in incoming_queue were received (time.monotonic()),
+    # by the id() of the message
+    _received_at: dict[int, float] = field(default_factory=dict, repr=False)
 
     peer_server_port: Optional[uint16] = None
     inbound_task: Optional[asyncio.Task[None]] = field(default=None, repr=False)
@@ -375,7 +403,12 @@ class WSChikConnection:
         try:
             while not self.closed:
                 msg = await self.outgoing_queue.get()
-                if msg is not None:
+                if isinstance(msg, Broadcast):
+                    try:
+                        await self._send_message(msg.message, msg.encoded)
+                    finally:
+                        msg.done()
+                elif msg is not None:
                     await self._send_message(msg)
         except asyncio.CancelledError:
             pass
@@ -394,9 +427,18 @@ class WSChikConnection:
                 error_stack = traceback.format_exc()
                 self.log.error(f"Exception: {e} with {self.peer_info.host}")
                 self.log.error(f"Exception Stack: {error_stack}")
+        finally:
+            # the messages left in the queue won't be sent
+            while not self.outgoing_queue.empty():
+                msg = self.outgoing_queue.get_nowait()
+                if isinstance(msg, Broadcast):
+                    msg.done()
 
     async def _api_call(self, full_message: Message, task_id: bytes32) -> None:
         start_time = time.time()
+        received_at = self._received_at.pop(id(full_message), None)
+        if received_at is not None:
+            self.stats.add_queue_wait(full_message.type, time.monotonic() - received_at)
         message_type = ""
         try:
             if self.received_message_callback is not None:
@@ -440,7 +482,8 @@ class WSChikConnection:
 
             async def wrapped_coroutine() -> Optional[Message]:
                 try:
-                    result = await coroutine
+                    with db_reader_context(f"api:{message_type}"):
+                        result = await coroutine
                     return result
                 except asyncio.CancelledError:
                     pass
@@ -461,7 +504,9 @@ class WSChikConnection:
                     raise
                 return None
 
+            handler_start = time.monotonic()
             response: Optional[Message] = await asyncio.wait_for(wrapped_coroutine(), timeout=timeout)
+            self.stats.add_handler_time(full_message.type, time.monotonic() - handler_start)
             self.log.debug(
                 f"Time taken to process {message_type} from {self.peer_node_id} is {time.time() - start_time} seconds"
             )
@@ -516,6 +561,7 @@ class WSChikConnection:
                         event = self.pending_requests[message.id]
                         event.set()
                     else:
+                        self._received_at[id(message)] = time.monotonic()
                         await self.incoming_queue.put(message)
                 else:
                     continue
@@ -531,6 +577,30 @@ class WSChikConnection:
         if self.closed:
             return False
         await self.outgoing_queue.put(message)
+        self.stats.message_queued(self.outgoing_queue.qsize())
+        return True
+
+    def send_delay(self, message: Message) -> float:
+        """
+        Returns the number of seconds until our outbound rate limit allows
+        sending message to this peer. 0 if it can be sent now, math.inf if it
+        never can be.
+        """
+        if is_localhost(self.peer_info.host):
+            return 0.0
+        return self.outbound_rate_limiter.send_delay(message, self.local_capabilities, self.peer_capabilities)
+
+    def send_broadcast(self, broadcast: Broadcast) -> bool:
+        """
+        Queues a message that's being sent to many connections, without
+        serializing it again. The outgoing queue is unbounded, so this never
+        has to wait.
+        """
+        if self.closed:
+            return False
+        broadcast.pending += 1
+        self.outgoing_queue.put_nowait(broadcast)
+        self.stats.message_queued(self.outgoing_queue.qsize())
         return True
 
     async def call_api(
@@ -596,7 +666,9 @@ class WSChikConnection:
         message = Message(message_no_id.type, request_id, message_no_id.data)
         assert message.id is not None
         self.pending_requests[message.id] = event
+        request_start = time.monotonic()
         await self.outgoing_queue.put(message)
+        self.stats.message_queued(self.outgoing_queue.qsize())
 
         try:
             await asyncio.wait_for(event.wait(), timeout=timeout)
@@ -608,6 +680,7 @@ class WSChikConnection:
         if message.id in self.request_results:
             result = self.request_results[message.id]
             assert result is not None
+            self.stats.add_response_latency(message.type, time.monotonic() - request_start)
             self.log.debug(
                 f"<- {ProtocolMessageTypes(result.type).name} from: {self.peer_info.host}:{self.peer_info.port}"
             )
@@ -615,18 +688,39 @@ class WSChikConnection:
 
         return result
 
-    async def _wait_and_retry(self, msg: Message) -> None:
+    async def _wait_and_retry(self, msg: Message, delay: float) -> None:
         try:
-            await asyncio.sleep(1)
+            await asyncio.sleep(delay)
             await self.outgoing_queue.put(msg)
         except Exception as e:
             self.log.debug(f"Exception {e} while waiting to retry sending rate limited message")
             return None
 
-    async def _send_message(self, message: Message) -> None:
-        encoded: bytes = bytes(message)
-        size = len(encoded)
-        assert len(encoded) < (2 ** (LENGTH_BYTES * 8))
+    def supports_compression(self) -> bool:
+        """
+        Whether the bulk message types in COMPRESSED_MESSAGE_TYPES are sent
+        compressed on this connection
+        """
+        return (
+            Capability.COMPRESSED_MESSAGES in self.local_capabilities
+            and Capability.COMPRESSED_MESSAGES in self.peer_capabilities
+        )
+
+    async def _encode(self, message: Message, encoded: Optional[bytes]) -> bytes:
+        if is_compressed_type(message.type):
+            if self.supports_compression():
+                data = message.data
+                if not isinstance(data, CompressedPayload):
+                    data = await asyncio.to_thread(compress_payload, data)
+                return bytes(Message(message.type, message.id, data))
+            if isinstance(message.data, CompressedPayload):
+                data = await asyncio.to_thread(decompress_payload, message.data)
+                return bytes(Message(message.type, message.id, data))
+        if encoded is None:
+            encoded = bytes(message)
+        return encoded
+
+    async def _send_message(self, message: Message, encoded: Optional[bytes] = None) -> None:
         limiter_msg = self.outbound_rate_limiter.process_msg_and_check(
             message, self.local_capabilities, self.peer_capabilities
         )
@@ -649,7 +743,11 @@ class WSChikConnection:
 
                 # TODO: fix this special case. This function has rate limits which are too low.
                 if ProtocolMessageTypes(message.type) != ProtocolMessageTypes.respond_peers:
-                    create_referenced_task(self._wait_and_retry(message), known_unreferenced=True)
+                    # retry once the rate limit allows it. Messages that
+                    # will never be allowed (e.g. too large) are dropped
+                    delay = self.send_delay(message)
+                    if delay != math.inf:
+                        create_referenced_task(self._wait_and_retry(message, delay), known_unreferenced=True)
 
                 return None
             else:
@@ -658,6 +756,9 @@ class WSChikConnection:
                     f"peer: {self.peer_info.host}"
                 )
 
+        encoded = await self._encode(message, encoded)
+        size = len(encoded)
+        assert len(encoded) < (2 ** (LENGTH_BYTES * 8))
         await self.ws.send_bytes(encoded)
         self.log.debug(
             f"-> {ProtocolMessageTypes(message.type).name} to peer {self.peer_info.host} {self.peer_node_id}"
@@ -701,6 +802,26 @@ class WSChikConnection:
                 message_type = ProtocolMessageTypes(full_message_loaded.type).name
             except Exception:
                 message_type = "Unknown"
+            if is_compressed_type(full_message_loaded.type) and self.supports_compression():
+                # don't decompress more than the rate limiter would accept
+                max_size = self.inbound_rate_limiter.max_message_size(
+                    ProtocolMessageTypes(full_message_loaded.type), self.local_capabilities, self.peer_capabilities
+                )
+                try:
+                    decompressed = await asyncio.to_thread(decompress_payload, full_message_loaded.data, max_size)
+                except Exception as e:
+                    self.log.error(f"Invalid compressed {message_type} message from {self.peer_info.host}: {e}")
+                    create_referenced_task(
+                        self.close(
+                            INTERNAL_PROTOCOL_ERROR_BAN_SECONDS,
+                            WSCloseCode.PROTOCOL_ERROR,
+                            Err.INVALID_PROTOCOL_MESSAGE,
+                        ),
+                        known_unreferenced=True,
+                    )
+                    await asyncio.sleep(3)
+                    return None
+                full_message_loaded = Message(full_message_loaded.type, full_message_loaded.id, decompressed)
             limiter_msg = self.inbound_rate_limiter.process_msg_and_check(
                 full_message_loaded, self.local_capabilities, self.peer_capabilities
             )
@@ -761,5 +882,8 @@ class WSChikConnection:
         else:
             return info
 
+    def get_stats(self) -> dict[str, Any]:
+        return self.stats.to_json_dict(self.outgoing_queue.qsize())
+
     def has_capability(self, capability: Capability) -> bool:
         return capability in self.peer_capabilities
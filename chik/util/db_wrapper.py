@@ -4,20 +4,27 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
+import contextvars
+import enum
 import functools
+import heapq
+import logging
 import secrets
 import sqlite3
 import sys
-from collections.abc import AsyncIterator, Iterable
+import time
+from collections.abc import AsyncIterator, Awaitable, Iterable, Iterator, Sequence
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional, TextIO, Union
+from typing import Any, Callable, Optional, TextIO, TypeVar, Union
 
 import aiosqlite
 import anyio
 from typing_extensions import final
 
+from chik.util.task_referencer import create_referenced_task
+
 if aiosqlite.sqlite_version_info < (3, 32, 0):
     SQLITE_MAX_VARIABLE_NUMBER = 900
 else:
@@ -26,6 +33,97 @@ else:
 # integers in sqlite are limited by int64
 SQLITE_INT_MAX = 2**63 - 1
 
+log = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+
+def parameter_bucket(count: int) -> int:
+    """
+    The number of parameters bucketed_parameters() binds for count values.
+    That's count rounded up to a power of two, as long as that doesn't exceed
+    SQLITE_MAX_VARIABLE_NUMBER.
+    """
+    bucket = 1
+    while bucket < count:
+        bucket *= 2
+    return min(bucket, max(count, SQLITE_MAX_VARIABLE_NUMBER))
+
+
+def bucketed_parameters(values: Sequence[_T]) -> tuple[str, list[_T]]:
+    """
+    Returns the placeholders for an "IN (...)" clause matching any of values,
+    along with the parameters to bind to them. The number of placeholders is
+    rounded up to a fixed bucket size (by repeating the last value, which
+    doesn't change what's matched), so a query made with any number of values
+    only has a handful of distinct SQL strings. This allows the connection's
+    statement cache to reuse the prepared statements, rather than parsing and
+    planning the query again on every call.
+    """
+    assert len(values) > 0
+    params = list(values)
+    params.extend([params[-1]] * (parameter_bucket(len(params)) - len(params)))
+    return ",".join(["?"] * len(params)), params
+
+
+class ReaderPriority(enum.IntEnum):
+    # waiters with a lower value are handed a reader connection first
+    high = 0
+    normal = 1
+
+
+# the caller name (for metrics) and priority of reads made by the current task
+_reader_context: contextvars.ContextVar[tuple[str, ReaderPriority]] = contextvars.ContextVar(
+    "db_reader_context", default=("other", ReaderPriority.normal)
+)
+
+
+@contextlib.contextmanager
+def db_reader_context(caller: str, priority: Optional[ReaderPriority] = None) -> Iterator[None]:
+    """
+    Attributes the reads made by the current task (and tasks it creates)
+    within this context to caller, in the reader pool metrics. If priority is
+    specified, waiting for a reader connection is done at that priority,
+    otherwise the priority of the enclosing context is kept.
+    """
+    if priority is None:
+        priority = _reader_context.get()[1]
+    token = _reader_context.set((caller, priority))
+    try:
+        yield
+    finally:
+        _reader_context.reset(token)
+
+
+@dataclass
+class ReaderPoolStats:
+    # the number of times a reader connection was checked out from the pool
+    checkouts: int = 0
+    # how many of those had to wait for a connection, and for how long
+    waits: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    # how long connections were held
+    total_checkout_time: float = 0.0
+    max_checkout_time: float = 0.0
+    # the number of reader connections opened and closed to adapt to the load
+    grown: int = 0
+    shrunk: int = 0
+    checkouts_by_caller: dict[str, int] = field(default_factory=dict)
+
+    def to_json_dict(self) -> dict[str, Any]:
+        return {
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "total_wait": self.total_wait,
+            "max_wait": self.max_wait,
+            "total_checkout_time": self.total_checkout_time,
+            "max_checkout_time": self.max_checkout_time,
+            "grown": self.grown,
+            "shrunk": self.shrunk,
+            "checkouts_by_caller": dict(self.checkouts_by_caller),
+        }
+
 
 class DBWrapperError(Exception):
     pass
@@ -80,9 +178,11 @@ async def _create_connection(
     uri: bool = False,
     log_file: Optional[TextIO] = None,
     name: Optional[str] = None,
+    statement_cache_size: int = 0,
 ) -> aiosqlite.Connection:
-    # To avoid https://github.com/python/cpython/issues/118172
-    connection = await aiosqlite.connect(database=database, uri=uri, cached_statements=0)
+    # The statement cache is disabled by default to avoid
+    # https://github.com/python/cpython/issues/118172
+    connection = await aiosqlite.connect(database=database, uri=uri, cached_statements=statement_cache_size)
 
     if log_file is not None:
         await connection.set_trace_callback(functools.partial(sql_trace_callback, file=log_file, name=name))
@@ -96,9 +196,12 @@ async def manage_connection(
     uri: bool = False,
     log_file: Optional[TextIO] = None,
     name: Optional[str] = None,
+    statement_cache_size: int = 0,
 ) -> AsyncIterator[aiosqlite.Connection]:
     connection: aiosqlite.Connection
-    connection = await _create_connection(database=database, uri=uri, log_file=log_file, name=name)
+    connection = await _create_connection(
+        database=database, uri=uri, log_file=log_file, name=name, statement_cache_size=statement_cache_size
+    )
 
     try:
         yield connection
@@ -143,19 +246,153 @@ class DBWrapper2:
     db_version: int = 1
     _log_file: Optional[TextIO] = None
     host_parameter_limit: int = get_host_parameter_limit()
+    # the number of prepared statements each connection caches
+    statement_cache_size: int = 0
     _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
-    _read_connections: asyncio.Queue[aiosqlite.Connection] = field(default_factory=asyncio.Queue)
+    # idle reader connections along with the time they were returned. The most
+    # recently used connection is at the end, so the ones at the start are the
+    # first to become idle long enough to be closed
+    _idle_readers: list[tuple[aiosqlite.Connection, float]] = field(default_factory=list)
+    # tasks waiting for a reader connection, by priority and then in order of arrival
+    _reader_waiters: list[tuple[int, int, asyncio.Future[aiosqlite.Connection]]] = field(default_factory=list)
+    _waiter_seq: int = 0
     _num_read_connections: int = 0
     _in_use: dict[asyncio.Task[object], aiosqlite.Connection] = field(default_factory=dict)
     _current_writer: Optional[asyncio.Task[object]] = None
     _savepoint_name: int = 0
+    # for each open savepoint (the innermost last), the callbacks undoing the
+    # in-memory changes made along with it (see on_rollback())
+    _undo: list[list[Callable[[], None]]] = field(default_factory=list)
+    # when set, the pool opens more reader connections (up to
+    # _max_read_connections) if tasks wait longer than _grow_wait seconds for
+    # one, and closes connections that have been idle for _idle_timeout seconds
+    # (down to _min_read_connections)
+    _open_reader: Optional[Callable[[], Awaitable[aiosqlite.Connection]]] = None
+    _min_read_connections: int = 0
+    _max_read_connections: int = 0
+    _grow_wait: float = 0.05
+    _idle_timeout: float = 60.0
+    _grow_task: Optional[asyncio.Task[None]] = None
+    # reader connections opened by the pool, which it's responsible for closing
+    _pool_readers: set[aiosqlite.Connection] = field(default_factory=set)
+    reader_stats: ReaderPoolStats = field(default_factory=ReaderPoolStats)
+
+    def in_parameters(self, values: Sequence[_T]) -> tuple[str, list[_T]]:
+        """
+        Returns the placeholders for an "IN (...)" clause matching any of
+        values, along with the parameters to bind to them. They're only padded
+        to a bucket size (see bucketed_parameters()) when the connections cache
+        prepared statements, otherwise padding would just bind more parameters.
+        """
+        if self.statement_cache_size > 0:
+            return bucketed_parameters(values)
+        return ",".join(["?"] * len(values)), list(values)
 
     async def add_connection(self, c: aiosqlite.Connection) -> None:
         # this guarantees that reader connections can only be used for reading
         assert c != self._write_connection
         await c.execute("pragma query_only")
-        self._read_connections.put_nowait(c)
         self._num_read_connections += 1
+        self._release_reader(c)
+
+    def _release_reader(self, c: aiosqlite.Connection) -> None:
+        while len(self._reader_waiters) > 0:
+            _, _, waiter = heapq.heappop(self._reader_waiters)
+            if not waiter.done():
+                waiter.set_result(c)
+                return
+        self._idle_readers.append((c, time.monotonic()))
+
+    async def _checkout_reader(self, priority: ReaderPriority) -> aiosqlite.Connection:
+        if len(self._idle_readers) > 0:
+            return self._idle_readers.pop()[0]
+
+        waiter: asyncio.Future[aiosqlite.Connection] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._reader_waiters, (priority, self._waiter_seq, waiter))
+        self._waiter_seq += 1
+        if (
+            self._open_reader is not None
+            and self._num_read_connections < self._max_read_connections
+            and (self._grow_task is None or self._grow_task.done())
+        ):
+            self._grow_task = create_referenced_task(self._grow_readers())
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            # we may have been handed a connection just as we were cancelled
+            if waiter.done() and not waiter.cancelled():
+                self._release_reader(waiter.result())
+            raise
+
+    async def _grow_readers(self) -> None:
+        assert self._open_reader is not None
+        while True:
+            await asyncio.sleep(self._grow_wait)
+            if not any(not w.done() for _, _, w in self._reader_waiters):
+                return
+            if self._num_read_connections >= self._max_read_connections:
+                return
+            try:
+                c = await self._open_reader()
+            except Exception as e:
+                log.warning(f"failed to open DB reader connection: {e}")
+                return
+            self._pool_readers.add(c)
+            self.reader_stats.grown += 1
+            await self.add_connection(c)
+
+    async def _shrink_readers(self) -> None:
+        # close connections that haven't been used in a while
+        now = time.monotonic()
+        while (
+            self._num_read_connections > self._min_read_connections
+            and len(self._idle_readers) > 0
+            and now - self._idle_readers[0][1] > self._idle_timeout
+        ):
+            c, _ = self._idle_readers.pop(0)
+            self._num_read_connections -= 1
+            self._pool_readers.discard(c)
+            self.reader_stats.shrunk += 1
+            await c.close()
+
+    async def _close_readers(self) -> None:
+        """
+        Waits for all reader connections to be returned, and closes the ones
+        the pool opened.
+        """
+        if self._grow_task is not None:
+            self._grow_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._grow_task
+        while self._num_read_connections > 0:
+            c = await self._checkout_reader(ReaderPriority.normal)
+            self._num_read_connections -= 1
+            if c in self._pool_readers:
+                self._pool_readers.discard(c)
+                await c.close()
+
+    def get_reader_stats(self) -> dict[str, Any]:
+        return {
+            "readers": self._num_read_connections,
+            "idle_readers": len(self._idle_readers),
+            "waiting": sum(1 for _, _, w in self._reader_waiters if not w.done()),
+            **self.reader_stats.to_json_dict(),
+        }
+
+    def configure_reader_pool(
+        self,
+        open_reader: Callable[[], Awaitable[aiosqlite.Connection]],
+        *,
+        min_readers: int,
+        max_readers: int,
+        grow_wait: float = 0.05,
+        idle_timeout: float = 60.0,
+    ) -> None:
+        self._open_reader = open_reader
+        self._min_read_connections = min_readers
+        self._max_read_connections = max_readers
+        self._grow_wait = grow_wait
+        self._idle_timeout = idle_timeout
 
     @classmethod
     @contextlib.asynccontextmanager
@@ -166,12 +403,20 @@ class DBWrapper2:
         db_version: int = 1,
         uri: bool = False,
         reader_count: int = 4,
+        max_reader_count: Optional[int] = None,
+        statement_cache_size: int = 0,
         log_path: Optional[Path] = None,
         journal_mode: str = "WAL",
         synchronous: Optional[str] = None,
         foreign_keys: Optional[bool] = None,
         row_factory: Optional[type[aiosqlite.Row]] = None,
     ) -> AsyncIterator[DBWrapper2]:
+        """
+        Opens reader_count reader connections. If max_reader_count is greater
+        than that, more are opened while readers are contended, up to
+        max_reader_count, and closed again once they're no longer needed.
+        Each connection keeps up to statement_cache_size prepared statements.
+        """
         if foreign_keys is None:
             foreign_keys = False
 
@@ -183,7 +428,13 @@ class DBWrapper2:
                 log_file = async_exit_stack.enter_context(log_path.open("a", encoding="utf-8"))
 
             write_connection = await async_exit_stack.enter_async_context(
-                manage_connection(database=database, uri=uri, log_file=log_file, name="writer"),
+                manage_connection(
+                    database=database,
+                    uri=uri,
+                    log_file=log_file,
+                    name="writer",
+                    statement_cache_size=statement_cache_size,
+                ),
             )
             await (await write_connection.execute(f"pragma journal_mode={journal_mode}")).close()
             if synchronous is not None:
@@ -193,7 +444,12 @@ class DBWrapper2:
 
             write_connection.row_factory = row_factory
 
-            self = cls(_write_connection=write_connection, db_version=db_version, _log_file=log_file)
+            self = cls(
+                _write_connection=write_connection,
+                db_version=db_version,
+                _log_file=log_file,
+                statement_cache_size=statement_cache_size,
+            )
 
             for index in range(reader_count):
                 read_connection = await async_exit_stack.enter_async_context(
@@ -202,18 +458,35 @@ class DBWrapper2:
                         uri=uri,
                         log_file=log_file,
                         name=f"reader-{index}",
+                        statement_cache_size=statement_cache_size,
                     ),
                 )
                 read_connection.row_factory = row_factory
                 await self.add_connection(c=read_connection)
 
+            if max_reader_count is not None and max_reader_count > reader_count:
+                reader_index = reader_count
+
+                async def open_reader() -> aiosqlite.Connection:
+                    nonlocal reader_index
+                    c = await _create_connection(
+                        database=database,
+                        uri=uri,
+                        log_file=log_file,
+                        name=f"reader-{reader_index}",
+                        statement_cache_size=statement_cache_size,
+                    )
+                    reader_index += 1
+                    c.row_factory = row_factory
+                    return c
+
+                self.configure_reader_pool(open_reader, min_readers=reader_count, max_readers=max_reader_count)
+
             try:
                 yield self
             finally:
                 with anyio.CancelScope(shield=True):
-                    while self._num_read_connections > 0:
-                        await self._read_connections.get()
-                        self._num_read_connections -= 1
+                    await self._close_readers()
 
     @classmethod
     async def create(
@@ -223,6 +496,7 @@ class DBWrapper2:
         db_version: int = 1,
         uri: bool = False,
         reader_count: int = 4,
+        statement_cache_size: int = 0,
         log_path: Optional[Path] = None,
         journal_mode: str = "WAL",
         synchronous: Optional[str] = None,
@@ -235,7 +509,9 @@ class DBWrapper2:
         else:
             log_path.parent.mkdir(parents=True, exist_ok=True)
             log_file = log_path.open("a", encoding="utf-8")
-        write_connection = await _create_connection(database=database, uri=uri, log_file=log_file, name="writer")
+        write_connection = await _create_connection(
+            database=database, uri=uri, log_file=log_file, name="writer", statement_cache_size=statement_cache_size
+        )
         await (await write_connection.execute(f"pragma journal_mode={journal_mode}")).close()
         if synchronous is not None:
             await (await write_connection.execute(f"pragma synchronous={synchronous}")).close()
@@ -244,7 +520,12 @@ class DBWrapper2:
 
         write_connection.row_factory = row_factory
 
-        self = cls(_write_connection=write_connection, db_version=db_version, _log_file=log_file)
+        self = cls(
+            _write_connection=write_connection,
+            db_version=db_version,
+            _log_file=log_file,
+            statement_cache_size=statement_cache_size,
+        )
 
         for index in range(reader_count):
             read_connection = await _create_connection(
@@ -252,6 +533,7 @@ class DBWrapper2:
                 uri=uri,
                 log_file=log_file,
                 name=f"reader-{index}",
+                statement_cache_size=statement_cache_size,
             )
             read_connection.row_factory = row_factory
             await self.add_connection(c=read_connection)
@@ -262,7 +544,7 @@ class DBWrapper2:
         # WARNING: please use .managed() instead
         try:
             while self._num_read_connections > 0:
-                await (await self._read_connections.get()).close()
+                await (await self._checkout_reader(ReaderPriority.normal)).close()
                 self._num_read_connections -= 1
             await self._write_connection.close()
         finally:
@@ -274,15 +556,36 @@ class DBWrapper2:
         self._savepoint_name += 1
         return name
 
+    def on_rollback(self, callback: Callable[[], None]) -> None:
+        """
+        Registers callback to be called if the current task's (innermost)
+        transaction is rolled back, or any transaction it's nested in. This is
+        meant for state kept in memory alongside the database, callback undoes
+        the change made to it. Callbacks are called in reverse order. Outside
+        of a transaction, or once it's committed, this does nothing.
+        """
+        if self._current_writer == asyncio.current_task() and len(self._undo) > 0:
+            self._undo[-1].append(callback)
+
     @contextlib.asynccontextmanager
     async def _savepoint_ctx(self) -> AsyncIterator[None]:
         name = self._next_savepoint()
         await self._write_connection.execute(f"SAVEPOINT {name}")
+        self._undo.append([])
         try:
             yield
         except:
+            undo = self._undo.pop()
             await self._write_connection.execute(f"ROLLBACK TO {name}")
+            for callback in reversed(undo):
+                callback()
             raise
+        else:
+            # if the enclosing transaction is rolled back, so are the changes
+            # of this one
+            undo = self._undo.pop()
+            if len(self._undo) > 0:
+                self._undo[-1].extend(undo)
         finally:
             # rollback to a savepoint doesn't cancel the transaction, it
             # just rolls back the state. We need to cancel it regardless
@@ -426,7 +729,18 @@ class DBWrapper2:
         if task in self._in_use:
             yield self._in_use[task]
         else:
-            c = await self._read_connections.get()
+            caller, priority = _reader_context.get()
+            stats = self.reader_stats
+            start = time.monotonic()
+            c = await self._checkout_reader(priority)
+            acquired = time.monotonic()
+            stats.checkouts += 1
+            stats.checkouts_by_caller[caller] = stats.checkouts_by_caller.get(caller, 0) + 1
+            wait = acquired - start
+            if wait > 0.001:
+                stats.waits += 1
+                stats.total_wait += wait
+                stats.max_wait = max(stats.max_wait, wait)
             try:
                 # record our connection in this dict to allow nested calls in
                 # the same task to use the same connection
@@ -434,4 +748,9 @@ class DBWrapper2:
                 yield c
             finally:
                 del self._in_use[task]
-                self._read_connections.put_nowait(c)
+                held = time.monotonic() - acquired
+                stats.total_checkout_time += held
+                stats.max_checkout_time = max(stats.max_checkout_time, held)
+                self._release_reader(c)
+                if self._open_reader is not None and self._num_read_connections > self._min_read_connections:
+                    await self._shrink_readers()
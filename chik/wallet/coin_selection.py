@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import logging
 import random
+import time
 from typing import Optional
 
 from chik_rs.sized_bytes import bytes32
@@ -11,6 +12,13 @@ from chik.types.blockchain_format.coin import Coin
 from chik.wallet.util.tx_config import CoinSelectionConfig
 from chik.wallet.wallet_coin_record import WalletCoinRecord
 
+# the maximum number of steps of the exact match search. Each step adds or
+# removes one coin
+BNB_MAX_STEPS = 100000
+# the time the knapsack algorithm may keep looking for a better set of coins,
+# once it found one
+KNAPSACK_TIME_LIMIT_SECONDS = 0.5
+
 
 async def select_coins(
     spendable_amount: uint128,
@@ -90,8 +98,16 @@ async def select_coins(
         log.debug(f"Selected closest greater coin: {smallest_coin.name()}")
         return {smallest_coin}
     elif smaller_coin_sum > amount:
-        coin_set: Optional[set[Coin]] = knapsack_coin_algorithm(
-            smaller_coins, amount, coin_selection_config.max_coin_amount, max_num_coins
+        coin_set: Optional[set[Coin]] = branch_and_bound_exact_match(smaller_coins, amount, max_num_coins)
+        if coin_set is not None:
+            log.debug(f"Selected coins with an exact match of the target: {coin_set}")
+            return coin_set
+        coin_set = knapsack_coin_algorithm(
+            smaller_coins,
+            amount,
+            coin_selection_config.max_coin_amount,
+            max_num_coins,
+            deadline=time.monotonic() + KNAPSACK_TIME_LIMIT_SECONDS,
         )
         log.debug(f"Selected coins from knapsack algorithm: {coin_set}")
         if coin_set is None:
@@ -137,16 +153,65 @@ def select_smallest_coin_over_target(target: uint128, sorted_coin_list: list[Coi
     assert False  # Should never reach here
 
 
+# Depth first search for a set of at most max_num_coins coins which adds up to exactly the target. Branches which
+# can't reach the target, with the remaining coins or within max_num_coins, are cut off. Gives up after max_steps.
+# IMPORTANT: The coins have to be sorted in descending order or else this function will not work.
+def branch_and_bound_exact_match(
+    sorted_coins: list[Coin], target: uint128, max_num_coins: int, max_steps: int = BNB_MAX_STEPS
+) -> Optional[set[Coin]]:
+    if target == 0:
+        return None
+    amounts = [coin.amount for coin in sorted_coins]
+    # remaining[i] is the sum of the coins from index i on
+    remaining = [0] * (len(amounts) + 1)
+    for i in reversed(range(len(amounts))):
+        remaining[i] = remaining[i + 1] + amounts[i]
+
+    selected: list[int] = []
+    selected_sum = 0
+    index = 0
+    for _ in range(max_steps):
+        if selected_sum == target:
+            return {sorted_coins[i] for i in selected}
+        missing = target - selected_sum
+        if index < len(amounts) and remaining[index] >= missing and amounts[index] > 0:
+            # the coins are sorted, so we need at least this many more coins
+            if len(selected) + -(-missing // amounts[index]) <= max_num_coins:
+                if amounts[index] <= missing:
+                    selected.append(index)
+                    selected_sum += amounts[index]
+                index += 1
+                continue
+        # backtrack, i.e. continue without the last selected coin
+        if len(selected) == 0:
+            return None
+        last = selected.pop()
+        selected_sum -= amounts[last]
+        index = last + 1
+        # coins of the same amount lead to the same sums as the one we just tried
+        while index < len(amounts) and amounts[index] == amounts[last]:
+            index += 1
+    return None
+
+
 # we use this to find the set of coins which have total value closest to the target, but at least the target.
+# Stops early once deadline (in time.monotonic() time) has passed and a set was found.
 # IMPORTANT: The coins have to be sorted in descending order or else this function will not work.
 def knapsack_coin_algorithm(
-    smaller_coins: list[Coin], target: uint128, max_coin_amount: int, max_num_coins: int, seed: bytes = b"knapsack seed"
+    smaller_coins: list[Coin],
+    target: uint128,
+    max_coin_amount: int,
+    max_num_coins: int,
+    seed: bytes = b"knapsack seed",
+    deadline: Optional[float] = None,
 ) -> Optional[set[Coin]]:
     best_set_sum = max_coin_amount
     best_set_of_coins: Optional[set[Coin]] = None
     ran: random.Random = random.Random()
     ran.seed(seed)
     for i in range(1000):
+        if deadline is not None and best_set_of_coins is not None and time.monotonic() > deadline:
+            break
         # reset these variables every loop.
         selected_coins: set[Coin] = set()
         selected_coins_sum = 0
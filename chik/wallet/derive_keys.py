@@ -71,6 +71,28 @@ def master_pk_to_wallet_pk_unhardened(master: G1Element, index: uint32) -> G1Ele
     return _derive_pk_unhardened(intermediate, [index])
 
 
+def derive_wallet_keys(
+    intermediate_sk: Optional[bytes], intermediate_pk_unhardened: bytes, start: int, end: int
+) -> tuple[list[tuple[bytes, bytes32]], list[tuple[bytes, bytes32]]]:
+    """
+    Derives the hardened and unhardened wallet public keys for the indices start to end (exclusive), from the
+    intermediate wallet keys, along with their standard puzzle hashes. The hardened keys are only derived if
+    intermediate_sk is set. Keys are passed as bytes, so this can run in a process pool.
+    """
+    hardened: list[tuple[bytes, bytes32]] = []
+    if intermediate_sk is not None:
+        sk = PrivateKey.from_bytes(intermediate_sk)
+        for index in range(start, end):
+            pk = _derive_path(sk, [index]).get_g1()
+            hardened.append((bytes(pk), puzzle_hash_for_pk(pk)))
+    unhardened: list[tuple[bytes, bytes32]] = []
+    intermediate_pk = G1Element.from_bytes_unchecked(intermediate_pk_unhardened)
+    for index in range(start, end):
+        pk = _derive_pk_unhardened(intermediate_pk, [index])
+        unhardened.append((bytes(pk), puzzle_hash_for_pk(pk)))
+    return hardened, unhardened
+
+
 def master_sk_to_local_sk(master: PrivateKey) -> PrivateKey:
     return _derive_path(master, [12381, 8444, 3, 0])
 
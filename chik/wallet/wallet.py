@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import logging
 import time
+from itertools import islice
 from typing import TYPE_CHECKING, Any, ClassVar, Optional, cast
 
 from chik_rs import AugSchemeMPL, CoinSpend, G1Element, G2Element, PrivateKey
@@ -100,6 +101,11 @@ class Wallet:
         return int(self.wallet_state_manager.constants.MAX_BLOCK_COST_KLVM / 5 / self.cost_of_single_tx)
 
     async def get_max_spendable_coins(self, records: Optional[set[WalletCoinRecord]] = None) -> set[WalletCoinRecord]:
+        if records is None:
+            # the unspent coins are kept ordered by amount, so only the largest ones need to be looked at
+            unspent = self.wallet_state_manager.coin_store.get_unspent_coins(self.id())
+            unspendable = await self.wallet_state_manager.get_unspendable_coin_ids(self.id())
+            return set(islice(unspent.largest_first(unspendable), self.max_send_quantity))
         spendable: list[WalletCoinRecord] = list(
             await self.wallet_state_manager.get_spendable_coins_for_wallet(self.id(), records)
         )
@@ -123,6 +129,10 @@ class Wallet:
         return await self.wallet_state_manager.get_unconfirmed_balance(self.id(), unspent_records)
 
     async def get_spendable_balance(self, unspent_records: Optional[set[WalletCoinRecord]] = None) -> uint128:
+        if unspent_records is None:
+            unspent = self.wallet_state_manager.coin_store.get_unspent_coins(self.id())
+            unspendable = await self.wallet_state_manager.get_unspendable_coin_ids(self.id())
+            return uint128(unspent.total - unspent.amount_of(unspendable))
         spendable = await self.wallet_state_manager.get_confirmed_spendable_balance_for_wallet(
             self.id(), unspent_records
         )
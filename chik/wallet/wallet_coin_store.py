@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import dataclasses
+import functools
 import sqlite3
+from collections.abc import Container, Iterable, Iterator
 from dataclasses import dataclass
 from enum import IntEnum
 from typing import Optional
 
 from chik_rs.sized_bytes import bytes32
 from chik_rs.sized_ints import uint8, uint32, uint64
+from sortedcontainers import SortedDict
 
 from chik.types.blockchain_format.coin import Coin
 from chik.util.db_wrapper import DBWrapper2, execute_fetchone
@@ -53,6 +57,50 @@ class GetCoinRecordsResult:
     total_count: Optional[uint32]
 
 
+class UnspentCoins:
+    """
+    The unspent coins of one wallet and coin type, ordered by amount. These are kept up to date by the
+    WalletCoinStore as coins are added, spent and rolled back, so balances don't need a database scan.
+    """
+
+    records: dict[bytes32, WalletCoinRecord]
+    # (amount, coin ID) -> record
+    by_amount: SortedDict[tuple[int, bytes32], WalletCoinRecord]
+    total: int
+
+    def __init__(self) -> None:
+        self.records = {}
+        self.by_amount = SortedDict()
+        self.total = 0
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, coin_id: bytes32) -> bool:
+        return coin_id in self.records
+
+    def add(self, coin_id: bytes32, record: WalletCoinRecord) -> None:
+        self.remove(coin_id)
+        self.records[coin_id] = record
+        self.by_amount[record.coin.amount, coin_id] = record
+        self.total += record.coin.amount
+
+    def remove(self, coin_id: bytes32) -> None:
+        record = self.records.pop(coin_id, None)
+        if record is not None:
+            del self.by_amount[record.coin.amount, coin_id]
+            self.total -= record.coin.amount
+
+    def amount_of(self, coin_ids: Iterable[bytes32]) -> int:
+        """Returns the total amount of the coins of coin_ids which are in this set"""
+        return sum(self.records[coin_id].coin.amount for coin_id in coin_ids if coin_id in self.records)
+
+    def largest_first(self, exclude: Container[bytes32] = ()) -> Iterator[WalletCoinRecord]:
+        for (_, coin_id), record in reversed(self.by_amount.items()):
+            if coin_id not in exclude:
+                yield record
+
+
 class WalletCoinStore:
     """
     This object handles CoinRecords in DB used by wallet.
@@ -60,6 +108,10 @@ class WalletCoinStore:
 
     db_wrapper: DBWrapper2
     total_count_cache: LRUCache[bytes32, uint32]
+    # the unspent coins, by wallet ID and coin type
+    unspent_coins: dict[tuple[int, CoinType], UnspentCoins]
+    # coin ID -> the key of the unspent coins it's in
+    _unspent_key: dict[bytes32, tuple[int, CoinType]]
 
     @classmethod
     async def create(cls, wrapper: DBWrapper2):
@@ -67,6 +119,8 @@ class WalletCoinStore:
 
         self.db_wrapper = wrapper
         self.total_count_cache = LRUCache(100)
+        self.unspent_coins = {}
+        self._unspent_key = {}
 
         async with self.db_wrapper.writer_maybe_transaction() as conn:
             await conn.execute(
@@ -102,8 +156,56 @@ class WalletCoinStore:
                 await conn.execute("CREATE INDEX IF NOT EXISTS coin_record_coin_type on coin_record(coin_type)")
             except sqlite3.OperationalError:
                 pass
+        await self.reload_unspent_coins()
         return self
 
+    async def reload_unspent_coins(self) -> None:
+        """
+        Loads the unspent coins from the database. They are kept up to date after that, changes made as part of a
+        transaction which is rolled back are undone along with it.
+        """
+        async with self.db_wrapper.writer_maybe_transaction() as conn:
+            rows = await conn.execute_fetchall("SELECT * FROM coin_record WHERE spent_height=0")
+        self.unspent_coins = {}
+        self._unspent_key = {}
+        for row in rows:
+            self._replace_unspent(bytes32.fromhex(row[0]), self.coin_record_from_row(row))
+
+    def get_unspent_coins(self, wallet_id: int, coin_type: CoinType = CoinType.NORMAL) -> UnspentCoins:
+        return self.unspent_coins.get((wallet_id, coin_type), UnspentCoins())
+
+    def _add_unspent(self, coin_id: bytes32, record: WalletCoinRecord) -> None:
+        self._set_unspent(coin_id, record if record.spent_block_height == 0 else None)
+
+    def _remove_unspent(self, coin_id: bytes32) -> None:
+        self._set_unspent(coin_id, None)
+
+    def _set_unspent(self, coin_id: bytes32, record: Optional[WalletCoinRecord]) -> None:
+        """
+        Sets the record of coin_id in the unspent coins, or removes it if record is None. If the database transaction
+        this is part of is rolled back, the change is undone.
+        """
+        key = self._unspent_key.get(coin_id)
+        previous = None if key is None else self.unspent_coins[key].records[coin_id]
+        if previous is None and record is None:
+            return
+        self._replace_unspent(coin_id, record)
+        self.db_wrapper.on_rollback(functools.partial(self._replace_unspent, coin_id, previous))
+
+    def _replace_unspent(self, coin_id: bytes32, record: Optional[WalletCoinRecord]) -> None:
+        key = self._unspent_key.pop(coin_id, None)
+        if key is not None:
+            self.unspent_coins[key].remove(coin_id)
+        if record is None:
+            return
+        key = (record.wallet_id, record.coin_type)
+        unspent = self.unspent_coins.get(key)
+        if unspent is None:
+            unspent = UnspentCoins()
+            self.unspent_coins[key] = unspent
+        unspent.add(coin_id, record)
+        self._unspent_key[coin_id] = key
+
     async def count_small_unspent(self, cutoff: int, coin_type: CoinType = CoinType.NORMAL) -> int:
         amount_bytes = uint64(cutoff).stream_to_bytes()
         async with self.db_wrapper.reader_no_transaction() as conn:
@@ -140,12 +242,14 @@ class WalletCoinStore:
                 ),
             )
         self.total_count_cache.cache.clear()
+        self._add_unspent(name, record)
 
     # Sometimes we realize that a coin is actually not interesting to us so we need to delete it
     async def delete_coin_record(self, coin_name: bytes32) -> None:
         async with self.db_wrapper.writer_maybe_transaction() as conn:
             await (await conn.execute("DELETE FROM coin_record WHERE coin_name=?", (coin_name.hex(),))).close()
         self.total_count_cache.cache.clear()
+        self._remove_unspent(coin_name)
 
     # Update coin_record to be spent in DB
     async def set_spent(self, coin_name: bytes32, height: uint32) -> None:
@@ -159,6 +263,8 @@ class WalletCoinStore:
                 ),
             )
         self.total_count_cache.cache.clear()
+        if height != 0:
+            self._remove_unspent(coin_name)
 
     def coin_record_from_row(self, row: sqlite3.Row) -> WalletCoinRecord:
         coin = Coin(bytes32.fromhex(row[6]), bytes32.fromhex(row[5]), uint64.from_bytes(row[7]))
@@ -336,7 +442,11 @@ class WalletCoinStore:
         """
 
         async with self.db_wrapper.writer_maybe_transaction() as conn:
+            removed = await conn.execute_fetchall(
+                "SELECT coin_name FROM coin_record WHERE confirmed_height>?", (height,)
+            )
             await (await conn.execute("DELETE FROM coin_record WHERE confirmed_height>?", (height,))).close()
+            unspent = await conn.execute_fetchall("SELECT * FROM coin_record WHERE spent_height>?", (height,))
             await (
                 await conn.execute(
                     "UPDATE coin_record SET spent_height = 0, spent = 0 WHERE spent_height>?",
@@ -344,9 +454,17 @@ class WalletCoinStore:
                 )
             ).close()
         self.total_count_cache.cache.clear()
+        for row in removed:
+            self._remove_unspent(bytes32.fromhex(row[0]))
+        for row in unspent:
+            record = dataclasses.replace(self.coin_record_from_row(row), spent_block_height=uint32(0), spent=False)
+            self._add_unspent(bytes32.fromhex(row[0]), record)
 
     async def delete_wallet(self, wallet_id: uint32) -> None:
         async with self.db_wrapper.writer_maybe_transaction() as conn:
             cursor = await conn.execute("DELETE FROM coin_record WHERE wallet_id=?", (wallet_id,))
             await cursor.close()
         self.total_count_cache.cache.clear()
+        for key in [key for key in self.unspent_coins if key[0] == wallet_id]:
+            for coin_id in list(self.unspent_coins[key].records):
+                self._remove_unspent(coin_id)
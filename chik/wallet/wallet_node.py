@@ -9,9 +9,9 @@ import random
 import sys
 import time
 import traceback
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Awaitable, Collection
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, ClassVar, Literal, Optional, Union, cast, overload
+from typing import TYPE_CHECKING, Any, Callable, ClassVar, Literal, Optional, Union, cast, overload
 
 import aiosqlite
 from chik_rs import AugSchemeMPL, CoinState, ConsensusConstants, G1Element, G2Element, HeaderBlock, PrivateKey
@@ -51,6 +51,7 @@ from chik.util.hash import std_hash
 from chik.util.keychain import Keychain
 from chik.util.path import path_from_root
 from chik.util.profiler import mem_profile_task, profile_task
+from chik.util.safe_cancel_task import cancel_task_safe
 from chik.util.streamable import Streamable, streamable
 from chik.util.task_referencer import create_referenced_task
 from chik.wallet.puzzles.clawback.metadata import AutoClaimSettings
@@ -68,6 +69,7 @@ from chik.wallet.util.wallet_sync_utils import (
     subscribe_to_phs,
 )
 from chik.wallet.util.wallet_types import CoinType, WalletType
+from chik.wallet.wallet import Wallet
 from chik.wallet.wallet_spend_bundle import WalletSpendBundle
 from chik.wallet.wallet_state_manager import WalletStateManager
 from chik.wallet.wallet_weight_proof_handler import WalletWeightProofHandler, get_wp_fork_point
@@ -834,14 +836,16 @@ class WalletNode:
             not_checked_puzzle_hashes = set(all_puzzle_hashes) - already_checked_ph
             if not_checked_puzzle_hashes == set():
                 break
-            for batch in to_batches(not_checked_puzzle_hashes, 1000):
-                ph_update_res: list[CoinState] = await subscribe_to_phs(
-                    batch.entries, full_node, min_height_for_subscriptions
-                )
-                ph_update_res = list(filter(is_new_state_update, ph_update_res))
-                if not await self.add_states_from_peer(ph_update_res, full_node):
-                    # If something goes wrong, abort sync
-                    return
+            if not await self.subscribe_and_add_states(
+                not_checked_puzzle_hashes,
+                subscribe_to_phs,
+                full_node,
+                min_height_for_subscriptions,
+                "puzzle hashes",
+                is_new_state_update,
+            ):
+                # If something goes wrong, abort sync
+                return
             already_checked_ph.update(not_checked_puzzle_hashes)
 
         self.log.info(f"Successfully subscribed and updated {len(already_checked_ph)} puzzle hashes")
@@ -854,14 +858,15 @@ class WalletNode:
             not_checked_coin_ids = set(all_coin_ids) - already_checked_coin_ids
             if not_checked_coin_ids == set():
                 break
-            for batch in to_batches(not_checked_coin_ids, 1000):
-                c_update_res: list[CoinState] = await subscribe_to_coin_updates(
-                    batch.entries, full_node, min_height_for_subscriptions
-                )
-
-                if not await self.add_states_from_peer(c_update_res, full_node):
-                    # If something goes wrong, abort sync
-                    return
+            if not await self.subscribe_and_add_states(
+                not_checked_coin_ids,
+                subscribe_to_coin_updates,
+                full_node,
+                min_height_for_subscriptions,
+                "coin ids",
+            ):
+                # If something goes wrong, abort sync
+                return
             already_checked_coin_ids.update(not_checked_coin_ids)
         self.log.info(f"Successfully subscribed and updated {len(already_checked_coin_ids)} coin ids")
 
@@ -878,6 +883,84 @@ class WalletNode:
 
         self.log.info(f"Sync (trusted: {trusted}) duration was: {time.time() - start_time}")
 
+    async def subscribe_and_add_states(
+        self,
+        items: Collection[bytes32],
+        subscribe: Callable[[list[bytes32], WSChikConnection, int], Awaitable[list[CoinState]]],
+        peer: WSChikConnection,
+        min_height: int,
+        name: str,
+        state_filter: Optional[Callable[[CoinState], bool]] = None,
+    ) -> bool:
+        """
+        Subscribes to the puzzle hashes or coin ids in items, in batches, and adds the coin states the peer responds
+        with. While the states of one batch are validated and added, the requests for up to
+        sync_subscriptions_in_flight of the following batches are already sent, so the round trips to the peer
+        overlap with adding states. The states are added in the order of the batches. Returns False if adding the
+        states failed.
+        """
+        in_flight = asyncio.Semaphore(max(1, int(self.config.get("sync_subscriptions_in_flight", 4))))
+        responses: asyncio.Queue[Optional[asyncio.Task[list[CoinState]]]] = asyncio.Queue()
+        request_count = 0
+        request_time = 0.0
+
+        async def request(batch: list[bytes32]) -> list[CoinState]:
+            nonlocal request_count, request_time
+            request_start = time.monotonic()
+            states = await subscribe(batch, peer, min_height)
+            request_count += 1
+            request_time += time.monotonic() - request_start
+            return states
+
+        async def send_requests() -> None:
+            try:
+                for batch in to_batches(items, 1000):
+                    # released once the response is taken off the queue
+                    await in_flight.acquire()
+                    if self._shut_down:
+                        break
+                    responses.put_nowait(create_referenced_task(request(batch.entries)))
+            finally:
+                # finished signal with None
+                responses.put_nowait(None)
+
+        start = time.monotonic()
+        wait_time = 0.0
+        add_time = 0.0
+        state_count = 0
+        sender = create_referenced_task(send_requests())
+        try:
+            while True:
+                wait_start = time.monotonic()
+                response = await responses.get()
+                if response is None:
+                    break
+                states = await response
+                in_flight.release()
+                add_start = time.monotonic()
+                wait_time += add_start - wait_start
+                if state_filter is not None:
+                    states = list(filter(state_filter, states))
+                state_count += len(states)
+                if not await self.add_states_from_peer(states, peer):
+                    return False
+                add_time += time.monotonic() - add_start
+        finally:
+            cancel_task_safe(sender, self.log)
+            while not responses.empty():
+                response = responses.get_nowait()
+                if response is not None:
+                    response.cancel()
+
+        duration = time.monotonic() - start
+        self.log.info(
+            f"Subscribed to {len(items)} {name} in {duration:.2f}s ({len(items) / max(duration, 0.001):.0f}/s): "
+            f"{request_count} requests taking {request_time:.2f}s in total, "
+            f"{state_count} coin states added in {add_time:.2f}s ({state_count / max(add_time, 0.001):.0f}/s), "
+            f"{wait_time:.2f}s waiting for responses"
+        )
+        return True
+
     async def add_states_from_peer(
         self,
         items_input: list[CoinState],
@@ -1736,12 +1819,23 @@ class WalletNode:
             coin_type = CoinType.CRCAT
         else:
             coin_type = CoinType.NORMAL
-        unspent_records = await self.wallet_state_manager.coin_store.get_unspent_coins_for_wallet(wallet_id, coin_type)
-        balance = await wallet.get_confirmed_balance(unspent_records)
-        pending_balance = await wallet.get_unconfirmed_balance(unspent_records)
-        spendable_balance = await wallet.get_spendable_balance(unspent_records)
+        # the unspent coins are kept up to date in memory by the coin store, this doesn't need a database scan
+        unspent = self.wallet_state_manager.coin_store.get_unspent_coins(wallet_id, coin_type)
+        if isinstance(wallet, Wallet):
+            # standard wallets can hold a lot of coins, only the pending changes are gone through here
+            balance = uint128(unspent.total)
+            pending_balance = await self.wallet_state_manager.get_unconfirmed_balance_for_unspent_coins(
+                wallet_id, unspent
+            )
+            spendable_balance = await wallet.get_spendable_balance()
+            max_send_amount = await wallet.get_max_send_amount()
+        else:
+            unspent_records = set(unspent.records.values())
+            balance = await wallet.get_confirmed_balance(unspent_records)
+            pending_balance = await wallet.get_unconfirmed_balance(unspent_records)
+            spendable_balance = await wallet.get_spendable_balance(unspent_records)
+            max_send_amount = await wallet.get_max_send_amount(unspent_records)
         pending_change = await wallet.get_pending_change_balance()
-        max_send_amount = await wallet.get_max_send_amount(unspent_records)
 
         unconfirmed_removals: dict[bytes32, Coin] = await wallet.wallet_state_manager.unconfirmed_removals_for_wallet(
             wallet_id
@@ -1752,7 +1846,7 @@ class WalletNode:
             spendable_balance=spendable_balance,
             pending_change=pending_change,
             max_send_amount=max_send_amount,
-            unspent_coin_count=uint32(len(unspent_records)),
+            unspent_coin_count=uint32(len(unspent)),
             pending_coin_removal_count=uint32(len(unconfirmed_removals)),
         )
 
@@ -4,10 +4,12 @@ import asyncio
 import contextlib
 import dataclasses
 import logging
+import multiprocessing
 import multiprocessing.context
 import time
 import traceback
 from collections.abc import AsyncIterator
+from concurrent.futures.process import ProcessPoolExecutor
 from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Callable, Optional, TypeVar, cast
@@ -37,12 +39,14 @@ from chik.types.blockchain_format.program import NIL, Program
 from chik.types.coin_record import CoinRecord
 from chik.types.mempool_inclusion_status import MempoolInclusionStatus
 from chik.util.bech32m import encode_puzzle_hash
+from chik.util.config import process_config_start_method
 from chik.util.db_synchronous import db_synchronous_on
 from chik.util.db_wrapper import DBWrapper2, PurposefulAbort
 from chik.util.errors import Err
 from chik.util.hash import std_hash
 from chik.util.lru_cache import LRUCache
 from chik.util.path import path_from_root
+from chik.util.setproctitle import getproctitle, setproctitle
 from chik.util.streamable import Streamable, UInt32Range, UInt64Range, VersionedBlob
 from chik.wallet.cat_wallet.cat_constants import DEFAULT_CATS
 from chik.wallet.cat_wallet.cat_info import CATCoinData, CATInfo, CRCATInfo
@@ -60,8 +64,7 @@ from chik.wallet.conditions import (
 from chik.wallet.db_wallet.db_wallet_puzzles import MIRROR_PUZZLE_HASH
 from chik.wallet.derivation_record import DerivationRecord
 from chik.wallet.derive_keys import (
-    _derive_path,
-    _derive_pk_unhardened,
+    derive_wallet_keys,
     master_pk_to_wallet_pk_unhardened,
     master_pk_to_wallet_pk_unhardened_intermediate,
     master_sk_to_wallet_sk,
@@ -123,7 +126,7 @@ from chik.wallet.wallet import Wallet
 from chik.wallet.wallet_action_scope import WalletActionScope, new_wallet_action_scope
 from chik.wallet.wallet_blockchain import WalletBlockchain
 from chik.wallet.wallet_coin_record import MetadataTypes, WalletCoinRecord
-from chik.wallet.wallet_coin_store import WalletCoinStore
+from chik.wallet.wallet_coin_store import UnspentCoins, WalletCoinStore
 from chik.wallet.wallet_info import WalletInfo
 from chik.wallet.wallet_interested_store import WalletInterestedStore
 from chik.wallet.wallet_nft_store import WalletNftStore
@@ -144,6 +147,17 @@ if TYPE_CHECKING:
 
 PendingTxCallback = Callable[[], None]
 
+# the number of derivation indices derived per task. Ranges with fewer
+# indices than this are derived on the event loop, larger ones in a process pool
+DERIVATION_BATCH_SIZE = 500
+DERIVATION_PROCESSES = 4
+# the number of derivation indices whose keys are kept for reuse by other wallets
+DERIVED_KEYS_CACHE_SIZE = 10000
+
+# the (public key, standard puzzle hash) of the hardened key of a derivation
+# index (if we have the private key), and of its unhardened key
+DerivedKeys = tuple[Optional[tuple[G1Element, bytes32]], tuple[G1Element, bytes32]]
+
 
 class WalletStateManager:
     # Ruff thinks these are "mutable class attributes" that should be annotated with `ClassVar`
@@ -193,6 +207,9 @@ class WalletStateManager:
     asset_to_wallet_map: dict[AssetType, Any]
     initial_num_public_keys: int
     decorator_manager: PuzzleDecoratorManager
+    # derivation index -> derived keys, shared by all wallets
+    _derived_keys: LRUCache[int, DerivedKeys]
+    _derivation_executor: Optional[ProcessPoolExecutor]
 
     @staticmethod
     async def create(
@@ -226,6 +243,12 @@ class WalletStateManager:
             synchronous=db_synchronous_on(self.config.get("db_sync", "auto")),
         )
 
+        self.multiprocessing_context = multiprocessing.get_context(
+            method=process_config_start_method(config=self.config, log=self.log)
+        )
+        self._derived_keys = LRUCache(DERIVED_KEYS_CACHE_SIZE)
+        self._derivation_executor = None
+
         self.initial_num_public_keys = config["initial_num_public_keys"]
         min_num_public_keys = 425
         if not config.get("testing", False) and self.initial_num_public_keys < min_num_public_keys:
@@ -461,21 +484,7 @@ class WalletStateManager:
 
                 lowest_start_index = min(start_index_by_wallet.values())
 
-                # now derive the keysfrom lowest_start_index to last_index
-                # these maps derivation index to public key
-                hardened_keys: dict[int, G1Element] = {}
-                unhardened_keys: dict[int, G1Element] = {}
-
-                if self.private_key is not None:
-                    # Hardened
-                    intermediate_sk = master_sk_to_wallet_sk_intermediate(self.private_key)
-                    for index in range(lowest_start_index, last_index + 1):
-                        hardened_keys[index] = _derive_path(intermediate_sk, [index]).get_g1()
-
-                # Unhardened
-                intermediate_pk_un = master_pk_to_wallet_pk_unhardened_intermediate(self.root_pubkey)
-                for index in range(lowest_start_index, last_index + 1):
-                    unhardened_keys[index] = _derive_pk_unhardened(intermediate_pk_un, [index])
+                derived_keys = await self._derive_keys(lowest_start_index, last_index + 1)
 
                 derivation_paths: list[DerivationRecord] = (
                     [] if previous_result is None else previous_result.derivation_paths
@@ -489,11 +498,18 @@ class WalletStateManager:
                         f"Creating puzzle hashes from {start_index} to {last_index} for wallet_id: {wallet_id}"
                     )
                     self.log.info(f"Start: {creating_msg}")
+                    # the standard puzzle hashes come with the derived keys
+                    standard = target_wallet.type() == WalletType.STANDARD_WALLET
                     for index in range(start_index, last_index + 1):
-                        pubkey: Optional[G1Element] = hardened_keys.get(index)
-                        if pubkey is not None:
+                        if (index - start_index) % DERIVATION_BATCH_SIZE == DERIVATION_BATCH_SIZE - 1:
+                            # other wallets compute their puzzle hashes here, give the event loop a chance to run
+                            await asyncio.sleep(0)
+                        hardened, (pubkey, puzzlehash_unhardened) = derived_keys[index]
+                        if hardened is not None:
                             # Hardened
-                            puzzlehash: bytes32 = target_wallet.puzzle_hash_for_pk(pubkey)
+                            hardened_pubkey, puzzlehash = hardened
+                            if not standard:
+                                puzzlehash = target_wallet.puzzle_hash_for_pk(hardened_pubkey)
                             self.log.debug(
                                 f"Puzzle at index {index} wallet ID {wallet_id} puzzle hash {puzzlehash.hex()}"
                             )
@@ -501,16 +517,15 @@ class WalletStateManager:
                                 DerivationRecord(
                                     uint32(index),
                                     puzzlehash,
-                                    pubkey,
+                                    hardened_pubkey,
                                     target_wallet.type(),
                                     uint32(target_wallet.id()),
                                     True,
                                 )
                             )
                         # Unhardened
-                        pubkey = unhardened_keys.get(index)
-                        assert pubkey is not None
-                        puzzlehash_unhardened: bytes32 = target_wallet.puzzle_hash_for_pk(pubkey)
+                        if not standard:
+                            puzzlehash_unhardened = target_wallet.puzzle_hash_for_pk(pubkey)
                         self.log.debug(
                             f"Puzzle at index {index} wallet ID {wallet_id} puzzle hash {puzzlehash_unhardened.hex()}"
                         )
@@ -530,13 +545,86 @@ class WalletStateManager:
                         derivation_paths=derivation_paths,
                         mark_existing_as_used=mark_existing_as_used,
                         unused=unused,
-                        new_unhardened_keys=(len(hardened_keys) > 0),
+                        new_unhardened_keys=self.private_key is not None,
                         last_index=last_index,
                     )
                 )
         except PurposefulAbort as e:
             return cast(CreateMorePuzzleHashesResult, e.obj)
 
+    async def _derive_keys(self, start: int, end: int) -> dict[int, DerivedKeys]:
+        """
+        Returns the public keys (and standard puzzle hashes) for the indices start to end (exclusive). The ones which
+        aren't cached yet are derived, larger ranges in batches in the process pool. Only the most recently used
+        DERIVED_KEYS_CACHE_SIZE indices stay cached.
+        """
+        keys: dict[int, DerivedKeys] = {}
+        batches: list[tuple[int, int]] = []
+        count = 0
+        for index in range(start, end):
+            cached = self._derived_keys.get(index)
+            if cached is not None:
+                keys[index] = cached
+                continue
+            count += 1
+            if len(batches) > 0 and batches[-1][1] == index and index - batches[-1][0] < DERIVATION_BATCH_SIZE:
+                batches[-1] = (batches[-1][0], index + 1)
+            else:
+                batches.append((index, index + 1))
+        if count == 0:
+            return keys
+
+        intermediate_sk: Optional[bytes] = None
+        if self.private_key is not None:
+            intermediate_sk = bytes(master_sk_to_wallet_sk_intermediate(self.private_key))
+        intermediate_pk_un = bytes(master_pk_to_wallet_pk_unhardened_intermediate(self.root_pubkey))
+
+        start_t = time.monotonic()
+        if count < DERIVATION_BATCH_SIZE:
+            results = [derive_wallet_keys(intermediate_sk, intermediate_pk_un, s, e) for s, e in batches]
+            for (batch_start, _), (hardened, unhardened) in zip(batches, results):
+                self._add_derived_keys(keys, batch_start, hardened, unhardened)
+        else:
+            if self._derivation_executor is None:
+                self._derivation_executor = ProcessPoolExecutor(
+                    DERIVATION_PROCESSES,
+                    mp_context=self.multiprocessing_context,
+                    initializer=setproctitle,
+                    initargs=(f"{getproctitle()}_worker",),
+                )
+            executor = self._derivation_executor
+            loop = asyncio.get_running_loop()
+            futures = [
+                loop.run_in_executor(executor, derive_wallet_keys, intermediate_sk, intermediate_pk_un, s, e)
+                for s, e in batches
+            ]
+            try:
+                for (batch_start, _), future in zip(batches, futures):
+                    hardened, unhardened = await future
+                    self._add_derived_keys(keys, batch_start, hardened, unhardened)
+            finally:
+                for future in futures:
+                    future.cancel()
+        self.log.info(f"Derived {count} wallet keys in {time.monotonic() - start_t:0.2f} seconds")
+        return keys
+
+    def _add_derived_keys(
+        self,
+        keys: dict[int, DerivedKeys],
+        start: int,
+        hardened: list[tuple[bytes, bytes32]],
+        unhardened: list[tuple[bytes, bytes32]],
+    ) -> None:
+        # the keys were derived by us, no need to validate them again. There
+        # are no hardened keys without the private key
+        for offset, (pubkey, puzzle_hash) in enumerate(unhardened):
+            hardened_keys: Optional[tuple[G1Element, bytes32]] = None
+            if offset < len(hardened):
+                hardened_keys = (G1Element.from_bytes_unchecked(hardened[offset][0]), hardened[offset][1])
+            derived = (hardened_keys, (G1Element.from_bytes_unchecked(pubkey), puzzle_hash))
+            keys[start + offset] = derived
+            self._derived_keys.put(start + offset, derived)
+
     async def update_wallet_puzzle_hashes(self, wallet_id: uint32) -> None:
         derivation_paths: list[DerivationRecord] = []
         target_wallet = self.wallets[wallet_id]
@@ -807,6 +895,36 @@ class WalletStateManager:
 
         return uint128(sum(coin.amount for coin in all_unspent_coins))
 
+    async def get_unconfirmed_balance_for_unspent_coins(self, wallet_id: int, unspent: UnspentCoins) -> uint128:
+        """
+        Same as get_unconfirmed_balance() for the given unspent coins, but only goes through the unconfirmed
+        transactions instead of all the coins.
+        """
+        unconfirmed_tx: list[TransactionRecord] = await self.tx_store.get_unconfirmed_for_wallet(wallet_id)
+        # the changes to the unspent coins
+        added: dict[bytes32, Coin] = {}
+        removed: set[bytes32] = set()
+        for record in unconfirmed_tx:
+            if record.type in CLAWBACK_INCOMING_TRANSACTION_TYPES:
+                continue
+            for addition in record.additions:
+                if await self.does_coin_belong_to_wallet(addition, wallet_id, record.hint_dict()):
+                    coin_id = addition.name()
+                    if coin_id in unspent:
+                        removed.discard(coin_id)
+                    else:
+                        added[coin_id] = addition
+
+            for removal in record.removals:
+                if await self.does_coin_belong_to_wallet(removal, wallet_id, record.hint_dict()):
+                    coin_id = removal.name()
+                    if coin_id in unspent:
+                        removed.add(coin_id)
+                    else:
+                        added.pop(coin_id, None)
+
+        return uint128(unspent.total - unspent.amount_of(removed) + sum(coin.amount for coin in added.values()))
+
     async def unconfirmed_removals_for_wallet(self, wallet_id: int) -> dict[bytes32, Coin]:
         """
         Returns new removals transactions that have not been confirmed yet.
@@ -2435,6 +2553,9 @@ class WalletStateManager:
         return remove_ids
 
     async def _await_closed(self) -> None:
+        if self._derivation_executor is not None:
+            self._derivation_executor.shutdown(wait=True, cancel_futures=True)
+            self._derivation_executor = None
         await self.db_wrapper.close()
 
     def unlink_db(self) -> None:
@@ -2497,27 +2618,25 @@ class WalletStateManager:
             else:
                 records = await self.coin_store.get_unspent_coins_for_wallet(wallet_id)
 
+        unspendable = await self.get_unspendable_coin_ids(wallet_id)
+        return {record for record in records if record.coin.name() not in unspendable}
+
+    async def get_unspendable_coin_ids(self, wallet_id: int) -> set[bytes32]:
+        """
+        Returns the IDs of the coins of the wallet which are part of unconfirmed transactions or locked by offers
+        """
         # Coins that are currently part of a transaction
         unconfirmed_tx: list[TransactionRecord] = await self.tx_store.get_unconfirmed_for_wallet(wallet_id)
-        removal_dict: dict[bytes32, Coin] = {}
+        unspendable: set[bytes32] = set()
         for tx in unconfirmed_tx:
             for coin in tx.removals:
                 # TODO, "if" might not be necessary once unconfirmed tx doesn't contain coins for other wallets
                 if await self.does_coin_belong_to_wallet(coin, wallet_id, tx.hint_dict()):
-                    removal_dict[coin.name()] = coin
+                    unspendable.add(coin.name())
 
         # Coins that are part of the trade
-        offer_locked_coins: dict[bytes32, WalletCoinRecord] = await self.trade_manager.get_locked_coins()
-
-        filtered = set()
-        for record in records:
-            if record.coin.name() in offer_locked_coins:
-                continue
-            if record.coin.name() in removal_dict:
-                continue
-            filtered.add(record)
-
-        return filtered
+        unspendable.update(await self.trade_manager.get_locked_coins())
+        return unspendable
 
     async def new_peak(self, height: uint32) -> None:
         for wallet_id, wallet in self.wallets.items():
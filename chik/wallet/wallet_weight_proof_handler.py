@@ -11,8 +11,14 @@ from typing import IO, Optional
 from chik_rs import BlockRecord, ConsensusConstants
 from chik_rs.sized_ints import uint32
 
-from chik.full_node.weight_proof import _validate_sub_epoch_summaries, validate_weight_proof_inner
+from chik.full_node.weight_proof import (
+    VERIFIED_SEGMENTS_CACHE_SIZE,
+    SegmentKey,
+    _validate_sub_epoch_summaries,
+    validate_weight_proof_inner,
+)
 from chik.types.weight_proof import WeightProof
+from chik.util.lru_cache import LRUCache
 from chik.util.setproctitle import getproctitle, setproctitle
 
 log = logging.getLogger(__name__)
@@ -37,6 +43,7 @@ class WalletWeightProofHandler:
             initializer=setproctitle,
             initargs=(f"{getproctitle()}_worker",),
         )
+        self._verified_segments: LRUCache[SegmentKey, bool] = LRUCache(VERIFIED_SEGMENTS_CACHE_SIZE)
 
     def cancel_weight_proof_tasks(self) -> None:
         self._executor_shutdown_tempfile.close()
@@ -61,6 +68,7 @@ class WalletWeightProofHandler:
             sub_epoch_weight_list,
             skip_segment_validation,
             validate_from,
+            self._verified_segments,
         )
         if not valid:
             raise ValueError("weight proof validation failed")
@@ -25,6 +25,8 @@ from chik_rs.sized_bytes import bytes32
 
 from chik.consensus.condition_tools import pkm_pairs
 from chik.consensus.default_constants import DEFAULT_CONSTANTS
+from chik.full_node.block_archive import BlockArchive, archive_directory
+from chik.full_node.block_height_map import HeightToHashReader
 from chik.full_node.full_block_utils import block_info_from_block, generator_from_block
 from chik.types.block_protocol import BlockInfo
 from chik.types.blockchain_format.serialized_program import SerializedProgram
@@ -55,6 +57,17 @@ def run_gen(
         return 117, None, 0
 
 
+# main chain blocks moved to the block archive have their "block" column set to
+# NULL in the database
+def block_blob(archive: BlockArchive, blob: Optional[bytes], height: int, header_hash: bytes) -> bytes:
+    if blob is not None:
+        return blob
+    archived = archive.get(height, bytes32(header_hash))
+    if archived is None:
+        raise RuntimeError(f"Block {header_hash.hex()} at height {height} is missing from the block archive")
+    return archived
+
+
 def callable_for_module_function_path(
     call: str,
 ) -> Callable[[Union[BlockInfo, FullBlock], bytes32, int, list[bytes], float, int], None]:
@@ -76,8 +89,20 @@ def callable_for_module_function_path(
 @click.option("--start", default=225000, help="first block to examine")
 @click.option("--end", default=None, help="last block to examine")
 @click.option("--call", default=None, help="function to pass block iterator to in form `module:function`")
+@click.option(
+    "--height-to-hash",
+    type=click.Path(),
+    default=None,
+    help="the node's height-to-hash file, used to look up referenced blocks. Defaults to the one next to the database",
+)
 def main(
-    file: Path, mempool_mode: bool, start: int, end: Optional[int], call: Optional[str], verify_signatures: bool
+    file: Path,
+    mempool_mode: bool,
+    start: int,
+    end: Optional[int],
+    call: Optional[str],
+    verify_signatures: bool,
+    height_to_hash: Optional[Path],
 ) -> None:
     call_f: Callable[[Union[BlockInfo, FullBlock], bytes32, int, list[bytes], float, int], None]
     if call is None:
@@ -86,6 +111,15 @@ def main(
         call_f = callable_for_module_function_path(call)
 
     c = sqlite3.connect(file)
+    archive = BlockArchive.open(archive_directory(Path(file)), read_only=True)
+
+    # the height-to-hash file lets us look up generator references by their
+    # header hash (the primary key), rather than scanning the height index for
+    # the main chain block
+    h2h_path = Path(file).parent / "height-to-hash" if height_to_hash is None else Path(height_to_hash)
+    h2h: Optional[HeightToHashReader] = None
+    if h2h_path.exists():
+        h2h = HeightToHashReader(h2h_path)
 
     end_limit_sql = "" if end is None else f"and height <= {end} "
 
@@ -98,10 +132,11 @@ def main(
         hh: bytes32 = r[0]
         height: int = r[1]
         block: Union[BlockInfo, FullBlock]
+        blob = block_blob(archive, r[2], height, hh)
         if verify_signatures:
-            block = FullBlock.from_bytes_unchecked(zstd.decompress(r[2]))
+            block = FullBlock.from_bytes_unchecked(zstd.decompress(blob))
         else:
-            block = block_info_from_block(memoryview(zstd.decompress(r[2])))
+            block = block_info_from_block(memoryview(zstd.decompress(blob)))
 
         if block.transactions_generator is None:
             sys.stderr.write(f" no-generator. block {height}\r")
@@ -110,8 +145,15 @@ def main(
         start_time = time()
         generator_blobs = []
         for h in block.transactions_generator_ref_list:
-            ref = c.execute("SELECT block FROM full_blocks WHERE height=? and in_main_chain=1", (h,))
-            generator = generator_from_block(memoryview(zstd.decompress(ref.fetchone()[0])))
+            if h2h is not None and h < len(h2h):
+                ref = c.execute(
+                    "SELECT block, height, header_hash FROM full_blocks WHERE header_hash=?", (h2h.get_hash(h),)
+                )
+            else:
+                ref = c.execute(
+                    "SELECT block, height, header_hash FROM full_blocks WHERE height=? and in_main_chain=1", (h,)
+                )
+            generator = generator_from_block(memoryview(zstd.decompress(block_blob(archive, *ref.fetchone()))))
             assert generator is not None
             generator_blobs.append(generator)
             ref.close()
@@ -125,6 +167,10 @@ def main(
 
         call_f(block, hh, height, generator_blobs, ref_lookup_time, flags)
 
+    if h2h is not None:
+        h2h.close()
+    archive.close()
+
 
 def default_call(
     verify_signatures: bool,
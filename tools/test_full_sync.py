@@ -12,13 +12,14 @@ import click
 import zstd
 from chik_rs import FullBlock
 
-from chik._tests.util.full_sync import FakePeer, FakeServer, run_sync_test
+from chik._tests.util.full_sync import FakePeer, FakeServer, block_blob, run_sync_test
 from chik.cmds.init_funcs import chik_init
 from chik.consensus.augmented_chain import AugmentedBlockchain
 from chik.consensus.block_body_validation import ForkInfo
 from chik.consensus.constants import replace_str_to_bytes
 from chik.consensus.default_constants import DEFAULT_CONSTANTS
 from chik.consensus.difficulty_adjustment import get_next_sub_slot_iters_and_difficulty
+from chik.full_node.block_archive import BlockArchive, archive_directory
 from chik.full_node.full_node import FullNode
 from chik.server.ws_connection import WSChikConnection
 from chik.types.validation_state import ValidationState
@@ -144,17 +145,20 @@ async def run_sync_checkpoint(
 
         print()
         height = 0
+        archive = BlockArchive.open(archive_directory(Path(file)), read_only=True)
         async with aiosqlite.connect(file) as in_db:
             await in_db.execute("pragma query_only")
             rows = await in_db.execute(
-                "SELECT block FROM full_blocks WHERE in_main_chain=1 AND height < ? ORDER BY height", (max_height,)
+                "SELECT header_hash, height, block FROM full_blocks "
+                "WHERE in_main_chain=1 AND height < ? ORDER BY height",
+                (max_height,),
             )
 
             block_batch = []
             peer_info = peer.get_peer_logging()
             blockchain = AugmentedBlockchain(full_node.blockchain)
             async for r in rows:
-                block = FullBlock.from_bytes_unchecked(zstd.decompress(r[0]))
+                block = FullBlock.from_bytes_unchecked(zstd.decompress(block_blob(archive, r[2], r[1], r[0])))
                 block_batch.append(block)
 
                 if len(block_batch) < 32:
@@ -201,6 +205,7 @@ async def run_sync_checkpoint(
                 )
                 if not success:
                     raise RuntimeError("failed to ingest block batch")
+        archive.close()
 
 
 main.add_command(run)
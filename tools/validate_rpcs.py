@@ -7,11 +7,11 @@ import time
 from pathlib import Path
 from typing import Any, Optional
 
-import aiofiles
 import click
 from chik_rs.sized_bytes import bytes32
 
 from chik.cmds.cmds_util import get_any_service_client
+from chik.full_node.block_height_map import HeightToHashReader
 from chik.full_node.full_node_rpc_client import FullNodeRpcClient
 from chik.util.default_root import resolve_root_path
 from chik.util.path import path_from_root
@@ -31,22 +31,11 @@ def get_height_to_hash_filename(root_path: Path, config: dict[str, Any]) -> Path
     return db_directory / f"height-to-hash{suffix}"
 
 
-async def get_height_to_hash_bytes(root_path: Path, config: dict[str, Any]) -> bytes:
+def open_height_to_hash(root_path: Path, config: dict[str, Any]) -> HeightToHashReader:
     """
-    Load the height-to-hash database file into a bytearray.
+    Memory map the height-to-hash database file (read-only).
     """
-    height_to_hash_filename: Path = get_height_to_hash_filename(root_path, config)
-    async with aiofiles.open(height_to_hash_filename, "rb") as f:
-        return await f.read()
-
-
-def get_block_hash_from_height(height: int, height_to_hash: bytes) -> bytes32:
-    """
-    Get the block header hash from the height-to-hash database.
-    """
-    idx = height * 32
-    assert idx + 32 <= len(height_to_hash)
-    return bytes32(height_to_hash[idx : idx + 32])
+    return HeightToHashReader(get_height_to_hash_filename(root_path, config))
 
 
 @click.command(help="Test RPC endpoints using chain", no_args_is_help=True)
@@ -204,7 +193,7 @@ async def cli_async(
 
         print("Connected to Full Node")
 
-        height_to_hash_bytes: bytes = await get_height_to_hash_bytes(root_path=root_path, config=config)
+        height_to_hash: HeightToHashReader = open_height_to_hash(root_path=root_path, config=config)
 
         print("block header hashes loaded from height-to-hash file.")
 
@@ -218,7 +207,7 @@ async def cli_async(
         start_time: float = cycle_start
 
         def add_tasks_for_height(height: int) -> None:
-            block_header_hash = get_block_hash_from_height(height, height_to_hash_bytes)
+            block_header_hash = height_to_hash.get_hash(height)
             # Create tasks for each RPC call based on the flags
             if spends_with_conditions:
                 pipeline.add(